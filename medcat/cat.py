@@ -11,7 +11,7 @@ from time import sleep
 from multiprocess import Process, Manager, cpu_count
 from multiprocess.queues import Queue
 from multiprocess.synchronize import Lock
-from typing import Union, List, Tuple, Optional, Dict, Iterable, Set
+from typing import Union, List, Tuple, Optional, Dict, Iterable, Set, Sequence
 from itertools import islice, chain, repeat
 from datetime import date
 from tqdm.autonotebook import tqdm, trange
@@ -24,14 +24,15 @@ from medcat.pipe import Pipe
 from medcat.preprocessing.taggers import tag_skip_and_punct
 from medcat.cdb import CDB
 from medcat.utils.data_utils import make_mc_train_test, get_false_positives
-from medcat.utils.normalizers import BasicSpellChecker
+from medcat.utils.normalizers import BasicSpellChecker, TokenNormalizer, SpellCorrectionCache, DeletionIndex
 from medcat.utils.checkpoint import Checkpoint, CheckpointConfig, CheckpointManager
 from medcat.utils.helpers import tkns_from_doc, get_important_config_parameters, has_new_spacy
 from medcat.utils.hasher import Hasher
 from medcat.ner.vocab_based_ner import NER
 from medcat.linking.context_based_linker import Linker
 from medcat.preprocessing.cleaners import prepare_name
-from medcat.meta_cat import MetaCAT
+from medcat.preprocessing.name_cache import PreparedNameCache
+from medcat.meta_cat import MetaCAT, MultiTaskMetaCAT, group_meta_cats
 from medcat.rel_cat import RelCAT
 from medcat.utils.meta_cat.data_utils import json_to_fake_spacy
 from medcat.config import Config
@@ -39,9 +40,11 @@ from medcat.vocab import Vocab
 from medcat.ner.transformers_ner import TransformersNER
 from medcat.utils.saving.serializer import SPECIALITY_NAMES, ONE2MANY
 from medcat.utils.saving.envsnapshot import get_environment_info, ENV_SNAPSHOT_FILE_NAME
+from medcat.utils.saving.pack_store import PackStore, write_stored_archive
 from medcat.stats.stats import get_stats
 from medcat.utils.filters import set_project_filters
 from medcat.utils.usage_monitoring import UsageMonitor
+from medcat.utils.long_documents import get_chunk_spans, merge_chunk_outputs
 
 
 logger = logging.getLogger(__name__) # separate logger from the package-level one
@@ -69,6 +72,9 @@ class CAT(object):
             detected annotation.
         rel_cats (list of medcat.rel_cat.RelCAT, optional)
             List of models applied sequentially on all detected annotations.
+        group_meta_cats (bool):
+            Whether to run the meta_cats that use the same (frozen) BERT model and context
+            window together, running the encoder only once. Default: False
 
     Attributes (limited):
         cdb (medcat.cdb.CDB):
@@ -80,6 +86,10 @@ class CAT(object):
         vocab (medcat.utils.vocab.Vocab):
             The vocabulary object used with this instance, please do not assign
             this value directly.
+        name_cache (Optional[medcat.preprocessing.name_cache.PreparedNameCache]):
+            If set, the names added to the CDB (e.g with `add_and_train_concept`) are
+            prepared using (and added to) this cache, and it is saved in the model pack.
+            Defaults to None (i.e no names are cached or saved).
 
     Examples:
 
@@ -88,6 +98,9 @@ class CAT(object):
         >>> print(spacy_doc.ents) # Detected entities
     """
     DEFAULT_MODEL_PACK_NAME = "medcat_model_pack"
+    SPELL_CHECK_CACHE_FILE_NAME = "spell_check.dat"
+    SPELL_CHECK_INDEX_FILE_NAME = "spell_check_index.dat"
+    PREPARED_NAMES_CACHE_FILE_NAME = "prepared_names.dat"
 
     def __init__(self,
                  cdb: CDB,
@@ -95,7 +108,8 @@ class CAT(object):
                  config: Optional[Config] = None,
                  meta_cats: List[MetaCAT] = [],
                  rel_cats: List[RelCAT] = [],
-                 addl_ner: Union[TransformersNER, List[TransformersNER]] = []) -> None:
+                 addl_ner: Union[TransformersNER, List[TransformersNER]] = [],
+                 group_meta_cats: bool = False) -> None:
         self.cdb = cdb
         self.vocab = vocab
         if config is None:
@@ -106,9 +120,11 @@ class CAT(object):
             self.config = config
             self.cdb.config = config
         self._meta_cats = meta_cats
+        self._group_meta_cats = group_meta_cats
         self._rel_cats = rel_cats
         self._addl_ner = addl_ner if isinstance(addl_ner, list) else [addl_ner]
         self._create_pipeline(self.config)
+        self.name_cache: Optional[PreparedNameCache] = None
         self.usage_monitor = UsageMonitor(self.config.version.id, self.config.general.usage_monitor)
 
     def _create_pipeline(self, config: Config):
@@ -122,7 +138,8 @@ class CAT(object):
                              additional_fields=['is_punct'])
 
         if self.vocab is not None:
-            spell_checker = BasicSpellChecker(cdb_vocab=self.cdb.vocab, config=config, data_vocab=self.vocab)
+            spell_checker = BasicSpellChecker(cdb_vocab=self.cdb.vocab, config=config, data_vocab=self.vocab,
+                                              get_vocab_version=self.cdb.get_vocab_version)
             self.pipe.add_token_normalizer(spell_checker=spell_checker, config=config)
 
             # Add NER
@@ -138,8 +155,15 @@ class CAT(object):
             self.pipe.add_addl_ner(ner, ner.config.general.name)
 
         # Add meta_annotation classes if they exist
-        for meta_cat in self._meta_cats:
-            self.pipe.add_meta_cat(meta_cat, meta_cat.config.general.category_name)
+        meta_cats: Sequence[Union[MetaCAT, MultiTaskMetaCAT]] = self._meta_cats
+        if self._group_meta_cats:
+            meta_cats = group_meta_cats(self._meta_cats)
+        for meta_cat in meta_cats:
+            if isinstance(meta_cat, MultiTaskMetaCAT):
+                self.pipe.add_meta_cat(meta_cat, "_".join(mc.config.general.category_name or mc.name
+                                                            for mc in meta_cat.meta_cats))
+            else:
+                self.pipe.add_meta_cat(meta_cat, meta_cat.config.general.category_name)
 
         for rel_cat in self._rel_cats:
             self.pipe.add_rel_cat(rel_cat, "_".join(list(rel_cat.config.general["labels2idx"].keys())))
@@ -147,6 +171,12 @@ class CAT(object):
         # Set max document length
         self.pipe.spacy_nlp.max_length = config.preprocessing.max_document_length
 
+    def _get_token_normalizer(self) -> Optional[TokenNormalizer]:
+        for _, comp in self.pipe.spacy_nlp.components:
+            if isinstance(comp, TokenNormalizer):
+                return comp
+        return None
+
     def get_hash(self, force_recalc: bool = False) -> str:
         """Will not be a deep hash but will try to catch all the changing parts during training.
 
@@ -228,7 +258,8 @@ class CAT(object):
             logger.warning("Please consider updating [description, performance, location, ontology] in cat.config.version")
 
     def create_model_pack(self, save_dir_path: str, model_pack_name: str = DEFAULT_MODEL_PACK_NAME, force_rehash: bool = False,
-            cdb_format: str = 'dill') -> str:
+            cdb_format: str = 'dill', compress: bool = True, pack_store_path: Optional[str] = None,
+            vocab_format: str = 'pickle') -> str:
         """Will crete a .zip file containing all the models in the current running instance
         of MedCAT. This is not the most efficient way, for sure, but good enough for now.
 
@@ -245,6 +276,19 @@ class CAT(object):
                 - dill
                 - json
                 Defaults to 'dill'
+            compress (bool):
+                Whether to compress the zip. If `False`, the zip is stored uncompressed
+                which makes its members readable in place. Defaults to `True`.
+            pack_store_path (Optional[str]):
+                If set, the model pack is also added to the (content-addressed) pack store
+                at this path so that files shared with other packs (e.g the spaCy model)
+                are only kept once. Defaults to None.
+            vocab_format (str):
+                The format of the saved Vocab in the model pack.
+                The available formats are:
+                - pickle
+                - binary (contiguous arrays, memory-mapped on load)
+                Defaults to 'pickle'
 
         Returns:
             str:
@@ -289,7 +333,20 @@ class CAT(object):
         vocab_path = os.path.join(save_dir_path, "vocab.dat")
         if self.vocab is not None:
             # We will allow creation of modelpacks without vocabs
-            self.vocab.save(vocab_path)
+            self.vocab.save(vocab_path, binary=vocab_format.lower() == 'binary')
+
+        # Save the spell checking lemma table, cached corrections and deletion index
+        token_normalizer = self._get_token_normalizer()
+        if token_normalizer is not None and self.config.general.spell_check:
+            token_normalizer.build_lemma_table(self.cdb.vocab)
+            token_normalizer.cache.save(os.path.join(save_dir_path, self.SPELL_CHECK_CACHE_FILE_NAME))
+            spell_checker = token_normalizer.spell_checker
+            index = spell_checker.get_index() or spell_checker.build_index()
+            index.save(os.path.join(save_dir_path, self.SPELL_CHECK_INDEX_FILE_NAME))
+
+        # Save the prepared names
+        if self.name_cache is not None:
+            self.name_cache.save(os.path.join(save_dir_path, self.PREPARED_NAMES_CACHE_FILE_NAME))
 
         # Save addl_ner
         for comp in self.pipe.spacy_nlp.components:
@@ -303,6 +360,10 @@ class CAT(object):
                 name = comp[0]
                 meta_path = os.path.join(save_dir_path, "meta_" + name)
                 comp[1].save(meta_path)
+            if isinstance(comp[1], MultiTaskMetaCAT):
+                for meta_cat in comp[1].meta_cats:
+                    meta_path = os.path.join(save_dir_path, "meta_" + (meta_cat.config.general.category_name or meta_cat.name))
+                    meta_cat.save(meta_path)
             if isinstance(comp[1], RelCAT):
                 name = comp[0]
                 rel_path = os.path.join(save_dir_path, "rel_" + name)
@@ -320,24 +381,43 @@ class CAT(object):
             json.dump(env_info, f)
 
         # Zip everything
-        shutil.make_archive(os.path.join(_save_dir_path, model_pack_name), 'zip', root_dir=save_dir_path)
+        if compress:
+            shutil.make_archive(os.path.join(_save_dir_path, model_pack_name), 'zip', root_dir=save_dir_path)
+        else:
+            write_stored_archive(save_dir_path, os.path.join(_save_dir_path, model_pack_name + '.zip'))
+
+        if pack_store_path is not None:
+            PackStore(pack_store_path).add(save_dir_path, model_pack_name)
 
         # Log model card and return new name
         logger.info(self.get_model_card()) # Print the model card
         return model_pack_name
 
     @classmethod
-    def attempt_unpack(cls, zip_path: str) -> str:
+    def attempt_unpack(cls, zip_path: str, pack_store_path: Optional[str] = None) -> str:
         """Attempt unpack the zip to a folder and get the model pack path.
 
         If the folder already exists, no unpacking is done.
 
+        If a pack store path is specified, the model pack is instead added to
+        the (content-addressed) pack store (unless the same zip is already there)
+        and the model pack folder within the store is used. That way files shared
+        between model packs (e.g the spaCy model) are only kept once.
+
         Args:
             zip_path (str): The ZIP path
+            pack_store_path (Optional[str]): The path to the pack store. Defaults to None.
 
         Returns:
             str: The model pack path
         """
+        if pack_store_path is not None:
+            store = PackStore(pack_store_path)
+            pack_name = os.path.basename(os.path.normpath(zip_path)).replace(".zip", '')
+            if not store.is_up_to_date(pack_name, zip_path):
+                logger.info("Adding the model pack to the pack store at: %s", store.root)
+                store.add(zip_path, pack_name)
+            return store.materialise(pack_name)
         base_dir = os.path.dirname(zip_path)
         filename = os.path.basename(zip_path)
 
@@ -359,7 +439,9 @@ class CAT(object):
                         medcat_config_dict: Optional[Dict] = None,
                         load_meta_models: bool = True,
                         load_addl_ner: bool = True,
-                        load_rel_models: bool = True) -> "CAT":
+                        load_rel_models: bool = True,
+                        pack_store_path: Optional[str] = None,
+                        group_meta_cats: bool = False) -> "CAT":
         """Load everything within the 'model pack', i.e. the CDB, config, vocab and any MetaCAT models
         (if present)
 
@@ -384,6 +466,12 @@ class CAT(object):
                 Whether to load additional NER models if present (Default value True).
             load_rel_models (bool):
                 Whether to load RelCAT models if present (Default value True).
+            pack_store_path (Optional[str]):
+                If set, the model pack is loaded through the (content-addressed) pack store
+                at this path rather than being extracted next to the zip. Defaults to None.
+            group_meta_cats (bool):
+                Whether to run the MetaCAT models that use the same (frozen) BERT model and
+                context window together, running the encoder only once (Default value False).
 
         Returns:
             CAT: The resulting CAT object.
@@ -393,7 +481,7 @@ class CAT(object):
         from medcat.meta_cat import MetaCAT
         from medcat.rel_cat import RelCAT
 
-        model_pack_path = cls.attempt_unpack(zip_path)
+        model_pack_path = cls.attempt_unpack(zip_path, pack_store_path)
 
         # Load the CDB
         cdb: CDB = cls.load_cdb(model_pack_path)
@@ -433,7 +521,21 @@ class CAT(object):
         for rel_path in rel_paths:
             rel_cats.append(RelCAT.load(load_path=rel_path))
 
-        cat = cls(cdb=cdb, config=cdb.config, vocab=vocab, meta_cats=meta_cats, addl_ner=addl_ner, rel_cats=rel_cats)
+        cat = cls(cdb=cdb, config=cdb.config, vocab=vocab, meta_cats=meta_cats, addl_ner=addl_ner, rel_cats=rel_cats,
+                  group_meta_cats=group_meta_cats)
+
+        # Load the spell checking lemma table and cached corrections
+        spell_check_path = os.path.join(model_pack_path, cls.SPELL_CHECK_CACHE_FILE_NAME)
+        token_normalizer = cat._get_token_normalizer()
+        if token_normalizer is not None and os.path.exists(spell_check_path):
+            token_normalizer.cache = SpellCorrectionCache.load(spell_check_path)
+            token_normalizer.cache.max_corrections = cdb.config.general.spell_check_cache_size
+        spell_check_index_path = os.path.join(model_pack_path, cls.SPELL_CHECK_INDEX_FILE_NAME)
+        if token_normalizer is not None and os.path.exists(spell_check_index_path):
+            token_normalizer.spell_checker.index = DeletionIndex.load(spell_check_index_path)
+        prepared_names_path = os.path.join(model_pack_path, cls.PREPARED_NAMES_CACHE_FILE_NAME)
+        if os.path.exists(prepared_names_path):
+            cat.name_cache = PreparedNameCache.load(prepared_names_path)
         logger.info(cat.get_model_card())  # Print the model card
 
         return cat
@@ -660,6 +762,8 @@ class CAT(object):
                 logger.info("DONE: %s", str(latest_trained_step))
             if checkpoint is not None and checkpoint.steps is not None and latest_trained_step % checkpoint.steps == 0:
                 checkpoint.save(cdb=self.cdb, count=latest_trained_step)
+        if checkpoint is not None:
+            checkpoint.close()
 
         self.config.linking.train = _prev_train
 
@@ -703,7 +807,7 @@ class CAT(object):
         if preprocessed_name:
             names = {name: {'nothing': 'nothing'}}
         else:
-            names = prepare_name(name, self.pipe.spacy_nlp, {}, self.config)
+            names = self._prepare_name(name)
 
         # If full unlink find all CUIs
         if self.config.general.full_unlink:
@@ -717,6 +821,50 @@ class CAT(object):
         for c in cuis:
             self.cdb._remove_names(cui=c, names=names.keys())
 
+    def _prepare_name(self, name: str) -> Dict:
+        # Prepare the name using (and updating) the cache of prepared names, if there is one
+        if self.name_cache is not None:
+            self.name_cache.check_settings(self.pipe.spacy_nlp, self.config)
+        return prepare_name(name, self.pipe.spacy_nlp, {}, self.config, cache=self.name_cache)
+
+    def unlink_concept_names(self, cui_name_pairs: Iterable[Tuple[str, str]], preprocessed_name: bool = False) -> None:
+        """Unlink multiple concept names from their CUIs (see `unlink_concept_name`).
+
+        Each distinct name is only prepared once and all the names of
+        a CUI are removed from the CDB in one go.
+
+        Args:
+            cui_name_pairs (Iterable[Tuple[str, str]]):
+                The (CUI, name) pairs to unlink.
+            preprocessed_name (bool):
+                Whether the names being used are preprocessed.
+
+        Examples:
+
+            >>> cat.unlink_concept_names([('C0020538', 'htn'), ('C0011849', 'dm')])
+        """
+        prepared: Dict[str, Set[str]] = {}
+        cui2names: Dict[str, Set[str]] = {}
+        for cui, name in cui_name_pairs:
+            if name not in prepared:
+                if preprocessed_name:
+                    prepared[name] = {name}
+                else:
+                    prepared[name] = set(self._prepare_name(name).keys())
+            names = prepared[name]
+            cui2names.setdefault(cui, set()).update(names)
+            # If full unlink find all CUIs
+            if self.config.general.full_unlink:
+                for n in names:
+                    for c in self.cdb.name2cuis.get(n, []):
+                        cui2names.setdefault(c, set()).add(n)
+        if self.config.general.full_unlink:
+            logger.warning("In the config `full_unlink` is set to `True`. "
+                           "Thus removing all CUIs linked to the specified names")
+
+        for cui, names in cui2names.items():
+            self.cdb._remove_names(cui=cui, names=names)
+
     def add_and_train_concept(self,
                               cui: str,
                               name: str,
@@ -763,7 +911,7 @@ class CAT(object):
             do_add_concept (bool):
                 Whether to add concept to CDB.
         """
-        names = prepare_name(name, self.pipe.spacy_nlp, {}, self.config)
+        names = self._prepare_name(name)
         if not names and cui not in self.cdb.cui2preferred_name and name_status == 'P':
             logger.warning("No names were able to be prepared in CAT.add_and_train_concept "
                            "method. As such no preferred name will be able to be specifeid. "
@@ -1081,6 +1229,8 @@ class CAT(object):
                                                                                use_overlaps=use_overlaps,
                                                                                use_groups=use_groups,
                                                                                extra_cui_filter=extra_cui_filter)
+        if checkpoint is not None:
+            checkpoint.close()
 
         # reset the state of filters
         self.config.linking.filters = orig_filters
@@ -1091,10 +1241,39 @@ class CAT(object):
                      text: str,
                      only_cui: bool = False,
                      addl_info: List[str] = ['cui2icd10', 'cui2ontologies', 'cui2snomed']) -> Dict:
+        if text is not None and len(self._get_chunk_spans(text)) > 1:
+            return self._get_entities_chunked(text, only_cui, addl_info)
         doc = self(text)
         out = self._doc_to_out(doc, only_cui, addl_info)  # type: ignore
         return out
 
+    def _get_chunk_spans(self, text: str) -> List[Tuple[int, int]]:
+        """Get the chunks a text should be processed in (see `config.preprocessing.long_document_mode`).
+
+        Args:
+            text (str): The text.
+
+        Returns:
+            List[Tuple[int, int]]: The start and end of the chunks (a single one unless it is a long document).
+        """
+        cnf_p = self.config.preprocessing
+        chunk_size = min(cnf_p.long_document_chunk_size, cnf_p.max_document_length)
+        if not cnf_p.long_document_mode or len(text) <= chunk_size:
+            return [(0, len(text))]
+        return get_chunk_spans(text, chunk_size, cnf_p.long_document_chunk_overlap)
+
+    def _get_entities_chunked(self, text: str, only_cui: bool, addl_info: List[str]) -> Dict:
+        # Process the chunks one by one, so only one of them is in memory at a time
+        self.config.linking.train = False
+        spans = self._get_chunk_spans(text)
+        logger.debug("Processing a document of %d characters in %d chunks", len(text), len(spans))
+        outs = [self._doc_to_out(self.pipe(text[start:end]), False, addl_info)  # type: ignore
+                for start, end in spans]
+        out = merge_chunk_outputs(outs, spans, text, only_cui)
+        if self.config.general.usage_monitor.enabled:
+            self.usage_monitor.log_inference(len(text), len(text), len(out['entities']))
+        return out
+
     def get_entities_multi_texts(self,
                                  texts: Union[Iterable[str], Iterable[Tuple]],
                                  only_cui: bool = False,
@@ -1122,7 +1301,7 @@ class CAT(object):
         if n_process is None:
             texts_ = self._generate_trimmed_texts(texts)
             for text in texts_:
-                out.append(self._doc_to_out(self(text), only_cui, addl_info))  # type: ignore
+                out.append(self.get_entities(text, only_cui, addl_info))
         else:
             self.pipe.set_error_handler(self._pipe_error_handler)
             try:
@@ -1136,30 +1315,35 @@ class CAT(object):
                             l1 = len(orig_text)
                             l2 = len(trimmed_text)
                         input_lengths.append((l1, l2))
-                docs = self.pipe.batch_multi_process(texts_, n_process, batch_size)
-
-                for doc_nr, doc in tqdm(enumerate(docs), total=len(texts_)):
+                # Long documents are split into chunks (see config.preprocessing.long_document_mode),
+                # which are processed in parallel, like the other texts
+                text_spans = [self._get_chunk_spans(text) for text in texts_]
+                chunks = [text[start:end] for text, spans in zip(texts_, text_spans) for start, end in spans]
+                docs = self.pipe.batch_multi_process(chunks, n_process, batch_size)
+
+                chunk_outs: List[Dict] = []
+                for doc in tqdm(docs, total=len(chunks)):
                     doc = None if doc.text.strip() == '' else doc
-                    out.append(self._doc_to_out(doc, only_cui, addl_info, out_with_text=True))
-                    if self.config.general.usage_monitor.enabled:
-                        l1, l2 = input_lengths[doc_nr]
-                        if doc is None:
-                            nents = 0
-                        elif self.config.general.show_nested_entities:
-                            nents = len(doc._.ents)  # type: ignore
-                        else:
-                            nents = len(doc.ents)  # type: ignore
-                        self.usage_monitor.log_inference(l1, l2, nents)
+                    # The full output is needed to merge the chunks, only_cui is applied by merge_chunk_outputs
+                    chunk_outs.append(self._doc_to_out(doc, False, addl_info, out_with_text=True))
 
                 # Currently spaCy cannot mark which pieces of texts failed within the pipe so be this workaround,
                 # which also assumes texts are different from each others.
-                if len(out) < len(texts_):
+                if len(chunk_outs) < len(chunks):
                     logger.warning("Found at least one failed batch and set output for enclosed texts to empty")
-                    for i, text in enumerate(texts_):
-                        if i == len(out):
-                            out.append(self._doc_to_out(None, only_cui, addl_info))  # type: ignore
-                        elif out[i].get('text', '') != text:
-                            out.insert(i, self._doc_to_out(None, only_cui, addl_info))  # type: ignore
+                    for i, text in enumerate(chunks):
+                        if i == len(chunk_outs):
+                            chunk_outs.append(self._doc_to_out(None, False, addl_info))  # type: ignore
+                        elif chunk_outs[i].get('text', '') != text:
+                            chunk_outs.insert(i, self._doc_to_out(None, False, addl_info))  # type: ignore
+
+                chunk_nr = 0
+                for text_nr, (text, spans) in enumerate(zip(texts_, text_spans)):
+                    out.append(merge_chunk_outputs(chunk_outs[chunk_nr:chunk_nr + len(spans)], spans, text, only_cui))
+                    chunk_nr += len(spans)
+                    if self.config.general.usage_monitor.enabled:
+                        l1, l2 = input_lengths[text_nr]
+                        self.usage_monitor.log_inference(l1, l2, len(out[-1]['entities']))
 
                 cnf_annotation_output = getattr(self.config, 'annotation_output', {})
                 if not (cnf_annotation_output.get('include_text_in_output', False)):
@@ -1221,7 +1405,7 @@ class CAT(object):
         # Loop though the models and check are there GPU devices
         nn_components = []
         for component in self.pipe.spacy_nlp.components:
-            if isinstance(component[1], MetaCAT) or isinstance(component[1], TransformersNER):
+            if isinstance(component[1], (MetaCAT, MultiTaskMetaCAT)) or isinstance(component[1], TransformersNER):
                 self.pipe.spacy_nlp.disable_pipe(component[0])
                 nn_components.append(component)
 
@@ -1241,7 +1425,7 @@ class CAT(object):
             component.config.general['disable_component_lock'] = True
 
         # For meta_cat components
-        for name, component in [c for c in nn_components if isinstance(c[1], MetaCAT)]:
+        for name, component in [c for c in nn_components if isinstance(c[1], (MetaCAT, MultiTaskMetaCAT))]:
             spacy_docs = component.pipe(spacy_docs)
         for spacy_doc in spacy_docs:
             for ent in spacy_doc.ents:
@@ -1765,21 +1949,39 @@ class CAT(object):
                 out['text'] = doc.text
         return out
 
-    def _get_trimmed_text(self, text: Optional[str]) -> str:
-        return text[0:self.config.preprocessing.max_document_length] if text is not None and len(text) > 0 else ""
+    def _get_trimmed_text(self, text: Optional[str], allow_long: bool = False) -> str:
+        """Trim the text to `config.preprocessing.max_document_length`.
+
+        Args:
+            text (Optional[str]): The text.
+            allow_long (bool): Whether the text can be longer (i.e will be processed in chunks)
+                if `config.preprocessing.long_document_mode` is enabled. Defaults to False.
+
+        Returns:
+            str: The (trimmed) text.
+        """
+        if text is None or len(text) == 0:
+            return ""
+        max_document_length = self.config.preprocessing.max_document_length
+        if len(text) <= max_document_length or (allow_long and self.config.preprocessing.long_document_mode):
+            return text
+        logger.warning("Trimming a document of %d characters to %d characters (config.preprocessing.max_document_length). "
+                       "Enable config.preprocessing.long_document_mode and use CAT.get_entities "
+                       "to process the whole document", len(text), max_document_length)
+        return text[0:max_document_length]
 
     def _generate_trimmed_texts(self, texts: Union[Iterable[str], Iterable[Tuple]]) -> Iterable[str]:
         text_: str
         for text in texts:
             text_ = text[1] if isinstance(text, tuple) else text
-            yield self._get_trimmed_text(text_)
+            yield self._get_trimmed_text(text_, allow_long=True)
 
     def _get_trimmed_texts(self, texts: Union[Iterable[str], Iterable[Tuple]]) -> List[str]:
         trimmed: List = []
         text_: str
         for text in texts:
             text_ = text[1] if isinstance(text, tuple) else text
-            trimmed.append(self._get_trimmed_text(text_))
+            trimmed.append(self._get_trimmed_text(text_, allow_long=True))
         return trimmed
 
     @staticmethod
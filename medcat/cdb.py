@@ -6,6 +6,7 @@ import logging
 import aiofiles
 import numpy as np
 from typing import Dict, Set, Optional, List, Union, cast, Iterable
+from collections.abc import MutableSet
 import os
 
 from medcat import __version__
@@ -23,6 +24,15 @@ from medcat.utils.config_utils import fix_waf_lambda, attempt_fix_weighted_avera
 logger = logging.getLogger(__name__)
 
 
+def _subset_map(d: Dict, keys_to_keep: Set) -> Dict:
+    # when most of a (plain) dict is kept, deleting the rest in place avoids building a copy
+    if type(d) is dict and 2 * len(keys_to_keep) >= len(d):
+        for key in [key for key in d if key not in keys_to_keep]:
+            del d[key]
+        return d
+    return dict((key, d[key]) for key in keys_to_keep)
+
+
 class CDB(object):
     """Concept DataBase - holds all information necessary for NER+L.
 
@@ -98,6 +108,8 @@ class CDB(object):
                 # Can be extended with whatever is necessary
                 }
         self.vocab: Dict = {} # Vocabulary of all words ever in our cdb
+        # changes whenever words are added to (or removed from) the vocab
+        self._vocab_version = 0
         self._optim_params = None
         self.is_dirty = False
         self._init_waf_from_config()
@@ -190,37 +202,58 @@ class CDB(object):
             cui (str):
                 Concept ID or unique identifier in this database.
         """
-        if cui in self.cui2names:
-            del self.cui2names[cui]
-        if cui in self.cui2snames:
-            del self.cui2snames[cui]
-        if cui in self.cui2context_vectors:
-            del self.cui2context_vectors[cui]
-        if cui in self.cui2count_train:
-            del self.cui2count_train[cui]
-        if cui in self.cui2tags:
-            del self.cui2tags[cui]
-        if cui in self.cui2type_ids:
-            del self.cui2type_ids[cui]
-        if cui in self.cui2preferred_name:
-            del self.cui2preferred_name[cui]
-        if cui in self.cui2average_confidence:
-            del self.cui2average_confidence[cui]
-        for name, cuis in self.name2cuis.items():
-            if cui in cuis:
-                cuis.remove(cui)
-        for name, cuis2status in self.name2cuis2status.items():
-            if cui in cuis2status:
-                del cuis2status[cui]
-        if isinstance(self.snames, set):
+        self.remove_cuis([cui])
+
+    def remove_cuis(self, cuis: Iterable[str]) -> None:
+        """Remove multiple CUIs from all the internal objects that reference them.
+
+        Only the names of the removed CUIs (found through `cui2names`) are updated.
+        The subnames (`snames`) of the removed CUIs are only dropped if no
+        remaining CUI still uses them (i.e their reference count drops to 0).
+
+        Args:
+            cuis (Iterable[str]):
+                Concept IDs or unique identifiers in this database.
+        """
+        cuis = set(cuis)
+        affected_names: Set[str] = set()
+        removed_snames: Set[str] = set()
+        for cui in cuis:
+            affected_names.update(self.cui2names.get(cui, ()))
+            removed_snames.update(self.cui2snames.get(cui, ()))
+            for cui2x in (self.cui2names, self.cui2snames, self.cui2context_vectors, self.cui2count_train,
+                          self.cui2tags, self.cui2type_ids, self.cui2preferred_name, self.cui2average_confidence):
+                cui2x.pop(cui, None)
+        for name in affected_names:
+            if name in self.name2cuis:
+                remaining = [cui for cui in self.name2cuis[name] if cui not in cuis]
+                self.name2cuis[name] = remaining
+                self.name2count_train[name] = len(remaining)
+            if name in self.name2cuis2status:
+                cuis2status = self.name2cuis2status[name]
+                for cui in cuis.intersection(cuis2status):
+                    del cuis2status[cui]
+        self._discard_unused_snames(removed_snames)
+        self.is_dirty = True
+
+    def _discard_unused_snames(self, snames: Set[str]) -> None:
+        """Remove the specified subnames from `snames` unless a CUI still uses them.
+
+        Args:
+            snames (Set[str]):
+                The subnames that may no longer be used.
+        """
+        if isinstance(self.snames, MutableSet) and snames:
             # if this is a memory optimised CDB, this won't be a set
             # but it also won't need to be changed since it
             # relies directly on cui2snames
-            self.snames = set()
-            for cuis in self.cui2snames.values():
-                self.snames |= cuis
-        self.name2count_train = {name: len(cuis) for name, cuis in self.name2cuis.items()}
-        self.is_dirty = True
+            sname_refs = dict.fromkeys(snames, 0)
+            for cui_snames in self.cui2snames.values():
+                for sname in snames.intersection(cui_snames):
+                    sname_refs[sname] += 1
+            for sname, nr_of_refs in sname_refs.items():
+                if nr_of_refs == 0:
+                    self.snames.discard(sname)
 
     def add_names(self, cui: str, names: Dict[str, Dict], name_status: str = 'A', full_build: bool = False) -> None:
         """Adds a name to an existing concept.
@@ -337,6 +370,7 @@ class CDB(object):
                     self.vocab[token] += 1
                 else:
                     self.vocab[token] = 1
+                    self._vocab_version += 1
 
         # Check is this a preferred name for the concept, this takes the name_info
         #dict which must have a value (but still have to check it, just in case).
@@ -385,6 +419,14 @@ class CDB(object):
                     self.addl_info['type_id2cuis'][type_id] = {cui}
         self.is_dirty = True
 
+    def get_vocab_version(self) -> int:
+        """Get the version of the vocab, which changes whenever words are added to or removed from it.
+
+        Returns:
+            int: The version of the vocab.
+        """
+        return self._vocab_version
+
     def add_addl_info(self, name: str, data: Dict, reset_existing: bool = False) -> None:
         """Add data to the addl_info dictionary. This is done in a function to
         not directly access the addl_info dictionary.
@@ -668,6 +710,9 @@ class CDB(object):
         This is because the dicts being involved will be rewritten.
         However, the memory optimisation can be performed again afterwards.
 
+        The per-concept and per-name data is never copied. And when most of a map is
+        kept, the rest is removed in place rather than copying the map.
+
         Args:
             cuis_to_keep (Union[List[str], Set[str]]):
                 CUIs that will be kept, the rest will be removed (not completely, look above).
@@ -691,48 +736,25 @@ class CDB(object):
         for name in names_to_keep:
             all_cuis_to_keep.update(self.name2cuis.get(name, []))
 
-        new_name2cuis = {}
-        new_name2cuis2status = {}
-        new_cui2names = {}
-        new_cui2snames = {}
-        new_cui2context_vectors = {}
-        new_cui2count_train = {}
-        new_cui2tags = {} # Used to add custom tags to CUIs
-        new_cui2type_ids = {}
-        new_cui2preferred_name = {}
-
         # Subset cui2<whatever>
-        for cui in all_cuis_to_keep:
-            if cui in self.cui2names:
-                new_cui2names[cui] = self.cui2names[cui]
-                new_cui2snames[cui] = self.cui2snames[cui]
-                if cui in self.cui2context_vectors:
-                    new_cui2context_vectors[cui] = self.cui2context_vectors[cui]
-                    # We assume that it must have the cui2count_train if it has a vector
-                    new_cui2count_train[cui] = self.cui2count_train[cui]
-                if cui in self.cui2tags:
-                    new_cui2tags[cui] = self.cui2tags[cui]
-                new_cui2type_ids[cui] = self.cui2type_ids[cui]
-                if cui in self.cui2preferred_name:
-                    new_cui2preferred_name[cui] = self.cui2preferred_name[cui]
+        cuis = set(cui for cui in all_cuis_to_keep if cui in self.cui2names)
+        vector_cuis = set(cui for cui in cuis if cui in self.cui2context_vectors)
+        self.cui2names = _subset_map(self.cui2names, cuis)
+        self.cui2snames = _subset_map(self.cui2snames, cuis)
+        self.cui2type_ids = _subset_map(self.cui2type_ids, cuis)
+        self.cui2context_vectors = _subset_map(self.cui2context_vectors, vector_cuis)
+        # We assume that it must have the cui2count_train if it has a vector
+        self.cui2count_train = _subset_map(self.cui2count_train,
+                                           set(cui for cui in vector_cuis if cui in self.cui2count_train))
+        self.cui2tags = _subset_map(self.cui2tags, set(cui for cui in cuis if cui in self.cui2tags))
+        self.cui2preferred_name = _subset_map(self.cui2preferred_name,
+                                              set(cui for cui in cuis if cui in self.cui2preferred_name))
 
         # Subset name2<whatever>
-        for name in names_to_keep:
-            if name in self.name2cuis:
-                new_name2cuis[name] = self.name2cuis[name]
-                new_name2cuis2status[name] = self.name2cuis2status[name]
-
-        # Replace everything
-        self.name2cuis = new_name2cuis
+        names = set(name for name in names_to_keep if name in self.name2cuis)
+        self.name2cuis = _subset_map(self.name2cuis, names)
+        self.name2cuis2status = _subset_map(self.name2cuis2status, names)
         self.snames = snames_to_keep
-        self.name2cuis2status = new_name2cuis2status
-        self.cui2names = new_cui2names
-        self.cui2snames = new_cui2snames
-        self.cui2context_vectors = new_cui2context_vectors
-        self.cui2count_train = new_cui2count_train
-        self.cui2tags = new_cui2tags
-        self.cui2type_ids = new_cui2type_ids
-        self.cui2preferred_name = new_cui2preferred_name
         self.is_dirty = True
         # reset memory optimisation state
         self._memory_optimised_parts.clear()
@@ -904,10 +926,11 @@ or download the compatible model."""
         for k,v in self.__dict__.items():
             if k in ['cui2countext_vectors', 'name2cuis']:
                 hasher.update(v, length=False)
-            elif k in ['_hash', 'is_dirty', '_config_hash']:
+            elif k in ['_hash', 'is_dirty', '_config_hash', '_vocab_version']:
                 # ignore _hash since if it previously didn't exist, the
                 # new hash would be different when the value does exist
                 # and ignore is_dirty so that we get the same hash as previously
+                # (the vocab version only keeps track of the changes to the vocab)
                 continue
             elif k != 'config':
                 hasher.update(v, length=True)
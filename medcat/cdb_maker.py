@@ -1,23 +1,68 @@
 import pandas as pd
 import numpy as np
 import datetime
+import hashlib
 import logging
+import os
 import re
-from typing import Optional, List, Dict, Union, Any
+import time
+from typing import Optional, List, Dict, Union, Any, NamedTuple, Set, Tuple, cast
 
 from medcat.pipe import Pipe
 from medcat.cdb import CDB
 from medcat.config import Config
 from medcat.preprocessing.tokenizers import spacy_split_all
-from medcat.preprocessing.cleaners import prepare_name
+from medcat.preprocessing.cleaners import prepare_name, get_name_versions, add_name_versions
+from medcat.preprocessing.name_cache import PreparedNameCache
 from medcat.preprocessing.taggers import tag_skip_and_punct
+from medcat.utils.cdb_utils import update_cdb
 
 PH_REMOVE = re.compile("(\s)\([a-zA-Z]+[^\)\(]*\)($)")
+NAME_STATUS_OPTIONS = {'A', 'P', 'N'}
+# The number of rows whose names are prepared at once in the batched mode
+BATCHED_BLOCK_SIZE = 100_000
 
 
 logger = logging.getLogger(__name__)
 
 
+def _read_csv(csv_path: Union[str, pd.DataFrame], sep: str = ',', encoding: Optional[str] = None,
+              escapechar: Optional[str] = None, index_col: bool = False, **kwargs: Any) -> pd.DataFrame:
+    # Read CSV, everything is converted to strings
+    if isinstance(csv_path, str):
+        logger.info("Started importing concepts from: {}".format(csv_path))
+        df = pd.pandas.read_csv(csv_path, sep=sep, encoding=encoding, escapechar=escapechar, index_col=index_col, dtype=str, **kwargs)
+    else:
+        # Not very clear, but csv_path can be a pre-loaded csv
+        df = csv_path
+    return df.fillna('')
+
+
+def _get_columns(df: pd.DataFrame) -> Tuple[List, Dict[str, int]]:
+    # Find which columns to use from the CSV
+    useful_columns = ['cui', 'name', 'ontologies', 'name_status', 'type_ids', 'description']
+    cols: List = []
+    col2ind = {}
+    for col in list(df.columns):
+        if str(col).lower().strip() in useful_columns:
+            col2ind[str(col).lower().strip()] = len(cols)
+            cols.append(col)
+    return cols, col2ind
+
+
+def _hash_int(text: str) -> int:
+    return int.from_bytes(hashlib.blake2b(text.encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+class _RowConcept(NamedTuple):
+    cui: str
+    ontologies: Set[str]
+    name_status: str
+    type_ids: Set[str]
+    description: str
+    raw_names: List[str]
+
+
 class CDBMaker(object):
     """Given a CSV as shown in https://github.com/CogStack/MedCAT/tree/master/examples/<example> it creates a CDB or
     updates an existing one.
@@ -28,9 +73,14 @@ class CDBMaker(object):
         cdb (medcat.cdb.CDB):
             If set the `CDBMaker` will update the existing `CDB` with
             new concepts in the CSV (Default value `None`).
+        name_cache (Optional[PreparedNameCache]):
+            The cache of prepared names. If not set and `config.cdb_maker.prepared_names_cache_path`
+            is set, it is loaded from (if that exists) or created for that path. Otherwise no names are
+            cached (Default value `None`).
     """
 
-    def __init__(self, config: Config, cdb: Optional[CDB] = None) -> None:
+    def __init__(self, config: Config, cdb: Optional[CDB] = None,
+                 name_cache: Optional[PreparedNameCache] = None) -> None:
         self.config = config
         # Set log level
         logger.setLevel(self.config.general['log_level'])
@@ -49,6 +99,13 @@ class CDBMaker(object):
                              name='skip_and_punct',
                              additional_fields=['is_punct'])
 
+        if name_cache is None:
+            # The cache holds the tokens of every name it has seen, so only keep one if it is saved
+            cache_path = self.cnf_cm.prepared_names_cache_path
+            if cache_path is not None:
+                name_cache = PreparedNameCache.load(cache_path) if os.path.exists(cache_path) else PreparedNameCache()
+        self.name_cache = name_cache
+
     def reset_cdb(self) -> None:
         """This will re-create a new internal CDB based on the same config.
 
@@ -64,7 +121,9 @@ class CDBMaker(object):
                      escapechar: Optional[str] = None,
                      index_col: bool = False,
                      full_build: bool = False,
-                     only_existing_cuis: bool = False, **kwargs: Any) -> CDB:
+                     only_existing_cuis: bool = False,
+                     n_process: Optional[int] = None,
+                     batch_size: int = 1000, **kwargs: Any) -> CDB:
         r"""Compile one or multiple CSVs into a CDB.
 
         Note: This class/method generally uses the same instance of the CDB.
@@ -92,6 +151,12 @@ class CDBMaker(object):
             only_existing_cuis (bool):
                 If True no new CUIs will be added, but only linked names will be extended. Mainly used when
                 enriching names of a CDB (e.g. SNOMED with UMLS terms) (Default value `False`).
+            n_process (Optional[int]):
+                If set, the (de-duplicated) names are processed in batches with the spacy pipeline using this
+                many processes. The concepts are then added to the CDB in the same order (and with the same result)
+                as without it (Default value `None`).
+            batch_size (int):
+                The number of names in a batch if `n_process` is set (Default value 1000).
             kwargs (Any):
                 Will be passed to pandas for CSV reading
 
@@ -105,26 +170,17 @@ class CDBMaker(object):
             CDB: CDB with the new concepts added.
         """
 
-        useful_columns = ['cui', 'name', 'ontologies', 'name_status', 'type_ids', 'description']
-        name_status_options = {'A', 'P', 'N'}
+        if self.name_cache is not None:
+            self.name_cache.check_settings(self.pipe.spacy_nlp, self.config)
+        self._row_hash_seed = self._get_row_hash_seed(full_build)
 
         for csv_path in csv_paths:
-            # Read CSV, everything is converted to strings
-            if isinstance(csv_path, str):
-                logger.info("Started importing concepts from: {}".format(csv_path))
-                df = pd.pandas.read_csv(csv_path, sep=sep, encoding=encoding, escapechar=escapechar, index_col=index_col, dtype=str, **kwargs)
-            else:
-                # Not very clear, but csv_path can be a pre-loaded csv
-                df = csv_path
-            df = df.fillna('')
-
-            # Find which columns to use from the CSV
-            cols: List = []
-            col2ind = {}
-            for col in list(df.columns):
-                if str(col).lower().strip() in useful_columns:
-                    col2ind[str(col).lower().strip()] = len(cols)
-                    cols.append(col)
+            df = _read_csv(csv_path, sep=sep, encoding=encoding, escapechar=escapechar, index_col=index_col, **kwargs)
+            cols, col2ind = _get_columns(df)
+
+            if n_process is not None:
+                self._prepare_rows_batched(df[cols].values, col2ind, full_build, only_existing_cuis, n_process, batch_size)
+                continue
 
             _time = None # Used to check speed
             _logging_freq = np.ceil(len(df[cols]) / 100)
@@ -147,56 +203,229 @@ class CDBMaker(object):
                 cui = row[col2ind['cui']].strip().upper()
 
                 if not only_existing_cuis or (only_existing_cuis and cui in self.cdb.cui2names):
-                    if 'ontologies' in col2ind:
-                        ontologies = set([ontology.strip() for ontology in row[col2ind['ontologies']].upper().split(self.cnf_cm['multi_separator']) if
-                                         len(ontology.strip()) > 0])
-                    else:
-                        ontologies = set()
-
-                    if 'name_status' in col2ind:
-                        name_status = row[col2ind['name_status']].strip().upper()
-
-                        # Must be allowed
-                        if name_status not in name_status_options:
-                            name_status = 'A'
-                    else:
-                        # Defaults to A - meaning automatic
-                        name_status = 'A'
-
-                    if 'type_ids' in col2ind:
-                        type_ids = set([type_id.strip() for type_id in row[col2ind['type_ids']].upper().split(self.cnf_cm['multi_separator']) if
-                                        len(type_id.strip()) > 0])
-                    else:
-                        type_ids = set()
-
-                    # Get the ones that do not need any changing
-                    if 'description' in col2ind:
-                        description = row[col2ind['description']].strip()
-                    else:
-                        description = ""
+                    concept = self._parse_row(cui, row, col2ind)
 
                     # We can have multiple versions of a name
                     names: Dict = {} # {'name': {'tokens': [<str>], 'snames': [<str>]}}
+                    for raw_name in concept.raw_names:
+                        prepare_name(raw_name, self.pipe.spacy_nlp, names, self.config, cache=self.name_cache)
+
+                    self._add_concept(concept, names, full_build)
 
-                    raw_names = [raw_name.strip() for raw_name in row[col2ind['name']].split(self.cnf_cm['multi_separator']) if
-                                 len(raw_name.strip()) > 0]
-                    for raw_name in raw_names:
-                        raw_name = raw_name.strip()
-                        prepare_name(raw_name, self.pipe.spacy_nlp, names, self.config)
+        cache_path = self.cnf_cm.prepared_names_cache_path
+        if cache_path is not None and self.name_cache is not None:
+            logger.info("Saving %d prepared names to: %s", len(self.name_cache), cache_path)
+            self.name_cache.save(cache_path)
 
-                        if self.config.cdb_maker.get('remove_parenthesis', 0) > 0 and name_status == 'P':
-                            # Should we remove the content in parenthesis from primary names and add them also
-                            raw_name = PH_REMOVE.sub(" ", raw_name).strip()
-                            if len(raw_name) >= self.config.cdb_maker['remove_parenthesis']:
-                                prepare_name(raw_name, self.pipe.spacy_nlp, names, self.config)
+        return self.cdb
+
+    def update_cdb(self,
+                   csv_paths: Union[pd.DataFrame, List[str]],
+                   full_build: bool = False,
+                   remove_missing_cuis: bool = True,
+                   n_process: Optional[int] = None,
+                   batch_size: int = 1000,
+                   prev_cdb: Optional[CDB] = None,
+                   sep: str = ',',
+                   encoding: Optional[str] = None,
+                   escapechar: Optional[str] = None,
+                   index_col: bool = False, **kwargs: Any) -> CDB:
+        """Update the (trained) CDB to match the concepts in the CSVs, e.g a new release of an ontology.
+
+        Instead of rebuilding the CDB from scratch and merging the training back in,
+        the concepts in the CSVs are compared with the ones in the CDB and only the
+        added, changed and removed concepts are updated (see `medcat.utils.cdb_utils.update_cdb`).
+        The training of the concepts that are kept is preserved.
+
+        The CDBs built by the `CDBMaker` keep a hash of the rows of each concept
+        (`cdb.addl_info['cui2row_hash']`). The concepts whose rows are the same as in the
+        previous release are kept as they are, so only the rows of the new and changed
+        concepts are prepared. Of those, only the names that are not in the cache of
+        prepared names (see `PreparedNameCache`) are run through the spacy pipeline.
+
+        Args:
+            csv_paths (Union[pd.DataFrame, List[str]]):
+                An array of paths to the csv files (or pd.DataFrames) with all the concepts of the new release.
+            full_build (bool):
+                Whether to also update the additional information of the concepts (Default value False).
+            remove_missing_cuis (bool):
+                Whether to remove the concepts that are not in the CSVs (Default value True).
+            n_process (Optional[int]):
+                See `prepare_csvs` (Default value `None`).
+            batch_size (int):
+                See `prepare_csvs` (Default value 1000).
+            prev_cdb (Optional[CDB]):
+                The build of the previous release, so that the names learned through
+                training are kept (see `medcat.utils.cdb_utils.update_cdb`) (Default value `None`).
+            sep (str):
+                See `prepare_csvs` (Default value ',').
+            encoding (Optional[str]):
+                See `prepare_csvs` (Default value `None`).
+            escapechar (Optional[str]):
+                See `prepare_csvs` (Default value `None`).
+            index_col (bool):
+                See `prepare_csvs` (Default value False).
+            kwargs (Any):
+                Will be passed to pandas for CSV reading
 
-                    self.cdb._add_concept(cui=cui, names=names, ontologies=ontologies, name_status=name_status, type_ids=type_ids,
-                                         description=description, full_build=full_build)
-                    # DEBUG
-                    logger.debug("\n\n**** Added\n CUI: %s\n Names: %s\n Ontologies: %s\n Name status: %s\n Type IDs: %s\n Description: %s\n Is full build: %s",
-                                   cui, names, ontologies, name_status, type_ids, description, full_build)
+        Returns:
+            CDB: The updated CDB.
+        """
+        cdb = self.cdb
+        dfs = [_read_csv(csv_path, sep=sep, encoding=encoding, escapechar=escapechar, index_col=index_col, **kwargs)
+               for csv_path in csv_paths]
+
+        # Hash the rows of each concept (as in `prepare_csvs`) to find the ones that changed
+        self._row_hash_seed = self._get_row_hash_seed(full_build)
+        row_hashes: Dict[str, int] = {}
+        df_cuis: List[List[str]] = []
+        for df in dfs:
+            cols, col2ind = _get_columns(df)
+            cuis = []
+            for row in df[cols].values:
+                cui = row[col2ind['cui']].strip().upper()
+                row_hashes[cui] = self._get_row_hash(self._parse_row(cui, row, col2ind),
+                                                     row_hashes.get(cui, self._row_hash_seed))
+                cuis.append(cui)
+            df_cuis.append(cuis)
+        release_cdb = prev_cdb if prev_cdb is not None else cdb
+        release_hashes = release_cdb.addl_info.get('cui2row_hash', {})
+        unchanged_cuis = {cui for cui, row_hash in row_hashes.items()
+                          if release_hashes.get(cui) == row_hash and cui in cdb.cui2names}
+        logger.info("The rows of %d out of %d concepts are the same as in the previous release, preparing the rest",
+                    len(unchanged_cuis), len(row_hashes))
 
+        self.cdb = CDB(config=self.config)
+        try:
+            new_cdb = self.prepare_csvs([df[np.array([cui not in unchanged_cuis for cui in cuis], dtype=bool)]
+                                         for df, cuis in zip(dfs, df_cuis)],
+                                        full_build=full_build, n_process=n_process, batch_size=batch_size)
+        finally:
+            self.cdb = cdb
+        update_cdb(self.cdb, new_cdb, remove_missing_cuis=remove_missing_cuis, full_build=full_build,
+                   prev_cdb=prev_cdb, unchanged_cuis=unchanged_cuis)
+        self.cdb.addl_info['cui2row_hash'] = row_hashes
         return self.cdb
 
+    def _parse_row(self, cui: str, row: np.ndarray, col2ind: Dict[str, int]) -> "_RowConcept":
+        if 'ontologies' in col2ind:
+            ontologies = set([ontology.strip() for ontology in row[col2ind['ontologies']].upper().split(self.cnf_cm['multi_separator']) if
+                             len(ontology.strip()) > 0])
+        else:
+            ontologies = set()
+
+        if 'name_status' in col2ind:
+            name_status = row[col2ind['name_status']].strip().upper()
+
+            # Must be allowed
+            if name_status not in NAME_STATUS_OPTIONS:
+                name_status = 'A'
+        else:
+            # Defaults to A - meaning automatic
+            name_status = 'A'
+
+        if 'type_ids' in col2ind:
+            type_ids = set([type_id.strip() for type_id in row[col2ind['type_ids']].upper().split(self.cnf_cm['multi_separator']) if
+                            len(type_id.strip()) > 0])
+        else:
+            type_ids = set()
+
+        # Get the ones that do not need any changing
+        if 'description' in col2ind:
+            description = row[col2ind['description']].strip()
+        else:
+            description = ""
+
+        raw_names = []
+        for raw_name in row[col2ind['name']].split(self.cnf_cm['multi_separator']):
+            raw_name = raw_name.strip()
+            if len(raw_name) == 0:
+                continue
+            raw_names.append(raw_name)
+
+            if self.config.cdb_maker.get('remove_parenthesis', 0) > 0 and name_status == 'P':
+                # Should we remove the content in parenthesis from primary names and add them also
+                raw_name = PH_REMOVE.sub(" ", raw_name).strip()
+                if len(raw_name) >= self.config.cdb_maker['remove_parenthesis']:
+                    raw_names.append(raw_name)
+
+        return _RowConcept(cui, ontologies, name_status, type_ids, description, raw_names)
+
+    def _get_row_hash_seed(self, full_build: bool) -> int:
+        # The same rows only give the same concepts if the names are prepared the same way
+        settings = cast(tuple, PreparedNameCache.get_settings(self.pipe.spacy_nlp, self.config))
+        settings = tuple(sorted(setting) if isinstance(setting, frozenset) else setting for setting in settings)
+        return _hash_int(repr((settings, full_build)))
+
+    def _get_row_hash(self, concept: "_RowConcept", prev_hash: int) -> int:
+        # Hash of a row of a concept, chained with the hash of its previous rows
+        row = (concept.name_status, sorted(concept.type_ids), sorted(concept.ontologies),
+               concept.description, concept.raw_names)
+        return _hash_int(repr((prev_hash, row)))
+
+    def _add_concept(self, concept: "_RowConcept", names: Dict, full_build: bool) -> None:
+        self.cdb._add_concept(cui=concept.cui, names=names, ontologies=concept.ontologies, name_status=concept.name_status,
+                              type_ids=concept.type_ids, description=concept.description, full_build=full_build)
+        # Keep track of the rows of each concept, so that `update_cdb` can tell whether they changed
+        row_hashes = self.cdb.addl_info.setdefault('cui2row_hash', {})
+        row_hashes[concept.cui] = self._get_row_hash(concept, row_hashes.get(concept.cui, self._row_hash_seed))
+        # DEBUG
+        logger.debug("\n\n**** Added\n CUI: %s\n Names: %s\n Ontologies: %s\n Name status: %s\n Type IDs: %s\n Description: %s\n Is full build: %s",
+                       concept.cui, names, concept.ontologies, concept.name_status, concept.type_ids, concept.description, full_build)
+
+    def _prepare_rows_batched(self, rows: np.ndarray, col2ind: Dict[str, int], full_build: bool,
+                              only_existing_cuis: bool, n_process: int, batch_size: int) -> None:
+        """Prepare the names of the rows in batches (and parallel) and then add the concepts to the CDB.
+
+        The rows are processed in blocks. In each block, the unique raw names (that are not
+        in the name cache) are run through the spacy pipeline (with `n_process` processes) and the concepts are
+        then added to the CDB row by row (i.e in the same order as `prepare_csvs`).
+
+        Args:
+            rows (np.ndarray): The rows of the CSV.
+            col2ind (Dict[str, int]): The index of each of the (useful) columns.
+            full_build (bool): Whether to do a full build.
+            only_existing_cuis (bool): Whether to only add names to existing CUIs.
+            n_process (int): The number of processes for the spacy pipeline.
+            batch_size (int): The number of names in a batch.
+        """
+        block_size = max(BATCHED_BLOCK_SIZE, batch_size * max(n_process, 1))
+        start_time = time.perf_counter()
+        for block_start in range(0, len(rows), block_size):
+            concepts = []
+            for row in rows[block_start:block_start + block_size]:
+                # This must exist
+                cui = row[col2ind['cui']].strip().upper()
+                # No CUIs are added with only_existing_cuis, so this can be checked for the whole block up front
+                if not only_existing_cuis or cui in self.cdb.cui2names:
+                    concepts.append(self._parse_row(cui, row, col2ind))
+
+            # De-duplicate the names (dicts keep the order, so this is deterministic) and skip the cached ones
+            name_versions: Dict[str, List[List[str]]] = {}
+            raw_names = []
+            for raw_name in dict.fromkeys(raw_name for concept in concepts for raw_name in concept.raw_names):
+                versions = self.name_cache.get(raw_name) if self.name_cache is not None else None
+                if versions is None:
+                    raw_names.append(raw_name)
+                else:
+                    name_versions[raw_name] = versions
+            docs = self.pipe.spacy_nlp.pipe(raw_names, n_process=n_process, batch_size=batch_size)
+            for raw_name, doc in zip(raw_names, docs):
+                name_versions[raw_name] = get_name_versions(doc, self.config)
+                if self.name_cache is not None:
+                    self.name_cache.add(raw_name, name_versions[raw_name])
+
+            # Single threaded reduce
+            for concept in concepts:
+                names: Dict = {}
+                for raw_name in concept.raw_names:
+                    add_name_versions(raw_name, name_versions[raw_name], names, self.config)
+                self._add_concept(concept, names, full_build)
+
+            nr_of_rows = min(block_start + block_size, len(rows))
+            logger.info("Current progress: %d/%d rows (%.0f%%) with %d new unique names in the last block at %.1f rows/sec",
+                        nr_of_rows, len(rows), nr_of_rows / len(rows) * 100, len(raw_names),
+                        nr_of_rows / (time.perf_counter() - start_time))
+
     def destroy_pipe(self) -> None:
         self.pipe.destroy()
@@ -288,6 +288,10 @@ class CDBMaker(MixingConfig, BaseModel):
     e.g. Head (Body part) -> Head"""
     min_letters_required: int = 2
     """Minimum number of letters required in a name to be accepted for a concept"""
+    prepared_names_cache_path: Optional[str] = None
+    """If set, the prepared names (see `medcat.preprocessing.name_cache.PreparedNameCache`) are loaded
+    from (if the file exists) and saved to this path by the `CDBMaker`, so that names do not need to be
+    prepared again when (re)building CDBs with the same spacy model and settings."""
 
     class Config:
         extra = Extra.allow
@@ -315,6 +319,10 @@ class CheckPoint(MixingConfig, BaseModel):
     """When training how often to save the checkpoint (one step represents one document), if None no ckpts will be created"""
     max_to_keep: int = 1
     """When training the maximum checkpoints will be kept on the disk"""
+    full_every: int = 1
+    """When training how many checkpoints there are between full snapshots of the CDB,
+    the ones in between only save the changes (deltas) - if 1 every checkpoint is a full snapshot.
+    With deltas the checkpoints are written in a background thread, otherwise in the training thread"""
 
     class Config:
         extra = Extra.allow
@@ -362,6 +370,18 @@ class General(MixingConfig, BaseModel):
     log_path: str = './medcat.log'
     spacy_model: str = 'en_core_web_md'
     """What model will be used for tokenization"""
+    spacy_minimal_pipeline: bool = False
+    """Should only the spacy components required by MedCAT (i.e the lemmatizer and, if needed,
+    the tagger and the components they depend on) be loaded. The others (e.g parser, NER)
+    and the static vectors (if not used by the required components) are excluded
+    rather than disabled, which reduces the memory use.
+
+    NB! For these changes to take effect, the pipe would need to be recreated."""
+    spacy_lemmatizer_mode: Optional[str] = None
+    """The lemmatizer mode to use with the minimal spacy pipeline (e.g 'lookup' or 'rule').
+    If None, the lemmatizer of the spacy model is used as is. The 'lookup' mode requires the
+    `spacy-lookups-data` package, but not the tagger (unless `preprocessing.do_not_normalize`
+    is used). Note that the lemmas (and thus the norms of the tokens) may change."""
     separator: str = '~'
     """Separator that will be used to merge tokens of a name. Once a CDB is built this should
     always stay the same."""
@@ -376,6 +396,8 @@ class General(MixingConfig, BaseModel):
     things drastically."""
     spell_check_len_limit: int = 7
     """Spelling will not be checked for words with length less than this"""
+    spell_check_cache_size: int = 100_000
+    """The maximum number of spell check corrections (misspelled word to norm) that are cached"""
     show_nested_entities: bool = False
     """If set to True functions like get_entities and get_json will return nested_entities and overlaps"""
     full_unlink: bool = False
@@ -414,14 +436,28 @@ class Preprocessing(MixingConfig, BaseModel):
     """Should stopwords be skipped/ignored when processing input"""
     min_len_normalize: int = 5
     """Nothing below this length will ever be normalized (input tokens or concept names), normalized means lemmatized in this case"""
+    lexeme_memo_size: int = 100_000
+    """The maximum number of word types for which the decisions of the tagger and the
+    normalizer (e.g is_punct, to_skip, norm) are memoised. If 0, nothing is memoised."""
     stopwords: Optional[set] = None
     """If None the default set of stowords from spacy will be used. This must be a Set.
 
     NB! For these changes to take effect, the pipe would need to be recreated."""
     max_document_length: int = 1000000
-    """Documents longer  than this will be trimmed.
+    """Documents longer  than this will be trimmed (unless `long_document_mode` is enabled).
 
     NB! For these changes to take effect, the pipe would need to be recreated."""
+    long_document_mode: bool = False
+    """Should documents longer than `long_document_chunk_size` be split into overlapping chunks
+    (on paragraph/sentence boundaries where possible) rather than be trimmed. The entities of the chunks
+    are stitched back together (with offsets within the document). This bounds the memory used
+    per document. Only applies to the methods that output entities (e.g `CAT.get_entities`,
+    `CAT.get_entities_multi_texts`, `CAT.multiprocessing_batch_char_size`), not to `CAT.__call__`."""
+    long_document_chunk_size: int = 100000
+    """The maximum number of characters in a chunk (see `long_document_mode`)"""
+    long_document_chunk_overlap: int = 1000
+    """The number of characters consecutive chunks overlap (see `long_document_mode`). Needs to be less than
+    half the chunk size. Each entity has at least half of this as context on both sides."""
 
     class Config:
         extra = Extra.allow
@@ -41,6 +41,11 @@ class General(MixingConfig, BaseModel):
     """If set the center (concept) will be replaced with this string"""
     batch_size_eval: int = 5000
     """Number of annotations to be meta-annotated at once in eval"""
+    batch_tokens_eval: Optional[int] = None
+    """If set, the maximum number of (padded) tokens in a batch when predicting.
+
+    The annotations are batched by length, so each batch is only padded to the length of
+    its longest annotation. This additionally limits the size of the batches of long annotations."""
     annotate_overlapping: bool = False
     """If set meta_anns will be calculated for doc._.ents, otherwise for doc.ents"""
     tokenizer_name: str = 'bbpe'
@@ -204,6 +209,17 @@ class Train(MixingConfig, BaseModel):
     """
     gamma: int = 2
     """Focal Loss hyperparameter - determines importance the loss gives to hard-to-classify examples"""
+    length_bucketing: bool = True
+    """If set, each training batch is made of samples of similar length (and the batches are reshuffled
+    every epoch), so the batches are only padded to the longest sample in them. Otherwise the samples
+    are used in order."""
+    gradient_accumulation_steps: int = 1
+    """Number of batches the gradients are accumulated over before each optimizer step"""
+    num_workers: int = 0
+    """Number of DataLoader worker processes used to create the (padded) training batches"""
+    data_cache_dir: Optional[str] = None
+    """If set, the tokenised training data is cached in this directory (keyed on the data, the tokenizer
+    and the context settings), so that retraining skips the tokenisation"""
 
     class Config:
         extra = Extra.allow
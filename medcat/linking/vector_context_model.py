@@ -244,10 +244,11 @@ class ContextModel(object):
         vectors = {}
 
         # Get vectors for each context type
-        for context_type in self.config.linking['context_vector_sizes'].keys():
-            size = self.config.linking['context_vector_sizes'][context_type]
-            # While it should be size*2 it is already too many negative examples, so we leave it at size
-            inds = self.vocab.get_negative_samples(size, ignore_punct_and_num=self.config.linking['negative_ignore_punct_and_num'])
+        context_types = list(self.config.linking['context_vector_sizes'].keys())
+        # While it should be size*2 it is already too many negative examples, so we leave it at size
+        sizes = [self.config.linking['context_vector_sizes'][context_type] for context_type in context_types]
+        all_inds = self.vocab.get_negative_sample_batches(sizes, ignore_punct_and_num=self.config.linking['negative_ignore_punct_and_num'])
+        for context_type, inds in zip(context_types, all_inds):
             values = [self.vocab.vec(self.vocab.index2word[ind]) for ind in inds]
             if len(values) > 0:
                 vectors[context_type] = np.average(values, axis=0)
@@ -10,11 +10,13 @@ from datetime import datetime
 from typing import Iterable, Iterator, Optional, Dict, List, Tuple, cast, Union
 from medcat.utils.hasher import Hasher
 from medcat.config_meta_cat import ConfigMetaCAT
-from medcat.utils.meta_cat.ml_utils import predict, train_model, set_all_seeds, eval_model
+from medcat.utils.meta_cat.ml_utils import predict, predict_multi_task, train_model, set_all_seeds, eval_model
 from medcat.utils.meta_cat.data_utils import prepare_from_json, encode_category_values, prepare_for_oversampled_data
 from medcat.pipeline.pipe_runner import PipeRunner
 from medcat.tokenizers.meta_cat_tokenizers import TokenizerWrapperBase
 from medcat.utils.meta_cat.data_utils import Doc as FakeDoc
+from medcat.utils.meta_cat.dataset import MetaCATDataset, prepare_from_json_cached
+from medcat.utils.meta_cat.export import ExportedModel, export_model, load_exported_model, save_exported_model
 from peft import get_peft_model, LoraConfig, TaskType
 
 # It should be safe to do this always, as all other multiprocessing
@@ -64,6 +66,9 @@ class MetaCAT(PipeRunner):
             # We will also set the padding
             config.model['padding_idx'] = tokenizer.get_pad_id()
         self.tokenizer = tokenizer
+        self._replace_center_ids: Optional[Tuple[TokenizerWrapperBase, str, List[int]]] = None
+        # An exported (TorchScript/ONNX) model used for inference instead of self.model, see `export`
+        self.inference_model: Optional[nn.Module] = None
 
         self.embeddings = torch.tensor(embeddings, dtype=torch.float32) if embeddings is not None else None
         self.model = self.get_model(embeddings=self.embeddings)
@@ -237,10 +242,14 @@ class MetaCAT(PipeRunner):
 
         # Prepare the data
         assert self.tokenizer is not None
-        data = prepare_from_json(data_loaded, g_config['cntx_left'], g_config['cntx_right'], self.tokenizer,
-                                 cui_filter=t_config['cui_filter'],
-                                 replace_center=g_config['replace_center'], prerequisites=t_config['prerequisites'],
-                                 lowercase=g_config['lowercase'])
+        data: Dict
+        if t_config['data_cache_dir'] is not None:
+            data = prepare_from_json_cached(data_loaded, self.tokenizer, self.config, t_config['data_cache_dir'])
+        else:
+            data = prepare_from_json(data_loaded, g_config['cntx_left'], g_config['cntx_right'], self.tokenizer,
+                                     cui_filter=t_config['cui_filter'],
+                                     replace_center=g_config['replace_center'], prerequisites=t_config['prerequisites'],
+                                     lowercase=g_config['lowercase'])
 
         # Check is the name present
         category_name = g_config['category_name']
@@ -249,10 +258,14 @@ class MetaCAT(PipeRunner):
                 "The category name does not exist in this json file. You've provided '{}', while the possible options are: {}".format(
                     category_name, " | ".join(list(data.keys()))))
 
+        # The (memory-mapped) cached dataset is used as is, rather than converted into lists
         data = data[category_name]
         if data_oversampled:
             data_sampled = prepare_for_oversampled_data(data_oversampled, self.tokenizer)
-            data = data + data_sampled
+            if isinstance(data, MetaCATDataset):
+                data = MetaCATDataset.concat([data, MetaCATDataset.from_samples(data_sampled)])
+            else:
+                data = data + data_sampled
 
         category_value2id = g_config['category_value2id']
         if not category_value2id:
@@ -296,6 +309,8 @@ class MetaCAT(PipeRunner):
                 logger.info("For phase 1, model state has to be saved. Saving model...")
                 t_config['auto_save_model'] = True
 
+        # The exported model (if any) does not match the trained model
+        self.inference_model = None
         report = train_model(self.model, data=data, config=self.config, save_dir_path=save_dir_path)
 
         # If autosave, then load the best model here
@@ -336,10 +351,14 @@ class MetaCAT(PipeRunner):
 
         # Prepare the data
         assert self.tokenizer is not None
-        data = prepare_from_json(data_loaded, g_config['cntx_left'], g_config['cntx_right'], self.tokenizer,
-                                 cui_filter=t_config['cui_filter'],
-                                 replace_center=g_config['replace_center'], prerequisites=t_config['prerequisites'],
-                                 lowercase=g_config['lowercase'])
+        data: Dict
+        if t_config['data_cache_dir'] is not None:
+            data = prepare_from_json_cached(data_loaded, self.tokenizer, self.config, t_config['data_cache_dir'])
+        else:
+            data = prepare_from_json(data_loaded, g_config['cntx_left'], g_config['cntx_right'], self.tokenizer,
+                                     cui_filter=t_config['cui_filter'],
+                                     replace_center=g_config['replace_center'], prerequisites=t_config['prerequisites'],
+                                     lowercase=g_config['lowercase'])
 
         # Check is the name there
         category_name = g_config['category_name']
@@ -347,6 +366,9 @@ class MetaCAT(PipeRunner):
             raise Exception("The category name does not exist in this json file.")
 
         data = data[category_name]
+        if isinstance(data, MetaCATDataset):
+            # The evaluation (and its examples) work on the samples
+            data = data.to_samples()
 
         # We already have everything, just get the data
         category_value2id = g_config['category_value2id']
@@ -382,11 +404,31 @@ class MetaCAT(PipeRunner):
         model_save_path = os.path.join(save_dir_path, 'model.dat')
         torch.save(self.model.state_dict(), model_save_path)
 
+        # Save (or remove the stale) exported model
+        save_exported_model(cast(Optional[ExportedModel], self.inference_model), save_dir_path)
+
         # This is everything we need to save from the class, we do not
         # save the class itself.
 
+    def export(self, save_dir_path: str, export_format: str = 'torchscript', quantize: bool = False) -> None:
+        """Export the model for (CPU) inference and use it.
+
+        The exported model is saved next to an already saved MetaCAT and
+        used by `MetaCAT.load` when running on CPU.
+
+        Args:
+            save_dir_path (str):
+                The directory the MetaCAT is saved to.
+            export_format (str):
+                Either torchscript or onnx (the latter requires onnx and onnxruntime). Defaults to 'torchscript'.
+            quantize (bool):
+                Whether to dynamically quantise the weights to int8. Defaults to False.
+        """
+        path = export_model(self.model, self.config, save_dir_path, export_format=export_format, quantize=quantize)
+        self.inference_model = ExportedModel(path)
+
     @classmethod
-    def load(cls, save_dir_path: str, config_dict: Optional[Dict] = None) -> "MetaCAT":
+    def load(cls, save_dir_path: str, config_dict: Optional[Dict] = None, load_exported: bool = True) -> "MetaCAT":
         """Load a meta_cat object.
 
         Args:
@@ -395,6 +437,9 @@ class MetaCAT(PipeRunner):
             config_dict (Optional[Dict], optional):
                 This can be used to overwrite saved parameters for this meta_cat
                 instance. Why? It is needed in certain cases where we autodeploy stuff. (Default value = None)
+            load_exported (bool):
+                Whether to use the exported model (see `export`), if there is one, for inference
+                on CPU. (Default value = True)
 
         Returns:
             MetaCAT:
@@ -429,8 +474,22 @@ class MetaCAT(PipeRunner):
             device = torch.device('cpu')
         meta_cat.model.load_state_dict(torch.load(model_save_path, map_location=device))
 
+        if load_exported and device.type == 'cpu':
+            meta_cat.inference_model = load_exported_model(save_dir_path)
+
         return meta_cat
 
+    def _get_replace_center_ids(self, replace_center: str, lowercase: bool) -> List[int]:
+        if lowercase:
+            replace_center = replace_center.lower()
+        assert self.tokenizer is not None
+        # Tokenise once for each tokenizer (instance) and replace_center
+        cached = self._replace_center_ids
+        if cached is None or cached[0] is not self.tokenizer or cached[1] != replace_center:
+            cached = (self.tokenizer, replace_center, self.tokenizer(replace_center)['input_ids'])
+            self._replace_center_ids = cached
+        return cached[2]
+
     def get_ents(self, doc: Doc) -> Iterable[Span]:
         spangroup_name = self.config.general.span_group
         if spangroup_name:
@@ -469,50 +528,44 @@ class MetaCAT(PipeRunner):
         cntx_left = config.general['cntx_left']
         cntx_right = config.general['cntx_right']
         replace_center = config.general['replace_center']
-
-        ents = self.get_ents(doc)
+        replace_center_ids: List[int] = []
+        if replace_center is not None:
+            replace_center_ids = self._get_replace_center_ids(replace_center, lowercase)
+
+        ents = sorted(self.get_ents(doc), key=lambda ent: ent.start_char)
+        if not ents:
+            return {}, []
+
+        # The offsets of the tokens are sorted, so we can find the (sub)tokens of all the entities at once
+        tkn_ends = numpy.asarray(offset_mapping, dtype=numpy.int64).reshape(-1, 2)[:, 1]
+        ent_starts = numpy.array([ent.start_char for ent in ents], dtype=numpy.int64)
+        ent_ends = numpy.array([ent.end_char for ent in ents], dtype=numpy.int64)
+        last_tkn = len(tkn_ends) - 1
+        # First token that ends at or after the start of the entity
+        first_inds = numpy.minimum(numpy.searchsorted(tkn_ends, ent_starts, side='left'), last_tkn).tolist()
+        # First token that ends at or after the end of the entity
+        last_inds = numpy.minimum(numpy.searchsorted(tkn_ends, ent_ends, side='left'), last_tkn).tolist()
+        if replace_center is not None:
+            # Token that contains the start of the entity
+            s_inds = numpy.searchsorted(tkn_ends, ent_starts, side='right').tolist()
 
         samples = []
-        last_ind = 0
         ent_id2ind = {}  # Map form entity ID to where is it in the samples array
-        for ent in sorted(ents, key=lambda ent: ent.start_char):
-            start = ent.start_char
-            end = ent.end_char
-
-            # Updated implementation to extract all the tokens for the medical entity (rather than the one)
-            ctoken_idx = []
-            for ind, pair in enumerate(offset_mapping[last_ind:]):
-                # Checking if we've reached at the start of the entity
-                if start <= pair[0] or start <= pair[1]:
-                    if end <= pair[1]:
-                        ctoken_idx.append(ind) # End reached
-                        break
-                    else:
-                        ctoken_idx.append(ind) # Keep going
-
-            # Start where the last ent was found, cannot be before it as we've sorted
-            last_ind += ind  # If we did not start from 0 in the for loop
-
-            _start = max(0, ctoken_idx[0] - cntx_left)
-            _end = min(len(input_ids), ctoken_idx[-1] + 1 + cntx_right)
+        for ent_ind, ent in enumerate(ents):
+            first_ind = first_inds[ent_ind]
+            last_ind = max(first_ind, last_inds[ent_ind])
+
+            _start = max(0, first_ind - cntx_left)
+            _end = min(len(input_ids), last_ind + 1 + cntx_right)
 
             tkns = input_ids[_start:_end]
-            cpos = cntx_left + min(0, ind - cntx_left)
-            cpos_new = [x - _start for x in ctoken_idx]
+            cpos_new = list(range(first_ind - _start, last_ind + 1 - _start))
 
             if replace_center is not None:
-                if lowercase:
-                    replace_center = replace_center.lower()
-                # We start from ind
-                s_ind = ind
-                e_ind = ind
-                for _ind, pair in enumerate(offset_mapping[ind:]):
-                    if end > pair[0] and end <= pair[1]:
-                        e_ind = _ind + ind
-                        break
-                ln = e_ind - s_ind  # Length of the concept in tokens
-                assert self.tokenizer is not None
-                tkns = tkns[:cpos] + self.tokenizer(replace_center)['input_ids'] + tkns[cpos + ln + 1:]
+                # Same as in data_utils.prepare_from_json, so that it matches the training data
+                cpos = cntx_left + min(0, last_ind - cntx_left)
+                ln = last_ind - s_inds[ent_ind]  # Length of the concept in tokens
+                tkns = tkns[:cpos] + replace_center_ids + tkns[cpos + ln + 1:]
             samples.append([tkns, cpos_new])
             ent_id2ind[ent._.id] = len(samples) - 1
 
@@ -584,56 +637,71 @@ class MetaCAT(PipeRunner):
                        id2category_value: Dict) -> Iterator[Optional[Doc]]:
         for docs in self.batch_generator(stream, batch_size_chars):  # type: ignore
             try:
-                if not config.general['save_and_reuse_tokens'] or docs[0]._.share_tokens is None:
-                    if config.general['lowercase']:
-                        all_text = [doc.text.lower() for doc in docs]
-                    else:
-                        all_text = [doc.text for doc in docs]
-                    assert self.tokenizer is not None
-                    all_text_processed = self.tokenizer(all_text)
-                    doc_ind2positions = {}
-                    data: List = []  # The thing that goes into the model
-                    for i, doc in enumerate(docs):
-                        ent_id2ind, samples = self.prepare_document(doc, input_ids=all_text_processed[i]['input_ids'],
-                                                                    offset_mapping=all_text_processed[i]['offset_mapping'],
-                                                                    lowercase=config.general['lowercase'])
-                        doc_ind2positions[i] = (len(data), len(data) + len(samples), ent_id2ind) # Needed so we know where is what in the big data array
-                        data.extend(samples)
-                        if config.general['save_and_reuse_tokens']:
-                            doc._.share_tokens = (samples, doc_ind2positions[i])
-                else:
-                    # This means another model has already processed the data and we can just use it. This is a
-                    # dangerous option - as it assumes the other model has the same tokenizer and context size.
-                    data = []
-                    doc_ind2positions = {}
-                    for i, doc in enumerate(docs):
-                        data.extend(doc._.share_tokens[0])
-                        doc_ind2positions[i] = doc._.share_tokens[1]
-                all_predictions, all_confidences = predict(self.model, data, config)
-                for i, doc in enumerate(docs):
-                    start_ind, end_ind, ent_id2ind = doc_ind2positions[i]
-
-                    predictions = all_predictions[start_ind:end_ind]
-                    confidences = all_confidences[start_ind:end_ind]
-                    ents = self.get_ents(doc)
-
-                    for ent in ents:
-                        ent_ind = ent_id2ind[ent._.id]
-                        value = id2category_value[predictions[ent_ind]]
-                        confidence = confidences[ent_ind]
-                        if ent._.meta_anns is None:
-                            ent._.meta_anns = {config.general['category_name']: {'value': value,
-                                                                                 'confidence': float(confidence),
-                                                                                 'name': config.general['category_name']}}
-                        else:
-                            ent._.meta_anns[config.general['category_name']] = {'value': value,
-                                                                                'confidence': float(confidence),
-                                                                                'name': config.general['category_name']}
+                data, doc_ind2positions = self._prepare_docs(docs, config)
+                model = self.inference_model if self.inference_model is not None else self.model
+                all_predictions, all_confidences = predict(model, data, config)
+                self._add_meta_anns(docs, doc_ind2positions, all_predictions, all_confidences, config,
+                                    id2category_value)
                 yield from docs
             except Exception as e:
                 self.get_error_handler()(self.name, self, docs, e)
                 yield from [None] * len(docs)
 
+    def _prepare_docs(self, docs: List, config: ConfigMetaCAT) -> Tuple[List, Dict]:
+        if not config.general['save_and_reuse_tokens'] or docs[0]._.share_tokens is None:
+            if config.general['lowercase']:
+                all_text = [doc.text.lower() for doc in docs]
+            else:
+                all_text = [doc.text for doc in docs]
+            assert self.tokenizer is not None
+            all_text_processed = self.tokenizer(all_text)
+            doc_ind2positions = {}
+            data: List = []  # The thing that goes into the model
+            for i, doc in enumerate(docs):
+                ent_id2ind, samples = self.prepare_document(doc, input_ids=all_text_processed[i]['input_ids'],
+                                                            offset_mapping=all_text_processed[i]['offset_mapping'],
+                                                            lowercase=config.general['lowercase'])
+                doc_ind2positions[i] = (len(data), len(data) + len(samples), ent_id2ind) # Needed so we know where is what in the big data array
+                data.extend(samples)
+                if config.general['save_and_reuse_tokens']:
+                    doc._.share_tokens = (samples, doc_ind2positions[i])
+        else:
+            # This means another model has already processed the data and we can just use it. This is a
+            # dangerous option - as it assumes the other model has the same tokenizer and context size.
+            data = []
+            doc_ind2positions = {}
+            for i, doc in enumerate(docs):
+                data.extend(doc._.share_tokens[0])
+                doc_ind2positions[i] = doc._.share_tokens[1]
+        return data, doc_ind2positions
+
+    def _add_meta_anns(self,
+                       docs: List,
+                       doc_ind2positions: Dict,
+                       all_predictions: List,
+                       all_confidences: List,
+                       config: ConfigMetaCAT,
+                       id2category_value: Dict) -> None:
+        for i, doc in enumerate(docs):
+            start_ind, end_ind, ent_id2ind = doc_ind2positions[i]
+
+            predictions = all_predictions[start_ind:end_ind]
+            confidences = all_confidences[start_ind:end_ind]
+            ents = self.get_ents(doc)
+
+            for ent in ents:
+                ent_ind = ent_id2ind[ent._.id]
+                value = id2category_value[predictions[ent_ind]]
+                confidence = confidences[ent_ind]
+                if ent._.meta_anns is None:
+                    ent._.meta_anns = {config.general['category_name']: {'value': value,
+                                                                         'confidence': float(confidence),
+                                                                         'name': config.general['category_name']}}
+                else:
+                    ent._.meta_anns[config.general['category_name']] = {'value': value,
+                                                                        'confidence': float(confidence),
+                                                                        'name': config.general['category_name']}
+
     # Override
     def __call__(self, doc: Doc) -> Doc:
         """Process one document, used in the spacy pipeline for sequential
@@ -682,3 +750,177 @@ class MetaCAT(PipeRunner):
             the 'Model Card' for this MetaCAT instance. This includes NER+L config and any MetaCATs
         """
         return self.get_model_card(as_dict=False)
+
+
+class MultiTaskMetaCAT(PipeRunner):
+    """Runs several MetaCAT models that use the same (frozen) BERT model and context
+    window at once.
+
+    The documents are tokenised once, the BERT encoder is run once for each annotation
+    and the classification head of each MetaCAT is applied to its output. The results are
+    the same as running the MetaCATs one after the other. Use `group_meta_cats` to find
+    the MetaCATs that can be grouped.
+
+    Args:
+        meta_cats (List[MetaCAT]):
+            The MetaCATs, as returned by `group_meta_cats`.
+
+    Raises:
+        ValueError: If the MetaCATs can not be run together.
+    """
+
+    # Custom pipeline component name
+    name = 'meta_cat_multi_task'
+
+    # Override
+    def __init__(self, meta_cats: List[MetaCAT]) -> None:
+        keys = set(get_multi_task_key(meta_cat) for meta_cat in meta_cats)
+        if len(meta_cats) < 2 or None in keys or len(keys) > 1:
+            raise ValueError("Can only run 2 or more MetaCATs with the same frozen BERT model and "
+                             "the same tokenizer and context window together")
+        encoder = meta_cats[0].model.bert
+        for meta_cat in meta_cats[1:]:
+            if not _same_weights(cast(nn.Module, encoder), cast(nn.Module, meta_cat.model.bert)):
+                raise ValueError("The BERT weights of %s differ from %s" % (
+                    meta_cat.config.general['category_name'], meta_cats[0].config.general['category_name']))
+        # Share the encoder, so that it is only kept (and moved to the device) once
+        for meta_cat in meta_cats[1:]:
+            meta_cat.model.bert = encoder
+        self.meta_cats = meta_cats
+
+    @property
+    def config(self) -> ConfigMetaCAT:
+        """The config used for tokenising and batching, i.e that of the first MetaCAT."""
+        return self.meta_cats[0].config
+
+    # Override
+    def pipe(self, stream: Iterable[Union[Doc, FakeDoc]], *args, **kwargs) -> Iterator[Doc]:
+        """Process a stream of documents with all the MetaCATs.
+
+        Args:
+            stream (Iterable[Union[Doc, FakeDoc]]):
+                List of spacy documents.
+            *args: Unused arguments (due to override)
+            **kwargs: Unused keyword arguments (due to override)
+
+        Yields:
+            Doc: The document.
+
+        Returns:
+            Iterator[Doc]: stream is None or empty.
+        """
+        # Just in case
+        if stream is None or not stream:
+            # return an empty generator
+            return
+
+        config = self.config
+        if config.general['device'] == 'cpu' or config.general['disable_component_lock']:
+            yield from self._set_meta_anns(stream, config)  # type: ignore
+        else:
+            with MetaCAT._component_lock:
+                yield from self._set_meta_anns(stream, config)  # type: ignore
+
+    def _set_meta_anns(self, stream: Iterable[Union[Doc, FakeDoc]], config: ConfigMetaCAT) -> Iterator[Optional[Doc]]:
+        first = self.meta_cats[0]
+        for docs in first.batch_generator(stream, config.general['pipe_batch_size_in_chars']):  # type: ignore
+            try:
+                data, doc_ind2positions = first._prepare_docs(docs, config)
+                all_results = predict_multi_task([meta_cat.model for meta_cat in self.meta_cats], data, config)
+                for meta_cat, (all_predictions, all_confidences) in zip(self.meta_cats, all_results):
+                    mc_config = meta_cat.config
+                    id2category_value = {v: k for k, v in mc_config.general['category_value2id'].items()}
+                    meta_cat._add_meta_anns(docs, doc_ind2positions, all_predictions, all_confidences, mc_config,
+                                            id2category_value)
+                yield from docs
+            except Exception as e:
+                self.get_error_handler()(self.name, self, docs, e)
+                yield from [None] * len(docs)
+
+    # Override
+    def __call__(self, doc: Doc) -> Doc:
+        """Process one document, used in the spacy pipeline for sequential
+        document processing.
+
+        Args:
+            doc (Doc):
+                A spacy document
+
+        Returns:
+            Doc: The same spacy document.
+        """
+        return next(self.pipe(iter([doc])))
+
+    def __repr__(self):
+        return "MultiTaskMetaCAT(%s)" % ", ".join(meta_cat.config.general['category_name']
+                                                  for meta_cat in self.meta_cats)
+
+
+def get_multi_task_key(meta_cat: MetaCAT) -> Optional[Tuple]:
+    """Get the key of the MetaCATs that can be run together with this one.
+
+    Only BERT based MetaCATs with frozen BERT layers (i.e where only the classification
+    head was trained) can share the encoder. The weights are checked separately.
+
+    Args:
+        meta_cat (MetaCAT): The MetaCAT.
+
+    Returns:
+        Optional[Tuple]: The key, or None if the encoder of this MetaCAT can not be shared.
+    """
+    from medcat.utils.meta_cat.models import BertForMetaAnnotation
+    config = meta_cat.config
+    if not isinstance(meta_cat.model, BertForMetaAnnotation) or not config.model.model_freeze_layers:
+        return None
+    if meta_cat.inference_model is not None:
+        # Runs the exported model on its own
+        return None
+    general = config.general
+    return (config.model.model_variant, config.model['num_layers'], general['tokenizer_name'],
+            general['vocab_size'], config.model['padding_idx'], general['cntx_left'], general['cntx_right'],
+            general['replace_center'], general['lowercase'], general['span_group'],
+            general['annotate_overlapping'], general['device'])
+
+
+def _same_weights(module: nn.Module, other: nn.Module) -> bool:
+    if module is other:
+        return True
+    state, other_state = module.state_dict(), other.state_dict()
+    return state.keys() == other_state.keys() and all(torch.equal(state[key], other_state[key]) for key in state)
+
+
+def group_meta_cats(meta_cats: List[MetaCAT]) -> List[Union[MetaCAT, MultiTaskMetaCAT]]:
+    """Group the MetaCATs that can share the BERT encoder.
+
+    Each group is placed where its first MetaCAT was, the other MetaCATs are
+    returned as they are.
+
+    Args:
+        meta_cats (List[MetaCAT]): The MetaCATs (e.g of a model pack).
+
+    Returns:
+        List[Union[MetaCAT, MultiTaskMetaCAT]]: The MetaCATs and the groups.
+    """
+    # Groups of MetaCATs with the same key and the same BERT weights
+    groups: List[List[MetaCAT]] = []
+    for meta_cat in meta_cats:
+        key = get_multi_task_key(meta_cat)
+        group = None
+        if key is not None:
+            group = next((group for group in groups if get_multi_task_key(group[0]) == key and
+                          _same_weights(cast(nn.Module, group[0].model.bert),
+                                        cast(nn.Module, meta_cat.model.bert))), None)
+        if group is None:
+            groups.append([meta_cat])
+        else:
+            group.append(meta_cat)
+
+    out: List[Union[MetaCAT, MultiTaskMetaCAT]] = []
+    for group in groups:
+        if len(group) > 1:
+            logger.info("Running the MetaCATs %s with a shared encoder",
+                        ", ".join(meta_cat.config.general['category_name'] for meta_cat in group))
+            out.append(MultiTaskMetaCAT(group))
+        else:
+            out.extend(group)
+    return out
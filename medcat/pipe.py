@@ -3,7 +3,7 @@ import os
 import spacy
 import gc
 import logging
-from typing import List, Optional, Union, Iterable, Callable
+from typing import List, Optional, Union, Iterable, Iterator, Callable
 from multiprocessing import cpu_count
 from spacy.tokens import Token, Doc, Span
 from spacy.tokenizer import Tokenizer
@@ -11,15 +11,16 @@ from spacy.language import Language
 from spacy.util import raise_error
 from tqdm.autonotebook import tqdm
 from medcat.linking.context_based_linker import Linker
-from medcat.meta_cat import MetaCAT
+from medcat.meta_cat import MetaCAT, MultiTaskMetaCAT
 from medcat.ner.vocab_based_ner import NER
 from medcat.rel_cat import RelCAT
-from medcat.utils.normalizers import TokenNormalizer, BasicSpellChecker
+from medcat.utils.normalizers import TokenNormalizer, BasicSpellChecker, SpellCorrectionCache
 from medcat.config import Config
 from medcat.pipeline.pipe_runner import PipeRunner
 from medcat.preprocessing.taggers import tag_skip_and_punct
 from medcat.ner.transformers_ner import TransformersNER
 from medcat.utils.helpers import ensure_spacy_model
+from medcat.utils.spacy_pipeline import load_spacy_model
 
 
 logger = logging.getLogger(__name__) # different logger from the package-level one
@@ -66,6 +67,8 @@ class Pipe(object):
             config.general.spacy_model = DEFAULT_SPACY_MODEL
             self._nlp = self._init_nlp(config)
         self._nlp.tokenizer = tokenizer(self._nlp, config)
+        # The components of the spacy model itself (e.g tagger, lemmatizer)
+        self._spacy_component_names = set(self._nlp.pipe_names)
         # Set max document length
         self._nlp.max_length = config.preprocessing.max_document_length
         self.config = config
@@ -73,7 +76,7 @@ class Pipe(object):
         logger.setLevel(self.config.general.log_level)
 
     def _init_nlp(selef, config: Config) -> Language:
-        return spacy.load(config.general.spacy_model, disable=config.general.spacy_disabled_components)
+        return load_spacy_model(config)
 
     def add_tagger(self, tagger: Callable, name: Optional[str] = None, additional_fields: List[str] = []) -> None:
         """Add any kind of a tagger for tokens.
@@ -99,8 +102,10 @@ class Pipe(object):
         for field in additional_fields:
             Token.set_extension(field, default=False, force=True)
 
-    def add_token_normalizer(self, config: Config, name: Optional[str] = None, spell_checker: Optional[BasicSpellChecker] = None) -> None:
-        token_normalizer = TokenNormalizer(config=config, spell_checker=spell_checker)
+    def add_token_normalizer(self, config: Config, name: Optional[str] = None, spell_checker: Optional[BasicSpellChecker] = None,
+                             cache: Optional[SpellCorrectionCache] = None) -> None:
+        token_normalizer = TokenNormalizer(config=config, spell_checker=spell_checker, cache=cache,
+                                           get_spacy_docs=self.get_spacy_docs)
         component_name = spacy.util.get_object_name(token_normalizer)
         name = name if name is not None else component_name
         Language.component(name=component_name, func=token_normalizer)
@@ -109,6 +114,31 @@ class Pipe(object):
         # Add custom fields needed for this usecase
         Token.set_extension('norm', default=None, force=True)
 
+    def get_spacy_docs(self, texts: Iterable[str], batch_size: int = 1000) -> Iterator[Doc]:
+        """Process texts with only the components of the underlying spacy model.
+
+        None of the MedCAT components (e.g NER, linker) are run. This allows
+        reusing the spacy model (e.g its lemmatizer) without loading it again.
+
+        Args:
+            texts (Iterable[str]):
+                The texts to process.
+            batch_size (int):
+                The batch size for the components that support batching. Defaults to 1000.
+
+        Returns:
+            Iterator[Doc]: The processed documents.
+        """
+        docs: Iterable[Doc] = (self._nlp.make_doc(text) for text in texts)
+        for name, proc in self._nlp.pipeline:
+            if name not in self._spacy_component_names:
+                continue
+            if hasattr(proc, 'pipe'):
+                docs = proc.pipe(docs, batch_size=batch_size)
+            else:
+                docs = map(proc, docs)
+        return iter(docs)
+
     def add_ner(self, ner: NER, name: Optional[str] = None) -> None:
         """Add NER from CAT to the pipeline, will also add the necessary fields
         to the document and Span objects.
@@ -151,7 +181,7 @@ class Pipe(object):
         Span.set_extension('cui', default=-1, force=True)
         Span.set_extension('context_similarity', default=-1, force=True)
 
-    def add_meta_cat(self, meta_cat: MetaCAT, name: Optional[str] = None) -> None:
+    def add_meta_cat(self, meta_cat: Union[MetaCAT, MultiTaskMetaCAT], name: Optional[str] = None) -> None:
         component_name = spacy.util.get_object_name(meta_cat)
         name = name if name is not None else component_name
         Language.component(name=component_name, func=meta_cat)
@@ -0,0 +1,64 @@
+from typing import Any, Dict, Hashable, Optional
+import logging
+
+
+logger = logging.getLogger(__name__)
+
+
+class LexemeMemo(object):
+    """A bounded memo of the per word type (lexeme) decisions of a pipeline component.
+
+    Most tokens in a corpus are repeats of a relatively small number of word types.
+    So a component that makes the same decision for every occurrence of a word type
+    (e.g whether to skip it) only needs to make it once per type.
+
+    Since the decisions depend on the config, the settings they were made with
+    need to be checked (see `check_settings`) and the memo is cleared if they change.
+    When the memo is full, it is cleared as well.
+
+    Args:
+        max_size (int): The maximum number of memoised word types. If 0, nothing is memoised.
+    """
+
+    def __init__(self, max_size: int) -> None:
+        self.max_size = max_size
+        self.values: Dict[Hashable, Any] = {}
+        self.settings: Optional[Hashable] = None
+
+    def check_settings(self, settings: Hashable) -> None:
+        """Make sure the memoised decisions were made with the specified settings.
+
+        If the settings have changed, the memo is cleared.
+
+        Args:
+            settings (Hashable): The settings the decisions depend on.
+        """
+        if settings != self.settings:
+            if self.values:
+                logger.debug("Settings changed, clearing %d memoised word types", len(self.values))
+            self.values.clear()
+            self.settings = settings
+
+    def get(self, key: Hashable) -> Any:
+        """Get the memoised decision for a word type.
+
+        Args:
+            key (Hashable): The key of the word type (e.g the lexeme orth).
+
+        Returns:
+            Any: The decision, or None if it has not been memoised.
+        """
+        return self.values.get(key)
+
+    def add(self, key: Hashable, value: Any) -> None:
+        """Memoise the decision for a word type.
+
+        Args:
+            key (Hashable): The key of the word type (e.g the lexeme orth).
+            value (Any): The decision (should not be None).
+        """
+        if len(self.values) >= self.max_size:
+            if not self.max_size:
+                return
+            self.values.clear()
+        self.values[key] = value
@@ -4,10 +4,13 @@ pretty much everything that is not a word.
 import re
 from typing import Dict, Optional, List
 from spacy.language import Language
+from spacy.tokens import Doc
 from medcat.config import Config
+from medcat.preprocessing.name_cache import PreparedNameCache
 
 
-def prepare_name(raw_name: str, nlp: Language, names: Dict, config: Config) -> Dict:
+def prepare_name(raw_name: str, nlp: Language, names: Dict, config: Config,
+                 cache: Optional[PreparedNameCache] = None) -> Dict:
     """Generates different forms of a name. Will edit the provided `names` dictionary
     and add information generated from the `name`.
 
@@ -21,16 +24,40 @@ def prepare_name(raw_name: str, nlp: Language, names: Dict, config: Config) -> D
             name versions and other required information will be added here.
         config (Config):
             Global config for medcat.
+        cache (Optional[PreparedNameCache]):
+            If set, the versions of the name are taken from (or added to) this cache. Its
+            settings need to be checked (see `PreparedNameCache.check_settings`) by the caller.
 
     Returns:
         names (Dict):
             The new dictionary of prepared names.
     """
-    sc_name = nlp(raw_name)
+    versions = cache.get(raw_name) if cache is not None else None
+    if versions is None:
+        sc_name = nlp(raw_name)
+        versions = get_name_versions(sc_name, config)
+        if cache is not None:
+            cache.add(raw_name, versions)
+    return add_name_versions(raw_name, versions, names, config)
 
+
+def get_name_versions(sc_name: Doc, config: Config) -> List[List[str]]:
+    """Get the tokens of the different versions (see `config.cdb_maker.name_versions`) of a name.
+
+    Only the versions that should be added (i.e not empty and with enough letters) are included.
+
+    Args:
+        sc_name (Doc):
+            The name processed by the spacy nlp model.
+        config (Config):
+            Global config for medcat.
+
+    Returns:
+        List[List[str]]: The tokens of each version of the name.
+    """
+    versions = []
     for version in config.cdb_maker['name_versions']:
         tokens = None
-        is_upper = sc_name.text.isupper()
 
         if version == "LOWER":
             tokens = [t.lower_ for t in sc_name if not t._.to_skip]
@@ -47,21 +74,45 @@ def prepare_name(raw_name: str, nlp: Language, names: Dict, config: Config) -> D
                         tokens.append(t.lemma_.lower())
 
         if tokens is not None and tokens:
-            snames = set()
             name = config.general['separator'].join(tokens)
 
             min_letters = config.cdb_maker.get('min_letters_required', 0)
             if not min_letters or len(re.sub("[^A-Za-z]*", '', name)) >= min_letters:
-                if name not in names:
-                    sname = ""
-                    for token in tokens:
-                        if sname:
-                            sname = sname + config.general['separator'] + token
-                        else:
-                            sname = token
-                        snames.add(sname.strip())
-
-                    names[name] = {'tokens': tokens, 'snames': snames, 'raw_name': raw_name, 'is_upper': is_upper}
+                versions.append(tokens)
+    return versions
+
+
+def add_name_versions(raw_name: str, versions: List[List[str]], names: Dict, config: Config) -> Dict:
+    """Add the versions of a name (see `get_name_versions`) to the `names` dictionary.
+
+    Args:
+        raw_name (str):
+            The raw name.
+        versions (List[List[str]]):
+            The tokens of each version of the name.
+        names (Dict):
+            Dictionary of existing names for this concept in this row of a CSV.
+        config (Config):
+            Global config for medcat.
+
+    Returns:
+        names (Dict):
+            The new dictionary of prepared names.
+    """
+    is_upper = raw_name.isupper()
+    for tokens in versions:
+        name = config.general['separator'].join(tokens)
+        if name not in names:
+            snames = set()
+            sname = ""
+            for token in tokens:
+                if sname:
+                    sname = sname + config.general['separator'] + token
+                else:
+                    sname = token
+                snames.add(sname.strip())
+
+            names[name] = {'tokens': tokens, 'snames': snames, 'raw_name': raw_name, 'is_upper': is_upper}
 
     return names
 
@@ -0,0 +1,118 @@
+"""A persistent cache of prepared names (see `medcat.preprocessing.cleaners.prepare_name`).
+
+The same raw names are prepared over and over again across CDB builds
+(e.g each new release of an ontology, enriching a CDB with the names
+of another one or adding concepts during training). Preparing a name
+requires running it through the spacy pipeline, so the cache keeps the
+tokens of each version of a name instead.
+"""
+import logging
+import pickle
+from typing import Dict, Hashable, List, Optional
+from spacy.language import Language
+from medcat.config import Config
+
+
+logger = logging.getLogger(__name__)
+
+
+class PreparedNameCache(object):
+    """Caches the tokens of the versions (see `get_name_versions`) of raw names.
+
+    The cached versions depend on the spacy model and the parts of the config
+    used in preparing the names (see `get_settings`). If any of those change,
+    the cache is cleared.
+    """
+
+    def __init__(self) -> None:
+        self.versions: Dict[str, List[List[str]]] = {}
+        self.settings: Optional[Hashable] = None
+
+    @staticmethod
+    def get_settings(nlp: Language, config: Config) -> Hashable:
+        """Get the settings the prepared names depend on.
+
+        Args:
+            nlp (Language): The spacy nlp model used for preparing the names.
+            config (Config): The global config for medcat.
+
+        Returns:
+            Hashable: The settings.
+        """
+        cnf_p = config.preprocessing
+        return (nlp.meta.get('lang'), nlp.meta.get('name'), nlp.meta.get('version'),
+                config.general.spacy_lemmatizer_mode,
+                tuple(sorted(config.general.spacy_disabled_components)),
+                tuple(config.cdb_maker.name_versions),
+                cnf_p.min_len_normalize,
+                frozenset(cnf_p.do_not_normalize),
+                config.general.separator,
+                config.cdb_maker.min_letters_required,
+                # The tokens to skip
+                frozenset(cnf_p.words_to_skip),
+                frozenset(cnf_p.keep_punct),
+                cnf_p.skip_stopwords,
+                frozenset(cnf_p.stopwords) if cnf_p.skip_stopwords and cnf_p.stopwords else None)
+
+    def check_settings(self, nlp: Language, config: Config) -> None:
+        """Make sure the cached names were prepared with the current spacy model and config.
+
+        If the settings have changed, the cached names are cleared.
+
+        Args:
+            nlp (Language): The spacy nlp model used for preparing the names.
+            config (Config): The global config for medcat.
+        """
+        settings = self.get_settings(nlp, config)
+        if settings != self.settings:
+            if self.versions:
+                logger.info("Name preparation settings changed, clearing %d cached names", len(self.versions))
+            self.versions.clear()
+            self.settings = settings
+
+    def get(self, raw_name: str) -> Optional[List[List[str]]]:
+        """Get the cached versions of a raw name.
+
+        Args:
+            raw_name (str): The raw name.
+
+        Returns:
+            Optional[List[List[str]]]: The tokens of each version of the name, or None if not cached.
+        """
+        return self.versions.get(raw_name)
+
+    def add(self, raw_name: str, versions: List[List[str]]) -> None:
+        """Cache the versions of a raw name.
+
+        Args:
+            raw_name (str): The raw name.
+            versions (List[List[str]]): The tokens of each version of the name.
+        """
+        self.versions[raw_name] = versions
+
+    def __len__(self) -> int:
+        return len(self.versions)
+
+    def save(self, path: str) -> None:
+        """Save the cache to disk.
+
+        Args:
+            path (str): The file to save to.
+        """
+        with open(path, 'wb') as f:
+            pickle.dump(self.__dict__, f)
+
+    @classmethod
+    def load(cls, path: str) -> "PreparedNameCache":
+        """Load the cache from disk.
+
+        Args:
+            path (str): The file to load from.
+
+        Returns:
+            PreparedNameCache: The loaded cache.
+        """
+        cache = cls()
+        with open(path, 'rb') as f:
+            cache.__dict__.update(pickle.load(f))
+        return cache
@@ -1,7 +1,9 @@
+from typing import Tuple
 from spacy.language import Language
-from spacy.tokens import Doc
-from medcat.config import Config
+from spacy.tokens import Doc, Token
+from medcat.config import Config, Preprocessing
 from medcat.pipeline.pipe_runner import PipeRunner
+from medcat.pipeline.lexeme_memo import LexemeMemo
 
 
 def tag_skip_and_punct(nlp: Language, name: str, config: Config) -> "_Tagger":
@@ -31,22 +33,37 @@ class _Tagger(PipeRunner):
     def __init__(self, nlp: Language, name: str, config: Config) -> None:
         self.name = name
         self.config = config
+        self.memo = LexemeMemo(self.config.preprocessing.lexeme_memo_size)
         super().__init__(self.config.general['workers'])
 
     # Override
     def __call__(self, doc: Doc) -> Doc:
         # Make life easier
         cnf_p = self.config.preprocessing
+        self.memo.max_size = cnf_p.lexeme_memo_size
+        self.memo.check_settings((self.config.punct_checker.pattern, self.config.word_skipper.pattern,
+                                  frozenset(cnf_p['keep_punct']), cnf_p['skip_stopwords']))
 
         for token in doc:
-            if self.config.punct_checker.match(token.lower_) and token.text not in cnf_p['keep_punct']:
-                # There can't be punct in a token if it also has text
+            # (is_punct, to_skip) only depend on the text
+            flags = self.memo.get(token.orth)
+            if flags is None:
+                flags = self._get_flags(token, cnf_p)
+                self.memo.add(token.orth, flags)
+            if flags[0]:
                 token._.is_punct = True
-                token._.to_skip = True
-            elif self.config.word_skipper.match(token.lower_):
-                # Skip if specific strings
-                token._.to_skip = True
-            elif cnf_p['skip_stopwords'] and token.is_stop:
+            if flags[1]:
                 token._.to_skip = True
 
         return doc
+
+    def _get_flags(self, token: Token, cnf_p: Preprocessing) -> Tuple[bool, bool]:
+        if self.config.punct_checker.match(token.lower_) and token.text not in cnf_p['keep_punct']:
+            # There can't be punct in a token if it also has text
+            return True, True
+        elif self.config.word_skipper.match(token.lower_):
+            # Skip if specific strings
+            return False, True
+        elif cnf_p['skip_stopwords'] and token.is_stop:
+            return False, True
+        return False, False
@@ -1,6 +1,7 @@
 import logging
 import contextlib
-from typing import Dict, TypedDict, Set, List, cast
+from typing import Any, Dict, Iterable, Iterator, TypedDict, Set, List, cast, KeysView, ItemsView, ValuesView
+from collections.abc import MutableMapping, MutableSet
 import numpy as np
 import tempfile
 import dill
@@ -8,7 +9,6 @@ import dill
 from copy import deepcopy
 
 
-
 logger = logging.getLogger(__name__) # separate logger from the package-level one
 
 
@@ -59,6 +59,144 @@ def copy_cdb_state(cdb) -> CDBState:
     })
 
 
+_ABSENT = object()
+
+
+def _copy_value(value: Any) -> Any:
+    # NOTE: a shallow copy is enough since the values within (e.g context vectors)
+    #       are replaced rather than changed in place
+    if isinstance(value, (dict, set, list)):
+        return type(value)(value)
+    return value
+
+
+class JournalingDict(MutableMapping):
+    """A dict overlay that keeps an undo log of the changes made through it.
+
+    The changes are made to the underlying dict directly.
+    Before a key is first changed (or a mutable value is first accessed
+    by key, i.e `d[key]`, since it may be changed in place), its original
+    value is recorded. Undoing the changes thus takes O(changes) rather than O(size).
+
+    Reading through `get`, `keys`, `items` and `values` is not recorded,
+    so that scanning the whole dict does not copy every value. The values
+    read that way should therefore not be changed in place.
+
+    Args:
+        base (dict): The underlying dict.
+    """
+
+    def __init__(self, base: dict) -> None:
+        self.base = base
+        self._journal: Dict[Any, Any] = {}
+
+    def _record(self, key: Any) -> None:
+        if key not in self._journal:
+            self._journal[key] = _copy_value(self.base[key]) if key in self.base else _ABSENT
+
+    def __getitem__(self, key: Any) -> Any:
+        value = self.base[key]
+        if key not in self._journal and isinstance(value, (dict, set, list)):
+            self._journal[key] = _copy_value(value)
+        return value
+
+    def __setitem__(self, key: Any, value: Any) -> None:
+        self._record(key)
+        self.base[key] = value
+
+    def __delitem__(self, key: Any) -> None:
+        self._record(key)
+        del self.base[key]
+
+    def __contains__(self, key: object) -> bool:
+        return key in self.base
+
+    def __iter__(self) -> Iterator:
+        return iter(self.base)
+
+    def __len__(self) -> int:
+        return len(self.base)
+
+    def get(self, key: Any, default: Any = None) -> Any:
+        return self.base.get(key, default)
+
+    def keys(self) -> KeysView:
+        return self.base.keys()
+
+    def items(self) -> ItemsView:
+        return self.base.items()
+
+    def values(self) -> ValuesView:
+        return self.base.values()
+
+    def undo(self) -> None:
+        """Revert the underlying dict to its original state."""
+        for key, value in self._journal.items():
+            if value is _ABSENT:
+                self.base.pop(key, None)
+            else:
+                self.base[key] = value
+        self._journal.clear()
+
+
+class JournalingSet(MutableSet):
+    """A set overlay that keeps track of the elements added and removed through it.
+
+    The changes are made to the underlying set directly.
+
+    Args:
+        base (set): The underlying set.
+    """
+
+    def __init__(self, base: set) -> None:
+        self.base = base
+        self._added: Set = set()
+        self._removed: Set = set()
+
+    @classmethod
+    def _from_iterable(cls, it: Iterable) -> set:
+        return set(it)
+
+    def add(self, value: Any) -> None:
+        if value in self.base:
+            return
+        self.base.add(value)
+        if value in self._removed:
+            self._removed.discard(value)
+        else:
+            self._added.add(value)
+
+    def discard(self, value: Any) -> None:
+        if value not in self.base:
+            return
+        self.base.discard(value)
+        if value in self._added:
+            self._added.discard(value)
+        else:
+            self._removed.add(value)
+
+    def update(self, *others: Iterable) -> None:
+        for other in others:
+            for value in other:
+                self.add(value)
+
+    def __contains__(self, value: object) -> bool:
+        return value in self.base
+
+    def __iter__(self) -> Iterator:
+        return iter(self.base)
+
+    def __len__(self) -> int:
+        return len(self.base)
+
+    def undo(self) -> None:
+        """Revert the underlying set to its original state."""
+        self.base -= self._added
+        self.base |= self._removed
+        self._added.clear()
+        self._removed.clear()
+
+
 def save_cdb_state(cdb, file_path: str) -> None:
     """Saves CDB state in a file.
 
@@ -152,15 +290,36 @@ def captured_state_cdb(cdb, save_state_to_disk: bool = False):
 def in_memory_state_capture(cdb):
     """Capture the CDB state in memory.
 
+    The parts of the state that are plain dicts or sets are temporarily
+    replaced by journaling overlays (see `JournalingDict` and `JournalingSet`)
+    so that only the changed entries are copied. Other parts (e.g memory
+    optimised ones) are (deep) copied.
+
     Args:
         cdb: The CDB to use.
 
     Yields:
         None
     """
-    state = copy_cdb_state(cdb)
-    yield
-    apply_cdb_state(cdb, state)
+    originals = {k: getattr(cdb, k) for k in CDBState.__annotations__}
+    overlays: Dict[str, Any] = {}
+    copies: Dict[str, Any] = {}
+    for k, v in originals.items():
+        if type(v) is dict:
+            overlays[k] = JournalingDict(v)
+        elif type(v) is set:
+            overlays[k] = JournalingSet(v)
+        else:
+            copies[k] = deepcopy(v)
+    for k, overlay in overlays.items():
+        setattr(cdb, k, overlay)
+    try:
+        yield
+    finally:
+        for k, overlay in overlays.items():
+            overlay.undo()
+            setattr(cdb, k, originals[k])
+        apply_cdb_state(cdb, cast(CDBState, copies))
 
 
 @contextlib.contextmanager
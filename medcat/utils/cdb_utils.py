@@ -1,19 +1,62 @@
+import os
 import logging
 import numpy as np
 
+from collections.abc import MutableSet
 from copy import deepcopy
+from typing import Any, Dict, Optional, Set
 from medcat.cdb import CDB
 
 logger = logging.getLogger(__name__) # separate logger from the package-level one
 
 
+def _copy_containers(value: Any) -> Any:
+    # copies the (nested) containers, but shares the leaves (e.g strings and context vectors)
+    # this is safe since the CDB replaces rather than modifies the context vectors
+    if isinstance(value, dict):
+        return {key: _copy_containers(val) for key, val in value.items()}
+    if isinstance(value, (set, list)):
+        return type(value)(value)
+    return value
+
+
+def _copy_map(d: Dict, share_unchanged: bool) -> Dict:
+    if share_unchanged:
+        return dict(d)
+    return {key: _copy_containers(val) for key, val in d.items()}
+
+
+class _CopyOnWrite:
+    """Keeps track of the per-key values of a merged CDB that are shared with the inputs.
+
+    Before a shared value is modified in place, it needs to be copied.
+    """
+
+    def __init__(self) -> None:
+        self._copied: Dict[int, Set[Any]] = {}
+
+    def own(self, d: Dict, key: Any) -> None:
+        copied = self._copied.setdefault(id(d), set())
+        if key in d and key not in copied:
+            d[key] = _copy_containers(d[key])
+        copied.add(key)
+
+
 def merge_cdb(cdb1: CDB, 
               cdb2: CDB, 
               overwrite_training: int = 0,
-              full_build: bool = False) -> CDB:
+              full_build: bool = False,
+              share_unchanged: bool = False) -> CDB:
     """Merge two CDB's together to produce a new, single CDB. The contents of inputs CDBs will not be changed.
     `addl_info` can not be perfectly merged, and will prioritise cdb1. see `full_build`
 
+    The merged CDB never deep copies the inputs. Only the containers (dicts, sets, lists) are copied,
+    while their contents (e.g names and context vectors) are shared with the input CDBs.
+    If `share_unchanged` is set, the per-concept and per-name containers are shared with the
+    inputs as well, and only the ones that are changed by the merge are copied. This makes the
+    merge a lot faster and lighter on memory, but the merged CDB should then be treated as read only
+    (e.g saved to disk) since modifying it (e.g by training) would modify the input CDBs as well.
+
     Args:
         cdb1 (CDB):
             The first medcat cdb to merge. In cases where merging isn't suitable isn't ideal (such as
@@ -24,6 +67,8 @@ def merge_cdb(cdb1: CDB,
             Choose to prioritise a CDB's context vectors values over merging gracefully. 0 - no prio, 1 - CDB1, 2 - CDB2
         full_build (bool):
             Add additional information from "addl_info" dicts "cui2ontologies" and "cui2description"
+        share_unchanged (bool):
+            Whether to share the unchanged per-concept and per-name data with the input CDBs. Defaults to False.
 
     Returns:
         CDB: The merged CDB.
@@ -32,20 +77,24 @@ def merge_cdb(cdb1: CDB,
     cdb = CDB(config)
 
     # Copy CDB 1 - as all settings from CDB 1 will be carried over
-    cdb.cui2names = deepcopy(cdb1.cui2names)
-    cdb.cui2snames = deepcopy(cdb1.cui2snames)
-    cdb.cui2count_train = deepcopy(cdb1.cui2count_train)
-    cdb.cui2info = deepcopy(cdb1.cui2info)
-    cdb.cui2context_vectors = deepcopy(cdb1.cui2context_vectors)
-    cdb.cui2tags = deepcopy(cdb1.cui2tags)
-    cdb.cui2type_ids = deepcopy(cdb1.cui2type_ids)
-    cdb.cui2preferred_name = deepcopy(cdb1.cui2preferred_name)
-    cdb.name2cuis = deepcopy(cdb1.name2cuis)
-    cdb.name2cuis2status = deepcopy(cdb1.name2cuis2status)
-    cdb.name2count_train = deepcopy(cdb1.name2count_train)
-    cdb.name_isupper = deepcopy(cdb1.name_isupper)
+    cdb.cui2names = _copy_map(cdb1.cui2names, share_unchanged)
+    cdb.cui2snames = _copy_map(cdb1.cui2snames, share_unchanged)
+    cdb.cui2count_train = dict(cdb1.cui2count_train)
+    cdb.cui2info = _copy_map(cdb1.cui2info, share_unchanged)
+    cdb.cui2context_vectors = _copy_map(cdb1.cui2context_vectors, share_unchanged)
+    cdb.cui2tags = _copy_map(cdb1.cui2tags, share_unchanged)
+    cdb.cui2type_ids = _copy_map(cdb1.cui2type_ids, share_unchanged)
+    cdb.cui2preferred_name = dict(cdb1.cui2preferred_name)
+    cdb.name2cuis = _copy_map(cdb1.name2cuis, share_unchanged)
+    cdb.name2cuis2status = _copy_map(cdb1.name2cuis2status, share_unchanged)
+    cdb.name2count_train = dict(cdb1.name2count_train)
+    cdb.name_isupper = dict(cdb1.name_isupper)
     if full_build:
-        cdb.addl_info = deepcopy(cdb1.addl_info)
+        cdb.addl_info = {key: (_copy_map(val, share_unchanged) if isinstance(val, dict) else deepcopy(val))
+                         for key, val in cdb1.addl_info.items()}
+    # the shared values that are about to be modified in place need to be copied first
+    cow = _CopyOnWrite()
+    copy_value = (lambda value: value) if share_unchanged else _copy_containers
 
     # handles cui2names, cui2snames, name_isupper, name2cuis, name2cuis2status, cui2preferred_name
     for cui in cdb2.cui2names:
@@ -53,6 +102,9 @@ def merge_cdb(cdb1: CDB,
         for name in cdb2.cui2names[cui]:
             names[name] = {'snames': cdb2.cui2snames.get(cui, set()), 'is_upper': cdb2.name_isupper.get(name, False), 'tokens': {}, 'raw_name': cdb2.get_name(cui)}
             name_status = cdb2.name2cuis2status.get(name, {}).get(cui, 'A') # get the name status if it exists, default to 'A'
+            if share_unchanged:
+                cow.own(cdb.name2cuis, name)
+                cow.own(cdb.name2cuis2status, name)
         # For addl_info check cui2original_names as they MUST be added
         ontologies = set()
         description = ''
@@ -63,8 +115,16 @@ def merge_cdb(cdb1: CDB,
                 ontologies.update(cdb2.addl_info['cui2ontologies'][cui])
             if 'cui2description' in cdb2.addl_info:
                 description = cdb2.addl_info['cui2description'][cui]
+        if share_unchanged:
+            for cui_map in (cdb.cui2names, cdb.cui2snames, cdb.cui2type_ids, cdb.cui2context_vectors, cdb.cui2tags):
+                cow.own(cui_map, cui)
+            if to_build:
+                cow.own(cdb.addl_info['cui2ontologies'], cui)
+                cow.own(cdb.addl_info['cui2original_names'], cui)
+                for type_id in cdb2.cui2type_ids[cui]:
+                    cow.own(cdb.addl_info['type_id2cuis'], type_id)
         cdb._add_concept(cui=cui, names=names, ontologies=ontologies, name_status=name_status,
-                        type_ids=cdb2.cui2type_ids[cui], description=description, full_build=to_build)
+                        type_ids=set(cdb2.cui2type_ids[cui]), description=description, full_build=to_build)
         if cui in cdb1.cui2names:
             if (cui in cdb1.cui2count_train or cui in cdb2.cui2count_train) and not (overwrite_training == 1 and cui in cdb1.cui2count_train): 
                 if overwrite_training == 2 and cui in cdb2.cui2count_train:
@@ -86,15 +146,15 @@ def merge_cdb(cdb1: CDB,
                 cdb.cui2type_ids[cui] = cdb1.cui2type_ids[cui].union(cdb2.cui2type_ids[cui])
         else:
             if cui in cdb2.cui2count_train: 
-                cdb.cui2count_train[cui] = cdb2.cui2names[cui]
+                cdb.cui2count_train[cui] = cdb2.cui2count_train[cui]
             if cui in cdb2.cui2info: 
-                cdb.cui2info[cui] = cdb2.cui2info[cui]
+                cdb.cui2info[cui] = copy_value(cdb2.cui2info[cui])
             if cui in cdb2.cui2context_vectors: 
-                cdb.cui2context_vectors[cui] = cdb2.cui2context_vectors[cui]
+                cdb.cui2context_vectors[cui] = copy_value(cdb2.cui2context_vectors[cui])
             if cui in cdb2.cui2tags: 
-                cdb.cui2tags[cui] = cdb2.cui2tags[cui]
+                cdb.cui2tags[cui] = copy_value(cdb2.cui2tags[cui])
             if cui in cdb2.cui2type_ids: 
-                cdb.cui2type_ids[cui] = cdb2.cui2type_ids[cui]
+                cdb.cui2type_ids[cui] = copy_value(cdb2.cui2type_ids[cui])
 
     if overwrite_training != 1:
         for name in cdb2.name2cuis:
@@ -109,7 +169,7 @@ def merge_cdb(cdb1: CDB,
     cdb.snames = cdb1.snames.union(cdb2.snames)
 
     # vocab, adding counts if they occur in both
-    cdb.vocab = deepcopy(cdb1.vocab)
+    cdb.vocab = dict(cdb1.vocab)
     if overwrite_training != 1:
         for word in cdb2.vocab:
             if word in cdb.vocab and overwrite_training == 0:
@@ -118,3 +178,217 @@ def merge_cdb(cdb1: CDB,
                 cdb.vocab[word] = cdb2.vocab[word]
 
     return cdb
+
+
+def _concept_changed(cdb: CDB, new_cdb: CDB, cui: str) -> bool:
+    if cdb.cui2names[cui] != new_cdb.cui2names[cui]:
+        return True
+    if cdb.cui2type_ids.get(cui) != new_cdb.cui2type_ids[cui]:
+        return True
+    if cui in new_cdb.cui2preferred_name and cdb.cui2preferred_name.get(cui) != new_cdb.cui2preferred_name[cui]:
+        return True
+    return any(cdb.name2cuis2status.get(name, {}).get(cui) != new_cdb.name2cuis2status[name][cui]
+               for name in new_cdb.cui2names[cui])
+
+
+def _get_snames(name: str, separator: str) -> Set[str]:
+    # the subnames of a name are all its leading tokens (see `prepare_name`)
+    tokens = name.split(separator)
+    return {separator.join(tokens[:i + 1]) for i in range(len(tokens))}
+
+
+def _remove_from_vocab(cdb: CDB, name: str) -> None:
+    # undoes the counting of the words of a linked name (see `_copy_concept`)
+    for token in name.split(cdb.config.general.separator):
+        if token in cdb.vocab:
+            cdb.vocab[token] -= 1
+            if cdb.vocab[token] <= 0:
+                del cdb.vocab[token]
+                cdb._vocab_version += 1
+
+
+def _unlink_name(cdb: CDB, cui: str, name: str) -> None:
+    # unlike CDB._remove_names, this does not change the status of the other CUIs linked to the name
+    if cui in cdb.name2cuis.get(name, ()):
+        cdb.name2cuis[name] = [other for other in cdb.name2cuis[name] if other != cui]
+        _remove_from_vocab(cdb, name)
+        if not cdb.name2cuis[name]:
+            del cdb.name2cuis[name]
+            cdb.name_isupper.pop(name, None)
+    if name in cdb.name2cuis2status:
+        cdb.name2cuis2status[name].pop(cui, None)
+        if not cdb.name2cuis2status[name]:
+            del cdb.name2cuis2status[name]
+
+
+def _copy_concept(cdb: CDB, new_cdb: CDB, cui: str, full_build: bool, learned_names: Set[str]) -> None:
+    # copy the names (and other core information) of a concept, but not its training
+    # (nor the names learned through training, which are kept along with their subnames)
+    old_type_ids = cdb.cui2type_ids.get(cui, set())
+    separator = cdb.config.general.separator
+    learned_snames = set().union(*(_get_snames(name, separator) for name in learned_names))
+    cdb.cui2names[cui] = set(new_cdb.cui2names[cui]) | learned_names
+    cdb.cui2snames[cui] = set(new_cdb.cui2snames[cui]) | (learned_snames & cdb.cui2snames.get(cui, set()))
+    if isinstance(cdb.snames, MutableSet):
+        cdb.snames.update(new_cdb.cui2snames[cui])
+    cdb.cui2type_ids[cui] = set(new_cdb.cui2type_ids[cui])
+    if cui in new_cdb.cui2preferred_name:
+        cdb.cui2preferred_name[cui] = new_cdb.cui2preferred_name[cui]
+    for name in new_cdb.cui2names[cui]:
+        if name not in cdb.name2cuis:
+            cdb.name2cuis[name] = []
+        if cui not in cdb.name2cuis[name]:
+            cdb.name2cuis[name].append(cui)
+            # the vocab counts the words of every linked name
+            for token in name.split(cdb.config.general.separator):
+                if token not in cdb.vocab:
+                    cdb._vocab_version += 1
+                cdb.vocab[token] = cdb.vocab.get(token, 0) + 1
+        if name not in cdb.name2cuis2status:
+            cdb.name2cuis2status[name] = {}
+        cdb.name2cuis2status[name][cui] = new_cdb.name2cuis2status[name][cui]
+        cdb.name_isupper[name] = new_cdb.name_isupper.get(name, False)
+    if full_build:
+        for key in ('cui2ontologies', 'cui2description', 'cui2original_names'):
+            if cui in new_cdb.addl_info.get(key, {}):
+                cdb.addl_info.setdefault(key, {})[cui] = _copy_containers(new_cdb.addl_info[key][cui])
+            elif key in cdb.addl_info:
+                cdb.addl_info[key].pop(cui, None)
+        type_id2cuis = cdb.addl_info.setdefault('type_id2cuis', {})
+        for type_id in old_type_ids - cdb.cui2type_ids[cui]:
+            type_id2cuis.get(type_id, set()).discard(cui)
+        for type_id in cdb.cui2type_ids[cui]:
+            type_id2cuis.setdefault(type_id, set()).add(cui)
+
+
+def update_cdb(cdb: CDB,
+               new_cdb: CDB,
+               remove_missing_cuis: bool = True,
+               full_build: bool = False,
+               prev_cdb: Optional[CDB] = None,
+               unchanged_cuis: Optional[Set[str]] = None) -> Dict[str, int]:
+    """Update a (trained) CDB in place to match a newly built one, e.g from a new release of the ontology.
+
+    Only the concepts that were added, changed (i.e their names, name statuses, type IDs or
+    preferred name differ) or removed are touched. The training (context vectors, counts, etc)
+    of all the concepts that are kept is preserved. This is generally a lot faster than
+    rebuilding the CDB and merging the training back in (see `merge_cdb`).
+
+    Training can also add names (and concepts) to a CDB. If the build of the previous release
+    (i.e the untrained CDB the trained one started from) is specified, the releases are compared
+    instead, so only the names and concepts that came from the previous release are removed.
+    Otherwise, the changed concepts get exactly the names in the new CDB, i.e the names they
+    learned through training are removed.
+
+    Args:
+        cdb (CDB):
+            The (trained) CDB to update.
+        new_cdb (CDB):
+            The newly built (untrained) CDB.
+        remove_missing_cuis (bool):
+            Whether to remove the concepts that are not in the new CDB. Defaults to True.
+        full_build (bool):
+            Whether to also update the "addl_info" (ontologies, descriptions, original names
+            and type IDs) of the added and changed concepts. Defaults to False.
+        prev_cdb (Optional[CDB]):
+            The build of the previous release, used to keep the names and concepts learned
+            through training. Defaults to None.
+        unchanged_cuis (Optional[Set[str]]):
+            The concepts known to be the same as in the previous release, which are
+            not in the new CDB (e.g they were not built again) and are left as they are.
+            Defaults to None.
+
+    Returns:
+        Dict[str, int]: The number of concepts that were added, changed, removed and unchanged.
+    """
+    release_cdb = prev_cdb if prev_cdb is not None else cdb
+    unchanged_cuis = unchanged_cuis or set()
+    added, changed = [], []
+    for cui in new_cdb.cui2names:
+        if cui not in cdb.cui2names:
+            added.append(cui)
+        elif cui not in release_cdb.cui2names or _concept_changed(release_cdb, new_cdb, cui):
+            changed.append(cui)
+    removed = [cui for cui in cdb.cui2names
+               if cui not in new_cdb.cui2names and cui not in unchanged_cuis
+               and cui in release_cdb.cui2names] if remove_missing_cuis else []
+
+    if removed:
+        removed_names = set().union(*(cdb.cui2names[cui] for cui in removed))
+        for cui in removed:
+            for name in cdb.cui2names[cui]:
+                if cui in cdb.name2cuis.get(name, ()):
+                    _remove_from_vocab(cdb, name)
+        cdb.remove_cuis(removed)
+        for name in removed_names:
+            # as in a rebuilt CDB, drop the names no longer linked to any concept
+            if name in cdb.name2cuis and not cdb.name2cuis[name]:
+                del cdb.name2cuis[name]
+                cdb.name_isupper.pop(name, None)
+            if name in cdb.name2cuis2status and not cdb.name2cuis2status[name]:
+                del cdb.name2cuis2status[name]
+        if full_build:
+            for key in ('cui2ontologies', 'cui2description', 'cui2original_names'):
+                for cui in removed:
+                    cdb.addl_info.get(key, {}).pop(cui, None)
+            for cuis in cdb.addl_info.get('type_id2cuis', {}).values():
+                cuis.difference_update(removed)
+    stale_snames: Set[str] = set()
+    learned_names: Dict[str, Set[str]] = {}
+    for cui in changed:
+        release_names = cdb.cui2names[cui] & release_cdb.cui2names.get(cui, set())
+        for name in release_names - new_cdb.cui2names[cui]:
+            _unlink_name(cdb, cui, name)
+        learned_names[cui] = cdb.cui2names[cui] - release_names - new_cdb.cui2names[cui]
+        stale_snames.update(set(cdb.cui2snames.get(cui, ())) - new_cdb.cui2snames[cui])
+    for cui in added + changed:
+        _copy_concept(cdb, new_cdb, cui, full_build, learned_names.get(cui, set()))
+    cdb._discard_unused_snames(stale_snames)
+    cdb.is_dirty = True
+
+    stats = {'added': len(added), 'changed': len(changed), 'removed': len(removed),
+             'unchanged': len(new_cdb.cui2names) - len(added) - len(changed) + len(unchanged_cuis)}
+    logger.info("Updated the CDB: %s", stats)
+    return stats
+
+
+def save_merged_cdb(cdb1: CDB,
+                    cdb2: CDB,
+                    save_dir_path: str,
+                    overwrite_training: int = 0,
+                    full_build: bool = False,
+                    cdb_format: str = 'dill') -> str:
+    """Merge two CDB's and write the result straight into a model pack folder.
+
+    The CDB (`cdb.dat` and, if applicable, its JSON parts) and its config (`config.json`)
+    are written in the same layout as in a model pack. Since the merged CDB is only written
+    to disk, it shares all the unchanged data with the input CDBs (see `merge_cdb`) and is
+    not kept in memory afterwards.
+
+    Args:
+        cdb1 (CDB):
+            The first medcat cdb to merge. This cdb's values are prioritised (see `merge_cdb`).
+        cdb2 (CDB):
+            The second medcat cdb to merge.
+        save_dir_path (str):
+            The model pack folder to write the merged CDB to.
+        overwrite_training (int):
+            Choose to prioritise a CDB's context vectors values over merging gracefully. 0 - no prio, 1 - CDB1, 2 - CDB2
+        full_build (bool):
+            Add additional information from "addl_info" dicts "cui2ontologies" and "cui2description"
+        cdb_format (str):
+            The format of the saved CDB (either 'dill' or 'json'). Defaults to 'dill'.
+
+    Returns:
+        str: The path to the saved CDB.
+    """
+    cdb = merge_cdb(cdb1, cdb2, overwrite_training=overwrite_training,
+                    full_build=full_build, share_unchanged=True)
+    save_dir_path = os.path.expanduser(save_dir_path)
+    os.makedirs(save_dir_path, exist_ok=True)
+    json_path = save_dir_path if cdb_format.lower() == 'json' else None
+    cdb_path = os.path.join(save_dir_path, "cdb.dat")
+    logger.info('Saving merged CDB to %s in %s format', save_dir_path, cdb_format)
+    cdb.save(cdb_path, json_path)
+    cdb.config.save(os.path.join(save_dir_path, "config.json"))
+    return cdb_path
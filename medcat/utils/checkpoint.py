@@ -1,8 +1,11 @@
 import os
 import logging
 import time
+import dill
+import numpy as np
+from concurrent.futures import Future, ThreadPoolExecutor
 from dataclasses import dataclass
-from typing import List, Tuple, Optional, TypeVar, Type
+from typing import Any, Callable, Dict, List, Tuple, Optional, TypeVar, Type, cast
 from medcat.cdb import CDB
 from medcat.utils.decorators import check_positive
 
@@ -12,9 +15,86 @@ T = TypeVar("T", bound="Checkpoint")
 logger = logging.getLogger(__name__) # separate logger from the package-level one
 
 
+# attributes that are never part of a delta record
+_DELTA_IGNORED_ATTRS = ('config', '_config_from_file')
+
+
+def _copy_entry(value: Any) -> Any:
+    # copies the containers but not the leaves (e.g arrays are shared)
+    if isinstance(value, dict):
+        return {k: _copy_entry(v) for k, v in value.items()}
+    if isinstance(value, (set, list)):
+        return type(value)(value)
+    return value
+
+
+def _is_same(old: Any, new: Any) -> bool:
+    # NOTE: arrays are compared by identity since the CDB always replaces
+    #       (rather than modifies in place) its context vectors
+    if isinstance(old, np.ndarray) or isinstance(new, np.ndarray):
+        return old is new
+    if isinstance(new, dict):
+        return (isinstance(old, dict) and old.keys() == new.keys() and
+                all(_is_same(old[k], v) for k, v in new.items()))
+    if isinstance(new, (set, list, str, int, float, bool, tuple, frozenset)) or new is None:
+        return type(old) is type(new) and old == new
+    return old is new
+
+
+def _get_changes(shadow: Dict[str, Any], cdb: CDB) -> Dict[str, Tuple[str, Any, Any]]:
+    changes: Dict[str, Tuple[str, Any, Any]] = {}
+    for attr, new in cdb.__dict__.items():
+        if attr in _DELTA_IGNORED_ATTRS:
+            continue
+        old = shadow.get(attr)
+        if isinstance(new, dict) and isinstance(old, dict):
+            updated = {k: _copy_entry(v) for k, v in new.items()
+                       if k not in old or not _is_same(old[k], v)}
+            removed = [k for k in old if k not in new]
+            if updated or removed:
+                changes[attr] = ('dict', updated, removed)
+        elif isinstance(new, set) and isinstance(old, set):
+            added, removed_set = new - old, old - new
+            if added or removed_set:
+                changes[attr] = ('set', added, removed_set)
+        elif attr not in shadow or not _is_same(old, new):
+            changes[attr] = ('value', _copy_entry(new), None)
+    return changes
+
+
+def _apply_changes(attrs: Dict[str, Any], changes: Dict[str, Tuple[str, Any, Any]]) -> None:
+    for attr, (kind, first, second) in changes.items():
+        if kind == 'dict':
+            target = attrs.setdefault(attr, {})
+            for key in second:
+                target.pop(key, None)
+            target.update(first)
+        elif kind == 'set':
+            target = attrs.setdefault(attr, set())
+            target -= second
+            target |= first
+        else:
+            attrs[attr] = _copy_entry(first)
+
+
 class Checkpoint(object):
     """The base class of checkpoint objects
 
+    Every `full_every` checkpoints the entire CDB is saved (a full snapshot).
+    The checkpoints in between are saved as delta records which only hold
+    the parts of the CDB that have changed since the previous checkpoint.
+    The delta records are appended to a log next to their full snapshot
+    and are replayed when the CDB is restored. In order to find the changes,
+    the checkpoint keeps a copy of the containers (but not the vectors) of
+    the CDB as of the last checkpoint.
+
+    With deltas (i.e `full_every` above 1), both the full snapshots and the delta
+    records are written on a background thread. The parts of the CDB that are
+    written are copied (again, without the vectors) in the calling thread first,
+    so that training can carry on modifying the CDB while the checkpoint is being
+    written. Without deltas, the CDB is neither copied nor shadowed and every
+    checkpoint is written in the calling thread.
+
     Args:
         dir_path (str):
             The path to the parent directory of checkpoint files.
@@ -22,19 +102,30 @@ class Checkpoint(object):
             The number of processed sentences/documents before a checkpoint is saved
             (N.B.: A small number could result in error "no space left on device"),
         max_to_keep (int):
-            The maximum number of checkpoints to keep
+            The maximum number of (full) checkpoints to keep
             (N.B.: A large number could result in error "no space left on device").
+        full_every (int):
+            The number of checkpoints between full snapshots of the CDB.
+            If 1 (the default), every checkpoint is a full snapshot written in the calling thread
+            (i.e no deltas are saved and nothing is written in the background).
     """
     DEFAULT_STEP = 1000
     DEFAULT_MAX_TO_KEEP = 1
+    DEFAULT_FULL_EVERY = 1
 
     @check_positive
-    def __init__(self, dir_path: str, *, steps: int = DEFAULT_STEP, max_to_keep: int = DEFAULT_MAX_TO_KEEP) -> None:
+    def __init__(self, dir_path: str, *, steps: int = DEFAULT_STEP, max_to_keep: int = DEFAULT_MAX_TO_KEEP,
+                 full_every: int = DEFAULT_FULL_EVERY) -> None:
         self._dir_path = os.path.abspath(dir_path)
         self._steps = steps
         self._max_to_keep = max_to_keep
+        self._full_every = full_every
         self._file_paths: List[str] = []
         self._count = 0
+        self._shadow: Optional[Dict[str, Any]] = None
+        self._deltas_since_full = 0
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._pending: List[Future] = []
         os.makedirs(self._dir_path, exist_ok=True)
 
     @property
@@ -55,6 +146,15 @@ class Checkpoint(object):
         check_positive(lambda _: ...)(value)    # [https://github.com/python/mypy/issues/1362]
         self._max_to_keep = value
 
+    @property
+    def full_every(self) -> int:
+        return self._full_every
+
+    @full_every.setter
+    def full_every(self, value: int) -> None:
+        check_positive(lambda _: ...)(value)    # [https://github.com/python/mypy/issues/1362]
+        self._full_every = value
+
     @property
     def count(self) -> int:
         return self._count
@@ -64,12 +164,15 @@ class Checkpoint(object):
         return self._dir_path
 
     @classmethod
-    def from_latest(cls: Type[T], dir_path: str) -> T:
+    def from_latest(cls: Type[T], dir_path: str, full_every: int = DEFAULT_FULL_EVERY) -> T:
         """Retrieve the latest checkpoint from the parent directory.
 
         Args:
             dir_path (str):
                 The path to the directory containing checkpoint files.
+            full_every (int):
+                The number of checkpoints between full snapshots of the CDB
+                (Default value `DEFAULT_FULL_EVERY`).
 
         Returns:
             T: A new checkpoint object.
@@ -84,34 +187,119 @@ class Checkpoint(object):
             raise Exception("Checkpoints not found. You need to train from scratch.")
         latest_ckpt = ckpt_file_paths[-1]
         steps, count = cls._get_steps_and_count(latest_ckpt)
+        deltas = cls._read_deltas(cls._get_delta_file_path(latest_ckpt))
 
-        checkpoint = cls(dir_path, steps=steps)
+        checkpoint = cls(dir_path, steps=steps, full_every=full_every)
         checkpoint._file_paths = ckpt_file_paths
-        checkpoint._count = count
+        checkpoint._count = deltas[-1][0] if deltas else count
         logger.info(f"Checkpoint loaded from {latest_ckpt}")
         return checkpoint
 
     def save(self, cdb: CDB, count: int) -> None:
         """Save the CDB as the latest checkpoint.
 
+        Depending on `full_every`, this is either a full snapshot of the CDB
+        or a delta record holding the changes since the previous checkpoint.
+
         Args:
             cdb (CDB):
                 The MedCAT CDB object to be checkpointed.
             count (int):
                 The number of the finished steps.
         """
+        if (self._shadow is None or not self._file_paths or getattr(cdb, '_memory_optimised_parts', None) or
+                self._deltas_since_full + 1 >= self._full_every):
+            self._save_full(cdb, count)
+        else:
+            self._save_delta(cdb, count)
+        self._count = count
+
+    def _save_full(self, cdb: CDB, count: int) -> None:
+        # the previous writes are waited for so that no file is removed while it's written
+        self.flush()
         ckpt_file_path = os.path.join(os.path.abspath(self._dir_path), "checkpoint-%s-%s" % (self.steps, count))
         while len(self._file_paths) >= self._max_to_keep:
             to_remove = self._file_paths.pop(0)
             os.remove(to_remove)
-        cdb.save(ckpt_file_path)
-        logger.debug("Checkpoint saved: %s", ckpt_file_path)
+            delta_file_path = self._get_delta_file_path(to_remove)
+            if os.path.exists(delta_file_path):
+                os.remove(delta_file_path)
         self._file_paths.append(ckpt_file_path)
-        self._count = count
+        self._deltas_since_full = 0
+        self._shadow = self._create_shadow(cdb) if self._full_every > 1 else None
+        if self._full_every == 1 or getattr(cdb, '_memory_optimised_parts', None):
+            # without deltas, the CDB is not copied for a background write (and
+            # the memory optimised parts can not be copied), so it is written in the calling thread
+            cdb.save(ckpt_file_path)
+            logger.debug("Checkpoint saved: %s", ckpt_file_path)
+            return
+        self._submit(self._save_snapshot, self._create_snapshot(cdb), ckpt_file_path)
+        logger.debug("Checkpoint queued for: %s", ckpt_file_path)
+
+    def _save_delta(self, cdb: CDB, count: int) -> None:
+        # the changes are found (and copied) in the calling thread
+        # so that the CDB can be modified while they are being written
+        shadow = cast(Dict[str, Any], self._shadow)
+        changes = _get_changes(shadow, cdb)
+        _apply_changes(shadow, changes)
+        delta_file_path = self._get_delta_file_path(self._file_paths[-1])
+        self._submit(self._append_delta, delta_file_path, count, changes)
+        self._deltas_since_full += 1
+        logger.debug("Checkpoint delta with %d changed parts queued for: %s", len(changes), delta_file_path)
+
+    def _submit(self, func: Callable, *args: Any) -> None:
+        # a single worker, so that the writes happen in the order they were queued
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="medcat-checkpoint")
+        self._pending.append(self._executor.submit(func, *args))
+
+    @staticmethod
+    def _create_snapshot(cdb: CDB) -> CDB:
+        snapshot = CDB.__new__(CDB)
+        snapshot.__dict__.update({attr: val if attr in _DELTA_IGNORED_ATTRS else _copy_entry(val)
+                                  for attr, val in cdb.__dict__.items()})
+        return snapshot
+
+    @staticmethod
+    def _save_snapshot(snapshot: CDB, ckpt_file_path: str) -> None:
+        snapshot.save(ckpt_file_path)
+        logger.debug("Checkpoint saved: %s", ckpt_file_path)
+
+    @staticmethod
+    def _append_delta(delta_file_path: str, count: int, changes: Dict[str, Tuple[str, Any, Any]]) -> None:
+        with open(delta_file_path, 'ab') as f:
+            dill.dump((count, changes), f)
+
+    def flush(self) -> None:
+        """Wait for all the queued checkpoint writes to finish.
+
+        Raises:
+            Exception: If any of the queued writes failed.
+        """
+        pending, self._pending = self._pending, []
+        for future in pending:
+            future.result()
+
+    def close(self) -> None:
+        """Wait for all the queued checkpoint writes to finish and shut down the background writer.
+
+        The checkpoint can still be used afterwards, a new writer is started when needed.
+
+        Raises:
+            Exception: If any of the queued writes failed.
+        """
+        try:
+            self.flush()
+        finally:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
 
     def restore_latest_cdb(self) -> CDB:
         """Restore the CDB from the latest checkpoint.
 
+        This loads the latest full snapshot and replays its delta records (if any).
+
         Returns:
             cdb (CDB):
                 The MedCAT CDB object.
@@ -119,6 +307,7 @@ class Checkpoint(object):
         Raises:
             Exception: If no checkpoint is found.
         """
+        self.flush()
         if not os.path.isdir(self._dir_path):
             raise Exception("Checkpoints not found. You need to train from scratch.")
         ckpt_file_paths = self._get_ckpt_file_paths(self._dir_path)
@@ -127,8 +316,39 @@ class Checkpoint(object):
         latest_ckpt = ckpt_file_paths[-1]
         _, count = self._get_steps_and_count(latest_ckpt)
         self._file_paths = ckpt_file_paths
+        cdb = CDB.load(self._file_paths[-1])
+        deltas = self._read_deltas(self._get_delta_file_path(latest_ckpt))
+        for count, changes in deltas:
+            _apply_changes(cdb.__dict__, changes)
+        if deltas:
+            logger.info("Replayed %d checkpoint deltas on top of %s", len(deltas), latest_ckpt)
         self._count = count
-        return CDB.load(self._file_paths[-1])
+        self._deltas_since_full = len(deltas)
+        self._shadow = self._create_shadow(cdb) if self._full_every > 1 else None
+        return cdb
+
+    @staticmethod
+    def _create_shadow(cdb: CDB) -> Dict[str, Any]:
+        return {attr: _copy_entry(val) for attr, val in cdb.__dict__.items()
+                if attr not in _DELTA_IGNORED_ATTRS}
+
+    @staticmethod
+    def _read_deltas(delta_file_path: str) -> List[Tuple[int, Dict[str, Tuple[str, Any, Any]]]]:
+        deltas: List[Tuple[int, Dict[str, Tuple[str, Any, Any]]]] = []
+        if not os.path.isfile(delta_file_path):
+            return deltas
+        with open(delta_file_path, 'rb') as f:
+            while True:
+                try:
+                    deltas.append(dill.load(f))
+                except EOFError:
+                    break
+        return deltas
+
+    @staticmethod
+    def _get_delta_file_path(ckpt_file_path: str) -> str:
+        steps, count = Checkpoint._get_steps_and_count(ckpt_file_path)
+        return os.path.join(os.path.dirname(ckpt_file_path), "delta-%s-%s" % (steps, count))
 
     @staticmethod
     def _get_ckpt_file_paths(dir_path: str) -> List[str]:
@@ -149,6 +369,7 @@ class CheckpointConfig(object):
     output_dir: str = "checkpoints"
     steps: int = Checkpoint.DEFAULT_STEP
     max_to_keep: int = Checkpoint.DEFAULT_MAX_TO_KEEP
+    full_every: int = Checkpoint.DEFAULT_FULL_EVERY
 
 
 class CheckpointManager(object):
@@ -177,7 +398,8 @@ class CheckpointManager(object):
         dir_path = dir_path or os.path.join(os.path.abspath(os.getcwd()), self.checkpoint_config.output_dir, self.name, str(int(time.time())))
         return Checkpoint(dir_path,
                           steps=self.checkpoint_config.steps,
-                          max_to_keep=self.checkpoint_config.max_to_keep)
+                          max_to_keep=self.checkpoint_config.max_to_keep,
+                          full_every=self.checkpoint_config.full_every)
 
     def get_latest_checkpoint(self, base_dir_path: Optional[str] = None) -> "Checkpoint":
         """Retrieve the latest checkpoint from the checkpoint base directory.
@@ -191,7 +413,7 @@ class CheckpointManager(object):
         """
         base_dir_path = base_dir_path or os.path.join(os.path.abspath(os.getcwd()), self.checkpoint_config.output_dir, self.name)
         ckpt_dir_path = self.get_latest_training_dir(base_dir_path=base_dir_path)
-        checkpoint = Checkpoint.from_latest(dir_path=ckpt_dir_path)
+        checkpoint = Checkpoint.from_latest(dir_path=ckpt_dir_path, full_every=self.checkpoint_config.full_every)
         checkpoint.steps = self.checkpoint_config.steps
         checkpoint.max_to_keep = self.checkpoint_config.max_to_keep
         return checkpoint
@@ -0,0 +1,322 @@
+"""A precomputed (transitive closure) index of a concept hierarchy.
+
+Ontologies like SNOMED CT or UMLS describe their hierarchy as a parent to
+children map (see `cdb.addl_info['pt2ch']`). Finding all the descendants
+(or ancestors) of a concept from that requires walking the hierarchy for
+every query. Since the hierarchy is a directed acyclic graph (concepts can
+have multiple parents), the index instead stores the (sorted) ancestors of
+each concept in a compressed sparse row (CSR) layout over a topological
+order, as well as the inverse (the descendants of each concept). This allows:
+- All the ancestors / descendants of a concept in O(output)
+- Checking whether a concept is a descendant of another in O(log(nr of ancestors))
+- Batch queries over NumPy arrays of concepts
+"""
+import logging
+from collections import deque
+from typing import Dict, Iterable, List, Mapping, Tuple, Union
+
+import numpy as np
+
+
+logger = logging.getLogger(__name__)
+
+
+class HierarchyIndex(object):
+    """The transitive closure of a concept hierarchy.
+
+    The concepts are numbered (in topological order, parents before their
+    children where possible) and the ancestors and descendants of each one are
+    kept as (sorted) arrays of concept indices. Use `from_pt2ch` to build it.
+
+    Args:
+        cuis (List[str]): The concepts (in the order of their indices).
+        parents (Tuple[np.ndarray, np.ndarray]): The CSR (indptr, indices) of the direct parents.
+        ancestors (Tuple[np.ndarray, np.ndarray]): The CSR (indptr, indices) of all the ancestors.
+        descendants (Tuple[np.ndarray, np.ndarray]): The CSR (indptr, indices) of all the descendants.
+    """
+
+    def __init__(self, cuis: List[str],
+                 parents: Tuple[np.ndarray, np.ndarray],
+                 ancestors: Tuple[np.ndarray, np.ndarray],
+                 descendants: Tuple[np.ndarray, np.ndarray]) -> None:
+        self.cuis = cuis
+        self.cui2index: Dict[str, int] = {cui: index for index, cui in enumerate(cuis)}
+        self.parents = parents
+        self.ancestors = ancestors
+        self.descendants = descendants
+        self._ancestor_keys: Union[np.ndarray, None] = None
+
+    @classmethod
+    def from_pt2ch(cls, pt2ch: Mapping[str, Iterable[str]]) -> "HierarchyIndex":
+        """Build the index from a parent to children map.
+
+        If the hierarchy has cycles (which it should not), the concepts in a
+        cycle are considered ancestors (and descendants) of one another.
+
+        Args:
+            pt2ch (Mapping[str, Iterable[str]]): The children of each (parent) concept.
+
+        Returns:
+            HierarchyIndex: The index.
+        """
+        cuis = list(dict.fromkeys(cui for parent, children in pt2ch.items() for cui in (parent, *children)))
+        cui2index = {cui: index for index, cui in enumerate(cuis)}
+        nr_of_cuis = len(cuis)
+        ch2pt: List[List[int]] = [[] for _ in range(nr_of_cuis)]
+        pt2ch_ind: List[List[int]] = [[] for _ in range(nr_of_cuis)]
+        for parent, children in pt2ch.items():
+            parent_ind = cui2index[parent]
+            for child in set(children):
+                child_ind = cui2index[child]
+                if child_ind != parent_ind:
+                    ch2pt[child_ind].append(parent_ind)
+                    pt2ch_ind[parent_ind].append(child_ind)
+
+        order, nr_sorted = cls._get_topological_order(ch2pt, pt2ch_ind)
+        # renumber the concepts in topological order
+        new_index = np.empty(nr_of_cuis, dtype=np.int64)
+        new_index[order] = np.arange(nr_of_cuis)
+        cuis = [cuis[ind] for ind in order]
+        # NOTE: keeping the order of the parents (as in pt2ch)
+        ch2pt = [new_index[ch2pt[ind]].tolist() for ind in order]
+        pt2ch_ind = [new_index[pt2ch_ind[ind]].tolist() for ind in order]
+
+        empty = np.empty(0, dtype=np.int64)
+        ancestors: List[np.ndarray] = [empty] * nr_of_cuis
+        done = np.zeros(nr_of_cuis, dtype=bool)
+        for ind in range(nr_of_cuis):
+            parents = ch2pt[ind]
+            if ind < nr_sorted:
+                # all the parents are already done
+                if len(parents) == 1:
+                    ancestors[ind] = np.insert(ancestors[parents[0]],
+                                               np.searchsorted(ancestors[parents[0]], parents[0]), parents[0])
+                elif parents:
+                    ancestors[ind] = np.unique(np.concatenate(
+                        [np.asarray(parents, dtype=np.int64)] + [ancestors[parent] for parent in parents]))
+            else:
+                # In (or after) a cycle
+                ancestors[ind] = cls._find_ancestors(ind, ch2pt, ancestors, done)
+            done[ind] = True
+
+        anc_lengths = np.fromiter((len(anc) for anc in ancestors), dtype=np.int64, count=nr_of_cuis)
+        anc_indptr = np.concatenate([[0], np.cumsum(anc_lengths)])
+        anc_indices = np.concatenate(ancestors) if nr_of_cuis else empty
+        del ancestors
+
+        # invert the ancestors to get the descendants (sorted as well)
+        anc_owners = np.repeat(np.arange(nr_of_cuis, dtype=np.int64), anc_lengths)
+        order = np.lexsort((anc_owners, anc_indices))
+        desc_indices = anc_owners[order]
+        desc_indptr = np.concatenate([[0], np.cumsum(np.bincount(anc_indices, minlength=nr_of_cuis))])
+
+        par_lengths = np.fromiter((len(parents) for parents in ch2pt), dtype=np.int64, count=nr_of_cuis)
+        par_indptr = np.concatenate([[0], np.cumsum(par_lengths)])
+        par_indices = np.fromiter((parent for parents in ch2pt for parent in parents), dtype=np.int64,
+                                  count=int(par_indptr[-1]))
+        return cls(cuis, (par_indptr, par_indices), (anc_indptr, anc_indices), (desc_indptr, desc_indices))
+
+    @staticmethod
+    def _get_topological_order(ch2pt: List[List[int]], pt2ch: List[List[int]]) -> Tuple[List[int], int]:
+        # Kahn's algorithm, the concepts that are in (or after) a cycle are added at the end
+        # returns the order and the number of concepts that are (topologically) sorted
+        nr_of_parents = [len(parents) for parents in ch2pt]
+        queue = deque(ind for ind, nr in enumerate(nr_of_parents) if nr == 0)
+        order = []
+        while queue:
+            ind = queue.popleft()
+            order.append(ind)
+            for child in pt2ch[ind]:
+                nr_of_parents[child] -= 1
+                if nr_of_parents[child] == 0:
+                    queue.append(child)
+        nr_sorted = len(order)
+        if nr_sorted < len(ch2pt):
+            logger.warning("The hierarchy has cycles, %d concepts are in (or under) a cycle",
+                           len(ch2pt) - len(order))
+            in_order = set(order)
+            order.extend(ind for ind in range(len(ch2pt)) if ind not in in_order)
+        return order, nr_sorted
+
+    @staticmethod
+    def _find_ancestors(ind: int, ch2pt: List[List[int]], ancestors: List[np.ndarray],
+                        done: np.ndarray) -> np.ndarray:
+        # Breadth first search over the parents, reusing the ancestors that are already known
+        found = set()
+        parts = []
+        queue = deque(ch2pt[ind])
+        while queue:
+            parent = queue.popleft()
+            if parent in found:
+                continue
+            found.add(parent)
+            if done[parent]:
+                parts.append(ancestors[parent])
+            else:
+                queue.extend(ch2pt[parent])
+        found.discard(ind)
+        result = np.unique(np.concatenate([np.fromiter(found, dtype=np.int64, count=len(found))] + parts))
+        return result[result != ind]
+
+    def __len__(self) -> int:
+        return len(self.cuis)
+
+    def __contains__(self, cui: str) -> bool:
+        return cui in self.cui2index
+
+    @staticmethod
+    def _get_row(csr: Tuple[np.ndarray, np.ndarray], index: int) -> np.ndarray:
+        indptr, indices = csr
+        return indices[indptr[index]:indptr[index + 1]]
+
+    def _get_cuis(self, indices: np.ndarray) -> List[str]:
+        return [self.cuis[index] for index in indices.tolist()]
+
+    def get_direct_parents(self, cui: str) -> List[str]:
+        """Get the direct parents of a concept.
+
+        Args:
+            cui (str): The concept.
+
+        Returns:
+            List[str]: The direct parents (empty if the concept is not in the hierarchy).
+        """
+        if cui not in self.cui2index:
+            return []
+        return self._get_cuis(self._get_row(self.parents, self.cui2index[cui]))
+
+    def get_all_ancestors(self, cui: str) -> List[str]:
+        """Get all the ancestors (parents, grandparents and so on) of a concept.
+
+        Args:
+            cui (str): The concept.
+
+        Returns:
+            List[str]: The ancestors (empty if the concept is not in the hierarchy).
+        """
+        if cui not in self.cui2index:
+            return []
+        return self._get_cuis(self._get_row(self.ancestors, self.cui2index[cui]))
+
+    def get_all_descendants(self, cui: str) -> List[str]:
+        """Get all the descendants (children, grandchildren and so on) of a concept.
+
+        Args:
+            cui (str): The concept.
+
+        Returns:
+            List[str]: The descendants (empty if the concept is not in the hierarchy).
+        """
+        if cui not in self.cui2index:
+            return []
+        return self._get_cuis(self._get_row(self.descendants, self.cui2index[cui]))
+
+    def is_descendant(self, cui: str, ancestor: str) -> bool:
+        """Check whether a concept is a descendant of another.
+
+        A concept is not its own descendant.
+
+        Args:
+            cui (str): The concept.
+            ancestor (str): The potential ancestor.
+
+        Returns:
+            bool: Whether `cui` is a descendant of `ancestor`.
+        """
+        if cui not in self.cui2index or ancestor not in self.cui2index:
+            return False
+        ancestors = self._get_row(self.ancestors, self.cui2index[cui])
+        ancestor_ind = self.cui2index[ancestor]
+        pos = np.searchsorted(ancestors, ancestor_ind)
+        return bool(pos < len(ancestors) and ancestors[pos] == ancestor_ind)
+
+    def get_indices(self, cuis: Union[np.ndarray, Iterable[str]]) -> np.ndarray:
+        """Get the indices of concepts within the index.
+
+        Args:
+            cuis (Union[np.ndarray, Iterable[str]]): The concepts.
+
+        Returns:
+            np.ndarray: The indices (-1 for concepts that are not in the hierarchy).
+        """
+        cuis = np.asarray(list(cuis) if not isinstance(cuis, np.ndarray) else cuis)
+        return np.fromiter((self.cui2index.get(cui, -1) for cui in cuis.ravel().tolist()),
+                           dtype=np.int64, count=cuis.size).reshape(cuis.shape)
+
+    def _to_indices(self, cuis: Union[np.ndarray, Iterable[str]]) -> np.ndarray:
+        if isinstance(cuis, np.ndarray) and cuis.dtype.kind in 'iu':
+            return cuis.astype(np.int64, copy=False)
+        return self.get_indices(cuis)
+
+    def is_descendant_batch(self, cuis: Union[np.ndarray, Iterable[str]],
+                            ancestors: Union[np.ndarray, Iterable[str]]) -> np.ndarray:
+        """Check whether concepts are descendants of others (element-wise).
+
+        The concepts can be specified by their CUIs or (as integer arrays) their
+        indices (see `get_indices`). The two arrays are broadcast against each other
+        (so e.g a list of concepts can be checked against a single ancestor).
+
+        Args:
+            cuis (Union[np.ndarray, Iterable[str]]): The concepts.
+            ancestors (Union[np.ndarray, Iterable[str]]): The potential ancestors.
+
+        Returns:
+            np.ndarray: Whether each of the concepts is a descendant of the corresponding ancestor.
+        """
+        cui_inds, anc_inds = np.broadcast_arrays(self._to_indices(cuis), self._to_indices(ancestors))
+        result = np.zeros(cui_inds.shape, dtype=bool)
+        known = (cui_inds >= 0) & (anc_inds >= 0)
+        if self._ancestor_keys is None:
+            # the ancestors of each concept are sorted, so these (concept, ancestor) keys are sorted as well
+            indptr, indices = self.ancestors
+            owners = np.repeat(np.arange(len(self.cuis), dtype=np.int64), np.diff(indptr))
+            self._ancestor_keys = owners * len(self.cuis) + indices
+        keys = cui_inds[known] * len(self.cuis) + anc_inds[known]
+        pos = np.searchsorted(self._ancestor_keys, keys)
+        found = pos < len(self._ancestor_keys)
+        found[found] = self._ancestor_keys[pos[found]] == keys[found]
+        result[known] = found
+        return result
+
+    def get_all_descendants_batch(self, cuis: Union[np.ndarray, Iterable[str]]) -> np.ndarray:
+        """Get all the concepts that are descendants of any of the specified concepts.
+
+        Args:
+            cuis (Union[np.ndarray, Iterable[str]]): The concepts (CUIs or indices).
+
+        Returns:
+            np.ndarray: The (sorted, unique) indices of the descendants (see `cuis` for the CUIs).
+        """
+        indices = self._to_indices(cuis).ravel()
+        indices = indices[indices >= 0]
+        indptr, desc_indices = self.descendants
+        return np.unique(np.concatenate([np.empty(0, dtype=np.int64)] +
+                                        [desc_indices[indptr[ind]:indptr[ind + 1]] for ind in indices.tolist()]))
+
+    def save(self, path: str) -> None:
+        """Save the index to a (NumPy `.npz`) file.
+
+        Args:
+            path (str): The file to save to.
+        """
+        with open(path, 'wb') as f:
+            np.savez(f, cuis=np.asarray(self.cuis, dtype=str),
+                     parents_indptr=self.parents[0], parents_indices=self.parents[1],
+                     ancestors_indptr=self.ancestors[0], ancestors_indices=self.ancestors[1],
+                     descendants_indptr=self.descendants[0], descendants_indices=self.descendants[1])
+
+    @classmethod
+    def load(cls, path: str) -> "HierarchyIndex":
+        """Load the index from a file.
+
+        Args:
+            path (str): The file to load from.
+
+        Returns:
+            HierarchyIndex: The loaded index.
+        """
+        with np.load(path) as data:
+            return cls(data['cuis'].tolist(),
+                       (data['parents_indptr'], data['parents_indices']),
+                       (data['ancestors_indptr'], data['ancestors_indices']),
+                       (data['descendants_indptr'], data['descendants_indices']))
@@ -0,0 +1,137 @@
+"""Process long documents in overlapping chunks.
+
+Rather than trimming documents that are longer than the chunk size, they
+are split into overlapping chunks (on paragraph, line, sentence or word
+boundaries where possible). Each chunk is processed on its own and the
+outputs (see `CAT._doc_to_out`) are stitched back together.
+
+Every character of the document belongs to exactly one chunk: the overlap
+between two consecutive chunks is split in the middle. An entity is kept
+from the chunk it starts in, which de-duplicates the entities found in the
+overlap and makes sure every entity has (at least half the overlap of)
+context on both sides.
+"""
+import re
+from typing import Dict, List, Tuple
+
+
+# In the order of preference
+BOUNDARIES = (re.compile(r'\n[^\S\n]*\n\s*'),  # paragraph
+              re.compile(r'\n\s*'),  # line
+              re.compile(r'[.!?;]\s+'),  # sentence
+              re.compile(r'\s+'))  # word
+
+
+def _find_last_boundary(text: str, start: int, end: int) -> int:
+    """Find the end of the last (most preferred) boundary within text[start:end].
+
+    Args:
+        text (str): The text.
+        start (int): The start of the window.
+        end (int): The end of the window.
+
+    Returns:
+        int: The position right after the boundary, or -1 if there is none.
+    """
+    for pattern in BOUNDARIES:
+        last = -1
+        for match in pattern.finditer(text, start, end):
+            last = match.end()
+        if last > start:
+            return last
+    return -1
+
+
+def get_chunk_spans(text: str, chunk_size: int, overlap: int) -> List[Tuple[int, int]]:
+    """Split a text into overlapping chunks.
+
+    A chunk ends at the last paragraph (or line, sentence, word) boundary
+    in its second half. The next one starts at the first word boundary
+    at least `overlap` characters before that.
+
+    Args:
+        text (str): The text to split.
+        chunk_size (int): The maximum number of characters in a chunk.
+        overlap (int): The (approximate) number of characters consecutive chunks overlap.
+
+    Raises:
+        ValueError: If the overlap is not less than half the chunk size.
+
+    Returns:
+        List[Tuple[int, int]]: The start and end (character offsets) of the chunks.
+    """
+    if not 0 <= overlap < chunk_size // 2:
+        raise ValueError(f"The chunk overlap ({overlap}) needs to be less than half "
+                         f"the chunk size ({chunk_size})")
+    spans: List[Tuple[int, int]] = []
+    start = 0
+    while len(text) - start > chunk_size:
+        end = _find_last_boundary(text, start + chunk_size // 2, start + chunk_size)
+        if end == -1:
+            end = start + chunk_size
+        spans.append((start, end))
+        match = BOUNDARIES[-1].search(text, end - overlap, end)
+        start = match.end() if match is not None and match.end() < end else end - overlap
+    spans.append((start, len(text)))
+    return spans
+
+
+def _get_cut_offs(spans: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    # the part of the text that each chunk is responsible for (the overlaps are split in the middle)
+    cut_offs = [(prev_end + next_start) // 2 for (_, prev_end), (next_start, _) in zip(spans, spans[1:])]
+    return list(zip([0] + cut_offs, cut_offs + [spans[-1][1]]))
+
+
+def merge_chunk_outputs(outs: List[Dict], spans: List[Tuple[int, int]], text: str, only_cui: bool) -> Dict:
+    """Stitch the outputs of the chunks of a document back together.
+
+    The character (and, if present, token) offsets of the entities are
+    shifted to the offsets within the document, the entities in the overlaps
+    are de-duplicated and the entity IDs are renumbered (unless there is a single chunk).
+
+    Args:
+        outs (List[Dict]): The outputs (see `CAT._doc_to_out`, not `only_cui`) of the chunks.
+        spans (List[Tuple[int, int]]): The start and end of the chunks (see `get_chunk_spans`).
+        text (str): The document.
+        only_cui (bool): Whether to only output the CUIs of the entities.
+
+    Returns:
+        Dict: The output of the document.
+    """
+    if len(outs) == 1:
+        # nothing to stitch
+        merged: Dict = dict(outs[0])
+        if only_cui:
+            merged['entities'] = {ent_id: ent['cui'] for ent_id, ent in merged['entities'].items()}
+        return merged
+    merged = {'entities': {}, 'tokens': []}
+    for out, (chunk_start, _), (cut_start, cut_end) in zip(outs, spans, _get_cut_offs(spans)):
+        tkn_offset = 0
+        if out['tokens']:
+            # keep the tokens that start in the part of the text this chunk is responsible for
+            tkn_start_char = chunk_start
+            first_tkn = None
+            for tkn_nr, tkn in enumerate(out['tokens']):
+                if cut_start <= tkn_start_char < cut_end:
+                    if first_tkn is None:
+                        first_tkn = tkn_nr
+                        tkn_offset = len(merged['tokens']) - tkn_nr
+                    merged['tokens'].append(tkn)
+                tkn_start_char += len(tkn)
+        for ent in sorted(out['entities'].values(), key=lambda ent: ent['start']):
+            start = ent['start'] + chunk_start
+            if not cut_start <= start < cut_end:
+                continue
+            ent = dict(ent)
+            ent['start'] = start
+            ent['end'] += chunk_start
+            if 'start_tkn' in ent:
+                ent['start_tkn'] += tkn_offset
+                ent['end_tkn'] += tkn_offset
+            ent['id'] = len(merged['entities'])
+            merged['entities'][ent['id']] = ent
+    if only_cui:
+        merged['entities'] = {ent_id: ent['cui'] for ent_id, ent in merged['entities'].items()}
+    if any('text' in out for out in outs):
+        merged['text'] = text
+    return merged
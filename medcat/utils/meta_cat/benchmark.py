@@ -0,0 +1,236 @@
+"""Benchmark the MetaCAT inference (`ml_utils.predict`) on CPU.
+
+Usage:
+    python -m medcat.utils.meta_cat.benchmark --model-name lstm
+    python -m medcat.utils.meta_cat.benchmark --model-name bert --model-variant prajjwal1/bert-tiny
+    python -m medcat.utils.meta_cat.benchmark --model-name bert --export torchscript --quantize
+
+The models are randomly initialised and the data is synthetic (random token IDs with
+lengths spread between `--min-len` and `--max-len`), so only the timings are meaningful.
+"""
+import argparse
+import logging
+import tempfile
+import time
+from typing import Dict, List, Tuple, Optional
+
+import numpy as np
+import torch
+from torch import nn
+
+from medcat.config_meta_cat import ConfigMetaCAT
+from medcat.utils.meta_cat.ml_utils import predict, create_batch_piped_data
+from medcat.utils.meta_cat.export import ExportedModel, export_model
+
+
+logger = logging.getLogger(__name__)
+
+
+def get_model(config: ConfigMetaCAT) -> nn.Module:
+    """Get a randomly initialised (or, for BERT, pretrained) model.
+
+    Args:
+        config (ConfigMetaCAT): The MetaCAT config.
+
+    Raises:
+        ValueError: If the model name is neither lstm nor bert.
+
+    Returns:
+        nn.Module: The model.
+    """
+    if config.model['model_name'] == 'lstm':
+        from medcat.utils.meta_cat.models import LSTM
+        return LSTM(None, config)
+    elif config.model['model_name'] == 'bert':
+        from medcat.utils.meta_cat.models import BertForMetaAnnotation
+        return BertForMetaAnnotation(config)
+    raise ValueError("Unknown model name %s" % config.model['model_name'])
+
+
+def get_synthetic_data(nr_of_samples: int, min_len: int, max_len: int, vocab_size: int,
+                       seed: int = 13) -> List[Tuple[List[int], List[int]]]:
+    """Create samples of random token IDs with random lengths.
+
+    Args:
+        nr_of_samples (int): The number of samples.
+        min_len (int): The minimum length of a sample.
+        max_len (int): The maximum length of a sample.
+        vocab_size (int): The token IDs are in [1, vocab_size).
+        seed (int): The random seed. Defaults to 13.
+
+    Returns:
+        List[Tuple[List[int], List[int]]]: The samples, as [<input_ids>, <cpos>].
+    """
+    rng = np.random.default_rng(seed)
+    data = []
+    for length in rng.integers(min_len, max_len + 1, size=nr_of_samples):
+        input_ids = rng.integers(1, vocab_size, size=length).tolist()
+        center = int(length) // 2
+        data.append((input_ids, [center]))
+    return data
+
+
+def predict_unbucketed(model: nn.Module, data: List, config: ConfigMetaCAT) -> np.ndarray:
+    """Predict in the order of the data, padding every batch to the longest sample in the data.
+
+    This is how `ml_utils.predict` batched the samples before length bucketing and is used
+    as the reference.
+
+    Args:
+        model (nn.Module): The model.
+        data (List): The data, as [[<input_ids>, <cpos>], ...].
+        config (ConfigMetaCAT): The MetaCAT config.
+
+    Returns:
+        np.ndarray: The logits.
+    """
+    pad_id = config.model['padding_idx']
+    batch_size = config.general['batch_size_eval']
+    device = config.general['device']
+    max_seq_len = max(len(x[0]) for x in data)
+    # pad every sample to the longest one, as before
+    padded_data: List = [(x[0] + [pad_id] * (max_seq_len - len(x[0])), x[1]) for x in data]
+    model.eval()
+    model.to(device)
+    all_logits = []
+    with torch.no_grad():
+        for start_ind in range(0, len(data), batch_size):
+            x, cpos, attention_masks, _ = create_batch_piped_data(padded_data, start_ind, start_ind + batch_size,
+                                                                  device=device, pad_id=pad_id)
+            logits = model(x, center_positions=cpos, attention_mask=attention_masks,
+                           ignore_cpos=config.model['ignore_cpos'])
+            all_logits.append(logits.detach().cpu().numpy())
+    return np.concatenate(all_logits, axis=0)
+
+
+def run_benchmark(config: ConfigMetaCAT, data: List, repeats: int = 3) -> Dict[str, float]:
+    """Time the unbucketed and the length bucketed prediction.
+
+    Args:
+        config (ConfigMetaCAT): The MetaCAT config.
+        data (List): The data, as [[<input_ids>, <cpos>], ...].
+        repeats (int): The number of times each is run (the best time is used). Defaults to 3.
+
+    Returns:
+        Dict[str, float]: The samples/sec of each and the fraction of matching predictions.
+    """
+    torch.manual_seed(config.general['seed'])
+    model = get_model(config)
+
+    def _best_time(func) -> Tuple[float, np.ndarray]:
+        best: Optional[float] = None
+        for _ in range(repeats):
+            start = time.perf_counter()
+            out = func()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return best, out  # type: ignore
+
+    unbucketed_time, logits = _best_time(lambda: predict_unbucketed(model, data, config))
+    bucketed_time, (predictions, _) = _best_time(lambda: predict(model, data, config))
+    return {
+        'unbucketed': len(data) / unbucketed_time,
+        'bucketed': len(data) / bucketed_time,
+        'same_predictions': float(np.mean(np.argmax(logits, axis=1) == predictions)),
+    }
+
+
+def _median_latency(model: nn.Module, data: List, config: ConfigMetaCAT, nr_of_samples: int = 200) -> float:
+    config.general['batch_size_eval'], batch_size = 1, config.general['batch_size_eval']
+    times = []
+    for sample in data[:nr_of_samples]:
+        start = time.perf_counter()
+        predict(model, [sample], config)
+        times.append(time.perf_counter() - start)
+    config.general['batch_size_eval'] = batch_size
+    return float(np.median(times)) * 1000
+
+
+def run_export_benchmark(config: ConfigMetaCAT, data: List, export_format: str = 'torchscript',
+                         quantize: bool = False, repeats: int = 3) -> Dict[str, float]:
+    """Compare the eager model with the exported one (both with length bucketed batches).
+
+    Args:
+        config (ConfigMetaCAT): The MetaCAT config.
+        data (List): The data, as [[<input_ids>, <cpos>], ...].
+        export_format (str): Either torchscript or onnx. Defaults to 'torchscript'.
+        quantize (bool): Whether to quantise the exported model. Defaults to False.
+        repeats (int): The number of times each is run (the best time is used). Defaults to 3.
+
+    Returns:
+        Dict[str, float]: The samples/sec and median latency (ms, one sample at a time) of each,
+            the fraction of matching predictions and the largest difference in confidence.
+    """
+    torch.manual_seed(config.general['seed'])
+    model = get_model(config)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        exported = ExportedModel(export_model(model, config, tmp_dir, export_format=export_format,
+                                              quantize=quantize))
+        results: Dict[str, float] = {}
+        outputs = {}
+        for setup, setup_model in (('eager', model), ('exported', exported)):
+            best: Optional[float] = None
+            for _ in range(repeats):
+                start = time.perf_counter()
+                outputs[setup] = predict(setup_model, data, config)
+                elapsed = time.perf_counter() - start
+                best = elapsed if best is None else min(best, elapsed)
+            results[setup] = len(data) / best  # type: ignore
+            results[setup + '_latency_ms'] = _median_latency(setup_model, data, config)
+    results['same_predictions'] = float(np.mean(outputs['eager'][0] == outputs['exported'][0]))
+    results['max_confidence_diff'] = float(np.max(np.abs(outputs['eager'][1] - outputs['exported'][1])))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark length bucketed MetaCAT inference on CPU.')
+    parser.add_argument('--model-name', help='The model (lstm or bert)', type=str, default='lstm')
+    parser.add_argument('--model-variant', help='The BERT variant', type=str, default='bert-base-uncased')
+    parser.add_argument('--nr-of-samples', help='The number of samples (annotations)', type=int, default=2000)
+    parser.add_argument('--min-len', help='The minimum number of tokens in a sample', type=int, default=10)
+    parser.add_argument('--max-len', help='The maximum number of tokens in a sample', type=int, default=256)
+    parser.add_argument('--batch-size', help='config.general.batch_size_eval', type=int, default=64)
+    parser.add_argument('--batch-tokens', help='config.general.batch_tokens_eval', type=int, default=None)
+    parser.add_argument('--threads', help='The number of torch threads', type=int, default=None)
+    parser.add_argument('--export', help='Compare the eager model with the one exported to this format '
+                        '(torchscript or onnx) instead of comparing the batching', type=str, default=None)
+    parser.add_argument('--quantize', help='Quantise the exported model to int8', action='store_true')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    if args.threads is not None:
+        torch.set_num_threads(args.threads)
+
+    config = ConfigMetaCAT()
+    config.general['device'] = 'cpu'
+    config.general['batch_size_eval'] = args.batch_size
+    config.general['batch_tokens_eval'] = args.batch_tokens
+    config.model['model_name'] = args.model_name
+    config.model['padding_idx'] = 0
+    config.model['nclasses'] = 3
+    if args.model_name == 'bert':
+        config.model.model_variant = args.model_variant
+        vocab_size = 1000
+    else:
+        config.general['vocab_size'] = vocab_size = 30000
+
+    data = get_synthetic_data(args.nr_of_samples, args.min_len, args.max_len, vocab_size,
+                              seed=config.general['seed'])
+    if args.export is not None:
+        results = run_export_benchmark(config, data, export_format=args.export, quantize=args.quantize)
+        print(f"{'setup':<12}{'samples/sec':>14}{'latency (ms)':>14}")
+        for setup in ('eager', 'exported'):
+            print(f"{setup:<12}{results[setup]:>14.1f}{results[setup + '_latency_ms']:>14.2f}")
+        print(f"Speedup: {results['exported'] / results['eager']:.2f}x; "
+              f"identical predictions: {results['same_predictions']:.1%}; "
+              f"largest confidence difference: {results['max_confidence_diff']:.2e}")
+        return
+    results = run_benchmark(config, data)
+    print(f"{'setup':<12}{'samples/sec':>14}")
+    for setup in ('unbucketed', 'bucketed'):
+        print(f"{setup:<12}{results[setup]:>14.1f}")
+    print(f"Speedup: {results['bucketed'] / results['unbucketed']:.2f}x; "
+          f"identical predictions: {results['same_predictions']:.1%}")
+
+
+if __name__ == "__main__":
+    main()
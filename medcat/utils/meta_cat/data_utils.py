@@ -1,7 +1,11 @@
-from typing import Dict, Optional, Tuple, Iterable, List
+from typing import Dict, Optional, Tuple, Iterable, List, Union, TYPE_CHECKING
 from medcat.tokenizers.meta_cat_tokenizers import TokenizerWrapperBase
 import logging
 
+if TYPE_CHECKING:
+    # imported within the functions at runtime, since the dataset module uses this one
+    from medcat.utils.meta_cat.dataset import MetaCATDataset
+
 logger = logging.getLogger(__name__)
 
 
@@ -152,13 +156,16 @@ def prepare_for_oversampled_data(data: List,
     return data_sampled
 
 
-def encode_category_values(data: Dict, existing_category_value2id: Optional[Dict] = None,
+def encode_category_values(data: Union[Dict, List, "MetaCATDataset"], existing_category_value2id: Optional[Dict] = None,
                            category_undersample=None) -> Tuple:
     """Converts the category values in the data outputted by `prepare_from_json`
     into integer values.
 
+    The data can also be a `MetaCATDataset` (e.g from `prepare_from_json_cached`),
+    in which case the returned data are datasets sharing its (memory-mapped) arrays.
+
     Args:
-        data (Dict):
+        data (Union[Dict, List, MetaCATDataset]):
             Output of `prepare_from_json`.
         existing_category_value2id(Optional[Dict]):
             Map from category_value to id (old/existing).
@@ -173,26 +180,34 @@ def encode_category_values(data: Dict, existing_category_value2id: Optional[Dict
         dict:
             Map from category value to ID for all categories in the data.
     """
-    data = list(data)
+    from medcat.utils.meta_cat.dataset import MetaCATDataset
+    samples: List = []
+    if isinstance(data, MetaCATDataset):
+        labels = data.sample_labels.tolist()
+    else:
+        samples = list(data)
+        labels = [x[2] for x in samples]
     if existing_category_value2id is not None:
         category_value2id = existing_category_value2id
     else:
         category_value2id = {}
 
-    category_values = set([x[2] for x in data])
+    category_values = set(labels)
     for c in category_values:
         if c not in category_value2id:
             category_value2id[c] = len(category_value2id)
 
     # Map values to numbers
-    for i in range(len(data)):
-        data[i][2] = category_value2id[data[i][2]]
+    labels = [category_value2id[label] for label in labels]
+    if not isinstance(data, MetaCATDataset):
+        for sample, label in zip(samples, labels):
+            sample[2] = label
 
     # Creating dict with labels and its number of samples
     label_data_ = {v: 0 for v in category_value2id.values()}
-    for i in range(len(data)):
-        if data[i][2] in category_value2id.values():
-            label_data_[data[i][2]] = label_data_[data[i][2]] + 1
+    for label in labels:
+        if label in label_data_:
+            label_data_[label] = label_data_[label] + 1
 
     logger.info("Original label_data: %s",label_data_)
     # Undersampling data
@@ -205,21 +220,23 @@ def encode_category_values(data: Dict, existing_category_value2id: Optional[Dict
         else:
             min_label = label_data_[category_undersample]
 
-    data_undersampled = []
+    undersampled_inds = []
     label_data_counter = {v: 0 for v in category_value2id.values()}
 
-    for sample in data:
-        if label_data_counter[sample[-1]] < min_label:
-            data_undersampled.append(sample)
-            label_data_counter[sample[-1]] += 1
+    for ind, label in enumerate(labels):
+        if label_data_counter[label] < min_label:
+            undersampled_inds.append(ind)
+            label_data_counter[label] += 1
 
     label_data = {v: 0 for v in category_value2id.values()}
-    for i in range(len(data_undersampled)):
-        if data_undersampled[i][2] in category_value2id.values():
-            label_data[data_undersampled[i][2]] = label_data[data_undersampled[i][2]] + 1
+    for ind in undersampled_inds:
+        label_data[labels[ind]] = label_data[labels[ind]] + 1
     logger.info("Updated label_data: %s",label_data)
 
-    return data, data_undersampled, category_value2id
+    if isinstance(data, MetaCATDataset):
+        encoded = data.map_labels(category_value2id)
+        return encoded, encoded.subset(undersampled_inds), category_value2id
+    return samples, [samples[ind] for ind in undersampled_inds], category_value2id
 
 
 def json_to_fake_spacy(data: Dict, id2text: Dict) -> Iterable:
@@ -0,0 +1,350 @@
+"""The training data pipeline for MetaCAT.
+
+The samples (`[<input_ids>, <cpos>, <label>]`, as returned by `data_utils.prepare_from_json`)
+are packed into flat arrays once (`MetaCATDataset`) rather than being sliced and padded
+from python lists for every batch of every epoch. Batches are formed from samples of
+similar length (`LengthBucketSampler`), so they are only padded to the longest sample in
+the batch, and can be created by `DataLoader` workers (`BatchCollator`).
+
+The tokenised data can also be cached on disk (`prepare_from_json_cached`), keyed on the
+data, the tokenizer and the config used to prepare it, so retraining with different
+hyperparameters skips the tokenisation. The cached arrays are memory-mapped when loaded.
+"""
+import json
+import logging
+import math
+import os
+from typing import Any, Dict, Iterable, Iterator, List, Literal, Optional, Tuple
+
+import numpy as np
+import torch
+from torch import Tensor
+from torch.utils.data import Dataset, Sampler
+
+from medcat.config_meta_cat import ConfigMetaCAT
+from medcat.tokenizers.meta_cat_tokenizers import TokenizerWrapperBase
+from medcat.utils.hasher import Hasher
+from medcat.utils.meta_cat.data_utils import prepare_from_json
+
+
+logger = logging.getLogger(__name__)
+
+
+class MetaCATDataset(Dataset):
+    """MetaCAT samples packed into flat arrays.
+
+    The input IDs (and center positions) of all the samples are concatenated, and the
+    offsets give where each sample starts and ends.
+
+    A dataset can also be a subset of the samples in the arrays (see `subset`), so that
+    splitting (or undersampling) the data does not copy the (possibly memory-mapped) arrays.
+
+    Args:
+        input_ids (np.ndarray): The concatenated input IDs.
+        input_offsets (np.ndarray): The start of the input IDs of each sample (and the end of the last).
+        cpos (np.ndarray): The concatenated center positions.
+        cpos_offsets (np.ndarray): The start of the center positions of each sample (and the end of the last).
+        labels (np.ndarray): The label of each sample (the category value, or its ID).
+        indices (Optional[np.ndarray]): The samples (in the arrays) that are in the dataset.
+            Defaults to all of them.
+    """
+
+    FILE_NAMES = ('input_ids', 'input_offsets', 'cpos', 'cpos_offsets', 'labels')
+
+    def __init__(self, input_ids: np.ndarray, input_offsets: np.ndarray, cpos: np.ndarray,
+                 cpos_offsets: np.ndarray, labels: np.ndarray, indices: Optional[np.ndarray] = None) -> None:
+        self.input_ids = input_ids
+        self.input_offsets = input_offsets
+        self.cpos = cpos
+        self.cpos_offsets = cpos_offsets
+        self.labels = labels
+        self.indices = indices
+
+    @classmethod
+    def from_samples(cls, samples: List) -> "MetaCATDataset":
+        """Pack samples in the format [[<input_ids>, <cpos>, <label>], ...].
+
+        Args:
+            samples (List): The samples.
+
+        Returns:
+            MetaCATDataset: The packed samples.
+        """
+        input_offsets = np.zeros(len(samples) + 1, dtype=np.int64)
+        input_offsets[1:] = np.cumsum([len(sample[0]) for sample in samples])
+        cpos_offsets = np.zeros(len(samples) + 1, dtype=np.int64)
+        cpos_offsets[1:] = np.cumsum([len(sample[1]) for sample in samples])
+        input_ids = np.fromiter((tkn for sample in samples for tkn in sample[0]), dtype=np.int64,
+                                count=int(input_offsets[-1]))
+        cpos = np.fromiter((pos for sample in samples for pos in sample[1]), dtype=np.int64,
+                           count=int(cpos_offsets[-1]))
+        labels = np.array([sample[2] for sample in samples])
+        return cls(input_ids, input_offsets, cpos, cpos_offsets, labels)
+
+    @classmethod
+    def concat(cls, datasets: List["MetaCATDataset"]) -> "MetaCATDataset":
+        """Concatenate datasets.
+
+        NOTE: The arrays are copied, i.e memory-mapped arrays are read into memory.
+
+        Args:
+            datasets (List[MetaCATDataset]): The datasets.
+
+        Returns:
+            MetaCATDataset: The samples of all the datasets.
+        """
+        datasets = [dataset._compact() for dataset in datasets]
+        input_offsets, cpos_offsets = [np.zeros(1, dtype=np.int64)], [np.zeros(1, dtype=np.int64)]
+        for dataset in datasets:
+            input_offsets.append(dataset.input_offsets[1:] + input_offsets[-1][-1])
+            cpos_offsets.append(dataset.cpos_offsets[1:] + cpos_offsets[-1][-1])
+        return cls(np.concatenate([dataset.input_ids for dataset in datasets]), np.concatenate(input_offsets),
+                   np.concatenate([dataset.cpos for dataset in datasets]), np.concatenate(cpos_offsets),
+                   np.concatenate([dataset.labels for dataset in datasets]))
+
+    def __len__(self) -> int:
+        if self.indices is not None:
+            return len(self.indices)
+        return len(self.input_offsets) - 1
+
+    def __getitem__(self, ind: int) -> Tuple[np.ndarray, List[int], Any]:
+        if self.indices is not None:
+            ind = self.indices[ind]
+        input_ids = self.input_ids[self.input_offsets[ind]:self.input_offsets[ind + 1]]
+        cpos = self.cpos[self.cpos_offsets[ind]:self.cpos_offsets[ind + 1]].tolist()
+        return input_ids, cpos, self.labels[ind].item()
+
+    @property
+    def lengths(self) -> np.ndarray:
+        """The number of tokens in each sample."""
+        lengths = np.diff(self.input_offsets)
+        return lengths[self.indices] if self.indices is not None else lengths
+
+    @property
+    def sample_labels(self) -> np.ndarray:
+        """The label of each sample."""
+        return self.labels[self.indices] if self.indices is not None else self.labels
+
+    def subset(self, indices: Iterable[int]) -> "MetaCATDataset":
+        """Get a subset of the samples, sharing the arrays.
+
+        Args:
+            indices (Iterable[int]): The indices of the samples (in this dataset).
+
+        Returns:
+            MetaCATDataset: The subset.
+        """
+        indices = np.asarray(list(indices), dtype=np.int64)
+        if self.indices is not None:
+            indices = self.indices[indices]
+        return MetaCATDataset(self.input_ids, self.input_offsets, self.cpos, self.cpos_offsets, self.labels,
+                              indices)
+
+    def map_labels(self, mapping: Dict) -> "MetaCATDataset":
+        """Get the dataset with the labels mapped (e.g the category values to their IDs), sharing the other arrays.
+
+        Args:
+            mapping (Dict): The new label of each label.
+
+        Returns:
+            MetaCATDataset: The dataset with the new labels.
+        """
+        values, inverse = np.unique(self.labels, return_inverse=True)
+        # the samples outside of a subset may have labels that are not mapped
+        new_values = np.array([mapping.get(value.item(), -1) for value in values], dtype=np.int64)
+        return MetaCATDataset(self.input_ids, self.input_offsets, self.cpos, self.cpos_offsets,
+                              new_values[inverse.reshape(-1)], self.indices)
+
+    def _compact(self) -> "MetaCATDataset":
+        # pack only the samples in the dataset
+        if self.indices is None:
+            return self
+        return MetaCATDataset.from_samples(self.to_samples())
+
+    def to_samples(self) -> List[list]:
+        """Get the samples in the format [[<input_ids>, <cpos>, <label>], ...].
+
+        Returns:
+            List[list]: The samples.
+        """
+        return [[input_ids.tolist(), cpos, label] for input_ids, cpos, label in
+                (self[ind] for ind in range(len(self)))]
+
+    def save(self, path: str) -> None:
+        """Save the arrays (as .npy files) in a directory.
+
+        Args:
+            path (str): The directory.
+        """
+        os.makedirs(path, exist_ok=True)
+        dataset = self._compact()
+        for name in self.FILE_NAMES:
+            np.save(os.path.join(path, name + '.npy'), getattr(dataset, name))
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True) -> "MetaCATDataset":
+        """Load the arrays saved in a directory.
+
+        Args:
+            path (str): The directory.
+            mmap (bool): Whether to memory-map the arrays rather than reading them. Defaults to True.
+
+        Returns:
+            MetaCATDataset: The dataset.
+        """
+        mmap_mode: Optional[Literal['r']] = 'r' if mmap else None
+        arrays = [np.load(os.path.join(path, name + '.npy'), mmap_mode=mmap_mode) for name in cls.FILE_NAMES]
+        return cls(*arrays)
+
+
+class BatchCollator:
+    """Pads the samples of a batch (from `MetaCATDataset`) to the longest one.
+
+    This is a class (rather than a closure) so that it can be used by `DataLoader` workers.
+
+    Args:
+        pad_id (int): The padding ID.
+    """
+
+    def __init__(self, pad_id: int) -> None:
+        self.pad_id = pad_id
+
+    def __call__(self, batch: List[Tuple[np.ndarray, List[int], Any]]) -> Tuple[Tensor, List, Tensor, Tensor]:
+        max_seq_len = max(len(input_ids) for input_ids, _, _ in batch)
+        x = np.full((len(batch), max_seq_len), self.pad_id, dtype=np.int64)
+        for i, (input_ids, _, _) in enumerate(batch):
+            x[i, :len(input_ids)] = input_ids
+        x_tensor = torch.from_numpy(x)
+        cpos = [sample[1] for sample in batch]
+        y = torch.tensor([sample[2] for sample in batch], dtype=torch.long)
+        attention_masks = (x_tensor != self.pad_id).type(torch.int)
+        return x_tensor, cpos, attention_masks, y
+
+
+class LengthBucketSampler(Sampler):
+    """Yields batches (of indices) of samples with similar lengths.
+
+    If shuffled, the samples are shuffled and split into buckets of `bucket_size_in_batches`
+    batches, each bucket is sorted by length and split into batches, and the order of the
+    batches is shuffled. So the batches differ between epochs (see `set_epoch`), while
+    having little padding. Otherwise all the samples are sorted by length.
+
+    Args:
+        lengths (np.ndarray): The length of each sample.
+        batch_size (int): The (maximum) number of samples in a batch.
+        shuffle (bool): Whether to shuffle the samples and batches. Defaults to True.
+        bucket_size_in_batches (int): The number of batches in a bucket. Defaults to 50.
+        seed (int): The random seed. Defaults to 13.
+    """
+
+    def __init__(self, lengths: np.ndarray, batch_size: int, shuffle: bool = True,
+                 bucket_size_in_batches: int = 50, seed: int = 13) -> None:
+        self.lengths = np.asarray(lengths)
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.bucket_size = batch_size * bucket_size_in_batches if shuffle else max(len(self.lengths), 1)
+        self.seed = seed
+        self.epoch = 0
+
+    def set_epoch(self, epoch: int) -> None:
+        """Set the epoch, used for shuffling.
+
+        Args:
+            epoch (int): The epoch.
+        """
+        self.epoch = epoch
+
+    def _get_batches(self) -> List[List[int]]:
+        rng = np.random.default_rng(self.seed + self.epoch)
+        inds = rng.permutation(len(self.lengths)) if self.shuffle else np.arange(len(self.lengths))
+        batches: List[List[int]] = []
+        for start in range(0, len(inds), self.bucket_size):
+            bucket = inds[start:start + self.bucket_size]
+            bucket = bucket[np.argsort(self.lengths[bucket], kind='stable')]
+            batches.extend(bucket[i:i + self.batch_size].tolist() for i in range(0, len(bucket), self.batch_size))
+        if self.shuffle:
+            batches = [batches[ind] for ind in rng.permutation(len(batches))]
+        return batches
+
+    def __iter__(self) -> Iterator[List[int]]:
+        return iter(self._get_batches())
+
+    def __len__(self) -> int:
+        nr_of_samples = len(self.lengths)
+        full_buckets, rest = divmod(nr_of_samples, self.bucket_size)
+        return full_buckets * math.ceil(self.bucket_size / self.batch_size) + math.ceil(rest / self.batch_size)
+
+
+def get_tokenizer_hash(tokenizer: TokenizerWrapperBase) -> str:
+    """Get a hash of the vocabulary of a tokenizer.
+
+    Args:
+        tokenizer (TokenizerWrapperBase): The tokenizer.
+
+    Returns:
+        str: The hex hash.
+    """
+    hasher = Hasher()
+    hasher.update(tokenizer.name)
+    hasher.update(sorted(tokenizer.ensure_tokenizer().get_vocab().items()))
+    return hasher.hexdigest()
+
+
+def get_data_cache_key(data_loaded: Dict, tokenizer: TokenizerWrapperBase, config: ConfigMetaCAT) -> str:
+    """Get the key of the prepared (tokenised) data in the cache.
+
+    Args:
+        data_loaded (Dict): The raw (MedCATtrainer export) data.
+        tokenizer (TokenizerWrapperBase): The tokenizer.
+        config (ConfigMetaCAT): The config, the parts used to prepare the data are used.
+
+    Returns:
+        str: The key.
+    """
+    g_config = config.general
+    t_config = config.train
+    hasher = Hasher()
+    hasher.update(data_loaded)
+    hasher.update(get_tokenizer_hash(tokenizer))
+    hasher.update([g_config['cntx_left'], g_config['cntx_right'], g_config['replace_center'],
+                   g_config['lowercase'], t_config['cui_filter'], t_config['prerequisites']])
+    return hasher.hexdigest()
+
+
+def prepare_from_json_cached(data_loaded: Dict, tokenizer: TokenizerWrapperBase, config: ConfigMetaCAT,
+                             cache_dir: str) -> Dict[str, MetaCATDataset]:
+    """Prepare the data as `data_utils.prepare_from_json`, using (and filling) a cache on disk.
+
+    Args:
+        data_loaded (Dict): The raw (MedCATtrainer export) data.
+        tokenizer (TokenizerWrapperBase): The tokenizer.
+        config (ConfigMetaCAT): The MetaCAT config.
+        cache_dir (str): The cache directory.
+
+    Returns:
+        Dict[str, MetaCATDataset]: The (memory-mapped) dataset of each category, with the
+            category values as labels.
+    """
+    key = get_data_cache_key(data_loaded, tokenizer, config)
+    path = os.path.join(cache_dir, key)
+    categories_path = os.path.join(path, 'categories.json')
+    if os.path.exists(categories_path):
+        logger.info("Loading the prepared data from %s", path)
+        with open(categories_path) as f:
+            categories = json.load(f)
+        return {name: MetaCATDataset.load(os.path.join(path, str(ind))) for ind, name in enumerate(categories)}
+
+    g_config = config.general
+    t_config = config.train
+    data = prepare_from_json(data_loaded, g_config['cntx_left'], g_config['cntx_right'], tokenizer,
+                             cui_filter=t_config['cui_filter'],
+                             replace_center=g_config['replace_center'], prerequisites=t_config['prerequisites'],
+                             lowercase=g_config['lowercase'])
+    categories = list(data)
+    for ind, name in enumerate(categories):
+        MetaCATDataset.from_samples(data[name]).save(os.path.join(path, str(ind)))
+    # Written last, so that an interrupted run is not used
+    with open(categories_path, 'w') as f:
+        json.dump(categories, f)
+    logger.info("Saved the prepared data to %s", path)
+    return {name: MetaCATDataset.load(os.path.join(path, str(ind))) for ind, name in enumerate(categories)}
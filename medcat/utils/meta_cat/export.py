@@ -0,0 +1,276 @@
+"""Export MetaCAT models for (CPU) inference with TorchScript or ONNX.
+
+The exported model takes only tensors: the input IDs, the attention mask and a (boolean)
+mask of the center tokens, so the python loops over the center positions in the eager
+models are replaced by a masked max. Optionally the linear (and LSTM) layers are
+dynamically quantised to int8.
+
+The exported file is saved next to the MetaCAT (see `MetaCAT.export`) and used by
+`MetaCAT.load` (when running on CPU) instead of the eager model.
+"""
+import copy
+import logging
+import os
+import shutil
+from typing import TYPE_CHECKING, Any, Iterable, List, Optional
+
+import torch
+from torch import nn, Tensor
+
+from medcat.config_meta_cat import ConfigMetaCAT
+
+if TYPE_CHECKING:
+    # Only imported for typing, the models import medcat.meta_cat (which imports this module)
+    from medcat.utils.meta_cat.models import LSTM, BertForMetaAnnotation
+
+logger = logging.getLogger(__name__)
+
+
+EXPORT_FILE_NAMES = {
+    'torchscript': 'model_optimised.pt',
+    'onnx': 'model_optimised.onnx',
+}
+_INPUT_NAMES = ['input_ids', 'attention_mask', 'center_mask']
+
+
+def _max_over_centers(hidden: Tensor, center_mask: Tensor) -> Tensor:
+    # Same as taking the max of hidden[i, center_positions[i], :] for each sample
+    fill_value = torch.finfo(hidden.dtype).min
+    return hidden.masked_fill(~center_mask.unsqueeze(-1), fill_value).max(dim=1)[0]
+
+
+class _LSTMForExport(nn.Module):
+
+    def __init__(self, model: "LSTM", ignore_cpos: bool) -> None:
+        super().__init__()
+        self.model = model
+        self.ignore_cpos = ignore_cpos
+        self.num_layers = model.config.model['num_layers']
+        self.num_directions = model.config.model['num_directions']
+        self.hidden_size = model.config.model['hidden_size']
+
+    def forward(self, input_ids: Tensor, attention_mask: Tensor, center_mask: Tensor) -> Tensor:
+        model = self.model
+        x = model.embeddings(input_ids)
+        x = nn.utils.rnn.pack_padded_sequence(x, attention_mask.sum(1).cpu(), batch_first=True,
+                                              enforce_sorted=False)
+        # The (zero) initial states are passed explicitly, otherwise the quantised LSTM
+        # creates them with the batch size of the example inputs when traced
+        h0 = torch.zeros(self.num_layers * self.num_directions, input_ids.shape[0],
+                         self.hidden_size // self.num_directions, dtype=torch.float)
+        x, hidden = model.rnn(x, (h0, h0))
+        x, _ = nn.utils.rnn.pad_packed_sequence(x, batch_first=True, total_length=input_ids.shape[1])
+
+        if self.ignore_cpos:
+            x = hidden[0]
+            x = x.view(self.num_layers, self.num_directions, -1, self.hidden_size // self.num_directions)
+            x = x[-1, :, :, :].permute(1, 2, 0).reshape(-1, self.hidden_size)
+        else:
+            x = _max_over_centers(x, center_mask)
+
+        x = model.d1(x)
+        return model.fc1(x)
+
+
+class _BertForExport(nn.Module):
+
+    def __init__(self, model: "BertForMetaAnnotation") -> None:
+        super().__init__()
+        self.model = model
+
+    def forward(self, input_ids: Tensor, attention_mask: Tensor, center_mask: Tensor) -> Tensor:
+        outputs = self.model.encode(input_ids, attention_mask=attention_mask)  # type: ignore
+        x = _max_over_centers(outputs[0], center_mask)
+        x = torch.cat((x, outputs[1]), dim=1)
+        return self.model.head(x)
+
+
+def _get_model_for_export(model: nn.Module, config: ConfigMetaCAT) -> nn.Module:
+    from medcat.utils.meta_cat.models import LSTM, BertForMetaAnnotation
+    model = copy.deepcopy(model).cpu()
+    if hasattr(model, 'merge_and_unload'):
+        # Merge the LoRA weights into the BERT model
+        model = model.merge_and_unload()  # type: ignore
+    model.eval()
+    if isinstance(model, LSTM):
+        return _LSTMForExport(model, config.model['ignore_cpos']).eval()
+    elif isinstance(model, BertForMetaAnnotation):
+        return _BertForExport(model).eval()
+    raise ValueError("Can not export model of type %s" % type(model).__name__)
+
+
+def _get_example_inputs(config: ConfigMetaCAT) -> tuple:
+    # Two samples of different lengths, so that the padding is traced
+    vocab_size = config.general['vocab_size'] or 100
+    pad_id = config.model['padding_idx']
+    input_ids = torch.randint(1, min(vocab_size, 100), (2, 8), dtype=torch.long)
+    input_ids[input_ids == pad_id] = 1
+    input_ids[1, 5:] = pad_id
+    attention_mask = (input_ids != pad_id).long()
+    center_mask = torch.zeros(input_ids.shape, dtype=torch.bool)
+    center_mask[0, 3:5] = True
+    center_mask[1, 2] = True
+    return input_ids, attention_mask, center_mask
+
+
+def get_center_mask(center_positions: Iterable[Any], shape: torch.Size) -> Tensor:
+    """Get the mask of the center tokens.
+
+    Args:
+        center_positions (Iterable[Any]): The center positions of each sample.
+        shape (torch.Size): The shape of the input IDs.
+
+    Returns:
+        Tensor: A boolean tensor of the same shape, True for the center tokens.
+    """
+    center_mask = torch.zeros(shape, dtype=torch.bool)
+    for i, indices in enumerate(center_positions):
+        center_mask[i, indices] = True
+    return center_mask
+
+
+def export_model(model: nn.Module, config: ConfigMetaCAT, save_dir_path: str,
+                 export_format: str = 'torchscript', quantize: bool = False) -> str:
+    """Export a MetaCAT model (LSTM or BertForMetaAnnotation) for CPU inference.
+
+    Args:
+        model (nn.Module): The (eager) model.
+        config (ConfigMetaCAT): The MetaCAT config.
+        save_dir_path (str): The directory of the MetaCAT.
+        export_format (str): Either torchscript or onnx (needs the onnx package,
+            and onnxruntime for quantize). Defaults to 'torchscript'.
+        quantize (bool): Whether to dynamically quantise the weights to int8. Defaults to False.
+
+    Raises:
+        ValueError: If the export format is unknown.
+
+    Returns:
+        str: The path of the exported model.
+    """
+    if export_format not in EXPORT_FILE_NAMES:
+        raise ValueError("Unknown export format %s, expected one of %s" % (export_format, list(EXPORT_FILE_NAMES)))
+    os.makedirs(save_dir_path, exist_ok=True)
+    path = os.path.join(save_dir_path, EXPORT_FILE_NAMES[export_format])
+    export_model_ = _get_model_for_export(model, config)
+    example_inputs = _get_example_inputs(config)
+
+    with torch.no_grad():
+        if export_format == 'torchscript':
+            if quantize:
+                export_model_ = torch.quantization.quantize_dynamic(export_model_, {nn.Linear, nn.LSTM},
+                                                                    dtype=torch.qint8)
+            traced = torch.jit.trace(export_model_, example_inputs, strict=False, check_trace=False)
+            traced = torch.jit.freeze(traced)
+            torch.jit.save(traced, path)
+        else:
+            onnx_path = path + '.fp32' if quantize else path
+            dynamic_axes = {name: {0: 'batch', 1: 'sequence'} for name in _INPUT_NAMES}
+            dynamic_axes['logits'] = {0: 'batch'}
+            torch.onnx.export(export_model_, example_inputs, onnx_path, input_names=_INPUT_NAMES,
+                              output_names=['logits'], dynamic_axes=dynamic_axes, opset_version=14)
+            if quantize:
+                from onnxruntime.quantization import quantize_dynamic, QuantType
+                quantize_dynamic(onnx_path, path, weight_type=QuantType.QInt8)
+                os.remove(onnx_path)
+    # Only keep one exported model
+    for other_path in get_export_paths(save_dir_path):
+        if other_path != path:
+            os.remove(other_path)
+    logger.info("Exported the %s model to %s", config.model['model_name'], path)
+    return path
+
+
+def get_export_paths(save_dir_path: str) -> List[str]:
+    """Get the exported models in a MetaCAT directory.
+
+    Args:
+        save_dir_path (str): The directory of the MetaCAT.
+
+    Returns:
+        List[str]: The paths of the exported models.
+    """
+    paths = [os.path.join(save_dir_path, file_name) for file_name in EXPORT_FILE_NAMES.values()]
+    return [path for path in paths if os.path.exists(path)]
+
+
+class ExportedModel(nn.Module):
+    """Runs an exported (TorchScript or ONNX) model with the same interface as the eager models.
+
+    Args:
+        path (str): The path of the exported model.
+    """
+
+    def __init__(self, path: str) -> None:
+        super().__init__()
+        self.path = path
+        self._module: Optional[torch.jit.ScriptModule] = None
+        self._session: Any = None
+        if path.endswith('.onnx'):
+            import onnxruntime
+            self._session = onnxruntime.InferenceSession(path, providers=['CPUExecutionProvider'])
+            # Inputs that are not used (e.g the center mask with ignore_cpos) are removed from the graph
+            self._input_names = [inp.name for inp in self._session.get_inputs()]
+        else:
+            self._module = torch.jit.load(path, map_location='cpu')
+
+    def forward(self,
+                input_ids: torch.LongTensor,
+                center_positions: Iterable[Any],
+                attention_mask: Optional[Tensor] = None,
+                ignore_cpos: bool = False) -> Tensor:
+        input_ids = input_ids.cpu()
+        if attention_mask is None:
+            attention_mask = torch.ones(input_ids.shape, dtype=torch.long)
+        inputs = {'input_ids': input_ids, 'attention_mask': attention_mask.cpu().long(),
+                  'center_mask': get_center_mask(center_positions, input_ids.shape)}
+        if self._session is not None:
+            feed = {name: inputs[name].numpy() for name in self._input_names}
+            return torch.from_numpy(self._session.run(None, feed)[0])
+        assert self._module is not None
+        return self._module(inputs['input_ids'], inputs['attention_mask'], inputs['center_mask'])
+
+
+def load_exported_model(save_dir_path: str) -> Optional[ExportedModel]:
+    """Load the exported model of a MetaCAT, if there is one.
+
+    If the exported model can not be loaded (e.g it is an ONNX model and
+    onnxruntime is not installed), a warning is logged and the eager model
+    should be used instead.
+
+    Args:
+        save_dir_path (str): The directory of the MetaCAT.
+
+    Returns:
+        Optional[ExportedModel]: The exported model, or None if there is none (or it can't be loaded).
+    """
+    paths = get_export_paths(save_dir_path)
+    if not paths:
+        return None
+    try:
+        model = ExportedModel(paths[0])
+    except Exception as e:
+        logger.warning("Unable to load the exported model %s, using the eager model instead: %s",
+                       paths[0], repr(e))
+        return None
+    logger.info("Using the exported model %s", paths[0])
+    return model
+
+
+def save_exported_model(model: Optional[ExportedModel], save_dir_path: str) -> None:
+    """Copy the exported model (if any) to the directory a MetaCAT is saved to.
+
+    Exported models already in that directory that are not the current one are removed,
+    since they may not match the saved weights.
+
+    Args:
+        model (Optional[ExportedModel]): The exported model in use.
+        save_dir_path (str): The directory the MetaCAT is saved to.
+    """
+    keep = None
+    if model is not None:
+        keep = os.path.join(save_dir_path, os.path.basename(model.path))
+        if os.path.abspath(keep) != os.path.abspath(model.path):
+            shutil.copyfile(model.path, keep)
+    for path in get_export_paths(save_dir_path):
+        if path != keep:
+            os.remove(path)
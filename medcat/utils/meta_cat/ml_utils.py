@@ -14,7 +14,9 @@ from medcat.tokenizers.meta_cat_tokenizers import TokenizerWrapperBase
 from sklearn.metrics import classification_report, precision_recall_fscore_support, confusion_matrix
 from sklearn.model_selection import train_test_split
 from sklearn.utils.class_weight import compute_class_weight
+from torch.utils.data import BatchSampler, DataLoader, Sampler, SequentialSampler
 from transformers import AdamW, get_linear_schedule_with_warmup
+from medcat.utils.meta_cat.dataset import MetaCATDataset, LengthBucketSampler, BatchCollator
 
 
 import logging
@@ -56,7 +58,8 @@ def create_batch_piped_data(data: List[Tuple[List[int], int, Optional[int]]],
         y:
             class label of the data
     """
-    max_seq_len = max([len(x[0]) for x in data])
+    # only pad to the longest sample in this batch
+    max_seq_len = max([len(x[0]) for x in data[start_ind:end_ind]])
     x = [x[0][0:max_seq_len] + [pad_id] * max(0, max_seq_len - len(x[0])) for x in data[start_ind:end_ind]]
     cpos = [x[1] for x in data[start_ind:end_ind]]
     y = None
@@ -70,6 +73,41 @@ def create_batch_piped_data(data: List[Tuple[List[int], int, Optional[int]]],
     return x, cpos, attention_masks, y
 
 
+def get_length_batches(lengths: List[int], batch_size: int,
+                       max_tokens: Optional[int] = None) -> Tuple[np.ndarray, List[Tuple[int, int]]]:
+    """Sort samples by length and split them into batches with little padding.
+
+    Args:
+        lengths (List[int]):
+            The length (number of tokens) of each sample.
+        batch_size (int):
+            The maximum number of samples in a batch.
+        max_tokens (Optional[int]):
+            If set, the maximum number of (padded) tokens in a batch, i.e the number
+            of samples times the length of the longest one. A sample longer than this
+            is still put in a batch (on its own).
+
+    Returns:
+        order (np.ndarray):
+            The indices of the samples sorted by length.
+        batches (List[Tuple[int, int]]):
+            The start and end index (in `order`) of each batch.
+    """
+    order = np.argsort(np.asarray(lengths, dtype=np.int64), kind='stable')
+    batches = []
+    start_ind = 0
+    for end_ind, sample_ind in enumerate(order):
+        # the samples are sorted, so the last one is the longest
+        nr_of_tokens = (end_ind + 1 - start_ind) * lengths[sample_ind]
+        if end_ind > start_ind and (end_ind - start_ind >= batch_size or
+                                    (max_tokens is not None and nr_of_tokens > max_tokens)):
+            batches.append((start_ind, end_ind))
+            start_ind = end_ind
+    if start_ind < len(order):
+        batches.append((start_ind, len(order)))
+    return order, batches
+
+
 def predict(model: nn.Module, data: List[Tuple[List[int], int, Optional[int]]],
             config: ConfigMetaCAT) -> Tuple:
     """Predict on data used in the meta_cat.pipe
@@ -97,40 +135,104 @@ def predict(model: nn.Module, data: List[Tuple[List[int], int, Optional[int]]],
     model.eval()
     model.to(device)
 
-    num_batches = math.ceil(len(data) / batch_size)
+    # Batch samples of similar length together to avoid padding them to the longest one
+    order, batches = get_length_batches([len(x[0]) for x in data], batch_size,
+                                        max_tokens=config.general['batch_tokens_eval'])
+    sorted_data = [data[ind] for ind in order]
     all_logits = []
 
     with torch.no_grad():
-        for i in range(num_batches):
-            x, cpos, attention_masks, _ = create_batch_piped_data(data, i * batch_size, (i + 1) * batch_size,
+        for start_ind, end_ind in batches:
+            x, cpos, attention_masks, _ = create_batch_piped_data(sorted_data, start_ind, end_ind,
                                                                   device=device, pad_id=pad_id)
 
             logits = model(x, center_positions=cpos, attention_mask=attention_masks, ignore_cpos=ignore_cpos)
             all_logits.append(logits.detach().cpu().numpy())
 
+    return _get_predictions(all_logits, order)
+
+
+def predict_multi_task(models: List[nn.Module], data: List[Tuple[List[int], int, Optional[int]]],
+                       config: ConfigMetaCAT) -> List[Tuple]:
+    """Predict on data used in the meta_cat.pipe for several tasks at once.
+
+    The models have to be `BertForMetaAnnotation` models with the same (frozen) BERT model.
+    The encoder of the first one is run once for each batch and the classification head
+    of each model is applied to its output.
+
+    Args:
+        models (List[nn.Module]):
+            The models, one per task.
+        data (List[Tuple[List[int], int, Optional[int]]]):
+            Data in the format: [[<input_ids>, <cpos>], ...]
+        config (ConfigMetaCAT):
+            Configuration used for batching and the device (e.g of the first task).
+
+    Returns:
+        List[Tuple]:
+            For each model the predictions and confidences (as in `predict`).
+    """
+    pad_id = config.model['padding_idx']
+    batch_size = config.general['batch_size_eval']
+    device = config.general['device']
+
+    for model in models:
+        model.eval()
+        model.to(device)
+    encoder = models[0]
+
+    order, batches = get_length_batches([len(x[0]) for x in data], batch_size,
+                                        max_tokens=config.general['batch_tokens_eval'])
+    sorted_data = [data[ind] for ind in order]
+    all_logits: List[List[np.ndarray]] = [[] for _ in models]
+
+    with torch.no_grad():
+        for start_ind, end_ind in batches:
+            x, cpos, attention_masks, _ = create_batch_piped_data(sorted_data, start_ind, end_ind,
+                                                                  device=device, pad_id=pad_id)
+
+            outputs = encoder.encode(x, attention_mask=attention_masks)  # type: ignore
+            for model, task_logits in zip(models, all_logits):
+                logits = model.classify(outputs, center_positions=cpos)  # type: ignore
+                task_logits.append(logits.detach().cpu().numpy())
+
+    return [_get_predictions(task_logits, order) for task_logits in all_logits]
+
+
+def _get_predictions(all_logits: List[np.ndarray], order: np.ndarray) -> Tuple:
     predictions = []
     confidences = []
 
     # Can be that there are not logits, data is empty
     if all_logits:
-        logits = np.concatenate(all_logits, axis=0)
+        # Restore the original order of the samples
+        logits = np.empty((len(order), all_logits[0].shape[1]), dtype=all_logits[0].dtype)
+        logits[order] = np.concatenate(all_logits, axis=0)
         predictions = np.argmax(logits, axis=1)
         confidences = np.max(softmax(logits, axis=1), axis=1)
 
     return predictions, confidences
 
 
-def split_list_train_test(data: List, test_size: float, shuffle: bool = True) -> Tuple:
+def split_list_train_test(data: Union[List, MetaCATDataset], test_size: float, shuffle: bool = True) -> Tuple:
     """Shuffle and randomly split data
 
+    A `MetaCATDataset` is split into two subsets that share its arrays.
+
     Args:
-        data (List): The data.
+        data (Union[List, MetaCATDataset]): The data.
         test_size (float): The test size.
         shuffle (bool): Whether to shuffle the data. Defaults to True.
 
     Returns:
         Tuple: The train data, and the test data.
     """
+    if isinstance(data, MetaCATDataset):
+        inds = list(range(len(data)))
+        if shuffle:
+            random.shuffle(inds)
+        train_inds, test_inds = train_test_split(inds, test_size=test_size, random_state=42)
+        return data.subset(train_inds), data.subset(test_inds)
     if shuffle:
         random.shuffle(data)
 
@@ -174,12 +276,13 @@ class FocalLoss(nn.Module):
         return loss
 
 
-def train_model(model: nn.Module, data: List, config: ConfigMetaCAT, save_dir_path: Optional[str] = None) -> Dict:
+def train_model(model: nn.Module, data: Union[List, MetaCATDataset], config: ConfigMetaCAT,
+                save_dir_path: Optional[str] = None) -> Dict:
     """Trains a LSTM model and BERT with autocheckpoints
 
     Args:
         model (nn.Module): The model
-        data (List): The data.
+        data (Union[List, MetaCATDataset]): The data (with the category value IDs as labels).
         config (ConfigMetaCAT): MetaCAT config.
         save_dir_path (Optional[str]): The save dir path if required. Defaults to None.
 
@@ -198,7 +301,7 @@ def train_model(model: nn.Module, data: List, config: ConfigMetaCAT, save_dir_pa
 
     if class_weights is None:
         if config.train['compute_class_weights'] is True:
-            y_ = [x[2] for x in train_data]
+            y_: Union[np.ndarray, List] = train_data.sample_labels if isinstance(train_data, MetaCATDataset) else [x[2] for x in train_data]
             class_weights = compute_class_weight(class_weight="balanced", classes=np.unique(y_), y=y_)
             config.train['class_weights'] = class_weights.tolist()
             logger.info("Class weights computed: %s",class_weights)
@@ -272,58 +375,76 @@ def train_model(model: nn.Module, data: List, config: ConfigMetaCAT, save_dir_pa
     pad_id = config.model['padding_idx']
     nepochs = config.train['nepochs']
     ignore_cpos = config.model['ignore_cpos']
-    num_batches = math.ceil(len(train_data) / batch_size)
-    num_batches_test = math.ceil(len(test_data) / batch_size_eval)
+    accumulation_steps = config.train['gradient_accumulation_steps']
     optimizer = optim.Adam(parameters, lr=config.train['lr'], weight_decay=1e-5)
     if config.model.model_architecture_config is not None:
         if config.model.model_architecture_config['lr_scheduler'] is True:
-            model, optimizer, scheduler = initialize_model(model, train_data, batch_size, config.train['lr'],
-                                                           epochs=nepochs)
+            model, optimizer, scheduler = initialize_model(model, train_data, batch_size * accumulation_steps,
+                                                           config.train['lr'], epochs=nepochs)
 
     model.to(device)  # Move the model to device
 
-    # Can be pre-calculated for the whole dataset
-    y_test = [x[2] for x in test_data]
-    y_train = [x[2] for x in train_data]
+    # Pack the data once (unless it already is), the batches are padded when they are created
+    train_dataset = train_data if isinstance(train_data, MetaCATDataset) else MetaCATDataset.from_samples(train_data)
+    test_dataset = test_data if isinstance(test_data, MetaCATDataset) else MetaCATDataset.from_samples(test_data)
+    if config.train['length_bucketing']:
+        train_sampler: Sampler = LengthBucketSampler(train_dataset.lengths, batch_size, shuffle=True,
+                                                     seed=config.general['seed'])
+    else:
+        train_sampler = BatchSampler(SequentialSampler(train_dataset), batch_size, drop_last=False)
+    test_sampler = LengthBucketSampler(test_dataset.lengths, batch_size_eval, shuffle=False)
+    collate_fn = BatchCollator(pad_id)
+    pin_memory = device.type == 'cuda'
+    train_loader = DataLoader(train_dataset, batch_sampler=train_sampler, collate_fn=collate_fn,
+                              num_workers=config.train['num_workers'], pin_memory=pin_memory)
+    test_loader = DataLoader(test_dataset, batch_sampler=test_sampler, collate_fn=collate_fn,
+                             num_workers=config.train['num_workers'], pin_memory=pin_memory)
 
     winner_report: Dict = {}
     for epoch in range(nepochs):
         running_loss = []
         all_logits = []
+        # The order of the samples changes, so the labels are collected with the logits
+        all_y = []
         model.train()
-        for i in range(num_batches):
-            model.zero_grad()
-
-            x, cpos, attention_masks, y = create_batch_piped_data(train_data, i * batch_size, (i + 1) * batch_size,
-                                                                  device=device, pad_id=pad_id)
+        if isinstance(train_sampler, LengthBucketSampler):
+            train_sampler.set_epoch(epoch)
+        model.zero_grad()
+        for i, (x, cpos, attention_masks, y) in enumerate(train_loader):
+            x, attention_masks, y = x.to(device), attention_masks.to(device), y.to(device)
             logits = model(x, attention_mask=attention_masks, center_positions=cpos, ignore_cpos=ignore_cpos)
             loss = criterion(logits, y)
-            loss.backward()
+            (loss / accumulation_steps).backward()
             # Track loss and logits
             running_loss.append(loss.item())
             all_logits.append(logits.detach().cpu().numpy())
-
-            parameters = filter(lambda p: p.requires_grad, model.parameters())
-            nn.utils.clip_grad_norm_(parameters, 0.15)
-            optimizer.step()
-            if config.model.model_architecture_config is not None:
-                if config.model.model_architecture_config['lr_scheduler'] is True:
-                    scheduler.step()
+            all_y.append(y.cpu().numpy())
+
+            if (i + 1) % accumulation_steps == 0 or i + 1 == len(train_loader):
+                parameters = filter(lambda p: p.requires_grad, model.parameters())
+                nn.utils.clip_grad_norm_(parameters, 0.15)
+                optimizer.step()
+                if config.model.model_architecture_config is not None:
+                    if config.model.model_architecture_config['lr_scheduler'] is True:
+                        scheduler.step()
+                model.zero_grad()
+        y_train = np.concatenate(all_y)
 
         all_logits_test = []
         running_loss_test = []
+        all_y_test = []
         model.eval()
 
         with torch.no_grad():
-            for i in range(num_batches_test):
-                x, cpos, attention_masks, y = create_batch_piped_data(test_data, i * batch_size_eval,
-                                                                      (i + 1) * batch_size_eval, device=device,
-                                                                      pad_id=pad_id)
+            for x, cpos, attention_masks, y in test_loader:
+                x, attention_masks = x.to(device), attention_masks.to(device)
                 logits = model(x, attention_mask=attention_masks, center_positions=cpos, ignore_cpos=ignore_cpos)
 
                 # Track loss and logits
                 running_loss_test.append(loss.item())
                 all_logits_test.append(logits.detach().cpu().numpy())
+                all_y_test.append(y.numpy())
+        y_test = np.concatenate(all_y_test)
 
         print_report(epoch, running_loss, all_logits, y=y_train, name='Train')
         print_report(epoch, running_loss_test, all_logits_test, y=y_test, name='Test')
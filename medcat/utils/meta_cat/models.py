@@ -167,11 +167,37 @@ class BertForMetaAnnotation(nn.Module):
         """
         # return_dict = return_dict if return_dict is not None else self.config.use_return_dict # type: ignore
 
-        outputs = self.bert(  # type: ignore
+        outputs = self.encode(input_ids, attention_mask=attention_mask)
+        return self.classify(outputs, center_positions)
+
+    def encode(self, input_ids: Optional[torch.LongTensor], attention_mask: Optional[torch.FloatTensor] = None) -> Any:
+        """Run the BERT encoder.
+
+        The output only depends on the (frozen) BERT model, so it can be shared by the
+        classification heads of several tasks (see `classify`).
+
+        Args:
+            input_ids (Optional[torch.LongTensor]): The input IDs.
+            attention_mask (Optional[torch.FloatTensor]): The attention mask. Defaults to None.
+
+        Returns:
+            Any: The output of the BERT model.
+        """
+        return self.bert(  # type: ignore
             input_ids,
             attention_mask=attention_mask, output_hidden_states=True
         )
 
+    def classify(self, outputs: Any, center_positions: Iterable[Any]) -> Tensor:
+        """Run the classification head on the output of the encoder.
+
+        Args:
+            outputs (Any): The output of the BERT model (from `encode`).
+            center_positions (Iterable[Any]): The center positions.
+
+        Returns:
+            Tensor: The logits.
+        """
         x_all = []
         for i, indices in enumerate(center_positions):
             this_hidden: torch.Tensor = outputs.last_hidden_state[i, indices, :]
@@ -182,7 +208,17 @@ class BertForMetaAnnotation(nn.Module):
 
         pooled_output = outputs[1]
         x = torch.cat((x, pooled_output), dim=1)
+        return self.head(x)
+
+    def head(self, x: Tensor) -> Tensor:
+        """Run the fully connected layers of the classification head.
 
+        Args:
+            x (Tensor): The pooled center tokens concatenated with the pooled output of BERT.
+
+        Returns:
+            Tensor: The logits.
+        """
         # fc1
         x = self.dropout(x)
         x = self.fc1(x)
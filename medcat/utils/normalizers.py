@@ -1,18 +1,187 @@
-from typing import Optional, Set, Iterable, Iterator
+from typing import Optional, Set, Iterable, Iterator, Dict, Tuple, Hashable, List, Callable
 import re
-import spacy
+import pickle
+import logging
+from collections import OrderedDict
+from spacy.tokens import Doc
 from medcat.pipeline.pipe_runner import PipeRunner
+from medcat.pipeline.lexeme_memo import LexemeMemo
+from medcat.utils.spacy_pipeline import load_spacy_model
+
+
+logger = logging.getLogger(__name__)
 
 
 CONTAINS_NUMBER = re.compile('[0-9]+')
+LETTERS = 'abcdefghijklmnopqrstuvwxyz'
+DIACRITICS = 'àáâãäåæçèéêëìíîïðñòóôõöøùúûüýþÿ'
+
+
+def _get_deletes(word: str, max_distance: int) -> Set[str]:
+    deletes = {word}
+    last = deletes
+    for _ in range(max_distance):
+        last = set(w[:i] + w[i + 1:] for w in last for i in range(len(w)))
+        deletes = deletes | last
+    return deletes
+
+
+class DeletionIndex(object):
+    """A symmetric deletion (SymSpell-like) index of the words in a vocab.
+
+    Each word is indexed under all the strings that can be obtained by deleting
+    up to `max_distance` characters from its prefix. Any two words that are
+    within `max_distance` edits of each other share at least one of these strings.
+    So the words close to a misspelled word can be found with a handful of lookups
+    instead of generating all of its edits. The found words still need to be verified
+    since the index may also return some words that are further away.
+
+    Args:
+        max_distance (int): The maximum edit distance supported. Defaults to 2.
+        prefix_length (int): The length of the word prefix that is indexed. Defaults to 7.
+    """
+
+    def __init__(self, max_distance: int = 2, prefix_length: int = 7) -> None:
+        self.max_distance = max_distance
+        self.prefix_length = prefix_length
+        self.deletes: Dict[str, List[str]] = {}
+        self.nr_of_words = 0
+
+    def add_words(self, words: Iterable[str]) -> None:
+        """Add words to the index.
+
+        Args:
+            words (Iterable[str]): The words to add.
+        """
+        for word in words:
+            for delete in _get_deletes(word[:self.prefix_length], self.max_distance):
+                self.deletes.setdefault(delete, []).append(word)
+            self.nr_of_words += 1
+
+    def __contains__(self, word: str) -> bool:
+        # every word is indexed under its own prefix (i.e with no deletes)
+        return word in self.deletes.get(word[:self.prefix_length], ())
+
+    def lookup(self, word: str, max_distance: int) -> Set[str]:
+        """Get the indexed words that may be within the specified distance of a word.
+
+        Args:
+            word (str): The word.
+            max_distance (int): The maximum distance (at most the distance of the index).
+
+        Returns:
+            Set[str]: The (unverified) candidates.
+        """
+        candidates: Set[str] = set()
+        for delete in _get_deletes(word[:self.prefix_length], max_distance):
+            candidates.update(self.deletes.get(delete, ()))
+        return set(cand for cand in candidates if abs(len(cand) - len(word)) <= max_distance)
+
+    def save(self, path: str) -> None:
+        """Save the index to disk.
+
+        Args:
+            path (str): The file to save to.
+        """
+        with open(path, 'wb') as f:
+            pickle.dump(self.__dict__, f)
+
+    @classmethod
+    def load(cls, path: str) -> "DeletionIndex":
+        """Load the index from disk.
+
+        Args:
+            path (str): The file to load from.
+
+        Returns:
+            DeletionIndex: The loaded index.
+        """
+        index = cls()
+        with open(path, 'rb') as f:
+            index.__dict__.update(pickle.load(f))
+        return index
+
+
+def _is_edit1(word: str, target: str, letters: str) -> bool:
+    # whether target is in BasicSpellChecker.get_edits1(word)
+    lw, lt = len(word), len(target)
+    if lt == lw:
+        mismatches = [i for i in range(lw) if word[i] != target[i]]
+        if not mismatches:
+            return any(c in letters for c in word) or any(word[i] == word[i + 1] for i in range(lw - 1))
+        if len(mismatches) == 1:
+            return target[mismatches[0]] in letters
+        i = mismatches[0]
+        return mismatches == [i, i + 1] and word[i] == target[i + 1] and word[i + 1] == target[i]
+    if abs(lt - lw) != 1:
+        return False
+    longer, shorter = (word, target) if lw > lt else (target, word)
+    i = 0
+    while i < len(shorter) and longer[i] == shorter[i]:
+        i += 1
+    if longer[i + 1:] != shorter[i:]:
+        return False
+    # an insertion can only use the allowed letters
+    return lw > lt or longer[i] in letters
+
+
+def _damerau_levenshtein(a: str, b: str) -> int:
+    # the (unrestricted) Damerau-Levenshtein distance, i.e the smallest number of
+    # deletions, insertions, substitutions and adjacent transpositions
+    inf = len(a) + len(b)
+    d = [[inf] * (len(b) + 2)] + [[inf] + [0] * (len(b) + 1) for _ in range(len(a) + 1)]
+    for i in range(len(a) + 1):
+        d[i + 1][1] = i
+    for j in range(len(b) + 1):
+        d[1][j + 1] = j
+    last_row: Dict[str, int] = {}
+    for i in range(1, len(a) + 1):
+        last_col = 0
+        for j in range(1, len(b) + 1):
+            i1 = last_row.get(b[j - 1], 0)
+            j1 = last_col
+            if a[i - 1] == b[j - 1]:
+                cost = 0
+                last_col = j
+            else:
+                cost = 1
+            d[i + 1][j + 1] = min(d[i][j] + cost, d[i + 1][j] + 1, d[i][j + 1] + 1,
+                                  d[i1][j1] + (i - i1 - 1) + 1 + (j - j1 - 1))
+        last_row[a[i - 1]] = i
+    return d[len(a) + 1][len(b) + 1]
 
 
 class BasicSpellChecker(object):
+    """Spell checking based on the words in the CDB vocab.
+
+    Args:
+        cdb_vocab (Dict[str, int]): The CDB vocab (word to count).
+        config (Config): The config.
+        data_vocab (Optional[Vocab]): The (data) vocab.
+        index (Optional[DeletionIndex]): The deletion index of the CDB vocab (see `build_index`).
+        get_vocab_version (Optional[Callable[[], int]]): Gets the version of the CDB vocab,
+            which changes whenever words are added or removed (e.g `CDB.get_vocab_version`).
+            It is used to keep the index up to date without checking the whole vocab on
+            every lookup. If not specified, the vocab is checked on every lookup.
+    """
 
-    def __init__(self, cdb_vocab, config, data_vocab=None):
+    def __init__(self, cdb_vocab, config, data_vocab=None, index: Optional[DeletionIndex] = None,
+                 get_vocab_version: Optional[Callable[[], int]] = None):
         self.vocab = cdb_vocab
         self.config = config
         self.data_vocab = data_vocab
+        self.get_vocab_version = get_vocab_version
+        self.index = index
+
+    @property
+    def index(self) -> Optional[DeletionIndex]:
+        return self._index
+
+    @index.setter
+    def index(self, index: Optional[DeletionIndex]) -> None:
+        self._index = index
+        # the version of the vocab the index has the words of, None if not known
+        self._index_vocab_version: Optional[int] = None
 
     def P(self, word: str) -> float:
         """Probability of `word`.
@@ -63,6 +232,10 @@ class BasicSpellChecker(object):
         Returns:
             Iterable[str]: The list of candidate words.
         """
+        index = self.get_index()
+        if index is not None:
+            return self.known([word]) or self._indexed_known(index, word, 1) or \
+                (self.config.general.spell_check_deep and self._indexed_known(index, word, 2)) or [word]
         if self.config.general.spell_check_deep:
             # This will check a two letter edit distance
             return self.known([word]) or self.known(self.edits1(word)) or self.known(self.edits2(word)) or [word]
@@ -70,6 +243,70 @@ class BasicSpellChecker(object):
             # Will check only one letter edit distance
             return self.known([word]) or self.known(self.edits1(word)) or [word]
 
+    def build_index(self, prefix_length: int = 7) -> DeletionIndex:
+        """Build the deletion index of the (CDB) vocab.
+
+        With the index, the candidates are found without generating all the edits of a word.
+        The words added to the vocab afterwards are added to the index when needed (see `get_index`).
+
+        Args:
+            prefix_length (int): The length of the word prefix that is indexed. Defaults to 7.
+
+        Returns:
+            DeletionIndex: The index.
+        """
+        max_distance = 2 if self.config.general.spell_check_deep else 1
+        vocab_version = self._get_vocab_version()
+        index = self.index = DeletionIndex(max_distance=max_distance, prefix_length=prefix_length)
+        index.add_words(self.vocab)
+        self._index_vocab_version = vocab_version
+        return index
+
+    def _get_vocab_version(self) -> Optional[int]:
+        return self.get_vocab_version() if self.get_vocab_version is not None else None
+
+    def get_index(self) -> Optional[DeletionIndex]:
+        """Get the deletion index (if there is one), up to date with the vocab.
+
+        The words added to the vocab since the index was built (or loaded) are added
+        to it. The ones that were removed are left in, they are never returned as
+        candidates since these are checked against the vocab. The index is rebuilt
+        if it was built for a smaller edit distance than currently needed.
+
+        Returns:
+            Optional[DeletionIndex]: The index, or None if there's no index.
+        """
+        index = self.index
+        if index is None:
+            return None
+        if self.config.general.spell_check_deep and index.max_distance < 2:
+            return self.build_index(index.prefix_length)
+        vocab_version = self._get_vocab_version()
+        if vocab_version is None or vocab_version != self._index_vocab_version:
+            new_words = [word for word in self.vocab if word not in index]
+            if new_words:
+                logger.debug("Adding %d new words to the spell checking index", len(new_words))
+                index.add_words(new_words)
+            self._index_vocab_version = vocab_version
+        return index
+
+    def _indexed_known(self, index: DeletionIndex, word: str, distance: int) -> Set[str]:
+        letters = LETTERS + DIACRITICS if self.config.general.diacritics else LETTERS
+        known = set()
+        for cand in index.lookup(word, distance):
+            if cand not in self.vocab:
+                continue
+            if distance == 1:
+                if _is_edit1(word, cand, letters):
+                    known.add(cand)
+            elif all(c in letters for c in cand):
+                # any 2 edits that only produce the allowed letters
+                if _damerau_levenshtein(word, cand) <= distance:
+                    known.add(cand)
+            elif any(_is_edit1(edit, cand, letters) for edit in self.edits1(word)):
+                known.add(cand)
+        return known
+
     def known(self, words: Iterable[str]) -> Set[str]:
         """The subset of `words` that appear in the dictionary of WORDS.
 
@@ -95,10 +332,10 @@ class BasicSpellChecker(object):
         Returns:
             Set[str]: The set of all edits
         """
-        letters    = 'abcdefghijklmnopqrstuvwxyz'
+        letters    = LETTERS
 
         if use_diacritics:
-            letters += 'àáâãäåæçèéêëìíîïðñòóôõöøùúûüýþÿ'
+            letters += DIACRITICS
 
         splits     = [(word[:i], word[i:])    for i in range(len(word) + 1)]
         deletes    = [L + R[1:]               for L, R in splits if R]
@@ -159,47 +396,209 @@ def get_all_edits_n(word: str, use_diacritics: bool, n: int,
         yield from get_all_edits_n(edited_word, use_diacritics, n - 1, return_ordered)
 
 
+class SpellCorrectionCache(object):
+    """Caches the normalised forms of spell checked words.
+
+    It holds:
+        - A lemma table - the lower case and the lemma of each correction target
+          (i.e the words in the CDB vocab) so the correction does not need to be parsed.
+        - A bounded (least recently used) cache of the final norm for each misspelled word
+          (`None` if the word could not be fixed).
+
+    The same instance can be shared across documents (and normalisers) and
+    can be saved along with the model pack.
+
+    Args:
+        max_corrections (int): The maximum number of cached corrections.
+    """
+
+    def __init__(self, max_corrections: int = 100_000) -> None:
+        self.max_corrections = max_corrections
+        self.lemmas: Dict[str, Tuple[str, str]] = {}
+        self.corrections: 'OrderedDict[str, Optional[str]]' = OrderedDict()
+        self.settings: Optional[Hashable] = None
+
+    def check_settings(self, settings: Hashable) -> None:
+        """Make sure the cached corrections were made with the specified settings.
+
+        If the settings have changed, the cached corrections are cleared.
+
+        Args:
+            settings (Hashable): The settings the corrections depend on.
+        """
+        if settings != self.settings:
+            if self.corrections:
+                logger.info("Spell checking settings changed, clearing %d cached corrections",
+                            len(self.corrections))
+            self.corrections.clear()
+            self.settings = settings
+
+    def get_correction(self, word: str) -> Tuple[bool, Optional[str]]:
+        """Get the cached norm of a misspelled word.
+
+        Args:
+            word (str): The (lower case) misspelled word.
+
+        Returns:
+            Tuple[bool, Optional[str]]: Whether the word was cached, and its norm (None if it can't be fixed).
+        """
+        if word not in self.corrections:
+            return False, None
+        self.corrections.move_to_end(word)
+        return True, self.corrections[word]
+
+    def add_correction(self, word: str, norm: Optional[str]) -> None:
+        """Cache the norm of a misspelled word.
+
+        Args:
+            word (str): The (lower case) misspelled word.
+            norm (Optional[str]): The norm, or None if the word can't be fixed.
+        """
+        self.corrections[word] = norm
+        self.corrections.move_to_end(word)
+        if len(self.corrections) > self.max_corrections:
+            self.corrections.popitem(last=False)
+
+    def clear(self) -> None:
+        """Clear the cached corrections and lemmas."""
+        self.corrections.clear()
+        self.lemmas.clear()
+
+    def save(self, path: str) -> None:
+        """Save the cache to disk.
+
+        Args:
+            path (str): The file to save to.
+        """
+        with open(path, 'wb') as f:
+            pickle.dump(self.__dict__, f)
+
+    @classmethod
+    def load(cls, path: str) -> "SpellCorrectionCache":
+        """Load the cache from disk.
+
+        Args:
+            path (str): The file to load from.
+
+        Returns:
+            SpellCorrectionCache: The loaded cache.
+        """
+        cache = cls()
+        with open(path, 'rb') as f:
+            cache.__dict__.update(pickle.load(f))
+        return cache
+
+
 class TokenNormalizer(PipeRunner):
     """Will normalize all tokens in a spacy document.
 
     Args:
         config
         spell_checker
+        cache (Optional[SpellCorrectionCache]): The (shared) spell correction cache.
+        get_spacy_docs (Optional[Callable[..., Iterator[Doc]]]):
+            Processes words with the spacy model (used to get the lemmas of the corrections),
+            e.g `Pipe.get_spacy_docs` to reuse the spacy model of the main pipeline.
+            If not specified, the spacy model is loaded again.
     """
 
     # Custom pipeline component name
     name = 'token_normalizer'
 
     # Override
-    def __init__(self, config, spell_checker=None):
+    def __init__(self, config, spell_checker=None, cache: Optional[SpellCorrectionCache] = None,
+                 get_spacy_docs: Optional[Callable[..., Iterator[Doc]]] = None):
         self.config = config
         self.spell_checker = spell_checker
-        self.nlp = spacy.load(config.general.spacy_model, disable=config.general.spacy_disabled_components)
+        self.cache = cache if cache is not None else SpellCorrectionCache(config.general.spell_check_cache_size)
+        if get_spacy_docs is None:
+            nlp = load_spacy_model(config)
+
+            def get_spacy_docs(texts: Iterable[str], batch_size: int = 1000) -> Iterator[Doc]:
+                return nlp.pipe(texts, batch_size=batch_size)
+        self.get_spacy_docs = get_spacy_docs
+        self.memo = LexemeMemo(config.preprocessing.lexeme_memo_size)
         super().__init__(self.config.general.workers)
 
+    def _get_lemma(self, word: str) -> Tuple[str, str]:
+        lemma = self.cache.lemmas.get(word)
+        if lemma is None:
+            tmp = next(self.get_spacy_docs([word]))[0]
+            lemma = self.cache.lemmas[word] = (tmp.lower_, tmp.lemma_.lower())
+        return lemma
+
+    def build_lemma_table(self, words: Iterable[str], batch_size: int = 1000) -> None:
+        """Precompute the lower case and lemma of all the specified words.
+
+        These should be all the possible spell check corrections (i.e the words in the CDB vocab).
+
+        Args:
+            words (Iterable[str]): The words.
+            batch_size (int): The batch size for the spacy pipeline. Defaults to 1000.
+        """
+        words = [word for word in words if word not in self.cache.lemmas and word.strip()]
+        logger.info("Building the lemma table for %d words", len(words))
+        for word, doc in zip(words, self.get_spacy_docs(words, batch_size)):
+            if len(doc):
+                self.cache.lemmas[word] = (doc[0].lower_, doc[0].lemma_.lower())
+
+    def _fix_norm(self, word: str) -> Optional[str]:
+        found, norm = self.cache.get_correction(word)
+        if not found:
+            fix = self.spell_checker.fix(word)
+            if fix is not None:
+                lower, lemma = self._get_lemma(fix)
+                norm = lower if len(word) < self.config.preprocessing.min_len_normalize else lemma
+            self.cache.add_correction(word, norm)
+        return norm
+
     # Override
     def __call__(self, doc):
+        cnf_p = self.config.preprocessing
+        spell_check = self.config.general.spell_check
+        # the corrections (and which words need fixing) change when words are added to the vocab
+        vocab_size = len(self.spell_checker.vocab) if spell_check and self.spell_checker is not None else None
+        if spell_check:
+            self.cache.check_settings((self.config.general.spell_check_deep, self.config.general.diacritics,
+                                       cnf_p.min_len_normalize, vocab_size))
+        self.memo.max_size = cnf_p.lexeme_memo_size
+        # is_punct (used by the spell check) is set by the tagger, based on the text and these settings
+        self.memo.check_settings((cnf_p.min_len_normalize, frozenset(cnf_p.do_not_normalize), spell_check,
+                                  self.config.general.spell_check_len_limit, vocab_size,
+                                  self.config.punct_checker.pattern, frozenset(cnf_p.keep_punct)))
         for token in doc:
-            if len(token.lower_) < self.config.preprocessing.min_len_normalize:
-                token._.norm = token.lower_
-            elif (self.config.preprocessing.do_not_normalize) and token.tag_ is not None and \
-                     token.tag_ in self.config.preprocessing.do_not_normalize:
-                token._.norm = token.lower_
-            elif token.lemma_ == '-PRON-':
-                token._.norm = token.lemma_
-                token._.to_skip = True
-            else:
-                token._.norm = token.lemma_.lower()
-
-            if self.config.general.spell_check:
-                # Fix the token if necessary
-                if len(token.text) >= self.config.general.spell_check_len_limit and not token._.is_punct \
-                        and token.lower_ not in self.spell_checker and not CONTAINS_NUMBER.search(token.lower_):
-                    fix = self.spell_checker.fix(token.lower_)
-                    if fix is not None:
-                        tmp = self.nlp(fix)[0]
-                        if len(token.lower_) < self.config.preprocessing.min_len_normalize:
-                            token._.norm = tmp.lower_
-                        else:
-                            token._.norm = tmp.lemma_.lower()
+            # the norm only depends on the text, the lemma and (for do_not_normalize) the tag
+            key = (token.orth, token.lemma, token.tag if cnf_p.do_not_normalize else 0)
+            decision = self.memo.get(key)
+            if decision is None:
+                decision = self._get_decision(token)
+                self.memo.add(key, decision)
+            norm, to_skip, to_fix = decision
+            if to_fix:
+                fixed_norm = self._fix_norm(token.lower_)
+                if fixed_norm is not None:
+                    norm = fixed_norm
+            underscore = token._
+            underscore.norm = norm
+            if to_skip:
+                underscore.to_skip = True
         return doc
+
+    def _get_decision(self, token) -> Tuple[str, bool, bool]:
+        to_skip = False
+        if len(token.lower_) < self.config.preprocessing.min_len_normalize:
+            norm = token.lower_
+        elif (self.config.preprocessing.do_not_normalize) and token.tag_ is not None and \
+                 token.tag_ in self.config.preprocessing.do_not_normalize:
+            norm = token.lower_
+        elif token.lemma_ == '-PRON-':
+            norm = token.lemma_
+            to_skip = True
+        else:
+            norm = token.lemma_.lower()
+
+        # Fix the token if necessary
+        to_fix = bool(self.config.general.spell_check and len(token.text) >= self.config.general.spell_check_len_limit
+                      and not token._.is_punct and token.lower_ not in self.spell_checker
+                      and not CONTAINS_NUMBER.search(token.lower_))
+        return norm, to_skip, to_fix
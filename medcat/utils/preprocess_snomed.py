@@ -1,12 +1,27 @@
 import os
+import csv
 import json
 import re
 import hashlib
+import logging
+import numpy as np
 import pandas as pd
-from typing import Dict, List, Optional, Tuple
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
 from dataclasses import dataclass, field
 from enum import Enum, auto
 
+from medcat.utils.hasher import Hasher
+from medcat.utils.hierarchy import HierarchyIndex
+
+
+logger = logging.getLogger(__name__)
+
+# The number of rows read from an RF2 file at once
+RF2_CHUNK_SIZE = 1_000_000
+# The number of bytes read at once when hashing a file
+_HASH_BLOCK_SIZE = 2 ** 20
+
 
 def parse_file(filename, first_row_header=True, columns=None):
     with open(filename, encoding='utf-8') as f:
@@ -14,18 +29,101 @@ def parse_file(filename, first_row_header=True, columns=None):
         return pd.DataFrame(entities[1:], columns=entities[0] if first_row_header else columns)
 
 
+def read_rf2_file(filename: str, only_active: bool = True, chunk_size: int = RF2_CHUNK_SIZE) -> pd.DataFrame:
+    """Read an RF2 (tab separated, with a header) release file.
+
+    The file is read in chunks (with all the columns as strings) and, if
+    `only_active` is set, the inactive rows are dropped from each chunk
+    before the next one is read.
+
+    Args:
+        filename (str): The RF2 file.
+        only_active (bool): Whether to only keep the active rows. Defaults to True.
+        chunk_size (int): The number of rows read at once. Defaults to RF2_CHUNK_SIZE.
+
+    Returns:
+        pd.DataFrame: The (active) rows of the file.
+    """
+    chunks = []
+    with pd.read_csv(filename, sep='\t', dtype=str, encoding='utf-8', quoting=csv.QUOTE_NONE,
+                     keep_default_na=False, chunksize=chunk_size) as reader:
+        for chunk in reader:
+            chunk.columns = chunk.columns.str.strip()
+            if only_active:
+                chunk = chunk[chunk['active'].str.strip() == '1']
+            chunks.append(chunk.apply(lambda column: column.str.strip()))
+    if not chunks:
+        # only the header
+        columns = pd.read_csv(filename, sep='\t', encoding='utf-8', quoting=csv.QUOTE_NONE, nrows=0).columns
+        return pd.DataFrame(columns=columns.str.strip(), dtype=str)
+    return pd.concat(chunks, ignore_index=True)
+
+
+def get_file_hash(filename: str) -> str:
+    """Get the hash of the contents of a file.
+
+    Args:
+        filename (str): The file.
+
+    Returns:
+        str: The hash.
+    """
+    hasher = Hasher()
+    with open(filename, 'rb') as f:
+        for block in iter(lambda: f.read(_HASH_BLOCK_SIZE), b''):
+            hasher.update_bytes(block)
+    return hasher.hexdigest()
+
+
+def read_rf2_file_cached(filename: str, cache_dir: Optional[str] = None, only_active: bool = True) -> pd.DataFrame:
+    """Read an RF2 release file (see `read_rf2_file`) using a local cache of the parsed files.
+
+    The parsed file is stored in the cache directory (keyed on the hash of its
+    contents), so reading the same file again (e.g when rebuilding a CDB) does
+    not need to parse it.
+
+    Args:
+        filename (str): The RF2 file.
+        cache_dir (Optional[str]): The cache directory. If None, the file is parsed without the cache.
+        only_active (bool): Whether to only keep the active rows. Defaults to True.
+
+    Returns:
+        pd.DataFrame: The (active) rows of the file.
+    """
+    if cache_dir is None:
+        return read_rf2_file(filename, only_active=only_active)
+    name = os.path.splitext(os.path.basename(filename))[0]
+    cache_path = os.path.join(cache_dir, f"{name}_{get_file_hash(filename)}{'_active' if only_active else ''}.pkl")
+    if os.path.exists(cache_path):
+        logger.debug("Loading cached RF2 file from %s", cache_path)
+        return pd.read_pickle(cache_path)
+    df = read_rf2_file(filename, only_active=only_active)
+    os.makedirs(cache_dir, exist_ok=True)
+    # write to a temporary file first so that a (parallel) reader never sees a partial file
+    temp_path = f"{cache_path}.{os.getpid()}.tmp"
+    df.to_pickle(temp_path)
+    os.replace(temp_path, cache_path)
+    return df
+
+
 def get_all_children(sctid, pt2ch):
     """
     Retrieves all the children of a given SNOMED CT ID (SCTID) from a given parent-to-child mapping (pt2ch) via the "IS A" relationship.
     pt2ch can be found in a MedCAT model in the additional info via the call: cat.cdb.addl_info['pt2ch']
 
+    For repeated queries, build a `medcat.utils.hierarchy.HierarchyIndex` (once) and pass it as `pt2ch`
+    to avoid walking the hierarchy for every query.
+
     Args:
         sctid (int): The SCTID whose children need to be retrieved.
-        pt2ch (dict): A dictionary containing the parent-to-child relationships in the form {parent_sctid: [list of child sctids]}.
+        pt2ch (Union[dict, HierarchyIndex]): A dictionary containing the parent-to-child relationships in the
+            form {parent_sctid: [list of child sctids]} or the index of the hierarchy.
 
     Returns:
-        list: A list of unique SCTIDs that are children of the given SCTID.
+        list: A list of unique SCTIDs that are children of the given SCTID (including the SCTID itself).
     """
+    if isinstance(pt2ch, HierarchyIndex):
+        return [sctid] + pt2ch.get_all_descendants(sctid)
     result = []
     stack = [sctid]
     while len(stack) != 0:
@@ -186,7 +284,7 @@ class BundleDescriptor:
     extensions: List[SupportedExtension]
     ignores: Dict[RefSetFileType, List[SupportedExtension]] = field(default_factory=dict)
 
-    def has_invalid(self, ext: SupportedExtension, file_types: Tuple[RefSetFileType]) -> bool:
+    def has_invalid(self, ext: SupportedExtension, file_types: Tuple[RefSetFileType, ...]) -> bool:
         for ft in file_types:
             if ft not in self.ignores:
                 continue
@@ -232,6 +330,92 @@ def match_partials_with_folders(exp_names: List[Tuple[str, Optional[str]]],
     return True
 
 
+# The description types of the names of the concepts
+_PRIMARY_DESC_TYPE = '900000000000003001'  # fully specified name
+_SYNONYM_DESC_TYPE = '900000000000013009'
+# The semantic tag at the end of a fully specified name, e.g "(disorder)"
+_SEMANTIC_TAG_PATTERN = r"\((\w+\s?.?\s?\w+.?\w+.?\w+.?)\)$"
+
+
+def get_type_ids(semantic_tags: pd.Series) -> pd.Series:
+    """Hash the semantic tags of concepts to get their (8 digit) type IDs.
+
+    Since there are only a few hundred distinct semantic tags, each one is only hashed once.
+
+    Args:
+        semantic_tags (pd.Series): The semantic tags (can include missing values).
+
+    Returns:
+        pd.Series: The type IDs (with the same index).
+    """
+    codes, uniques = pd.factorize(semantic_tags)
+    # the missing values have the code -1, i.e the last hash
+    hashes = np.array([int(hashlib.sha256(str(tag).encode('utf-8')).hexdigest(), 16) % 10 ** 8
+                       for tag in list(uniques) + [np.nan]], dtype=np.int64)
+    return pd.Series(hashes[codes], index=semantic_tags.index)
+
+
+def _get_release_concept_df(concept_file: str, description_file: str, cache_dir: Optional[str]) -> pd.DataFrame:
+    # the concepts (with their names) of a single release (see Snomed.to_concept_df)
+    active_terms = read_rf2_file_cached(concept_file, cache_dir)
+    active_descs = read_rf2_file_cached(description_file, cache_dir)
+
+    # only the columns and descriptions that are used are merged
+    active_descs = active_descs.loc[active_descs['typeId'].isin([_PRIMARY_DESC_TYPE, _SYNONYM_DESC_TYPE]),
+                                    ['conceptId', 'term', 'typeId']]
+    active_snomed_df = pd.merge(active_terms[['id']], active_descs,
+                                left_on='id', right_on='conceptId', how='inner')
+    del active_terms
+    del active_descs
+    # the fully specified names first, then the synonyms
+    is_primary = (active_snomed_df['typeId'] == _PRIMARY_DESC_TYPE).to_numpy()
+    active_snomed_df = pd.DataFrame({
+        'cui': active_snomed_df['id'].to_numpy(),
+        'name': active_snomed_df['term'].to_numpy(),
+        'name_status': np.where(is_primary, 'P', 'A').astype(object),
+    }).iloc[np.argsort(~is_primary, kind='stable')].reset_index(drop=True)
+    active_snomed_df['ontologies'] = 'SNOMED-CT'
+
+    primary = active_snomed_df[active_snomed_df['name_status'] == 'P']
+    semantic_tags = primary['name'].str.extract(_SEMANTIC_TAG_PATTERN, expand=False)
+    semantic_tags.index = primary['cui']
+    if semantic_tags.index.is_unique:
+        active_snomed_df['description_type_ids'] = active_snomed_df['cui'].map(semantic_tags)
+    else:
+        # each of the names of a concept is repeated for each of its fully specified names
+        active_snomed_df = pd.merge(active_snomed_df, semantic_tags.rename('description_type_ids').reset_index(),
+                                    on='cui', how='left')
+
+    # Hash semantic tag to get a 8 digit type_id code
+    active_snomed_df['type_ids'] = get_type_ids(active_snomed_df['description_type_ids'])
+    return active_snomed_df
+
+
+def _get_release_relationship_types(relationship_file: str, cache_dir: Optional[str]) -> List[str]:
+    # the (unique) types of the active relationships of a single release
+    active_relat = read_rf2_file_cached(relationship_file, cache_dir)
+    return list(active_relat["typeId"].unique())
+
+
+def _get_release_relationships(relationship_file: str, relationshipcode: str,
+                               cache_dir: Optional[str]) -> Dict[str, List[str]]:
+    # the sources of the relationships of the specified type per destination of a single release
+    active_relat = read_rf2_file_cached(relationship_file, cache_dir)
+    relationship: Dict[str, List[str]] = dict(
+        [(key, []) for key in active_relat["destinationId"].unique()])
+    of_type = active_relat[active_relat['typeId'] == relationshipcode]
+    for destination_id, source_id in zip(of_type['destinationId'], of_type['sourceId']):
+        relationship[destination_id].append(source_id)
+    return relationship
+
+
+def _get_release_refset_mappings(refset_file: str, cache_dir: Optional[str]) -> pd.DataFrame:
+    # the active refset mappings of a single release
+    mappings = read_rf2_file_cached(refset_file, cache_dir)
+    return mappings.sort_values(by=['referencedComponentId', 'mapPriority', 'mapGroup']).reset_index(
+        drop=True)
+
+
 class Snomed:
     """
     Pre-process SNOMED CT release files.
@@ -244,11 +428,19 @@ class Snomed:
         uk_ext (bool, optional): Specifies whether the version is a SNOMED UK extension released after 2021. Defaults to False.
         uk_drug_ext (bool, optional): Specifies whether the version is a SNOMED UK drug extension. Defaults to False.
         au_ext (bool, optional): Specifies whether the version is a AU release. Defaults to False.
+        cache_dir (Optional[str]): If set, the parsed RF2 files are cached in this directory
+            (see `read_rf2_file_cached`). Defaults to None.
+        n_process (int): The number of processes used for processing the releases (e.g the
+            international release and the extensions) in parallel (at most one per release).
+            Each process sends back the full DataFrames of its release, so the peak memory use
+            grows with the number of processes. Defaults to 1 (i.e no parallel processing).
     """
     NO_VERSION_DETECTED = 'N/A'
 
-    def __init__(self, data_path):
+    def __init__(self, data_path, cache_dir: Optional[str] = None, n_process: int = 1):
         self.data_path = data_path
+        self.cache_dir = cache_dir
+        self.n_process = n_process
         self.bundle = self._determine_bundle(self.data_path)
         self.paths, self.snomed_releases, self.exts = self._check_path_and_release()
 
@@ -313,82 +505,71 @@ class Snomed:
             return cls.NO_VERSION_DETECTED
         return match.group(_group_nr)[:_keep_chars]
 
-    def to_concept_df(self):
-        """
-        Create a SNOMED CT concept DataFrame.
+    def _get_release_files(self, *file_types: RefSetFileType) -> List[List[str]]:
+        """Get the paths to the snapshot files of the specified types for each of the releases.
 
-        Creates a SNOMED CT concept DataFrame ready for MEDCAT CDB creation.
-        Checks if the version is a UK extension release and sets the correct file names for the concept and description snapshots accordingly.
-        Additionally, handles the divergent release format of the UK Drug Extension >v2021 with the `uk_drug_ext` variable.
+        The releases that do not have these files (or are ignored in the bundle) are skipped.
+
+        Args:
+            *file_types (RefSetFileType): The types of the files.
 
         Returns:
-            pandas.DataFrame: SNOMED CT concept DataFrame.
+            List[List[str]]: The paths to the files (in the order of `file_types`) for each release.
         """
-
-        df2merge = []
+        # the version in the file names is determined from the concept snapshot (or the refset itself)
+        version_type = RefSetFileType.refset if RefSetFileType.refset in file_types else RefSetFileType.concept
+        release_files = []
         for i, snomed_release in enumerate(self.snomed_releases):
             self._set_extension(snomed_release, self.exts[i])
-            contents_path = os.path.join(self.paths[i], PER_FILE_TYPE_PATHS[RefSetFileType.concept])
-            concept_snapshot = self._extension.value.exp_files.get_concept()
-            description_snapshot = self._extension.value.exp_files.get_description()
-            if concept_snapshot is None or _IGNORE_TAG in concept_snapshot or (
+            exp_files = self._extension.value.exp_files
+            version_snapshot = exp_files.get_file_per_type(version_type)
+            if version_snapshot is None or _IGNORE_TAG in version_snapshot or (
                     self.bundle and self.bundle.value.has_invalid(
-                        self._extension, [RefSetFileType.concept, RefSetFileType.description])):
+                        self._extension, (RefSetFileType.concept, RefSetFileType.description))):
                 continue
 
-            for f in os.listdir(contents_path):
-                m = re.search(f'{concept_snapshot}'+r'_(.*)_\d*.txt', f)
+            for f in os.listdir(os.path.join(self.paths[i], PER_FILE_TYPE_PATHS[version_type])):
+                m = re.search(f'{version_snapshot}'+r'_(.*)_\d*.txt', f)
                 if m:
                     snomed_v = m.group(1)
+            release_files.append([
+                os.path.join(self.paths[i], PER_FILE_TYPE_PATHS[file_type],
+                             f'{exp_files.get_file_per_type(file_type)}_{snomed_v}_{snomed_release}.txt')
+                for file_type in file_types])
+        return release_files
+
+    def _process_releases(self, func: Callable, release_args: List[tuple]) -> list:
+        """Process each of the releases (in parallel if there are multiple).
 
-            int_terms = parse_file(
-                f'{contents_path}/{concept_snapshot}_{snomed_v}_{snomed_release}.txt')
-            active_terms = int_terms[int_terms.active == '1']
-            del int_terms
-
-            int_desc = parse_file(
-                f'{contents_path}/{description_snapshot}_{snomed_v}_{snomed_release}.txt')
-            active_descs = int_desc[int_desc.active == '1']
-            del int_desc
-
-            _ = pd.merge(active_terms, active_descs, left_on=[
-                         'id'], right_on=['conceptId'], how='inner')
-            del active_terms
-            del active_descs
-
-            active_with_primary_desc = _[
-                _['typeId'] == '900000000000003001']  # active description
-            active_with_synonym_desc = _[
-                _['typeId'] == '900000000000013009']  # active synonym
-            del _
-            active_with_all_desc = pd.concat(
-                [active_with_primary_desc, active_with_synonym_desc])
-
-            active_snomed_df = active_with_all_desc[['id_x', 'term', 'typeId']]
-            del active_with_all_desc
-
-            active_snomed_df = active_snomed_df.rename(
-                columns={'id_x': 'cui', 'term': 'name', 'typeId': 'name_status'})
-            active_snomed_df['ontologies'] = 'SNOMED-CT'
-            active_snomed_df['name_status'] = active_snomed_df['name_status'].replace(
-                ['900000000000003001', '900000000000013009'],
-                ['P', 'A'])
-            active_snomed_df = active_snomed_df.reset_index(drop=True)
-
-            temp_df = active_snomed_df[active_snomed_df['name_status'] == 'P'][[
-                'cui', 'name']]
-            temp_df['description_type_ids'] = temp_df['name'].str.extract(
-                r"\((\w+\s?.?\s?\w+.?\w+.?\w+.?)\)$")
-            active_snomed_df = pd.merge(active_snomed_df, temp_df.loc[:, ['cui', 'description_type_ids']],
-                                        on='cui',
-                                        how='left')
-            del temp_df
-
-            # Hash semantic tag to get a 8 digit type_id code
-            active_snomed_df['type_ids'] = active_snomed_df['description_type_ids'].apply(
-                lambda x: int(hashlib.sha256(str(x).encode('utf-8')).hexdigest(), 16) % 10 ** 8)
-            df2merge.append(active_snomed_df)
+        Args:
+            func (Callable): The (picklable) function processing a single release.
+            release_args (List[tuple]): The arguments to the function for each release.
 
+        Returns:
+            list: The results for each release (in the same order).
+        """
+        n_process = min(self.n_process, len(release_args))
+        if n_process <= 1:
+            return [func(*args) for args in release_args]
+        logger.info("Processing %d releases with %d processes", len(release_args), n_process)
+        with ProcessPoolExecutor(max_workers=n_process) as executor:
+            return list(executor.map(func, *zip(*release_args)))
+
+    def to_concept_df(self):
+        """
+        Create a SNOMED CT concept DataFrame.
+
+        Creates a SNOMED CT concept DataFrame ready for MEDCAT CDB creation.
+        Checks if the version is a UK extension release and sets the correct file names for the concept and description snapshots accordingly.
+        Additionally, handles the divergent release format of the UK Drug Extension >v2021 with the `uk_drug_ext` variable.
+
+        Returns:
+            pandas.DataFrame: SNOMED CT concept DataFrame.
+        """
+        release_files = self._get_release_files(RefSetFileType.concept, RefSetFileType.description)
+        df2merge = self._process_releases(
+            _get_release_concept_df,
+            [(concept_file, description_file, self.cache_dir) for concept_file, description_file in release_files])
         return pd.concat(df2merge).reset_index(drop=True)
 
     def list_all_relationships(self):
@@ -400,28 +581,12 @@ class Snomed:
         Returns:
             list: List of all SNOMED CT relationships.
         """
+        release_files = self._get_release_files(RefSetFileType.relationship)
         all_rela = []
-        for i, snomed_release in enumerate(self.snomed_releases):
-            self._set_extension(snomed_release, self.exts[i])
-            contents_path = os.path.join(self.paths[i], PER_FILE_TYPE_PATHS[RefSetFileType.concept])
-            concept_snapshot = self._extension.value.exp_files.get_concept()
-            relationship_snapshot = self._extension.value.exp_files.get_relationship()
-            if concept_snapshot is None or _IGNORE_TAG in concept_snapshot or (
-                    self.bundle and self.bundle.value.has_invalid(
-                        self._extension, [RefSetFileType.concept, RefSetFileType.description])):
-                continue
-
-            for f in os.listdir(contents_path):
-                m = re.search(f'{concept_snapshot}'+r'_(.*)_\d*.txt', f)
-                if m:
-                    snomed_v = m.group(1)
-            int_relat = parse_file(
-                f'{contents_path}/{relationship_snapshot}_{snomed_v}_{snomed_release}.txt')
-            active_relat = int_relat[int_relat.active == '1']
-            del int_relat
-
-            all_rela.extend(
-                [relationship for relationship in active_relat["typeId"].unique()])
+        for relationships in self._process_releases(
+                _get_release_relationship_types, [(relationship_file, self.cache_dir)
+                                                  for relationship_file, in release_files]):
+            all_rela.extend(relationships)
         return all_rela
 
     def relationship2json(self, relationshipcode, output_jsonfile):
@@ -436,34 +601,11 @@ class Snomed:
         Returns:
             file: JSON file of relationship mapping.
         """
+        release_files = self._get_release_files(RefSetFileType.relationship)
         output_dict = {}
-        for i, snomed_release in enumerate(self.snomed_releases):
-            self._set_extension(snomed_release, self.exts[i])
-            contents_path = os.path.join(self.paths[i], PER_FILE_TYPE_PATHS[RefSetFileType.concept])
-            concept_snapshot = self._extension.value.exp_files.get_concept()
-            relationship_snapshot = self._extension.value.exp_files.get_relationship()
-            if concept_snapshot is None or _IGNORE_TAG in concept_snapshot or (
-                    self.bundle and self.bundle.value.has_invalid(
-                        self._extension, [RefSetFileType.concept, RefSetFileType.description])):
-                continue
-
-            for f in os.listdir(contents_path):
-                m = re.search(f'{concept_snapshot}'+r'_(.*)_\d*.txt', f)
-                if m:
-                    snomed_v = m.group(1)
-            int_relat = parse_file(
-                f'{contents_path}/{relationship_snapshot}_{snomed_v}_{snomed_release}.txt')
-            active_relat = int_relat[int_relat.active == '1']
-            del int_relat
-
-            relationship = dict(
-                [(key, []) for key in active_relat["destinationId"].unique()])
-            for _, v in active_relat.iterrows():
-                if v['typeId'] == str(relationshipcode):
-                    _ = v['destinationId']
-                    relationship[_].append(v['sourceId'])
-                else:
-                    pass
+        for relationship in self._process_releases(
+                _get_release_relationships, [(relationship_file, str(relationshipcode), self.cache_dir)
+                                             for relationship_file, in release_files]):
             output_dict = {key: output_dict.get(key, []) + relationship.get(key, []) for key in
                            set(list(output_dict.keys()) + list(relationship.keys()))}
         with open(output_jsonfile, 'w') as json_file:
@@ -561,25 +703,9 @@ class Snomed:
             OR
             tuple: Tuple of dataframes containing SNOMED CT to refset mappings and metadata (ICD-10, OPCS4), if uk_ext is True.
         """
-        dfs2merge = []
-        for i, snomed_release in enumerate(self.snomed_releases):
-            self._set_extension(snomed_release, self.exts[i])
-            refset_terminology = os.path.join(self.paths[i], PER_FILE_TYPE_PATHS[RefSetFileType.refset])
-            icd10_ref_set = self._extension.value.exp_files.get_refset()
-            if icd10_ref_set is None or _IGNORE_TAG in icd10_ref_set or (
-                    self.bundle and self.bundle.value.has_invalid(
-                        self._extension, [RefSetFileType.concept, RefSetFileType.description])):
-                continue
-            for f in os.listdir(refset_terminology):
-                m = re.search(f'{icd10_ref_set}'+r'_(.*)_\d*.txt', f)
-                if m:
-                    snomed_v = m.group(1)
-            mappings = parse_file(
-                f'{refset_terminology}/{icd10_ref_set}_{snomed_v}_{snomed_release}.txt')
-            mappings = mappings[mappings.active == '1']
-            icd_mappings = mappings.sort_values(by=['referencedComponentId', 'mapPriority', 'mapGroup']).reset_index(
-                drop=True)
-            dfs2merge.append(icd_mappings)
+        release_files = self._get_release_files(RefSetFileType.refset)
+        dfs2merge = self._process_releases(
+            _get_release_refset_mappings, [(refset_file, self.cache_dir) for refset_file, in release_files])
         mapping_df = pd.concat(dfs2merge)
         del dfs2merge
         if any(ext in (SupportedExtension.UK_CLINICAL, SupportedExtension.UK_DRUG)
@@ -1,5 +1,5 @@
 
-from typing import List, Union
+from typing import Any, Iterator, List, Optional, Union
 import pandas as pd
 import tqdm
 import os
@@ -67,9 +67,12 @@ class UMLS:
             Languages to filter out. Defaults to just English (['ENG']).
         sep (str):
             The separator used within the files. Defaults to '|'.
+        chunk_size (int):
+            The number of rows read from the (main and MRHIER) files at once. Defaults to 1 000 000.
     """
 
-    def __init__(self, main_file_name: str, sem_types_file: str, allow_languages: list = ['ENG'], sep: str = '|'):
+    def __init__(self, main_file_name: str, sem_types_file: str, allow_languages: list = ['ENG'], sep: str = '|',
+                 chunk_size: int = 1_000_000):
         self.main_file_name = main_file_name
         self.sem_types_file = sem_types_file
         self.main_columns = list(_DEFAULT_COLUMNS)  # copy
@@ -79,6 +82,94 @@ class UMLS:
         # copy in case of default list
         self.allow_langugages = list(
             allow_languages) if allow_languages else allow_languages
+        self.chunk_size = chunk_size
+
+    def _read_chunks(self, file_name: str, columns: List[str],
+                     usecols: Optional[List[str]] = None) -> Iterator[pd.DataFrame]:
+        # Read a file in chunks (with all the columns as strings)
+        return pd.read_csv(file_name, names=columns, sep=self.sep, index_col=False,
+                           usecols=usecols, dtype=str, chunksize=self.chunk_size)
+
+    def process(self, concepts: bool = False, snomed: bool = False,
+                sources: Optional[Union[str, List[str]]] = None, pt2ch: bool = False) -> Dict[str, Any]:
+        """Generate the specified outputs in a single (streaming) pass over the main file.
+
+        The main file is read in chunks (see `chunk_size`) and each chunk is filtered
+        (by language, source and so on) for each of the outputs before the next one is
+        read, so the whole file is never in memory at once. Only the required columns
+        are read and all of them are read as strings.
+
+        Args:
+            concepts (bool): Whether to create the concept DataFrame (see `to_concept_df`). Defaults to False.
+            snomed (bool): Whether to map to SNOMED-CT (see `map_umls2snomed`). Defaults to False.
+            sources (Optional[Union[str, List[str]]]): The source(s) to map to (see `map_umls2source`), if any.
+                Defaults to None.
+            pt2ch (bool): Whether to generate the parent to children dict (see `get_pt2ch`). Defaults to False.
+
+        Raises:
+            ValueError: If `pt2ch` is requested and the MRHIER.RRF file wasn't found.
+
+        Returns:
+            Dict[str, Any]: The requested outputs, keyed by 'concepts', 'snomed', 'sources' and/or 'pt2ch'.
+        """
+        if pt2ch:
+            # the parent AUIs (and children) are needed for filtering the main file
+            hier_df = self._read_isa_hierarchy()
+            parent_auis = set(hier_df['PAUI'].dropna())
+            child_auis = set(hier_df['AUI'])
+        if snomed or sources is not None:
+            usecols = None
+        else:
+            usecols = []
+            if concepts:
+                usecols += ['CUI', 'LAT', 'ISPREF', 'SAB', 'STR', 'CVF']
+            if pt2ch:
+                usecols += ['CUI', 'LAT', 'ISPREF', 'AUI']
+            usecols = [col for col in self.main_columns if col in usecols]
+        if isinstance(sources, str):
+            sources = [sources]
+
+        parts: Dict[str, List[pd.DataFrame]] = {'concepts': [], 'snomed': [], 'sources': [],
+                                                'aui_cui': [], 'pref': []}
+        for chunk in tqdm.tqdm(self._read_chunks(self.main_file_name, self.main_columns, usecols),
+                               desc="Reading chunks"):
+            if snomed:
+                parts['snomed'].append(chunk[(chunk.SAB == 'SNOMEDCT_US') & chunk.SCUI.notna()])
+            if sources is not None:
+                parts['sources'].append(chunk[chunk.SAB.isin(sources) & chunk.CODE.notna()])
+            if not (concepts or pt2ch):
+                continue
+            # filter languages
+            if self.allow_langugages:
+                chunk = chunk[chunk["LAT"].isin(self.allow_langugages)]
+            if concepts:
+                parts['concepts'].append(chunk[['CUI', 'ISPREF', 'SAB', 'STR', 'CVF']])
+            if pt2ch:
+                parts['aui_cui'].append(chunk.loc[chunk['AUI'].isin(parent_auis), ['AUI', 'CUI']])
+                # remove non-preferred
+                parts['pref'].append(chunk.loc[(chunk['ISPREF'] == 'Y') & chunk['AUI'].isin(child_auis),
+                                               ['CUI', 'AUI']])
+
+        outputs: Dict[str, Any] = {}
+        if concepts:
+            outputs['concepts'] = self._get_concept_df(pd.concat(parts.pop('concepts')))
+        if snomed:
+            df = pd.concat(parts.pop('snomed'))
+            # sort by SCUI
+            df = df.sort_values(by='SCUI').reset_index(drop=True)
+            # rearrange with SCUI as the first column
+            outputs['snomed'] = df[['SCUI',] + [col for col in df.columns.values if col != 'SCUI']]
+        if sources is not None:
+            df = pd.concat(parts.pop('sources'))
+            # sort by CODE
+            df = df.sort_values(by='CODE').reset_index(drop=True)
+            # rearrange columns starting with CODE
+            outputs['sources'] = df[['CODE',] + [col for col in df.columns.values if col != 'CODE']]
+        if pt2ch:
+            aui_cui_df = pd.concat(parts.pop('aui_cui'))
+            outputs['pt2ch'] = self._get_pt2ch(pd.concat(parts.pop('pref')), hier_df,
+                                               dict(zip(aui_cui_df['AUI'], aui_cui_df['CUI'])))
+        return outputs
 
     def to_concept_df(self) -> pd.DataFrame:
         """Create a concept DataFrame.
@@ -87,21 +178,18 @@ class UMLS:
         Returns:
             pd.DataFrame: The resulting DataFrame
         """
+        return self.process(concepts=True)['concepts']
+
+    def _get_concept_df(self, df: pd.DataFrame) -> pd.DataFrame:
         # target columns:
         # cui, name, name_status, ontologies, description_type_ids, type_ids
-        df = pd.read_csv(self.main_file_name,
-                         names=self.main_columns, sep=self.sep, index_col=False)
-
-        # filter languages
-        if self.allow_langugages:
-            df = df[df["LAT"].isin(self.allow_langugages)]
 
         # TODO filter by activity ?
 
         # get TUI
 
         sem_types = pd.read_csv(
-            self.sem_types_file, names=self.sem_types_columns, sep=self.sep, index_col=False)
+            self.sem_types_file, names=self.sem_types_columns, sep=self.sep, index_col=False, dtype=str)
         df = df.merge(sem_types)
 
         # rename columns
@@ -128,15 +216,8 @@ class UMLS:
         Returns:
             pd.DataFrame: Dataframe that contains the SCUI (source CUI) as well as the UMLS CUI for each applicable concept
         """
-        df = pd.read_csv(self.main_file_name, names=self.main_columns,
-                         sep=self.sep, index_col=False, dtype={'SCUI': 'str'})
         # get only SNOMED-CT US based concepts that have a SNOMED-CT (source) CUI
-        df = df[df.SAB == 'SNOMEDCT_US'][df.SCUI.notna()]
-        # sort by SCUI
-        df = df.sort_values(by='SCUI').reset_index(drop=True)
-        # rearrange with SCUI as the first column
-        df = df[['SCUI',] + [col for col in df.columns.values if col != 'SCUI']]
-        return df
+        return self.process(snomed=True)['snomed']
 
     def map_umls2icd10(self) -> pd.DataFrame:
         """Map to ICD-10.
@@ -174,18 +255,7 @@ class UMLS:
         Returns:
             pd.DataFrame: DataFrame that has the target source codes
         """
-        df = pd.read_csv(self.main_file_name, names=self.main_columns,
-                         sep=self.sep, index_col=False, dtype={'CODE': 'str'})
-        # get the specified source(s)
-        if isinstance(sources, list):
-            df = df[df.SAB.isin(sources)][df.CODE.notna()]
-        else:
-            df = df[df.SAB == sources][df.CODE.notna()]
-        # sort by CODE
-        df = df.sort_values(by='CODE').reset_index(drop=True)
-        # rearrange columns starting with CODE
-        df = df[['CODE',] + [col for col in df.columns.values if col != 'CODE']]
-        return df
+        return self.process(sources=sources)['sources']
 
     def get_pt2ch(self) -> dict:
         """Generates a parent to children dict.
@@ -205,6 +275,10 @@ class UMLS:
         Returns:
             dict: The dictionary of parent CUI and their children.
         """
+        return self.process(pt2ch=True)['pt2ch']
+
+    def _read_isa_hierarchy(self) -> pd.DataFrame:
+        # The (CUI, AUI, PAUI) of the ISA relationships in MRHIER.RRF
         path = self.main_file_name.rsplit('/', 1)[0]
         hier_file = f"{path}/MRHIER.RRF"
 
@@ -212,25 +286,12 @@ class UMLS:
             raise ValueError(
                 f'Expected MRHIER.RRF to exist within the same parent folder ({path})')
 
-        conso_df = pd.read_csv(self.main_file_name, names=self.main_columns,
-                               sep=self.sep, index_col=False)
-
-        hier_df = pd.read_csv(hier_file, sep=self.sep, index_col=False,
-                              header=None, names=self.mrhier_columns)
-
-        # filter languages
-        if self.allow_langugages:
-            conso_df = conso_df[conso_df["LAT"].isin(self.allow_langugages)]
-
-        # create a AUI -> CUI map
-        aui_cui = dict(zip(conso_df["AUI"], conso_df["CUI"]))
-
-        # remove non-preferred from conso
-        conso_df = conso_df[conso_df['ISPREF'] == 'Y']
-
         # filter ISA relationships
-        hier_df = hier_df[hier_df['RELA'] == 'isa']
+        return pd.concat(chunk.loc[chunk['RELA'] == 'isa', ['CUI', 'AUI', 'PAUI']]
+                         for chunk in self._read_chunks(hier_file, self.mrhier_columns,
+                                                        ['CUI', 'AUI', 'PAUI', 'RELA']))
 
+    def _get_pt2ch(self, conso_df: pd.DataFrame, hier_df: pd.DataFrame, aui_cui: Dict[str, str]) -> dict:
         # merge dataframes
         merged_df = pd.merge(conso_df, hier_df, on=['AUI', 'CUI'])
 
@@ -241,9 +302,7 @@ class UMLS:
 
         # create dict
         pt2ch: dict = {}
-        for _, row in tqdm.tqdm(cui_parent.iterrows(), total=len(cui_parent.index)):
-            cur_cui = row['CUI']
-            paui = row['PAUI']
+        for cur_cui, paui in tqdm.tqdm(zip(cui_parent['CUI'], cui_parent['PAUI']), total=len(cui_parent.index)):
             parent_cui = aui_cui[paui]
             # avoid self as parent/child
             if parent_cui == cur_cui:
@@ -264,21 +323,19 @@ if __name__ == '__main__':
         print('Need to specify two file locations: MRCONSO.RRF and MRSTY.RRF')
         sys.exit(1)
     umls = UMLS(sys.argv[1], sys.argv[2])
-    df = umls.to_concept_df()
+    # all the outputs in a single pass over the main file
+    outputs = umls.process(concepts=True, snomed=True, sources='ICD10', pt2ch=True)
+    df = outputs['concepts']
     save_file = "preprocessed_umls.csv"
     print(f"Saving to {save_file}")
     df.to_csv(save_file, index=False)
-    print('Converting to SNOMED')
-    to_snomed = umls.map_umls2snomed()
+    to_snomed = outputs['snomed']
     print('As SNOMED:')
     print(to_snomed.head())
-    to_ICD10 = umls.map_umls2icd10()
+    to_ICD10 = outputs['sources']
     print('As ICD-10:')
     print(to_ICD10.head())
-    to_ICD10_man = umls.map_umls2source(sources=['ICD10'])
-    print('As ICD-10(MAN):')
-    print(to_ICD10_man.head())
-    pt2ch = umls.get_pt2ch()
+    pt2ch = outputs['pt2ch']
     print('Get parent-child dict', len(pt2ch),
           '' if len(pt2ch) > 1_000 else pt2ch)
     all_vals = [len(v) for v in pt2ch.values()]
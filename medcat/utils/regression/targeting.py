@@ -1,11 +1,11 @@
 import logging
-from typing import Dict, Iterable, Iterator, List, Set, Tuple, Any
-from functools import lru_cache
+from typing import Dict, Iterable, Iterator, List, Set, Tuple, Any, Optional
 from itertools import product
 
 from pydantic import BaseModel
 
 from medcat.cdb import CDB
+from medcat.utils.hierarchy import HierarchyIndex
 
 logger = logging.getLogger(__name__)
 
@@ -27,12 +27,15 @@ class TranslationLayer:
         name2cuis (Dict[str, List[str]]): The map from name to CUIs
         cui2type_ids (Dict[str, Set[str]]): The map from CUI to type_ids
         cui2children (Dict[str, Set[str]]): The map from CUI to child CUIs
+        hierarchy (Optional[HierarchyIndex]): The precomputed index of the hierarchy. If not specified,
+            it is built from `cui2children` when first needed.
     """
 
     def __init__(self, cui2names: Dict[str, Set[str]], name2cuis: Dict[str, List[str]],
                  cui2type_ids: Dict[str, Set[str]], cui2children: Dict[str, Set[str]],
                  cui2preferred_names: Dict[str, str],
-                 separator: str, whitespace: str = ' ') -> None:
+                 separator: str, whitespace: str = ' ',
+                 hierarchy: Optional[HierarchyIndex] = None) -> None:
         self.cui2names = cui2names
         self.name2cuis = name2cuis
         self.cui2type_ids = cui2type_ids
@@ -49,6 +52,14 @@ class TranslationLayer:
         for cui in cui2names:
             if cui not in cui2children:
                 self.cui2children[cui] = set()
+        self._hierarchy = hierarchy
+
+    @property
+    def hierarchy(self) -> HierarchyIndex:
+        """The index of the hierarchy (built from the parent to children map when first needed)."""
+        if self._hierarchy is None:
+            self._hierarchy = HierarchyIndex.from_pt2ch(self.cui2children)
+        return self._hierarchy
 
     def get_names_of(self, cui: str, only_prefnames: bool) -> List[str]:
         """Get the preprocessed names of a CUI.
@@ -124,26 +135,20 @@ class TranslationLayer:
         """
         return list(self.cui2children.get(cui, []))
 
-    @lru_cache(maxsize=10_000)
     def get_direct_parents(self, cui: str) -> List[str]:
         """Get the direct parent(s) of a concept.
 
-        PS: This method can be quite a CPU heavy one since it relies
-            on running through all the parent-children relationships
-            since the child->parent(s) relationship isn't normally
-            kept track of.
+        PS: The child->parent(s) relationship is looked up from the
+            hierarchy index (see `hierarchy`) which is built the first
+            time this is called.
 
         Args:
-            cui (str): _description_
+            cui (str): The concept in question.
 
         Returns:
-            List[str]: _description_
+            List[str]: The (potentially empty) list of direct parents.
         """
-        parents = []
-        for pot_parent, children in self.cui2children.items():
-            if cui in children:
-                parents.append(pot_parent)
-        return parents
+        return self.hierarchy.get_direct_parents(cui)
 
     def get_children_of(self, found_cuis: Iterable[str], cui: str, depth: int = 1) -> List[str]:
         """Get the children of the specifeid CUI in the listed CUIs (if they exist).
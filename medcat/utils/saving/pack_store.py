@@ -0,0 +1,345 @@
+"""This module provides a content-addressed local store for model packs.
+
+Model packs often share large parts (e.g the spaCy model or the vocab).
+The store keeps every file as a blob named by the hash of its content,
+so that each distinct file is only kept on disk once regardless of how many
+packs it is used in. Each pack is described by a manifest (relative path -> hash)
+and is materialised as a folder of (hard) links to the blobs. Such a folder can
+be loaded in place (e.g by `CAT.load_model_pack`) without any extraction.
+The materialised folders are keyed by the hash of the manifest, so re-adding
+a pack with different contents never reuses a stale folder.
+
+The archives written by this module are stored (i.e uncompressed) zip files,
+so their members can be read (or memory-mapped) in place.
+"""
+from typing import Any, Dict, Iterator, List, Tuple
+
+import os
+import json
+import shutil
+import hashlib
+import tempfile
+import zipfile
+import logging
+
+
+logger = logging.getLogger(__name__)
+
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def _iter_files(folder: str) -> Iterator[Tuple[str, str]]:
+    for root, _, files in os.walk(folder):
+        for file_name in files:
+            full_path = os.path.join(root, file_name)
+            yield os.path.relpath(full_path, folder).replace(os.sep, '/'), full_path
+
+
+def hash_file(path: str) -> str:
+    """Get the content hash of a file.
+
+    Args:
+        path (str): The path of the file.
+
+    Returns:
+        str: The (sha256) hex digest of the file contents.
+    """
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def _get_zip_crcs(zip_path: str) -> Dict[str, List[int]]:
+    # Only reads the central directory of the zip, not the members
+    with zipfile.ZipFile(zip_path) as zf:
+        return {info.filename: [info.CRC, info.file_size] for info in zf.infolist()}
+
+
+def write_stored_archive(folder: str, zip_path: str) -> str:
+    """Write the contents of a folder into a stored (uncompressed) zip archive.
+
+    Since the members are not compressed, they can be read
+    in place (without decompression) from the archive.
+
+    Args:
+        folder (str): The folder to archive.
+        zip_path (str): The path of the resulting archive.
+
+    Returns:
+        str: The path of the resulting archive.
+    """
+    with zipfile.ZipFile(zip_path, 'w', compression=zipfile.ZIP_STORED) as zf:
+        for rel_path, full_path in sorted(_iter_files(folder)):
+            zf.write(full_path, arcname=rel_path)
+    return zip_path
+
+
+class PackStore:
+    """A content-addressed local store for model packs.
+
+    The layout of the store is:
+        - blobs/<hash[:2]>/<hash> - the (read only) contents of all the files
+        - manifests/<pack name>.json - the relative paths and hashes of the files of each pack
+        - manifests/<pack name>.source - the hash, size, modification time and member CRCs
+          of the zip the pack was added from (if any)
+        - packs/<pack name>/<manifest hash>/ - the materialised packs (i.e links to the blobs)
+
+    NOTE: Since the files of materialised packs are shared between packs,
+          they should never be modified in place.
+
+    Args:
+        root (str): The root folder of the store.
+    """
+
+    def __init__(self, root: str) -> None:
+        self.root = os.path.abspath(os.path.expanduser(root))
+        self.blobs_dir = os.path.join(self.root, 'blobs')
+        self.manifests_dir = os.path.join(self.root, 'manifests')
+        self.packs_dir = os.path.join(self.root, 'packs')
+        for folder in (self.blobs_dir, self.manifests_dir, self.packs_dir):
+            os.makedirs(folder, exist_ok=True)
+
+    def _blob_path(self, file_hash: str) -> str:
+        return os.path.join(self.blobs_dir, file_hash[:2], file_hash)
+
+    def _manifest_path(self, pack_name: str) -> str:
+        return os.path.join(self.manifests_dir, pack_name + '.json')
+
+    def _source_path(self, pack_name: str) -> str:
+        return os.path.join(self.manifests_dir, pack_name + '.source')
+
+    def _add_blob(self, file_hash: str, write_to: str) -> None:
+        # the contents are written into a (unique) temporary file in the store
+        # and moved so partial blobs are never seen
+        blob_path = self._blob_path(file_hash)
+        os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+        os.chmod(write_to, 0o444)
+        os.replace(write_to, blob_path)
+
+    def _add_file(self, path: str) -> str:
+        file_hash = hash_file(path)
+        if not os.path.exists(self._blob_path(file_hash)):
+            fd, tmp_copy = tempfile.mkstemp(dir=self.blobs_dir, suffix='.tmp')
+            os.close(fd)
+            shutil.copyfile(path, tmp_copy)
+            self._add_blob(file_hash, tmp_copy)
+        else:
+            logger.debug("Reusing existing blob for %s", path)
+        return file_hash
+
+    def _add_zip_member(self, zf: zipfile.ZipFile, info: zipfile.ZipInfo) -> str:
+        hasher = hashlib.sha256()
+        fd, tmp_path = tempfile.mkstemp(dir=self.blobs_dir, suffix='.tmp')
+        with zf.open(info) as src, os.fdopen(fd, 'wb') as dst:
+            for chunk in iter(lambda: src.read(HASH_CHUNK_SIZE), b''):
+                hasher.update(chunk)
+                dst.write(chunk)
+        file_hash = hasher.hexdigest()
+        if os.path.exists(self._blob_path(file_hash)):
+            os.remove(tmp_path)
+        else:
+            self._add_blob(file_hash, tmp_path)
+        return file_hash
+
+    def _read_source(self, pack_name: str) -> Dict[str, Any]:
+        with open(self._source_path(pack_name)) as f:
+            content = f.read().strip()
+        try:
+            source = json.loads(content)
+        except ValueError:
+            source = None
+        if not isinstance(source, dict):
+            # older stores only kept the hash of the zip
+            source = {'sha256': content}
+        return source
+
+    def _write_source(self, pack_name: str, zip_path: str, zip_hash: str) -> None:
+        stat = os.stat(zip_path)
+        source = {'sha256': zip_hash, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns,
+                  'crcs': _get_zip_crcs(zip_path)}
+        with open(self._source_path(pack_name), 'w') as f:
+            json.dump(source, f)
+
+    def has_pack(self, pack_name: str) -> bool:
+        """Check whether a pack with the specified name is in the store.
+
+        Args:
+            pack_name (str): The pack name.
+
+        Returns:
+            bool: Whether the pack is in the store.
+        """
+        return os.path.exists(self._manifest_path(pack_name))
+
+    def get_manifest(self, pack_name: str) -> Dict[str, str]:
+        """Get the manifest (relative path -> hash) of a pack.
+
+        Args:
+            pack_name (str): The pack name.
+
+        Returns:
+            Dict[str, str]: The manifest.
+        """
+        with open(self._manifest_path(pack_name)) as f:
+            return json.load(f)
+
+    def get_manifest_hash(self, pack_name: str) -> str:
+        """Get the hash of the manifest of a pack.
+
+        This changes whenever the contents of the pack change.
+
+        Args:
+            pack_name (str): The pack name.
+
+        Returns:
+            str: The (sha256) hex digest of the manifest.
+        """
+        manifest = json.dumps(self.get_manifest(pack_name), sort_keys=True)
+        return hashlib.sha256(manifest.encode('utf-8')).hexdigest()
+
+    def is_up_to_date(self, pack_name: str, zip_path: str) -> bool:
+        """Check whether a pack is in the store and was added from a zip with the same contents.
+
+        The size and modification time of the zip are compared first, and then the
+        CRCs of its members (from the central directory). The whole zip is only hashed
+        if those don't tell whether the contents changed (e.g the zip was copied).
+
+        Args:
+            pack_name (str): The pack name.
+            zip_path (str): The path to the model pack zip.
+
+        Returns:
+            bool: Whether the pack in the store matches the zip.
+        """
+        if not self.has_pack(pack_name) or not os.path.exists(self._source_path(pack_name)):
+            return False
+        source = self._read_source(pack_name)
+        stat = os.stat(zip_path)
+        if 'size' in source and source['size'] != stat.st_size:
+            return False
+        if source.get('mtime_ns') == stat.st_mtime_ns:
+            return True
+        if 'crcs' in source and source['crcs'] != _get_zip_crcs(zip_path):
+            return False
+        if source['sha256'] != hash_file(zip_path):
+            return False
+        # same contents, keep the new size and modification time so the next check is cheap
+        self._write_source(pack_name, zip_path, source['sha256'])
+        return True
+
+    def list_packs(self) -> List[str]:
+        """List the names of all the packs in the store.
+
+        Returns:
+            List[str]: The pack names.
+        """
+        return sorted(file_name[:-len('.json')] for file_name in os.listdir(self.manifests_dir)
+                      if file_name.endswith('.json'))
+
+    def add(self, pack_path: str, pack_name: str = '') -> str:
+        """Add a model pack (either a folder or a zip) to the store.
+
+        Files whose content is already in the store are not written again.
+        If a pack with the same name is already in the store, it is replaced
+        (along with its materialised folder, if the contents changed).
+
+        Args:
+            pack_path (str): The path to the model pack folder or zip.
+            pack_name (str): The name of the pack. Defaults to the name of the folder/zip.
+
+        Returns:
+            str: The name of the pack in the store.
+        """
+        pack_name = pack_name or os.path.basename(os.path.normpath(pack_path)).replace('.zip', '')
+        manifest: Dict[str, str] = {}
+        source_hash = ''
+        if os.path.isdir(pack_path):
+            for rel_path, full_path in _iter_files(pack_path):
+                manifest[rel_path] = self._add_file(full_path)
+        else:
+            source_hash = hash_file(pack_path)
+            with zipfile.ZipFile(pack_path) as zf:
+                for info in zf.infolist():
+                    if info.is_dir():
+                        continue
+                    manifest[info.filename] = self._add_zip_member(zf, info)
+        with open(self._manifest_path(pack_name), 'w') as f:
+            json.dump(manifest, f, indent=1, sort_keys=True)
+        if source_hash:
+            self._write_source(pack_name, pack_path, source_hash)
+        elif os.path.exists(self._source_path(pack_name)):
+            os.remove(self._source_path(pack_name))
+        # remove the folders materialised from previous versions of the pack
+        current = self.get_manifest_hash(pack_name)
+        pack_versions_dir = os.path.join(self.packs_dir, pack_name)
+        if os.path.isdir(pack_versions_dir):
+            for version in os.listdir(pack_versions_dir):
+                if version != current:
+                    shutil.rmtree(os.path.join(pack_versions_dir, version), ignore_errors=True)
+        logger.info("Added model pack %s to store at %s (%d files)", pack_name, self.root, len(manifest))
+        return pack_name
+
+    def materialise(self, pack_name: str) -> str:
+        """Get a folder with the contents of the pack.
+
+        The files in the folder are (hard) links to the blobs in the store.
+        If linking is not possible (e.g the file system does not support it),
+        the blobs are copied instead.
+
+        Args:
+            pack_name (str): The pack name.
+
+        Returns:
+            str: The path to the model pack folder.
+        """
+        pack_dir = os.path.join(self.packs_dir, pack_name, self.get_manifest_hash(pack_name))
+        if os.path.isdir(pack_dir):
+            return pack_dir
+        tmp_dir = pack_dir + '.tmp'
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        for rel_path, file_hash in self.get_manifest(pack_name).items():
+            target = os.path.join(tmp_dir, *rel_path.split('/'))
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            try:
+                os.link(self._blob_path(file_hash), target)
+            except OSError:
+                shutil.copyfile(self._blob_path(file_hash), target)
+        os.makedirs(tmp_dir, exist_ok=True)
+        os.replace(tmp_dir, pack_dir)
+        return pack_dir
+
+    def export(self, pack_name: str, zip_path: str) -> str:
+        """Export a pack in the store as a stored (uncompressed) zip archive.
+
+        Args:
+            pack_name (str): The pack name.
+            zip_path (str): The path of the resulting archive.
+
+        Returns:
+            str: The path of the resulting archive.
+        """
+        with zipfile.ZipFile(zip_path, 'w', compression=zipfile.ZIP_STORED) as zf:
+            for rel_path, file_hash in sorted(self.get_manifest(pack_name).items()):
+                zf.write(self._blob_path(file_hash), arcname=rel_path)
+        return zip_path
+
+    def remove(self, pack_name: str) -> None:
+        """Remove a pack from the store, along with the blobs no other pack uses.
+
+        Args:
+            pack_name (str): The pack name.
+        """
+        removed = set(self.get_manifest(pack_name).values())
+        os.remove(self._manifest_path(pack_name))
+        if os.path.exists(self._source_path(pack_name)):
+            os.remove(self._source_path(pack_name))
+        shutil.rmtree(os.path.join(self.packs_dir, pack_name), ignore_errors=True)
+        for other in self.list_packs():
+            removed -= set(self.get_manifest(other).values())
+        for file_hash in removed:
+            blob_path = self._blob_path(file_hash)
+            os.chmod(blob_path, 0o644)
+            os.remove(blob_path)
@@ -0,0 +1,280 @@
+"""Load only the parts of the spacy model that MedCAT actually uses.
+
+MedCAT only needs the lemmas (and, for `config.preprocessing.do_not_normalize`,
+the detailed part-of-speech tags) from the spacy model. The parser and NER
+(and often the static vectors) are never used, but by default they are still
+loaded (the components in `config.general.spacy_disabled_components` are
+disabled, not excluded). The minimal pipeline (`config.general.spacy_minimal_pipeline`)
+excludes everything that is not required.
+
+The module can also be run to benchmark the default pipeline against the minimal one:
+
+    python -m medcat.utils.spacy_pipeline --spacy-model en_core_web_md --texts texts.txt
+"""
+import argparse
+import logging
+import multiprocessing
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+import psutil
+import spacy
+from spacy.language import Language
+from spacy.pipeline import Lemmatizer
+from thinc.api import Config as SpacyConfig
+
+from medcat.config import Config
+
+
+logger = logging.getLogger(__name__)
+
+
+LEMMATIZER_FACTORIES = ('lemmatizer', 'trainable_lemmatizer')
+POS_FACTORIES = ('tagger', 'morphologizer', 'attribute_ruler')
+TAG_FACTORIES = ('tagger',)
+LISTENED_FACTORIES = ('tok2vec', 'transformer')
+# The lemmatizer modes that need the part-of-speech of the token
+POS_LEMMATIZER_MODES = ('rule', 'pos_lookup')
+VECTORS = 'vectors'
+
+
+def get_spacy_config(spacy_model: str) -> SpacyConfig:
+    """Get the config of a spacy model without loading the model.
+
+    Args:
+        spacy_model (str): The name of the installed spacy model or the path to it.
+
+    Returns:
+        SpacyConfig: The spacy config.
+    """
+    path = Path(spacy_model)
+    if not path.exists():
+        path = Path(spacy.util.get_package_path(spacy_model))
+    return spacy.util.load_config(path / 'config.cfg')
+
+
+def _find_listened(model_config: Any, factories: Dict[str, str]) -> Set[str]:
+    """Find the (upstream) components a (nested) model config listens to."""
+    listened: Set[str] = set()
+    if isinstance(model_config, dict):
+        architecture = model_config.get('@architectures', '')
+        if 'Listener' in architecture:
+            upstream = model_config.get('upstream', '*')
+            if upstream == '*':
+                listened.update(name for name, factory in factories.items() if factory in LISTENED_FACTORIES)
+            else:
+                listened.add(upstream)
+        for value in model_config.values():
+            listened.update(_find_listened(value, factories))
+    return listened
+
+
+def _uses_static_vectors(model_config: Any) -> bool:
+    if isinstance(model_config, dict):
+        if model_config.get('include_static_vectors') or 'StaticVectors' in model_config.get('@architectures', ''):
+            return True
+        return any(_uses_static_vectors(value) for value in model_config.values())
+    return False
+
+
+def get_required_components(spacy_config: Dict, config: Config) -> Tuple[Set[str], bool]:
+    """Get the spacy components (and whether the static vectors) are required by MedCAT.
+
+    The lemmatizer is always required. If it needs the part-of-speech, so are the
+    components that provide it. If `config.preprocessing.do_not_normalize` is
+    not empty, the tagger is required. As are the components (e.g tok2vec)
+    that any of the above listen to.
+
+    Args:
+        spacy_config (Dict): The config of the spacy model.
+        config (Config): The MedCAT config.
+
+    Returns:
+        Tuple[Set[str], bool]: The names of the required components and whether the static vectors are required.
+    """
+    pipeline: List[str] = list(spacy_config['nlp']['pipeline'])
+    components: Dict[str, Dict] = spacy_config['components']
+    factories = {name: components[name].get('factory', components[name].get('source', name)) for name in pipeline}
+
+    required = {name for name in pipeline if factories[name] in LEMMATIZER_FACTORIES}
+    lemmatizer_mode = config.general.spacy_lemmatizer_mode
+    for name in list(required):
+        mode = lemmatizer_mode or components[name].get('mode')
+        if factories[name] == 'lemmatizer' and mode in POS_LEMMATIZER_MODES:
+            required.update(other for other in pipeline if factories[other] in POS_FACTORIES)
+    if config.preprocessing.do_not_normalize:
+        required.update(name for name in pipeline if factories[name] in TAG_FACTORIES)
+
+    # The components the required ones listen to
+    for name in list(required):
+        required.update(_find_listened(components[name].get('model'), factories))
+    # Components disabled by the user are never loaded
+    required.difference_update(config.general.spacy_disabled_components)
+
+    uses_vectors = any(_uses_static_vectors(components[name].get('model')) for name in required)
+    return required, uses_vectors
+
+
+def get_excluded_components(spacy_config: Dict, config: Config) -> List[str]:
+    """Get the spacy components (and `'vectors'`) that are not required by MedCAT.
+
+    Args:
+        spacy_config (Dict): The config of the spacy model.
+        config (Config): The MedCAT config.
+
+    Returns:
+        List[str]: The names to exclude when loading the spacy model.
+    """
+    required, uses_vectors = get_required_components(spacy_config, config)
+    excluded = [name for name in spacy_config['nlp']['pipeline'] if name not in required]
+    if not uses_vectors:
+        excluded.append(VECTORS)
+    return excluded
+
+
+def load_minimal_spacy_model(config: Config) -> Language:
+    """Load the spacy model with only the components required by MedCAT.
+
+    If `config.general.spacy_lemmatizer_mode` is set, the lemmatizer is
+    replaced with one using that mode (e.g 'lookup', which needs the
+    `spacy-lookups-data` package, but not the part-of-speech tags).
+
+    Args:
+        config (Config): The MedCAT config.
+
+    Returns:
+        Language: The spacy model.
+    """
+    spacy_model = config.general.spacy_model
+    spacy_config = get_spacy_config(spacy_model)
+    excluded = get_excluded_components(spacy_config, config)
+    logger.info("Loading spacy model '%s' excluding %s", spacy_model, excluded)
+    nlp = spacy.load(spacy_model, exclude=excluded)
+
+    lemmatizer_mode = config.general.spacy_lemmatizer_mode
+    if lemmatizer_mode is not None:
+        for name, proc in list(nlp.pipeline):
+            if isinstance(proc, Lemmatizer) and proc.mode != lemmatizer_mode:
+                logger.info("Replacing the '%s' lemmatizer with the '%s' mode", proc.mode, lemmatizer_mode)
+                lemmatizer = nlp.replace_pipe(name, 'lemmatizer', config={'mode': lemmatizer_mode})
+                lemmatizer.initialize()  # type: ignore
+    return nlp
+
+
+def load_spacy_model(config: Config) -> Language:
+    """Load the spacy model as specified in the config.
+
+    Args:
+        config (Config): The MedCAT config.
+
+    Returns:
+        Language: The spacy model.
+    """
+    if config.general.spacy_minimal_pipeline:
+        return load_minimal_spacy_model(config)
+    return spacy.load(config.general.spacy_model, disable=config.general.spacy_disabled_components)
+
+
+def _get_rss_mb() -> float:
+    return psutil.Process().memory_info().rss / 1024 ** 2
+
+
+def _run_benchmark(config: Config, texts: List[str], batch_size: int) -> Dict[str, Any]:
+    # NOTE: imported here to avoid the circular import (medcat.pipe imports this module)
+    from medcat.pipe import Pipe
+    from medcat.preprocessing.tokenizers import spacy_split_all
+    from medcat.preprocessing.taggers import tag_skip_and_punct
+
+    rss_before = _get_rss_mb()
+    start = time.perf_counter()
+    pipe = Pipe(tokenizer=spacy_split_all, config=config)
+    pipe.add_tagger(tagger=tag_skip_and_punct, name='skip_and_punct', additional_fields=['is_punct'])
+    pipe.add_token_normalizer(config=config)
+    load_time = time.perf_counter() - start
+    rss_loaded = _get_rss_mb()
+
+    start = time.perf_counter()
+    norms = [[token._.norm for token in doc] for doc in pipe.spacy_nlp.pipe(texts, batch_size=batch_size)]
+    run_time = time.perf_counter() - start
+    return {'components': list(pipe.spacy_nlp.component_names),
+            'vectors': pipe.spacy_nlp.vocab.vectors.shape[0],
+            'load_time': load_time,
+            'docs_per_sec': len(texts) / run_time,
+            'rss_mb': rss_loaded - rss_before,
+            'rss_after_mb': _get_rss_mb() - rss_before,
+            'norms': norms}
+
+
+def run_benchmark(config: Config, texts: List[str], batch_size: int = 100) -> Dict[str, Any]:
+    """Benchmark the pipeline (spacy model, tagger and token normalizer) in a new process.
+
+    The new process makes sure the memory use of the spacy model is measured on its own.
+
+    Args:
+        config (Config): The MedCAT config.
+        texts (List[str]): The texts to process.
+        batch_size (int): The batch size. Defaults to 100.
+
+    Returns:
+        Dict[str, Any]: The loaded components, number of vectors, load time, docs/sec,
+            increase of the RSS (in MB) after loading and after processing and the norms of the tokens.
+    """
+    with multiprocessing.get_context('spawn').Pool(1) as pool:
+        return pool.apply(_run_benchmark, (config, texts, batch_size))
+
+
+def _read_texts(path: Optional[str], nr_of_docs: int) -> Iterator[str]:
+    if path is None:
+        text = ("The patient was admitted with worsening shortness of breath and a productive cough. "
+                "History of type 2 diabetes mellitus, hypertension and chronic kidney disease. "
+                "Chest x-ray showed bilateral infiltrates, started on antibiotics for pneumonia. ")
+        texts = [text * 3]
+    else:
+        with open(path) as f:
+            texts = [line.strip() for line in f if line.strip()]
+    for nr in range(nr_of_docs):
+        yield texts[nr % len(texts)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the default spacy pipeline against the minimal one.')
+    parser.add_argument('--spacy-model', help='The spacy model (name or path)', type=str,
+                        default='en_core_web_md')
+    parser.add_argument('--texts', help='A file with a document per line '
+                        '(by default a synthetic clinical note is used)', type=str, default=None)
+    parser.add_argument('--nr-of-docs', help='The number of documents to process', type=int, default=2000)
+    parser.add_argument('--batch-size', help='The batch size', type=int, default=100)
+    parser.add_argument('--lemmatizer-mode', help='The lemmatizer mode for the minimal pipeline '
+                        '(e.g "lookup", which does not need the tagger if --no-do-not-normalize is set)',
+                        type=str, default=None)
+    parser.add_argument('--no-do-not-normalize', help='Normalize all part-of-speech tags '
+                        '(i.e empty config.preprocessing.do_not_normalize)', action='store_true')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    texts = list(_read_texts(args.texts, args.nr_of_docs))
+    results = {}
+    for setup in ('default', 'minimal'):
+        config = Config()
+        config.general.spacy_model = args.spacy_model
+        config.general.spell_check = False
+        if args.no_do_not_normalize:
+            config.preprocessing.do_not_normalize = set()
+        if setup == 'minimal':
+            config.general.spacy_minimal_pipeline = True
+            config.general.spacy_lemmatizer_mode = args.lemmatizer_mode
+        results[setup] = run_benchmark(config, texts, args.batch_size)
+
+    print(f"{'setup':<10}{'docs/sec':>12}{'RSS (MB)':>12}{'RSS after':>12}{'load (s)':>12}{'vectors':>10}  components")
+    for setup, result in results.items():
+        print(f"{setup:<10}{result['docs_per_sec']:>12.1f}{result['rss_mb']:>12.1f}{result['rss_after_mb']:>12.1f}"
+              f"{result['load_time']:>12.2f}"
+              f"{result['vectors']:>10}  {', '.join(result['components'])}")
+    nr_same = sum(default == minimal for default, minimal in zip(results['default']['norms'],
+                                                                 results['minimal']['norms']))
+    print(f"Documents with identical norms: {nr_same}/{len(texts)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,81 @@
 import numpy as np
+import json
 import pickle
-from typing import Optional, List, Dict
+from typing import Any, Optional, List, Dict, Iterator, Mapping, cast
+
+
+BINARY_MAGIC = b'MCVOCAB1'
+"""The first bytes of a vocab saved in the binary format"""
+_BINARY_ALIGNMENT = 64
+
+
+class BinaryWordTable(Mapping):
+    """Read-only word table of a vocab loaded from the binary format.
+
+    The counts and vectors are kept in (memory-mapped) arrays indexed
+    by word index rather than in a dict per word. The items (i.e
+    `{'vec': <np.array>, 'cnt': <int>, 'ind': <int>}`) are created on access.
+
+    Args:
+        path (str):
+            The path of the binary vocab file.
+        mmap (bool):
+            Whether to memory-map the vectors. Defaults to True.
+    """
+
+    def __init__(self, path: str, mmap: bool = True) -> None:
+        with open(path, 'rb') as f:
+            if f.read(len(BINARY_MAGIC)) != BINARY_MAGIC:
+                raise ValueError(f"Not a binary vocab file: {path}")
+            header_len = int(np.frombuffer(f.read(8), dtype='<u8')[0])
+            header = json.loads(f.read(header_len).decode('utf-8'))
+        self.unigram_table_size: int = header['unigram_table_size']
+        n_words: int = header['n_words']
+        sections = header['sections']
+
+        def _read(name: str, dtype: str, shape: tuple, use_mmap: bool = False) -> np.ndarray:
+            offset = sections[name]
+            if use_mmap and int(np.prod(shape)) > 0:
+                return np.memmap(path, dtype=dtype, mode='r', offset=offset, shape=shape).view(np.ndarray)
+            return np.fromfile(path, dtype=dtype, count=int(np.prod(shape)), offset=offset).reshape(shape)
+
+        offsets = _read('word_offsets', '<u8', (n_words + 1,))
+        words_blob = _read('words', 'u1', (int(offsets[-1]),)).tobytes()
+        # words are stored sorted, order maps the sorted position to the word index
+        order = _read('order', '<i8', (n_words,))
+        words = [b''] * n_words
+        for pos, ind in enumerate(order.tolist()):
+            words[ind] = words_blob[offsets[pos]:offsets[pos + 1]]
+        self.words: List[str] = [word.decode('utf-8') for word in words]
+        self.word2ind: Dict[str, int] = {word: ind for ind, word in enumerate(self.words)}
+        self.counts = _read('counts', '<i8', (n_words,))
+        self.has_vec = _read('has_vec', '?', (n_words,))
+        self.vectors = _read('vectors', header['dtype'], (n_words, header['dim']), use_mmap=mmap)
+
+    def vec(self, word: str) -> Optional[np.ndarray]:
+        ind = self.word2ind[word]
+        return self.vectors[ind] if self.has_vec[ind] else None
+
+    def count(self, word: str) -> int:
+        return int(self.counts[self.word2ind[word]])
+
+    def __getitem__(self, word: str) -> Dict:
+        ind = self.word2ind[word]
+        return {'vec': self.vectors[ind] if self.has_vec[ind] else None,
+                'cnt': int(self.counts[ind]), 'ind': ind}
+
+    def __contains__(self, word: object) -> bool:
+        return word in self.word2ind
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.words)
+
+    def __len__(self) -> int:
+        return len(self.words)
+
+
+def _align(f) -> None:
+    f.write(b'\0' * (-f.tell() % _BINARY_ALIGNMENT))
 
 
 class Vocab(object):
@@ -15,14 +90,32 @@ class Vocab(object):
             From word to an index - used for negative sampling
         vec_index2word (dict):
             Same as index2word but only words that have vectors
-        unigram_table (dict):
-            Negative sampling.
+        unigram_table (np.ndarray):
+            The legacy unigram table (each word index repeated according to its probability).
+            It is converted (and emptied) on load and is not used anymore, it is only kept
+            (empty) so that older versions of medcat can still load the vocab.
+        unigram_cumsum (np.ndarray):
+            Negative sampling - the cumulative (repeat) counts of the words in `unigram_table_inds`.
+        unigram_table_inds (np.ndarray):
+            The word indices of the unigram table.
+        unigram_table_alpha (np.ndarray):
+            Whether the words of the unigram table have letters in them.
+
+    A vocab can be saved in (and loaded from) a binary format where the words,
+    counts and vectors are kept in contiguous arrays (the vectors being memory-mapped).
+    The unigram table is not saved in that format, it is rebuilt when first needed.
+    Such a vocab is read-only until it's modified, at which point it's converted
+    to the in-memory representation.
     """
     def __init__(self) -> None:
         self.vocab: Dict = {}
         self.index2word: Dict = {}
         self.vec_index2word: Dict = {}
-        self.unigram_table: np.ndarray = np.array([])
+        self.unigram_table: np.ndarray = np.array([], dtype=np.int64)
+        self.unigram_cumsum: np.ndarray = np.array([], dtype=np.int64)
+        self.unigram_table_inds: np.ndarray = np.array([], dtype=np.int64)
+        self.unigram_table_alpha: np.ndarray = np.array([], dtype=bool)
+        self.unigram_table_size: int = 0
 
     def inc_or_add(self, word: str, cnt: int = 1, vec: Optional[np.ndarray] = None) -> None:
         """Add a word or increase its count.
@@ -43,6 +136,7 @@ class Vocab(object):
 
     def remove_all_vectors(self) -> None:
         """Remove all stored vector representations."""
+        self._ensure_in_memory()
         self.vec_index2word = {}
 
         for word in self.vocab:
@@ -55,6 +149,7 @@ class Vocab(object):
             cnt(int):
                 Word count limit.
         """
+        self._ensure_in_memory()
         for word in list(self.vocab.keys()):
             if self.vocab[word]['cnt'] < cnt:
                 del self.vocab[word]
@@ -79,6 +174,7 @@ class Vocab(object):
             cnt(int):
                 By how muhc to increase the count (Default value = 1)
         """
+        self._ensure_in_memory()
         self.item(word)['cnt'] += cnt
 
     def add_vec(self, word: str, vec: np.ndarray) -> None:
@@ -90,6 +186,7 @@ class Vocab(object):
             vec(np.ndarray):
                 The vector to add.
         """
+        self._ensure_in_memory()
         self.vocab[word]['vec'] = vec
 
         ind = self.vocab[word]['ind']
@@ -103,6 +200,7 @@ class Vocab(object):
             cnt(int):
                 New count for all words in the vocab. (Default value = 1)
         """
+        self._ensure_in_memory()
         for word in self.vocab.keys():
             self.vocab[word]['cnt'] = cnt
 
@@ -130,6 +228,7 @@ class Vocab(object):
             replace(bool):
                 Will replace old vector representation (Default value = True)
         """
+        self._ensure_in_memory()
         if word not in self.vocab:
             ind = len(self.index2word)
             self.index2word[ind] = word
@@ -172,34 +271,89 @@ class Vocab(object):
 
                 self.add_word(word, cnt, vec, replace)
 
+    def _ensure_in_memory(self) -> None:
+        # convert a vocab loaded from the binary format so that it can be modified
+        if not isinstance(self.vocab, BinaryWordTable):
+            return
+        table = self.vocab
+        self.vocab = {word: {'vec': np.array(table.vectors[ind]) if table.has_vec[ind] else None,
+                             'cnt': int(table.counts[ind]), 'ind': ind}
+                      for ind, word in enumerate(table.words)}
+
     def make_unigram_table(self, table_size: int = 100000000) -> None:
         """Make unigram table for negative sampling, look at the paper if interested
         in details.
 
+        Rather than repeating each word index `int(p * table_size)` times, the
+        table holds the cumulative sums of those repeat counts (one entry per word
+        with a vector, see `unigram_cumsum`), so it takes O(V) memory but samples
+        from the same distribution.
+
         Args:
             table_size (int):
                 The size of the table (Defaults to 100 000 000)
         """
-        freqs = []
-        unigram_table = []
-
+        inds = np.fromiter(self.vec_index2word.keys(), dtype=np.int64, count=len(self.vec_index2word))
         words = list(self.vec_index2word.values())
-        for word in words:
-            freqs.append(self[word])
-
-        freqs = np.array(freqs)
-        freqs = np.power(freqs, 3/4)
+        freqs = np.power(np.array([self[word] for word in words], dtype=np.float64), 3/4)
         sm = np.sum(freqs)
+        repeats = (freqs / sm * table_size).astype(np.int64) if len(freqs) else np.zeros(0, dtype=np.int64)
+
+        # words that would not appear in the table are dropped
+        keep = repeats > 0
+        self.unigram_table = np.array([], dtype=np.int64)
+        self.unigram_cumsum = np.cumsum(repeats[keep])
+        self.unigram_table_inds = inds[keep]
+        self.unigram_table_alpha = np.array([word.upper().isupper() for word, kept in zip(words, keep) if kept],
+                                            dtype=bool)
+        self.unigram_table_size = table_size
+
+    def _ensure_unigram_table(self) -> None:
+        if len(self.unigram_table):
+            # legacy table (each index repeated according to its probability)
+            self._convert_legacy_unigram_table()
+        if len(self.unigram_cumsum) == 0 and self.unigram_table_size:
+            # e.g the binary format does not save the table, build it on first use
+            self.make_unigram_table(table_size=self.unigram_table_size)
+        if len(self.unigram_cumsum) == 0:
+            raise Exception("No unigram table present, please run the function vocab.make_unigram_table() first.")
+
+    def _convert_legacy_unigram_table(self) -> None:
+        repeats = np.bincount(self.unigram_table)
+        inds = np.flatnonzero(repeats)
+        self.unigram_table_size = len(self.unigram_table)
+        self.unigram_table = np.array([], dtype=np.int64)
+        self.unigram_cumsum = np.cumsum(repeats[inds])
+        self.unigram_table_inds = inds
+        self.unigram_table_alpha = np.array([self.index2word[ind].upper().isupper() for ind in inds], dtype=bool)
+
+    def get_negative_sample_batches(self, sizes: List[int], ignore_punct_and_num: bool = False) -> List[np.ndarray]:
+        """Get multiple sets of negative samples with a single draw.
+
+        Args:
+            sizes (List[int]):
+                How many words to return for each of the sets.
+            ignore_punct_and_num (bool):
+                Whether to ignore punctuation and numbers. (Default value = False)
 
-        for ind in self.vec_index2word.keys():
-            word = self.vec_index2word[ind]
-            f_ind = words.index(word)
-            p = freqs[f_ind] / sm
-            unigram_table.extend([ind] * int(p * table_size))
+        Raises:
+            Exception: If no unigram table is present.
 
-        self.unigram_table = np.array(unigram_table)
+        Returns:
+            List[np.ndarray]:
+                Indices for words in this vocabulary, for each of the sets.
+        """
+        self._ensure_unigram_table()
+        positions = np.searchsorted(self.unigram_cumsum,
+                                    np.random.randint(0, self.unigram_cumsum[-1], sum(sizes)),
+                                    side='right')
+        batches = np.split(positions, np.cumsum(sizes)[:-1])
+        if ignore_punct_and_num:
+            # Do not return anything that does not have letters in it
+            batches = [batch[self.unigram_table_alpha[batch]] for batch in batches]
+        return [self.unigram_table_inds[batch] for batch in batches]
 
-    def get_negative_samples(self, n: int = 6, ignore_punct_and_num: bool = False) -> List[int]:
+    def get_negative_samples(self, n: int = 6, ignore_punct_and_num: bool = False) -> np.ndarray:
         """Get N negative samples.
 
         Args:
@@ -212,27 +366,22 @@ class Vocab(object):
             Exception: If no unigram table is present.
 
         Returns:
-            List[int]:
+            np.ndarray:
                 Indices for words in this vocabulary.
         """
-        if len(self.unigram_table) == 0:
-            raise Exception("No unigram table present, please run the function vocab.make_unigram_table() first.")
-        inds = np.random.randint(0, len(self.unigram_table), n)
-        inds = self.unigram_table[inds]
-
-        if ignore_punct_and_num:
-            # Do not return anything that does not have letters in it
-            inds = [ind for ind in inds if self.index2word[ind].upper().isupper()]
-
-        return inds
+        return self.get_negative_sample_batches([n], ignore_punct_and_num=ignore_punct_and_num)[0]
 
     def __getitem__(self, word: str) -> int:
         return self.count(word)
 
     def vec(self, word: str) -> np.ndarray:
+        if isinstance(self.vocab, BinaryWordTable):
+            return cast(np.ndarray, self.vocab.vec(word))
         return self.vocab[word]['vec']
 
     def count(self, word: str) -> int:
+        if isinstance(self.vocab, BinaryWordTable):
+            return self.vocab.count(word)
         return self.vocab[word]['cnt']
 
     def item(self, word: str) -> Dict:
@@ -244,13 +393,91 @@ class Vocab(object):
 
         return False
 
-    def save(self, path: str) -> None:
+    def save(self, path: str, binary: bool = False) -> None:
+        """Save the vocab.
+
+        Args:
+            path (str):
+                The path to save the vocab at.
+            binary (bool):
+                Whether to use the binary format (i.e contiguous arrays of counts and vectors
+                that can be memory-mapped on load) rather than pickle. Defaults to False.
+        """
+        if binary:
+            self._save_binary(path)
+            return
+        self._ensure_in_memory()
         with open(path, 'wb') as f:
             pickle.dump(self.__dict__, f)
 
+    def _save_binary(self, path: str) -> None:
+        words = [self.index2word[ind] for ind in range(len(self.index2word))]
+        vecs = [self.vec(word) for word in words]
+        first_vec = next((vec for vec in vecs if vec is not None), None)
+        dim = len(first_vec) if first_vec is not None else 0
+        dtype = np.asarray(first_vec).dtype if first_vec is not None else np.dtype('float32')
+        vectors = np.zeros((len(words), dim), dtype=dtype)
+        has_vec = np.zeros(len(words), dtype=bool)
+        for ind, vec in enumerate(vecs):
+            if vec is not None:
+                vectors[ind] = vec
+                has_vec[ind] = True
+        order = np.array(sorted(range(len(words)), key=words.__getitem__), dtype='<i8')
+        encoded = [words[ind].encode('utf-8') for ind in order]
+        offsets = np.zeros(len(words) + 1, dtype='<u8')
+        offsets[1:] = np.cumsum([len(word) for word in encoded])
+        counts = np.array([self.count(word) for word in words], dtype='<i8')
+        parts = [('words', b''.join(encoded)), ('word_offsets', offsets.tobytes()), ('order', order.tobytes()),
+                 ('counts', counts.tobytes()), ('has_vec', has_vec.tobytes()),
+                 ('vectors', np.ascontiguousarray(vectors).tobytes())]
+        # the header is written with placeholder offsets first so its length is known
+        header: Dict[str, Any] = {'n_words': len(words), 'dim': dim, 'dtype': dtype.str,
+                  'unigram_table_size': self.unigram_table_size,
+                  'sections': {name: 0 for name, _ in parts}}
+        header_len = len(json.dumps(header)) + 20 * len(parts)
+        pos = len(BINARY_MAGIC) + 8 + header_len
+        for name, data in parts:
+            pos += -pos % _BINARY_ALIGNMENT
+            header['sections'][name] = pos
+            pos += len(data)
+        header_bytes = json.dumps(header).encode('utf-8').ljust(header_len)
+        with open(path, 'wb') as f:
+            f.write(BINARY_MAGIC)
+            f.write(np.array([header_len], dtype='<u8').tobytes())
+            f.write(header_bytes)
+            for _, data in parts:
+                _align(f)
+                f.write(data)
+
     @classmethod
-    def load(cls, path: str) -> "Vocab":
+    def load(cls, path: str, mmap: bool = True) -> "Vocab":
+        """Load the vocab.
+
+        Both the pickle and the binary formats are supported.
+
+        Args:
+            path (str):
+                The path of the saved vocab.
+            mmap (bool):
+                Whether to memory-map the vectors if the vocab was saved
+                in the binary format. Defaults to True.
+
+        Returns:
+            Vocab: The loaded vocab.
+        """
+        with open(path, 'rb') as f:
+            is_binary = f.read(len(BINARY_MAGIC)) == BINARY_MAGIC
+        vocab = cls()
+        if is_binary:
+            table = BinaryWordTable(path, mmap=mmap)
+            vocab.vocab = table  # type: ignore
+            vocab.index2word = dict(enumerate(table.words))
+            vocab.vec_index2word = {int(ind): table.words[ind] for ind in np.flatnonzero(table.has_vec)}
+            vocab.unigram_table_size = table.unigram_table_size
+            return vocab
         with open(path, 'rb') as f:
-            vocab = cls()
-            vocab.__dict__ = pickle.load(f)
+            # older vocabs may be missing some of the (newer) attributes
+            vocab.__dict__.update(pickle.load(f))
+        if len(vocab.unigram_table):
+            vocab._convert_legacy_unigram_table()
         return vocab
@@ -0,0 +1,48 @@
+import os
+import tempfile
+import unittest
+
+import spacy
+
+from medcat.config import Config
+from medcat.preprocessing.name_cache import PreparedNameCache
+
+
+class PreparedNameCacheTests(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.nlp = spacy.blank('en')
+        self.config = Config()
+        self.cache = PreparedNameCache()
+        self.cache.check_settings(self.nlp, self.config)
+        self.cache.add('Kidney failure', [['kidney', 'failure']])
+
+    def test_get(self):
+        self.assertEqual([['kidney', 'failure']], self.cache.get('Kidney failure'))
+        self.assertIsNone(self.cache.get('Renal failure'))
+
+    def test_same_settings_keeps_names(self):
+        self.cache.check_settings(self.nlp, Config())
+        self.assertEqual(1, len(self.cache))
+
+    def test_changed_config_clears_names(self):
+        self.config.cdb_maker.name_versions = ['LOWER']
+        self.cache.check_settings(self.nlp, self.config)
+        self.assertEqual(0, len(self.cache))
+
+    def test_changed_model_clears_names(self):
+        self.cache.check_settings(spacy.blank('de'), self.config)
+        self.assertEqual(0, len(self.cache))
+
+    def test_save_and_load(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, 'prepared_names.dat')
+            self.cache.save(path)
+            cache = PreparedNameCache.load(path)
+        self.assertEqual(self.cache.versions, cache.versions)
+        cache.check_settings(self.nlp, self.config)
+        self.assertEqual(1, len(cache))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,41 @@
+import unittest
+from spacy.lang.en import English
+from spacy.tokens import Token
+
+from medcat.config import Config
+from medcat.preprocessing.taggers import tag_skip_and_punct
+
+
+class TaggerTests(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        Token.set_extension('is_punct', default=False, force=True)
+        Token.set_extension('to_skip', default=False, force=True)
+        cls.nlp = English()
+
+    def setUp(self) -> None:
+        self.config = Config()
+        self.tagger = tag_skip_and_punct(self.nlp, "skip_and_punct", self.config)
+
+    def _tag(self, text: str):
+        doc = self.tagger(self.nlp.make_doc(text))
+        return [(token.text, token._.is_punct, token._.to_skip) for token in doc]
+
+    def test_tags_repeated_words(self):
+        tagged = self._tag("fever , nos fever . nos ,")
+        self.assertEqual([("fever", False, False), (",", True, True), ("nos", False, True),
+                          ("fever", False, False), (".", False, False), ("nos", False, True),
+                          (",", True, True)], tagged)
+        self.assertEqual(4, len(self.tagger.memo.values))
+
+    def test_memo_cleared_on_config_change(self):
+        self._tag("fever nos")
+        self.config.preprocessing.words_to_skip = {'fever'}
+        self.config.rebuild_re()
+        self.assertEqual([("fever", False, True), ("nos", False, False)], self._tag("fever nos"))
+
+    def test_memo_bounded(self):
+        self.config.preprocessing.lexeme_memo_size = 2
+        self._tag("a b c d e")
+        self.assertLessEqual(len(self.tagger.memo.values), 2)
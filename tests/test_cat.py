@@ -286,6 +286,40 @@ class CATTests(unittest.TestCase):
         self.assertEqual([], out["tokens"])
         self.assertTrue(text in out["text"])
 
+    def test_get_entities_long_document_mode(self):
+        text = "The dog is sitting outside the house and second csv.\n\n" * 40
+        expected = self.undertest.get_entities(text)
+        self.cdb.config.preprocessing.long_document_mode = True
+        self.cdb.config.preprocessing.long_document_chunk_size = 300
+        self.cdb.config.preprocessing.long_document_chunk_overlap = 100
+        try:
+            self.assertGreater(len(self.undertest._get_chunk_spans(text)), 1)
+            outs = [self.undertest.get_entities(text),
+                    self.undertest.get_entities_multi_texts([text], n_process=2)[0]]
+        finally:
+            self.cdb.config.preprocessing.long_document_mode = False
+        for out in outs:
+            with self.subTest(f"{out}"):
+                self.assertEqual([(ent['start'], ent['end'], ent['cui']) for ent in expected['entities'].values()],
+                                 [(ent['start'], ent['end'], ent['cui']) for ent in out['entities'].values()])
+
+    def test_get_entities_multi_texts_long_document_only_cui(self):
+        texts = ["The dog is sitting outside the house and second csv.\n\n" * 40,
+                 "The dog is sitting outside the house."]
+        expected = [self.undertest.get_entities(text, only_cui=True) for text in texts]
+        self.cdb.config.preprocessing.long_document_mode = True
+        self.cdb.config.preprocessing.long_document_chunk_size = 300
+        self.cdb.config.preprocessing.long_document_chunk_overlap = 100
+        try:
+            self.assertGreater(len(self.undertest._get_chunk_spans(texts[0])), 1)
+            outs = self.undertest.get_entities_multi_texts(texts, only_cui=True, n_process=2)
+        finally:
+            self.cdb.config.preprocessing.long_document_mode = False
+        self.assertEqual(len(outs), len(texts))
+        for out, exp in zip(outs, expected):
+            self.assertTrue(all(isinstance(cui, str) for cui in out['entities'].values()))
+            self.assertEqual(list(out['entities'].values()), list(exp['entities'].values()))
+
     def test_get_entities_multi_texts(self):
         in_data = [(1, "The dog is sitting outside the house."), (2, ""), (3, "The dog is sitting outside the house.")]
         out = self.undertest.get_entities_multi_texts(in_data, n_process=2)
@@ -462,6 +496,8 @@ class CATTests(unittest.TestCase):
         self.assertTrue("vocab.dat" in contents)
         self.assertTrue("model_card.json" in contents)
         self.assertTrue("meta_Status" in contents)
+        # No names are cached (or saved) unless a cache of prepared names is set
+        self.assertFalse(CAT.PREPARED_NAMES_CACHE_FILE_NAME in contents)
         with open(os.path.join(save_dir_path, full_model_pack_name, "model_card.json")) as file:
             model_card = json.load(file)
         self.assertTrue("MedCAT Version" in model_card)
@@ -93,6 +93,24 @@ class CDBTests(unittest.TestCase):
         assert 'C0000039' not in self.undertest.name2cuis['virus~z']
         assert 'C0000039' not in self.undertest.name2cuis2status['virus~z']
 
+    def test_remove_cuis(self):
+        to_remove = ['C0000039', 'C0000139']
+        remaining_snames = set()
+        for cui, snames in self.undertest.cui2snames.items():
+            if cui not in to_remove:
+                remaining_snames.update(snames)
+        self.undertest.remove_cuis(to_remove)
+        for cui in to_remove:
+            with self.subTest(cui):
+                self.assertNotIn(cui, self.undertest.cui2names)
+                self.assertNotIn(cui, self.undertest.cui2snames)
+                for name, cuis in self.undertest.name2cuis.items():
+                    self.assertNotIn(cui, cuis)
+                for name, cuis2status in self.undertest.name2cuis2status.items():
+                    self.assertNotIn(cui, cuis2status)
+        # snames only dropped if no longer used by any CUI
+        self.assertEqual(remaining_snames, self.undertest.snames)
+
     def test_cui2snames_population(self):
         self.undertest.cui2snames.clear()
         self.undertest.populate_cui2snames()
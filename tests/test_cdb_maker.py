@@ -1,11 +1,15 @@
 import unittest
 import logging
 import os
+import tempfile
+from unittest import mock
 import numpy as np
+import pandas as pd
 from medcat.cdb_maker import CDBMaker
 from medcat.cdb import CDB
 from medcat.config import Config
 from medcat.preprocessing.cleaners import prepare_name
+from medcat.preprocessing.name_cache import PreparedNameCache
 
 #cdb.csv
 #cui  name  ontologies  name_status type_ids  description
@@ -105,11 +109,13 @@ class A_CDBMakerLoadTests(unittest.TestCase):
         self.assertEqual(self.cdb.cui2type_ids, target_result)
 
     def test_as_cdb_additional_info_length(self):
-        self.assertEqual(len(self.cdb.addl_info), 8, "Should equal 8")
+        self.assertEqual(len(self.cdb.addl_info), 9, "Should equal 9")
 
     def test_at_cdb_additional_info_output(self):
         target_result = {'cui2icd10': {}, 'cui2opcs4': {}, 'cui2ontologies': {'C0000039': {'MSH'}}, 'cui2original_names': {'C0000039': {'Virus K', 'Virus M', 'Virus', 'Virus Z'}, 'C0000139': {'Virus K', 'Virus M', 'Virus', 'Virus Z'}, 'C0000239': {'Second csv'}}, 'cui2description': {'C0000039': 'Synthetic phospholipid used in liposomes and lipid bilayers to study biological membranes. It is also a major constituent of PULMONARY SURFACTANTS.'}, 'type_id2name': {}, 'type_id2cuis': {'T109': {'C0000039'}, 'T123': {'C0000039'}, 'T234': {'C0000039'}}, 'cui2group': {}}
-        self.assertEqual(self.cdb.addl_info, target_result)
+        addl_info = dict(self.cdb.addl_info)
+        self.assertEqual(set(addl_info.pop('cui2row_hash')), {'C0000039', 'C0000139', 'C0000239'})
+        self.assertEqual(addl_info, target_result)
 
 
 class B_CDBMakerEditTests(unittest.TestCase):
@@ -216,5 +222,110 @@ class B_CDBMakerEditTests(unittest.TestCase):
         self.assertEqual(self.cdb.cui2context_vectors, target_result)
 
 
+class C_CDBMakerBatchedTests(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.config = Config()
+        cls.config.general["spacy_model"] = "en_core_web_md"
+        cls.config.cdb_maker.remove_parenthesis = 5
+        cls.maker = CDBMaker(cls.config)
+        cls.csvs = [
+            os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'examples', 'cdb.csv'),
+            os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'examples', 'cdb_2.csv')
+        ]
+        cls.cdb = cls.maker.prepare_csvs(cls.csvs, full_build=True)
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        cls.maker.destroy_pipe()
+
+    def assert_same_cdb(self, cdb: CDB):
+        for attr, value in self.cdb.__dict__.items():
+            if attr == 'config':
+                continue
+            with self.subTest(attr):
+                self.assertEqual(value, getattr(cdb, attr))
+
+    def setUp(self) -> None:
+        self.maker.reset_cdb()
+        self.maker.name_cache = PreparedNameCache()
+
+    def test_batched_same_cdb(self):
+        self.assert_same_cdb(self.maker.prepare_csvs(self.csvs, full_build=True, n_process=1, batch_size=2))
+
+    def test_parallel_same_cdb(self):
+        self.assert_same_cdb(self.maker.prepare_csvs(self.csvs, full_build=True, n_process=2, batch_size=2))
+
+    def test_cached_same_cdb(self):
+        self.maker.prepare_csvs(self.csvs, full_build=True)
+        self.assertTrue(self.maker.name_cache.versions)
+        self.maker.reset_cdb()
+        self.assert_same_cdb(self.maker.prepare_csvs(self.csvs, full_build=True))
+
+    def test_batched_cached_same_cdb(self):
+        self.maker.prepare_csvs(self.csvs, full_build=True)
+        self.maker.reset_cdb()
+        self.assert_same_cdb(self.maker.prepare_csvs(self.csvs, full_build=True, n_process=1, batch_size=2))
+
+    def test_batched_no_cache_same_cdb(self):
+        self.maker.name_cache = None
+        self.assert_same_cdb(self.maker.prepare_csvs(self.csvs, full_build=True, n_process=1, batch_size=2))
+        self.assertIsNone(self.maker.name_cache)
+
+    def test_no_cache_without_path(self):
+        self.assertIsNone(CDBMaker(self.config, cdb=self.cdb).name_cache)
+
+    def test_cache_saved_and_loaded(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            config = Config()
+            config.general["spacy_model"] = "en_core_web_md"
+            config.cdb_maker.remove_parenthesis = 5
+            config.cdb_maker.prepared_names_cache_path = os.path.join(temp_dir, "prepared_names.dat")
+            maker = CDBMaker(config)
+            maker.prepare_csvs(self.csvs, full_build=True)
+            versions = maker.name_cache.versions
+            maker.destroy_pipe()
+            maker = CDBMaker(config)
+            self.assertTrue(versions)
+            self.assertEqual(versions, maker.name_cache.versions)
+            self.assert_same_cdb(maker.prepare_csvs(self.csvs, full_build=True))
+            maker.destroy_pipe()
+
+    def test_update_cdb(self):
+        cdb = self.maker.prepare_csvs(self.csvs[:1], full_build=True)
+        cdb.update_context_vector("C0000039", {"short": np.ones(300)})
+        self.assertIs(cdb, self.maker.update_cdb(self.csvs, full_build=True))
+        for attr in ["cui2names", "cui2snames", "cui2type_ids", "cui2preferred_name", "name2cuis",
+                     "name2cuis2status", "snames", "name_isupper", "addl_info"]:
+            with self.subTest(attr):
+                self.assertEqual(getattr(self.cdb, attr), getattr(cdb, attr))
+        self.assertTrue(np.array_equal(cdb.cui2context_vectors["C0000039"]["short"], np.ones(300)))
+        self.assertEqual(cdb.cui2count_train["C0000039"], 1)
+
+    def test_update_cdb_same_release_prepares_nothing(self):
+        self.maker.prepare_csvs(self.csvs, full_build=True)
+        with mock.patch("medcat.cdb_maker.prepare_name", wraps=prepare_name) as mock_prepare_name:
+            cdb = self.maker.update_cdb(self.csvs, full_build=True)
+        mock_prepare_name.assert_not_called()
+        self.assert_same_cdb(cdb)
+
+    def test_update_cdb_only_prepares_changed_concepts(self):
+        self.maker.prepare_csvs(self.csvs, full_build=True)
+        df = pd.read_csv(self.csvs[1], dtype=str)
+        df.loc[0, "name"] = "Second csv changed"
+        with mock.patch("medcat.cdb_maker.prepare_name", wraps=prepare_name) as mock_prepare_name:
+            cdb = self.maker.update_cdb([self.csvs[0], df], full_build=True)
+        self.assertEqual({call.args[0] for call in mock_prepare_name.call_args_list}, {"Second csv changed"})
+        self.assertEqual(cdb.addl_info["cui2original_names"]["C0000239"], {"Second csv changed"})
+        self.assertEqual(cdb.cui2names["C0000039"], self.cdb.cui2names["C0000039"])
+
+    def test_update_cdb_removes_missing(self):
+        self.maker.prepare_csvs(self.csvs, full_build=True)
+        cdb = self.maker.update_cdb(self.csvs[1:], full_build=True)
+        self.assertEqual(set(cdb.cui2names), {"C0000239"})
+        self.assertNotIn("virus", cdb.name2cuis)
+
+
 if __name__ == '__main__':
     unittest.main()
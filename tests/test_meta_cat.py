@@ -4,7 +4,7 @@ import unittest
 
 from transformers import AutoTokenizer
 
-from medcat.meta_cat import MetaCAT
+from medcat.meta_cat import MetaCAT, MultiTaskMetaCAT, group_meta_cats
 from medcat.config_meta_cat import ConfigMetaCAT
 from medcat.tokenizers.meta_cat_tokenizers import TokenizerWrapperBERT
 import spacy
@@ -36,6 +36,34 @@ class MetaCATTests(unittest.TestCase):
         if self.meta_cat.config.model.phase_number != 1:
             self.assertEqual(results['report']['weighted avg']['f1-score'], 1.0)
 
+    def test_train_cached_accumulated(self):
+        json_path = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'resources',
+                                 'mct_export_for_meta_cat_test.json')
+        t_config = self.meta_cat.config.train
+        t_config['data_cache_dir'] = os.path.join(self.tmp_dir, 'data_cache')
+        t_config['gradient_accumulation_steps'] = 2
+        try:
+            self.meta_cat.train_from_json(json_path, save_dir_path=self.tmp_dir)
+            self.assertEqual(len(os.listdir(t_config['data_cache_dir'])), 1)
+            results = self.meta_cat.train_from_json(json_path, save_dir_path=self.tmp_dir)
+        finally:
+            t_config['data_cache_dir'] = None
+            t_config['gradient_accumulation_steps'] = 1
+        self.assertIn('report', results)
+
+    def test_eval_cached(self):
+        json_path = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'resources',
+                                 'mct_export_for_meta_cat_test.json')
+        self.meta_cat.train_from_json(json_path, save_dir_path=self.tmp_dir)
+        f1 = self.meta_cat.eval(json_path)['f1']
+        t_config = self.meta_cat.config.train
+        t_config['data_cache_dir'] = os.path.join(self.tmp_dir, 'data_cache')
+        try:
+            cached_f1 = self.meta_cat.eval(json_path)['f1']
+        finally:
+            t_config['data_cache_dir'] = None
+        self.assertEqual(f1, cached_f1)
+
     def test_save_load(self):
         json_path = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'resources',
                                  'mct_export_for_meta_cat_test.json')
@@ -64,6 +92,31 @@ class MetaCATTests(unittest.TestCase):
         doc.spans[spangroup_name] = [span_0, span_1]
         return doc
 
+    def test_prepare_document(self):
+        spangroup_name = "mock_span_group"
+        self.meta_cat.config.general.span_group = spangroup_name
+        doc = self._prepare_doc_w_spangroup(spangroup_name)
+        for ind, span in enumerate(doc.spans[spangroup_name]):
+            span._.id = ind
+        text = doc.text.lower()
+        tokenized = self.meta_cat.tokenizer(text)
+        ent_id2ind, samples = self.meta_cat.prepare_document(doc, input_ids=tokenized['input_ids'],
+                                                             offset_mapping=tokenized['offset_mapping'],
+                                                             lowercase=True)
+        self.meta_cat.config.general.span_group = None
+
+        self.assertEqual(len(samples), 2)
+        for span in doc.spans[spangroup_name]:
+            tkns, cpos = samples[ent_id2ind[span._.id]]
+            with self.subTest(span.text):
+                self.assertEqual([tkns[ind] for ind in cpos],
+                                 self.meta_cat.tokenizer(span.text.lower())['input_ids'])
+
+    def test_replace_center_ids_cached(self):
+        ids = self.meta_cat._get_replace_center_ids('CONCEPT', lowercase=True)
+        self.assertEqual(ids, self.meta_cat.tokenizer('concept')['input_ids'])
+        self.assertIs(self.meta_cat._get_replace_center_ids('CONCEPT', lowercase=True), ids)
+
     def test_predict_spangroup(self):
         json_path = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'resources',
                                  'mct_export_for_meta_cat_test.json')
@@ -118,5 +171,64 @@ class MetaCATBertTest(MetaCATTests):
         self.meta_cat.config.model['phase_number'] = 0
 
 
+class MultiTaskMetaCATTest(unittest.TestCase):
+
+    @staticmethod
+    def _get_meta_cat(category_name: str, seed: int) -> MetaCAT:
+        tokenizer = TokenizerWrapperBERT(AutoTokenizer.from_pretrained('prajjwal1/bert-tiny'))
+        config = ConfigMetaCAT()
+        config.general['category_name'] = category_name
+        config.general['category_value2id'] = {'Affirmed': 0, 'Negated': 1}
+        config.general['seed'] = seed
+        config.model['model_name'] = 'bert'
+        config.model['model_variant'] = 'prajjwal1/bert-tiny'
+        return MetaCAT(tokenizer=tokenizer, embeddings=None, config=config)
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.meta_cats = [cls._get_meta_cat('Status', 1), cls._get_meta_cat('Presence', 2)]
+
+    def _get_doc(self):
+        Span.set_extension('id', default=0, force=True)
+        Span.set_extension('meta_anns', default=None, force=True)
+        nlp = spacy.blank("en")
+        doc = nlp("Pt has diabetes and no copd.")
+        doc.ents = [doc.char_span(7, 15, label="diabetes"), doc.char_span(23, 27, label="copd")]
+        for ind, ent in enumerate(doc.ents):
+            ent._.id = ind
+        return doc
+
+    def test_groups_compatible(self):
+        grouped = group_meta_cats(self.meta_cats)
+        self.assertEqual(len(grouped), 1)
+        self.assertIsInstance(grouped[0], MultiTaskMetaCAT)
+
+    def test_same_as_sequential(self):
+        doc = self._get_doc()
+        for meta_cat in self.meta_cats:
+            doc = meta_cat(doc)
+        expected = [ent._.meta_anns for ent in doc.ents]
+
+        doc = MultiTaskMetaCAT(self.meta_cats)(self._get_doc())
+        got = [ent._.meta_anns for ent in doc.ents]
+        self.assertEqual(len(got), len(expected))
+        for meta_anns, exp_meta_anns in zip(got, expected):
+            self.assertEqual(meta_anns.keys(), exp_meta_anns.keys())
+            for name, meta_ann in meta_anns.items():
+                self.assertEqual(meta_ann['value'], exp_meta_anns[name]['value'])
+                self.assertAlmostEqual(meta_ann['confidence'], exp_meta_anns[name]['confidence'], places=5)
+
+    def test_does_not_group_lstm(self):
+        config = ConfigMetaCAT()
+        config.general['vocab_size'] = 10
+        config.model['padding_idx'] = 0
+        lstm = MetaCAT(tokenizer=None, embeddings=None, config=config)
+        grouped = group_meta_cats([lstm] + self.meta_cats)
+        self.assertEqual(len(grouped), 2)
+        self.assertIs(grouped[0], lstm)
+        with self.assertRaises(ValueError):
+            MultiTaskMetaCAT([lstm, self.meta_cats[0]])
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -73,6 +73,14 @@ class PipeTests(unittest.TestCase):
 
         self.assertEqual(TokenNormalizer.name, Language.get_factory_meta(TokenNormalizer.name).factory)
 
+    def test_get_spacy_docs_uses_spacy_components_only(self):
+        PipeTests.undertest.add_tagger(tagger=tag_skip_and_punct, name=tag_skip_and_punct.name, additional_fields=["is_punct"])
+        PipeTests.undertest.add_token_normalizer(PipeTests.config, spell_checker=PipeTests.spell_checker)
+        doc = next(PipeTests.undertest.get_spacy_docs(["running"]))
+
+        self.assertEqual("run", doc[0].lemma_)
+        self.assertIsNone(doc[0]._.norm)
+
     def test_add_ner(self):
         PipeTests.undertest.add_ner(PipeTests.ner)
 
@@ -1,7 +1,9 @@
 import os
 import shutil
+import pickle
 import unittest
-from medcat.vocab import Vocab
+import numpy as np
+from medcat.vocab import Vocab, BinaryWordTable
 
 
 class CATTests(unittest.TestCase):
@@ -35,6 +37,100 @@ class CATTests(unittest.TestCase):
         vocab = Vocab.load(vocab_path)
         self.assertEqual(["house", "dog", "test"], list(vocab.vocab.keys()))
 
+    def test_save_and_load_binary(self):
+        self.undertest.add_words(os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "examples", "vocab_data.txt"))
+        self.undertest.add_word("test", cnt=31, vec=None)
+        self.undertest.add_word("ünicode", cnt=5, vec=np.array([1.42, 1.44, 1.55]))
+        vocab_path = f"{self.tmp_dir}/vocab_binary.dat"
+        self.undertest.save(vocab_path, binary=True)
+        vocab = Vocab.load(vocab_path)
+        self.assertIsInstance(vocab.vocab, BinaryWordTable)
+        self.assertEqual(list(self.undertest.vocab.keys()), list(vocab.vocab.keys()))
+        self.assertEqual(self.undertest.index2word, vocab.index2word)
+        self.assertEqual(self.undertest.vec_index2word, vocab.vec_index2word)
+        for word in self.undertest.vocab:
+            with self.subTest(word):
+                self.assertIn(word, vocab)
+                self.assertEqual(self.undertest.count(word), vocab.count(word))
+                if self.undertest.vec(word) is None:
+                    self.assertIsNone(vocab.vec(word))
+                else:
+                    np.testing.assert_array_equal(self.undertest.vec(word), vocab.vec(word))
+        self.assertNotIn("missing", vocab)
+
+    def test_binary_modified_after_load(self):
+        self.undertest.add_words(os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "examples", "vocab_data.txt"))
+        vocab_path = f"{self.tmp_dir}/vocab_binary.dat"
+        self.undertest.save(vocab_path, binary=True)
+        vocab = Vocab.load(vocab_path)
+        vocab.inc_or_add("house", 6)
+        vocab.inc_or_add("new")
+        self.assertEqual(34450, vocab.count("house"))
+        self.assertEqual(1, vocab.count("new"))
+        self.assertEqual(2, vocab.item("new")["ind"])
+
+    def test_binary_builds_unigram_table(self):
+        self.undertest.add_words(os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "examples", "vocab_data.txt"))
+        self.undertest.make_unigram_table(table_size=1000)
+        vocab_path = f"{self.tmp_dir}/vocab_binary.dat"
+        self.undertest.save(vocab_path, binary=True)
+        vocab = Vocab.load(vocab_path)
+        self.assertEqual(0, len(vocab.unigram_cumsum))
+        inds = vocab.get_negative_samples(10)
+        self.assertEqual(10, len(inds))
+        self.assertTrue(set(inds) <= set(vocab.vec_index2word))
+
+    def _add_sampling_words(self):
+        self.undertest.add_word("house", cnt=100, vec=np.ones(3))
+        self.undertest.add_word("dog", cnt=20, vec=np.ones(3))
+        self.undertest.add_word("123", cnt=100, vec=np.ones(3))
+        self.undertest.add_word("novec", cnt=1000)
+
+    def test_unigram_table_is_linear(self):
+        self._add_sampling_words()
+        self.undertest.make_unigram_table(table_size=1000)
+        self.assertEqual(3, len(self.undertest.unigram_cumsum))
+        self.assertEqual(0, len(self.undertest.unigram_table))
+        self.assertEqual([0, 1, 2], list(self.undertest.unigram_table_inds))
+        self.assertEqual([True, True, False], list(self.undertest.unigram_table_alpha))
+
+    def test_negative_samples_follow_counts(self):
+        self._add_sampling_words()
+        self.undertest.make_unigram_table(table_size=1000)
+        inds = self.undertest.get_negative_samples(20000)
+        self.assertEqual(20000, len(inds))
+        freqs = np.bincount(inds, minlength=4) / len(inds)
+        self.assertEqual(0, freqs[3])
+        self.assertAlmostEqual(freqs[0], freqs[2], delta=0.03)
+        self.assertGreater(freqs[0], freqs[1])
+
+    def test_negative_samples_ignore_punct_and_num(self):
+        self._add_sampling_words()
+        self.undertest.make_unigram_table(table_size=1000)
+        inds = self.undertest.get_negative_samples(1000, ignore_punct_and_num=True)
+        self.assertTrue(0 < len(inds) < 1000)
+        self.assertNotIn(2, set(inds))
+
+    def test_negative_sample_batches(self):
+        self._add_sampling_words()
+        self.undertest.make_unigram_table(table_size=1000)
+        batches = self.undertest.get_negative_sample_batches([3, 5, 0])
+        self.assertEqual([3, 5, 0], [len(batch) for batch in batches])
+
+    def test_load_converts_legacy_unigram_table(self):
+        self._add_sampling_words()
+        vocab_path = f"{self.tmp_dir}/vocab_legacy.dat"
+        legacy = {key: val for key, val in self.undertest.__dict__.items() if not key.startswith("unigram_")}
+        legacy["unigram_table"] = np.array([0] * 6 + [1] * 3 + [2])
+        with open(vocab_path, 'wb') as f:
+            pickle.dump(legacy, f)
+        vocab = Vocab.load(vocab_path)
+        self.assertEqual([6, 9, 10], list(vocab.unigram_cumsum))
+        self.assertEqual(0, len(vocab.unigram_table))
+        self.assertEqual([0, 1, 2], list(vocab.unigram_table_inds))
+        self.assertEqual(10, vocab.unigram_table_size)
+        self.assertEqual(4, len(vocab.get_negative_samples(4)))
+
 
 if __name__ == '__main__':
     unittest.main()
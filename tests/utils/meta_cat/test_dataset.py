@@ -0,0 +1,161 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+from transformers import AutoTokenizer
+
+from medcat.config_meta_cat import ConfigMetaCAT
+from medcat.tokenizers.meta_cat_tokenizers import TokenizerWrapperBERT
+from medcat.utils.meta_cat import dataset
+from medcat.utils.meta_cat.data_utils import encode_category_values
+from medcat.utils.meta_cat.dataset import (MetaCATDataset, BatchCollator, LengthBucketSampler,
+                                           prepare_from_json_cached)
+
+
+SAMPLES = [[[1, 2, 3], [1], 0], [[4], [0], 1], [[5, 6, 7, 8, 9], [2, 3], 1], [[1, 2], [0, 1], 0]]
+
+
+class MetaCATDatasetTests(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.dataset = MetaCATDataset.from_samples(SAMPLES)
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.tmp_dir)
+
+    def test_getitem(self):
+        input_ids, cpos, label = self.dataset[2]
+        self.assertEqual(input_ids.tolist(), [5, 6, 7, 8, 9])
+        self.assertEqual(cpos, [2, 3])
+        self.assertEqual(label, 1)
+
+    def test_to_samples(self):
+        self.assertEqual(len(self.dataset), len(SAMPLES))
+        self.assertEqual(self.dataset.to_samples(), SAMPLES)
+        self.assertEqual(self.dataset.lengths.tolist(), [3, 1, 5, 2])
+
+    def test_save_load_mmap(self):
+        samples = [sample[:2] + [str(sample[2])] for sample in SAMPLES]
+        MetaCATDataset.from_samples(samples).save(self.tmp_dir)
+        loaded = MetaCATDataset.load(self.tmp_dir)
+        self.assertIsInstance(loaded.input_ids, np.memmap)
+        self.assertEqual(loaded.to_samples(), samples)
+
+    def test_subset(self):
+        subset = self.dataset.subset([3, 0, 2]).subset([1, 2])
+        self.assertIs(subset.input_ids, self.dataset.input_ids)
+        self.assertEqual(subset.to_samples(), [SAMPLES[0], SAMPLES[2]])
+        self.assertEqual(subset.lengths.tolist(), [3, 5])
+        self.assertEqual(subset.sample_labels.tolist(), [0, 1])
+        subset.save(self.tmp_dir)
+        self.assertEqual(MetaCATDataset.load(self.tmp_dir).to_samples(), [SAMPLES[0], SAMPLES[2]])
+
+    def test_map_labels(self):
+        samples = [sample[:2] + [str(sample[2])] for sample in SAMPLES]
+        mapped = MetaCATDataset.from_samples(samples).subset([1, 2]).map_labels({'1': 5, '0': 7})
+        self.assertEqual(mapped.sample_labels.tolist(), [5, 5])
+        self.assertEqual(mapped[0][2], 5)
+
+    def test_concat(self):
+        concatenated = MetaCATDataset.concat([self.dataset.subset([2]), self.dataset])
+        self.assertEqual(concatenated.to_samples(), [SAMPLES[2]] + SAMPLES)
+
+
+class BatchCollatorTests(unittest.TestCase):
+
+    def test_pads_to_longest(self):
+        data = MetaCATDataset.from_samples(SAMPLES)
+        x, cpos, attention_masks, y = BatchCollator(pad_id=0)([data[0], data[1]])
+        self.assertEqual(x.tolist(), [[1, 2, 3], [4, 0, 0]])
+        self.assertEqual(cpos, [[1], [0]])
+        self.assertEqual(attention_masks.sum().item(), 4)
+        self.assertEqual(y.tolist(), [0, 1])
+
+
+class LengthBucketSamplerTests(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.lengths = np.random.default_rng(1).integers(1, 100, size=1003)
+
+    def test_all_samples_once(self):
+        sampler = LengthBucketSampler(self.lengths, batch_size=10, bucket_size_in_batches=5)
+        batches = list(sampler)
+        self.assertEqual(len(batches), len(sampler))
+        self.assertEqual(sorted(ind for batch in batches for ind in batch), list(range(len(self.lengths))))
+        self.assertTrue(all(len(batch) <= 10 for batch in batches))
+
+    def test_less_padding(self):
+        sampler = LengthBucketSampler(self.lengths, batch_size=10, bucket_size_in_batches=20)
+        padded = sum(len(batch) * self.lengths[batch].max() for batch in sampler)
+        padded_in_order = sum(len(self.lengths[i:i + 10]) * self.lengths[i:i + 10].max()
+                              for i in range(0, len(self.lengths), 10))
+        self.assertLess(padded, padded_in_order)
+
+    def test_epochs_differ(self):
+        sampler = LengthBucketSampler(self.lengths, batch_size=10)
+        first = list(sampler)
+        sampler.set_epoch(1)
+        self.assertNotEqual(first, list(sampler))
+
+    def test_no_shuffle_sorted(self):
+        sampler = LengthBucketSampler(self.lengths, batch_size=10, shuffle=False)
+        inds = [ind for batch in sampler for ind in batch]
+        self.assertEqual(self.lengths[inds].tolist(), sorted(self.lengths.tolist()))
+
+
+class PrepareFromJsonCachedTests(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.tokenizer = TokenizerWrapperBERT(AutoTokenizer.from_pretrained('prajjwal1/bert-tiny'))
+        json_path = os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', '..', 'resources',
+                                 'mct_export_for_meta_cat_test.json')
+        with open(json_path) as f:
+            cls.data_loaded = json.load(f)
+        cls.config = ConfigMetaCAT()
+
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.tmp_dir)
+
+    def test_same_as_uncached(self):
+        g_config = self.config.general
+        expected = dataset.prepare_from_json(self.data_loaded, g_config['cntx_left'], g_config['cntx_right'],
+                                             self.tokenizer, lowercase=g_config['lowercase'])
+        got = prepare_from_json_cached(self.data_loaded, self.tokenizer, self.config, self.tmp_dir)
+        self.assertEqual(got.keys(), expected.keys())
+        for name in expected:
+            self.assertEqual(got[name].to_samples(), expected[name])
+
+    def test_uses_cache(self):
+        first = prepare_from_json_cached(self.data_loaded, self.tokenizer, self.config, self.tmp_dir)
+        with mock.patch.object(dataset, 'prepare_from_json') as prepare:
+            second = prepare_from_json_cached(self.data_loaded, self.tokenizer, self.config, self.tmp_dir)
+            prepare.assert_not_called()
+        for name in first:
+            self.assertEqual(second[name].to_samples(), first[name].to_samples())
+
+    def test_encode_category_values_shares_arrays(self):
+        name = next(iter(prepare_from_json_cached(self.data_loaded, self.tokenizer, self.config, self.tmp_dir)))
+        cached = prepare_from_json_cached(self.data_loaded, self.tokenizer, self.config, self.tmp_dir)[name]
+        full, undersampled, category_value2id = encode_category_values(cached)
+        exp_full, exp_undersampled, exp_category_value2id = encode_category_values(cached.to_samples())
+        self.assertIsInstance(full.input_ids, np.memmap)
+        self.assertIsInstance(undersampled.input_ids, np.memmap)
+        self.assertEqual(category_value2id, exp_category_value2id)
+        self.assertEqual(full.to_samples(), exp_full)
+        self.assertEqual(undersampled.to_samples(), exp_undersampled)
+
+    def test_context_in_key(self):
+        prepare_from_json_cached(self.data_loaded, self.tokenizer, self.config, self.tmp_dir)
+        config = ConfigMetaCAT()
+        config.general['cntx_left'] = 3
+        prepare_from_json_cached(self.data_loaded, self.tokenizer, config, self.tmp_dir)
+        self.assertEqual(len(os.listdir(self.tmp_dir)), 2)
@@ -0,0 +1,129 @@
+import importlib.util
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import torch
+from transformers import AutoTokenizer
+
+from medcat.config_meta_cat import ConfigMetaCAT
+from medcat.meta_cat import MetaCAT
+from medcat.tokenizers.meta_cat_tokenizers import TokenizerWrapperBERT
+from medcat.utils.meta_cat.export import ExportedModel, export_model, get_export_paths, load_exported_model
+from medcat.utils.meta_cat.ml_utils import predict
+from medcat.utils.meta_cat.models import LSTM, BertForMetaAnnotation
+
+
+HAS_ONNX = all(importlib.util.find_spec(name) is not None for name in ('onnx', 'onnxruntime'))
+
+
+class ExportLSTMTests(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        torch.manual_seed(13)
+        cls.config = ConfigMetaCAT()
+        cls.config.general['vocab_size'] = 50
+        cls.config.general['batch_size_eval'] = 3
+        cls.config.model['padding_idx'] = 0
+        cls.config.model['input_size'] = 16
+        cls.config.model['hidden_size'] = 16
+        cls.model = cls.get_model(cls.config)
+        cls.data = [(list(range(1, length + 1)), [length // 2, length // 2 + 1][:length])
+                    for length in (7, 1, 12, 4, 9, 3, 20)]
+
+    @staticmethod
+    def get_model(config: ConfigMetaCAT) -> torch.nn.Module:
+        return LSTM(None, config)
+
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.tmp_dir)
+
+    def assert_same(self, export_format: str, quantize: bool = False, places: int = 5):
+        exported = ExportedModel(export_model(self.model, self.config, self.tmp_dir,
+                                              export_format=export_format, quantize=quantize))
+        exp_predictions, exp_confidences = predict(self.model, self.data, self.config)
+        predictions, confidences = predict(exported, self.data, self.config)
+        self.assertEqual(len(confidences), len(self.data))
+        if not quantize:
+            self.assertEqual(list(predictions), list(exp_predictions))
+        np.testing.assert_almost_equal(confidences, exp_confidences, decimal=places)
+
+    def test_torchscript(self):
+        self.assert_same('torchscript')
+
+    def test_torchscript_quantized(self):
+        self.assert_same('torchscript', quantize=True, places=1)
+
+    @unittest.skipUnless(HAS_ONNX, "Requires onnx and onnxruntime")
+    def test_onnx(self):
+        self.assert_same('onnx')
+
+    @unittest.skipUnless(HAS_ONNX, "Requires onnx and onnxruntime")
+    def test_onnx_quantized(self):
+        self.assert_same('onnx', quantize=True, places=1)
+
+    def test_keeps_one_export(self):
+        export_model(self.model, self.config, self.tmp_dir, export_format='torchscript')
+        if HAS_ONNX:
+            export_model(self.model, self.config, self.tmp_dir, export_format='onnx')
+        self.assertEqual(len(get_export_paths(self.tmp_dir)), 1)
+
+    def test_unknown_format(self):
+        with self.assertRaises(ValueError):
+            export_model(self.model, self.config, self.tmp_dir, export_format='tflite')
+
+    def test_load_failure_falls_back(self):
+        with open(os.path.join(self.tmp_dir, 'model_optimised.onnx'), 'wb') as f:
+            f.write(b'not a model')
+        with self.assertLogs('medcat.utils.meta_cat.export', level='WARNING'):
+            self.assertIsNone(load_exported_model(self.tmp_dir))
+
+
+class ExportBertTests(ExportLSTMTests):
+
+    @staticmethod
+    def get_model(config: ConfigMetaCAT) -> torch.nn.Module:
+        config.model['model_name'] = 'bert'
+        config.model['model_variant'] = 'prajjwal1/bert-tiny'
+        return BertForMetaAnnotation(config)
+
+
+class MetaCATExportTests(unittest.TestCase):
+
+    def setUp(self) -> None:
+        tokenizer = TokenizerWrapperBERT(AutoTokenizer.from_pretrained('prajjwal1/bert-tiny'))
+        config = ConfigMetaCAT()
+        config.general['category_name'] = 'Status'
+        config.model['input_size'] = 100
+        self.meta_cat = MetaCAT(tokenizer=tokenizer, embeddings=None, config=config)
+        self.tmp_dir = tempfile.mkdtemp()
+        self.save_dir = os.path.join(self.tmp_dir, 'meta_Status')
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.tmp_dir)
+
+    def test_load_uses_export(self):
+        self.meta_cat.save(self.save_dir)
+        self.meta_cat.export(self.save_dir)
+        self.assertIsInstance(MetaCAT.load(self.save_dir).inference_model, ExportedModel)
+        self.assertIsNone(MetaCAT.load(self.save_dir, load_exported=False).inference_model)
+
+    def test_save_copies_export(self):
+        self.meta_cat.save(self.save_dir)
+        self.meta_cat.export(self.save_dir)
+        other_dir = os.path.join(self.tmp_dir, 'other')
+        self.meta_cat.save(other_dir)
+        self.assertEqual(len(get_export_paths(other_dir)), 1)
+
+    def test_save_removes_stale_export(self):
+        self.meta_cat.save(self.save_dir)
+        self.meta_cat.export(self.save_dir)
+        self.meta_cat.inference_model = None
+        self.meta_cat.save(self.save_dir)
+        self.assertEqual(get_export_paths(self.save_dir), [])
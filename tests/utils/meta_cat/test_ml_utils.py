@@ -0,0 +1,68 @@
+import unittest
+
+import torch
+
+from medcat.config_meta_cat import ConfigMetaCAT
+from medcat.utils.meta_cat.ml_utils import create_batch_piped_data, get_length_batches, predict
+from medcat.utils.meta_cat.models import LSTM
+
+
+class CreateBatchTests(unittest.TestCase):
+
+    def test_pads_to_longest_in_batch(self):
+        data = [([1, 2], [0]), ([1, 2, 3], [1]), ([1, 2, 3, 4, 5, 6], [2])]
+        x, _, attention_masks, _ = create_batch_piped_data(data, 0, 2, device=torch.device('cpu'), pad_id=0)
+        self.assertEqual(x.shape, (2, 3))
+        self.assertEqual(attention_masks.sum().item(), 5)
+
+
+class GetLengthBatchesTests(unittest.TestCase):
+
+    def test_sorts_by_length(self):
+        lengths = [5, 1, 3, 2, 4]
+        order, batches = get_length_batches(lengths, batch_size=2)
+        self.assertEqual([lengths[ind] for ind in order], [1, 2, 3, 4, 5])
+        self.assertEqual(batches, [(0, 2), (2, 4), (4, 5)])
+
+    def test_token_budget(self):
+        lengths = [10, 10, 10, 50, 50, 200]
+        _, batches = get_length_batches(lengths, batch_size=100, max_tokens=100)
+        self.assertEqual(batches, [(0, 3), (3, 5), (5, 6)])
+
+    def test_empty(self):
+        order, batches = get_length_batches([], batch_size=10)
+        self.assertEqual(len(order), 0)
+        self.assertEqual(batches, [])
+
+
+class PredictTests(unittest.TestCase):
+
+    def setUp(self) -> None:
+        torch.manual_seed(13)
+        self.config = ConfigMetaCAT()
+        self.config.general['vocab_size'] = 50
+        self.config.model['padding_idx'] = 0
+        self.config.model['input_size'] = 16
+        self.config.model['hidden_size'] = 16
+        self.model = LSTM(None, self.config)
+        self.data = [(list(range(1, length + 1)), [length // 2]) for length in (7, 2, 12, 4, 9, 3)]
+
+    def _predict_one_by_one(self):
+        self.config.general['batch_size_eval'] = 1
+        return predict(self.model, self.data, self.config)
+
+    def test_keeps_order(self):
+        exp_predictions, exp_confidences = self._predict_one_by_one()
+        self.config.general['batch_size_eval'] = 4
+        predictions, confidences = predict(self.model, self.data, self.config)
+        self.assertEqual(list(predictions), list(exp_predictions))
+        self.assertEqual(len(confidences), len(self.data))
+        for conf, exp_conf in zip(confidences, exp_confidences):
+            self.assertAlmostEqual(conf, exp_conf, places=5)
+
+    def test_keeps_order_token_budget(self):
+        exp_predictions, _ = self._predict_one_by_one()
+        self.config.general['batch_size_eval'] = 4
+        self.config.general['batch_tokens_eval'] = 20
+        predictions, _ = predict(self.model, self.data, self.config)
+        self.assertEqual(list(predictions), list(exp_predictions))
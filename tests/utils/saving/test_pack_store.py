@@ -0,0 +1,138 @@
+import os
+import tempfile
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+from medcat.utils.saving import pack_store
+from medcat.utils.saving.pack_store import PackStore, write_stored_archive, hash_file
+
+import unittest
+from unittest import mock
+
+
+def _write_pack(folder: str, cdb_content: bytes) -> str:
+    os.makedirs(os.path.join(folder, "spacy_model"), exist_ok=True)
+    with open(os.path.join(folder, "spacy_model", "model.bin"), 'wb') as f:
+        f.write(b"shared spacy model" * 100)
+    with open(os.path.join(folder, "vocab.dat"), 'wb') as f:
+        f.write(b"shared vocab")
+    with open(os.path.join(folder, "cdb.dat"), 'wb') as f:
+        f.write(cdb_content)
+    return folder
+
+
+class PackStoreTests(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.store = PackStore(os.path.join(self.temp_dir.name, "store"))
+        self.pack1 = _write_pack(os.path.join(self.temp_dir.name, "pack1"), b"cdb 1")
+        self.pack2 = _write_pack(os.path.join(self.temp_dir.name, "pack2"), b"cdb 2")
+
+    def tearDown(self) -> None:
+        self.temp_dir.cleanup()
+
+    def _num_blobs(self) -> int:
+        return sum(len(files) for _, _, files in os.walk(self.store.blobs_dir))
+
+    def test_shared_files_stored_once(self):
+        self.store.add(self.pack1)
+        self.store.add(self.pack2)
+        self.assertEqual(["pack1", "pack2"], self.store.list_packs())
+        # spacy model and vocab shared, the 2 CDBs are different
+        self.assertEqual(4, self._num_blobs())
+
+    def test_add_from_zip(self):
+        zip_path = write_stored_archive(self.pack1, os.path.join(self.temp_dir.name, "pack1.zip"))
+        with zipfile.ZipFile(zip_path) as zf:
+            self.assertTrue(all(info.compress_type == zipfile.ZIP_STORED for info in zf.infolist()))
+        self.store.add(zip_path)
+        self.store.add(self.pack1, "pack1_folder")
+        self.assertEqual(self.store.get_manifest("pack1"), self.store.get_manifest("pack1_folder"))
+        self.assertEqual(3, self._num_blobs())
+
+    def test_materialise(self):
+        self.store.add(self.pack1)
+        pack_dir = self.store.materialise("pack1")
+        for rel_path in ["cdb.dat", "vocab.dat", os.path.join("spacy_model", "model.bin")]:
+            with self.subTest(rel_path):
+                self.assertEqual(hash_file(os.path.join(self.pack1, rel_path)),
+                                 hash_file(os.path.join(pack_dir, rel_path)))
+
+    def test_export(self):
+        self.store.add(self.pack1)
+        zip_path = self.store.export("pack1", os.path.join(self.temp_dir.name, "exported.zip"))
+        with zipfile.ZipFile(zip_path) as zf:
+            self.assertEqual(sorted(self.store.get_manifest("pack1")), sorted(zf.namelist()))
+
+    def test_remove_keeps_shared_blobs(self):
+        self.store.add(self.pack1)
+        self.store.add(self.pack2)
+        self.store.materialise("pack1")
+        self.store.remove("pack1")
+        self.assertEqual(["pack2"], self.store.list_packs())
+        self.assertEqual(3, self._num_blobs())
+        pack_dir = self.store.materialise("pack2")
+        with open(os.path.join(pack_dir, "cdb.dat"), 'rb') as f:
+            self.assertEqual(b"cdb 2", f.read())
+
+    def test_materialise_after_readding_changed_pack(self):
+        self.store.add(self.pack1)
+        old_dir = self.store.materialise("pack1")
+        with open(os.path.join(self.pack1, "cdb.dat"), 'wb') as f:
+            f.write(b"cdb 1 retrained")
+        self.store.add(self.pack1)
+        pack_dir = self.store.materialise("pack1")
+        self.assertNotEqual(old_dir, pack_dir)
+        self.assertFalse(os.path.exists(old_dir))
+        with open(os.path.join(pack_dir, "cdb.dat"), 'rb') as f:
+            self.assertEqual(b"cdb 1 retrained", f.read())
+
+    def test_is_up_to_date(self):
+        zip_path = write_stored_archive(self.pack1, os.path.join(self.temp_dir.name, "pack1.zip"))
+        self.assertFalse(self.store.is_up_to_date("pack1", zip_path))
+        self.store.add(zip_path)
+        self.assertTrue(self.store.is_up_to_date("pack1", zip_path))
+        with open(os.path.join(self.pack1, "cdb.dat"), 'wb') as f:
+            f.write(b"cdb 1 retrained")
+        write_stored_archive(self.pack1, zip_path)
+        self.assertFalse(self.store.is_up_to_date("pack1", zip_path))
+
+    def test_is_up_to_date_only_hashes_on_metadata_mismatch(self):
+        zip_path = write_stored_archive(self.pack1, os.path.join(self.temp_dir.name, "pack1.zip"))
+        self.store.add(zip_path)
+        with mock.patch.object(pack_store, "hash_file", wraps=hash_file) as mocked:
+            self.assertTrue(self.store.is_up_to_date("pack1", zip_path))
+            self.assertEqual(0, mocked.call_count)
+            # same contents, newer modification time
+            stat = os.stat(zip_path)
+            os.utime(zip_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+            self.assertTrue(self.store.is_up_to_date("pack1", zip_path))
+            self.assertEqual(1, mocked.call_count)
+            self.assertTrue(self.store.is_up_to_date("pack1", zip_path))
+            self.assertEqual(1, mocked.call_count)
+            # the member CRCs differ (same size)
+            with open(os.path.join(self.pack1, "cdb.dat"), 'wb') as f:
+                f.write(b"cdb 3")
+            write_stored_archive(self.pack1, zip_path)
+            self.assertFalse(self.store.is_up_to_date("pack1", zip_path))
+            self.assertEqual(1, mocked.call_count)
+
+    def test_is_up_to_date_legacy_source(self):
+        zip_path = write_stored_archive(self.pack1, os.path.join(self.temp_dir.name, "pack1.zip"))
+        self.store.add(zip_path)
+        with open(self.store._source_path("pack1"), 'w') as f:
+            f.write(hash_file(zip_path))
+        self.assertTrue(self.store.is_up_to_date("pack1", zip_path))
+        self.assertIn("mtime_ns", self.store._read_source("pack1"))
+
+    def test_add_zips_concurrently(self):
+        zip_paths = [write_stored_archive(pack, os.path.join(self.temp_dir.name, "%s.zip" % name))
+                     for name, pack in (("pack1", self.pack1), ("pack2", self.pack2))]
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            self.assertEqual(["pack1", "pack2"], list(executor.map(self.store.add, zip_paths)))
+        self.assertEqual(4, self._num_blobs())
+        for name, pack in (("pack1", self.pack1), ("pack2", self.pack2)):
+            pack_dir = self.store.materialise(name)
+            with self.subTest(name):
+                self.assertEqual(hash_file(os.path.join(pack, "cdb.dat")), hash_file(os.path.join(pack_dir, "cdb.dat")))
@@ -3,6 +3,7 @@ import os
 from unittest import mock
 from typing import Callable, Any, Dict
 import tempfile
+import numpy as np
 
 from medcat.utils.cdb_state import captured_state_cdb, CDBState, copy_cdb_state
 from medcat.cdb import CDB
@@ -111,3 +112,63 @@ class StateRestoredAfterTrain(StateWithTrainingTests):
 
     def test_restored_state_same(self):
         self.assertDictEqual(self.initial_state, self.restored_state)
+
+
+class JournaledStateTests(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.cdb = CDB.load(os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "..", "examples", "cdb.dat"))
+        cls.initial_state = copy_cdb_state(cls.cdb)
+        cls.initial_objects = {k: getattr(cls.cdb, k) for k in CDBState.__annotations__}
+        cui = next(iter(cls.cdb.cui2names))
+        with captured_state_cdb(cls.cdb):
+            cls.cdb.add_names("NEWCUI", {"new~name": {"tokens": ["new", "name"], "snames": {"new", "new~name"},
+                                                     "raw_name": "new name", "is_upper": False}})
+            cls.cdb.add_names(cui, {"other~name": {"tokens": ["other", "name"], "snames": {"other", "other~name"},
+                                                  "raw_name": "other name", "is_upper": False}})
+            cls.cdb.update_context_vector(cui, {"long": np.ones(300)})
+            cls.cdb._remove_names(cui, list(cls.initial_state["cui2names"][cui]))
+            cls.changed_state = copy_cdb_state(cls.cdb)
+        cls.restored_state = copy_cdb_state(cls.cdb)
+
+    def test_state_changed(self):
+        for k in ["name2cuis", "snames", "cui2names", "cui2snames", "cui2context_vectors", "cui2count_train"]:
+            with self.subTest(k):
+                self.assertNotEqual(self.initial_state[k], self.changed_state[k])
+
+    def test_state_restored(self):
+        for k in ["name2cuis", "snames", "cui2names", "cui2snames", "cui2count_train", "name_isupper", "vocab"]:
+            with self.subTest(k):
+                self.assertEqual(self.initial_state[k], self.restored_state[k])
+        self.assertEqual(self.initial_state["cui2context_vectors"].keys(),
+                         self.restored_state["cui2context_vectors"].keys())
+        for cui, vecs in self.initial_state["cui2context_vectors"].items():
+            for ctx_type, vec in vecs.items():
+                np.testing.assert_array_equal(vec, self.restored_state["cui2context_vectors"][cui][ctx_type])
+
+    def test_original_objects_restored(self):
+        for k, v in self.initial_objects.items():
+            with self.subTest(k):
+                self.assertIs(v, getattr(self.cdb, k))
+
+    def test_scans_not_journaled(self):
+        cui = next(iter(self.cdb.cui2names))
+        with captured_state_cdb(self.cdb):
+            for _, names in self.cdb.cui2names.items():
+                len(names)
+            for cui_snames in self.cdb.cui2snames.values():
+                len(cui_snames)
+            self.cdb.cui2names.get(cui)
+            self.cdb.add_names(cui, {"other~name": {"tokens": ["other", "name"], "snames": {"other", "other~name"},
+                                                   "raw_name": "other name", "is_upper": False}})
+            self.assertEqual(len(self.cdb.cui2names._journal), 1)
+            self.assertEqual(len(self.cdb.cui2snames._journal), 1)
+        self.assertNotIn("other~name", self.cdb.cui2names[cui])
+
+    def test_restored_after_exception(self):
+        with self.assertRaises(ValueError):
+            with captured_state_cdb(self.cdb):
+                self.cdb.cui2count_train["NEWCUI"] = 10
+                raise ValueError()
+        self.assertNotIn("NEWCUI", self.cdb.cui2count_train)
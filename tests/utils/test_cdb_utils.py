@@ -1,7 +1,10 @@
+import os
+import tempfile
 import unittest
 import numpy as np
 from tests.helper import ForCDBMerging
-from medcat.utils.cdb_utils import merge_cdb
+from medcat.cdb import CDB
+from medcat.utils.cdb_utils import merge_cdb, save_merged_cdb, update_cdb
 
 
 class CDBMergeTests(unittest.TestCase):
@@ -41,3 +44,128 @@ class CDBMergeTests(unittest.TestCase):
             self.assertTrue(np.array_equal(self.overwrite_cdb.cui2context_vectors[cui]["short"], self.zeroes))
             self.assertEqual(self.overwrite_cdb.addl_info["cui2ontologies"][cui], {"test_ontology"})
             self.assertEqual(self.overwrite_cdb.addl_info["cui2description"][cui], "test_description")
+
+    def test_shared_merge_same_as_copied(self):
+        shared_cdb = merge_cdb(cdb1=self.cdb1, cdb2=self.cdb2, share_unchanged=True)
+        for attr in ["cui2names", "cui2snames", "cui2type_ids", "name2cuis", "name2cuis2status", "cui2count_train"]:
+            with self.subTest(attr):
+                self.assertEqual(getattr(self.merged_cdb, attr), getattr(shared_cdb, attr))
+
+    def test_merge_does_not_share_containers(self):
+        cui = "C0006826"
+        self.assertIsNot(self.merged_cdb.cui2names[cui], self.cdb1.cui2names[cui])
+        self.assertIsNot(self.merged_cdb.cui2context_vectors["UniqueTest"], self.cdb2.cui2context_vectors["UniqueTest"])
+
+    def test_save_merged_cdb(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            cdb_path = save_merged_cdb(cdb1=self.cdb1, cdb2=self.cdb2, save_dir_path=temp_dir, cdb_format='json')
+            self.assertTrue(os.path.exists(os.path.join(temp_dir, "config.json")))
+            cdb = CDB.load(cdb_path, temp_dir)
+        self.assertEqual(self.merged_cdb.cui2names, cdb.cui2names)
+
+
+def _names(*raw_names):
+    names = {}
+    for raw_name in raw_names:
+        tokens = raw_name.lower().split(" ")
+        snames = {"~".join(tokens[:i + 1]) for i in range(len(tokens))}
+        names["~".join(tokens)] = {'tokens': tokens, 'snames': snames, 'raw_name': raw_name, 'is_upper': False}
+    return names
+
+
+def _build_cdb(concepts):
+    cdb = CDB()
+    for cui, (raw_names, type_id) in concepts.items():
+        cdb._add_concept(cui=cui, names=_names(*raw_names), ontologies={"TEST"}, name_status='A',
+                         type_ids={type_id}, description="", full_build=True)
+    return cdb
+
+
+class CDBUpdateTests(unittest.TestCase):
+    OLD_RELEASE = {
+        "C1": (["heart attack", "myocardial infarction"], "T1"),
+        "C2": (["kidney failure"], "T1"),
+        "C3": (["fever"], "T2"),
+        "C4": (["cold"], "T2"),
+    }
+    NEW_RELEASE = {
+        "C1": (["heart attack", "myocardial infarction"], "T1"),
+        "C2": (["renal failure"], "T1"),
+        "C3": (["fever"], "T3"),
+        "C5": (["kidney stone"], "T2"),
+    }
+
+    def setUp(self):
+        self.cdb = _build_cdb(self.OLD_RELEASE)
+        for cui in self.cdb.cui2names:
+            self.cdb.update_context_vector(cui, {"short": np.ones(300)})
+        self.new_cdb = _build_cdb(self.NEW_RELEASE)
+        self.stats = update_cdb(self.cdb, self.new_cdb, full_build=True)
+
+    def test_stats(self):
+        self.assertEqual(self.stats, {'added': 1, 'changed': 2, 'removed': 1, 'unchanged': 1})
+
+    def test_same_names_as_rebuild(self):
+        for attr in ["cui2names", "cui2snames", "cui2type_ids", "cui2preferred_name", "name2cuis",
+                     "name2cuis2status", "snames", "name_isupper", "vocab"]:
+            with self.subTest(attr):
+                self.assertEqual(getattr(self.cdb, attr), getattr(self.new_cdb, attr))
+        self.assertEqual(self.cdb.addl_info["cui2ontologies"], self.new_cdb.addl_info["cui2ontologies"])
+
+    def test_type_id2cuis_updated(self):
+        self.assertNotIn("C3", self.cdb.addl_info["type_id2cuis"]["T2"])
+        self.assertIn("C3", self.cdb.addl_info["type_id2cuis"]["T3"])
+
+    def test_keeps_training(self):
+        for cui in ["C1", "C2", "C3"]:
+            with self.subTest(cui):
+                self.assertIn(cui, self.cdb.cui2context_vectors)
+                self.assertEqual(self.cdb.cui2count_train[cui], 1)
+        self.assertNotIn("C5", self.cdb.cui2context_vectors)
+
+    def test_removes_missing(self):
+        self.assertNotIn("C4", self.cdb.cui2names)
+        self.assertNotIn("C4", self.cdb.cui2context_vectors)
+        self.assertNotIn("cold", self.cdb.name2cuis)
+
+    def _trained_cdb(self):
+        cdb = _build_cdb(self.OLD_RELEASE)
+        # names and concepts learned through training
+        cdb.add_names("C2", _names("kidney insufficiency"))
+        cdb.add_names("C3", _names("pyrexia"))
+        cdb._add_concept(cui="C6", names=_names("sore throat"), ontologies=set(), name_status='A',
+                         type_ids={"T2"}, description="", full_build=False)
+        return cdb
+
+    def test_keeps_learned_names_with_prev_cdb(self):
+        cdb = self._trained_cdb()
+        stats = update_cdb(cdb, self.new_cdb, prev_cdb=_build_cdb(self.OLD_RELEASE))
+        self.assertEqual(stats['removed'], 1)
+        self.assertEqual(cdb.cui2names["C2"], {"renal~failure", "kidney~insufficiency"})
+        self.assertEqual(cdb.cui2names["C3"], {"fever", "pyrexia"})
+        self.assertEqual(cdb.cui2names["C6"], {"sore~throat"})
+        self.assertEqual(cdb.name2cuis["kidney~insufficiency"], ["C2"])
+        self.assertNotIn("kidney~failure", cdb.name2cuis)
+        self.assertIn("kidney~insufficiency", cdb.cui2snames["C2"])
+        self.assertIn("kidney~insufficiency", cdb.snames)
+        self.assertNotIn("kidney~failure", cdb.snames)
+
+    def test_learned_names_removed_without_prev_cdb(self):
+        cdb = self._trained_cdb()
+        update_cdb(cdb, self.new_cdb)
+        self.assertEqual(cdb.cui2names["C2"], {"renal~failure"})
+        self.assertNotIn("kidney~insufficiency", cdb.name2cuis)
+        self.assertNotIn("C6", cdb.cui2names)
+
+    def test_unlinked_names_cleaned_up(self):
+        self.assertNotIn("kidney~failure", self.cdb.name_isupper)
+        self.assertNotIn("cold", self.cdb.name_isupper)
+        self.assertNotIn("cold", self.cdb.vocab)
+        self.assertEqual(self.cdb.vocab["kidney"], 1)
+        self.assertEqual(self.cdb.vocab["failure"], 1)
+
+    def test_keep_missing(self):
+        cdb = _build_cdb(self.OLD_RELEASE)
+        stats = update_cdb(cdb, self.new_cdb, remove_missing_cuis=False)
+        self.assertEqual(stats['removed'], 0)
+        self.assertEqual(cdb.cui2names["C4"], {"cold"})
@@ -6,6 +6,7 @@ from unittest.mock import patch
 from tests.helper import AsyncMock
 from medcat.utils.checkpoint import Checkpoint, CheckpointConfig, CheckpointManager
 from medcat.cdb import CDB
+import numpy as np
 
 
 class CheckpointTest(unittest.TestCase):
@@ -18,6 +19,8 @@ class CheckpointTest(unittest.TestCase):
         self.assertEqual(2, checkpoint.steps)
         self.assertEqual(20, checkpoint.count)
         self.assertEqual(1, checkpoint.max_to_keep)
+        self.assertEqual(Checkpoint.DEFAULT_FULL_EVERY, checkpoint.full_every)
+        self.assertEqual(3, Checkpoint.from_latest(dir_path, full_every=3).full_every)
 
     @patch("medcat.cdb.CDB.load", return_value="cdb_object")
     def test_restore_latest_cdb(self, cdb_load):
@@ -44,6 +47,76 @@ class CheckpointTest(unittest.TestCase):
         self.assertEqual(1, checkpoint.max_to_keep)
         self.assertEqual(1, checkpoint.count)
 
+    def test_save_delta_and_restore(self):
+        dir_path = tempfile.TemporaryDirectory()
+        checkpoint = Checkpoint(dir_path=dir_path.name, steps=1, max_to_keep=1, full_every=3)
+        cdb = CDB()
+        cdb.update_context_vector("C1", {"long": np.ones(3)})
+        checkpoint.save(cdb, 1)
+        cdb.update_context_vector("C1", {"long": np.zeros(3)})
+        cdb.update_context_vector("C2", {"long": np.ones(3)})
+        checkpoint.save(cdb, 2)
+        cdb.add_names("C3", {"c3": {"tokens": ["c3"], "snames": {"c3"}, "raw_name": "c3", "is_upper": False}})
+        checkpoint.save(cdb, 3)
+        checkpoint.flush()
+
+        files = sorted(os.listdir(dir_path.name))
+        self.assertEqual(["checkpoint-1-1", "delta-1-1"], files)
+        self.assertEqual(3, Checkpoint.from_latest(dir_path.name).count)
+
+        restored = Checkpoint(dir_path=dir_path.name, steps=1, max_to_keep=1, full_every=3).restore_latest_cdb()
+
+        self.assertEqual(cdb.cui2count_train, restored.cui2count_train)
+        self.assertEqual(cdb.cui2names, restored.cui2names)
+        self.assertEqual(cdb.snames, restored.snames)
+        self.assertEqual(cdb.name2cuis, restored.name2cuis)
+        for cui, vecs in cdb.cui2context_vectors.items():
+            np.testing.assert_array_equal(vecs["long"], restored.cui2context_vectors[cui]["long"])
+
+    def test_save_full_in_background_uses_snapshot(self):
+        dir_path = tempfile.TemporaryDirectory()
+        checkpoint = Checkpoint(dir_path=dir_path.name, steps=1, max_to_keep=1, full_every=2)
+        cdb = CDB()
+        cdb.update_context_vector("C1", {"long": np.ones(3)})
+        checkpoint.save(cdb, 1)
+        # changes made while the checkpoint may still be written are not part of it
+        cdb.update_context_vector("C2", {"long": np.ones(3)})
+        checkpoint.close()
+
+        restored = checkpoint.restore_latest_cdb()
+        self.assertEqual({"C1": 1}, restored.cui2count_train)
+        self.assertEqual(["checkpoint-1-1"], sorted(os.listdir(dir_path.name)))
+        self.assertIsNone(checkpoint._executor)
+
+    def test_save_full_without_deltas_in_calling_thread(self):
+        dir_path = tempfile.TemporaryDirectory()
+        checkpoint = Checkpoint(dir_path=dir_path.name, steps=1, max_to_keep=1, full_every=1)
+        cdb = CDB()
+        cdb.update_context_vector("C1", {"long": np.ones(3)})
+        with patch.object(Checkpoint, "_create_snapshot") as create_snapshot:
+            checkpoint.save(cdb, 1)
+            checkpoint.save(cdb, 2)
+
+        create_snapshot.assert_not_called()
+        self.assertIsNone(checkpoint._shadow)
+        self.assertIsNone(checkpoint._executor)
+        self.assertEqual(["checkpoint-1-2"], sorted(os.listdir(dir_path.name)))
+        self.assertEqual({"C1": 1}, checkpoint.restore_latest_cdb().cui2count_train)
+
+    def test_save_compacts_deltas(self):
+        dir_path = tempfile.TemporaryDirectory()
+        checkpoint = Checkpoint(dir_path=dir_path.name, steps=1, max_to_keep=1, full_every=2)
+        cdb = CDB()
+        for count in range(1, 5):
+            cdb.update_context_vector("C1", {"long": np.full(3, count)})
+            checkpoint.save(cdb, count)
+        checkpoint.flush()
+
+        self.assertEqual(["checkpoint-1-3", "delta-1-3"], sorted(os.listdir(dir_path.name)))
+        self.assertEqual(4, Checkpoint.from_latest(dir_path.name).count)
+        restored = checkpoint.restore_latest_cdb()
+        self.assertEqual(4, restored.cui2count_train["C1"])
+
     def test_validation_on_steps(self):
         with self.assertRaises(Exception) as e1:
             Checkpoint(dir_path="dir_path", steps=0, max_to_keep=1)
@@ -0,0 +1,99 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from medcat.utils.hierarchy import HierarchyIndex
+
+
+#        A
+#      /   \
+#     B     C
+#      \   / \
+#        D    E
+#        |
+#        F
+EXAMPLE_PT2CH = {
+    'A': ['B', 'C'],
+    'B': ['D'],
+    'C': ['D', 'E'],
+    'D': ['F'],
+}
+
+
+class HierarchyIndexTests(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.index = HierarchyIndex.from_pt2ch(EXAMPLE_PT2CH)
+
+    def test_has_all_concepts(self):
+        self.assertEqual(set('ABCDEF'), set(self.index.cuis))
+
+    def test_topological_order(self):
+        for parent, children in EXAMPLE_PT2CH.items():
+            for child in children:
+                with self.subTest(f"{parent} -> {child}"):
+                    self.assertLess(self.index.cui2index[parent], self.index.cui2index[child])
+
+    def test_direct_parents(self):
+        self.assertEqual(['B', 'C'], self.index.get_direct_parents('D'))
+        self.assertEqual([], self.index.get_direct_parents('A'))
+
+    def test_all_ancestors(self):
+        self.assertEqual({'A', 'B', 'C', 'D'}, set(self.index.get_all_ancestors('F')))
+
+    def test_all_descendants(self):
+        self.assertEqual({'D', 'E', 'F'}, set(self.index.get_all_descendants('C')))
+        self.assertEqual([], self.index.get_all_descendants('F'))
+
+    def test_unknown_concept(self):
+        self.assertEqual([], self.index.get_all_descendants('X'))
+        self.assertFalse(self.index.is_descendant('X', 'A'))
+
+    def test_is_descendant(self):
+        self.assertTrue(self.index.is_descendant('F', 'B'))
+        self.assertFalse(self.index.is_descendant('E', 'B'))
+        self.assertFalse(self.index.is_descendant('A', 'A'))
+
+    def test_is_descendant_batch(self):
+        cuis = np.array(['F', 'E', 'A', 'X'])
+        self.assertEqual([True, False, False, False],
+                         self.index.is_descendant_batch(cuis, np.array(['B', 'B', 'A', 'A'])).tolist())
+
+    def test_is_descendant_batch_broadcasts_indices(self):
+        cuis = self.index.get_indices(['D', 'E', 'B'])
+        self.assertEqual([True, True, False], self.index.is_descendant_batch(cuis, self.index.get_indices(['C'])).tolist())
+
+    def test_all_descendants_batch(self):
+        descendants = self.index.get_all_descendants_batch(np.array(['B', 'E']))
+        self.assertEqual({'D', 'F'}, {self.index.cuis[ind] for ind in descendants})
+
+    def test_save_and_load(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, 'hierarchy.npz')
+            self.index.save(path)
+            index = HierarchyIndex.load(path)
+        self.assertEqual(self.index.cuis, index.cuis)
+        for cui in self.index.cuis:
+            with self.subTest(cui):
+                self.assertEqual(self.index.get_all_descendants(cui), index.get_all_descendants(cui))
+
+
+class HierarchyIndexWithCycleTests(unittest.TestCase):
+
+    def setUp(self) -> None:
+        with self.assertLogs('medcat.utils.hierarchy', level='WARNING'):
+            self.index = HierarchyIndex.from_pt2ch({'A': ['B'], 'B': ['C'], 'C': ['B', 'D']})
+
+    def test_cycle_members_are_ancestors_of_one_another(self):
+        self.assertEqual({'A', 'C'}, set(self.index.get_all_ancestors('B')))
+        self.assertEqual({'A', 'B'}, set(self.index.get_all_ancestors('C')))
+
+    def test_after_cycle(self):
+        self.assertEqual({'A', 'B', 'C'}, set(self.index.get_all_ancestors('D')))
+
+
+if __name__ == '__main__':
+    unittest.main()
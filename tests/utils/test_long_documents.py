@@ -0,0 +1,69 @@
+import unittest
+
+from medcat.utils import long_documents
+
+
+class GetChunkSpansTests(unittest.TestCase):
+    TEXT = ("First paragraph. It has two sentences.\n\n"
+            "Second paragraph, which is a bit longer than the first one. Also two sentences.\n\n"
+            "Third paragraph.") * 5
+
+    def test_short_text_single_chunk(self):
+        self.assertEqual([(0, 10)], long_documents.get_chunk_spans("0123456789", 100, 10))
+
+    def test_chunks_cover_text(self):
+        spans = long_documents.get_chunk_spans(self.TEXT, 100, 20)
+        self.assertEqual(0, spans[0][0])
+        self.assertEqual(len(self.TEXT), spans[-1][1])
+        for (_, prev_end), (next_start, _) in zip(spans, spans[1:]):
+            with self.subTest(f"{prev_end}, {next_start}"):
+                self.assertLess(next_start, prev_end)
+                self.assertGreaterEqual(next_start, prev_end - 20)
+
+    def test_chunks_within_size(self):
+        for start, end in long_documents.get_chunk_spans(self.TEXT, 100, 20):
+            with self.subTest(f"{start}, {end}"):
+                self.assertLessEqual(end - start, 100)
+
+    def test_chunks_end_on_boundaries(self):
+        for _, end in long_documents.get_chunk_spans(self.TEXT, 100, 20)[:-1]:
+            with self.subTest(f"{end}"):
+                self.assertTrue(self.TEXT[end - 1].isspace())
+
+    def test_chunks_without_boundaries(self):
+        spans = long_documents.get_chunk_spans("a" * 250, 100, 20)
+        self.assertEqual([(0, 100), (80, 180), (160, 250)], spans)
+
+    def test_overlap_too_large(self):
+        with self.assertRaises(ValueError):
+            long_documents.get_chunk_spans(self.TEXT, 100, 50)
+
+
+class MergeChunkOutputsTests(unittest.TestCase):
+    TEXT = "aa bb cc dd ee"
+    SPANS = [(0, 9), (6, 14)]
+
+    @staticmethod
+    def _ent(ent_id: int, start: int, end: int, cui: str) -> dict:
+        return {'id': ent_id, 'start': start, 'end': end, 'cui': cui, 'start_tkn': start // 3, 'end_tkn': end // 3 + 1}
+
+    def setUp(self) -> None:
+        # entity "cc" is found in both chunks
+        self.outs = [{'entities': {0: self._ent(0, 3, 5, 'B'), 1: self._ent(1, 6, 8, 'C')},
+                      'tokens': ['aa ', 'bb ', 'cc ']},
+                     {'entities': {0: self._ent(0, 0, 2, 'C'), 1: self._ent(1, 6, 8, 'E')},
+                      'tokens': ['cc ', 'dd ', 'ee']}]
+
+    def test_offsets_and_deduplication(self):
+        out = long_documents.merge_chunk_outputs(self.outs, self.SPANS, self.TEXT, only_cui=False)
+        self.assertEqual([(0, 3, 5, 'B'), (1, 6, 8, 'C'), (2, 12, 14, 'E')],
+                         [(ent_id, ent['start'], ent['end'], ent['cui']) for ent_id, ent in out['entities'].items()])
+
+    def test_tokens(self):
+        out = long_documents.merge_chunk_outputs(self.outs, self.SPANS, self.TEXT, only_cui=False)
+        self.assertEqual(['aa ', 'bb ', 'cc ', 'dd ', 'ee'], out['tokens'])
+        self.assertEqual([1, 2, 4], [ent['start_tkn'] for ent in out['entities'].values()])
+
+    def test_only_cui(self):
+        out = long_documents.merge_chunk_outputs(self.outs, self.SPANS, self.TEXT, only_cui=True)
+        self.assertEqual({0: 'B', 1: 'C', 2: 'E'}, out['entities'])
@@ -1,5 +1,8 @@
+import os
+import tempfile
 import unittest
 
+from medcat.config import Config
 from medcat.utils import normalizers
 
 
@@ -69,3 +72,108 @@ class EditOrderTests(unittest.TestCase):
         all_edits1 = list(normalizers.get_all_edits_n(self.WORD, use_diacritics=False, n=1, return_ordered=True))
         ordered = sorted(all_edits1)
         self.assertEqual(all_edits1, ordered)
+
+
+class SpellCorrectionCacheTests(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.cache = normalizers.SpellCorrectionCache(max_corrections=2)
+        self.cache.check_settings((False, False, 5))
+
+    def test_caches_corrections(self):
+        self.cache.add_correction("hosue", "house")
+        self.cache.add_correction("qwzx", None)
+        self.assertEqual((True, "house"), self.cache.get_correction("hosue"))
+        self.assertEqual((True, None), self.cache.get_correction("qwzx"))
+        self.assertEqual((False, None), self.cache.get_correction("other"))
+
+    def test_least_recently_used_removed(self):
+        self.cache.add_correction("hosue", "house")
+        self.cache.add_correction("dgo", "dog")
+        self.cache.get_correction("hosue")
+        self.cache.add_correction("cta", "cat")
+        self.assertTrue(self.cache.get_correction("hosue")[0])
+        self.assertFalse(self.cache.get_correction("dgo")[0])
+        self.assertTrue(self.cache.get_correction("cta")[0])
+
+    def test_settings_change_clears(self):
+        self.cache.add_correction("hosue", "house")
+        self.cache.check_settings((False, False, 5))
+        self.assertTrue(self.cache.get_correction("hosue")[0])
+        self.cache.check_settings((True, False, 5))
+        self.assertFalse(self.cache.get_correction("hosue")[0])
+
+    def test_save_and_load(self):
+        self.cache.add_correction("hosue", "house")
+        self.cache.lemmas["houses"] = ("houses", "house")
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, "spell_check.dat")
+            self.cache.save(path)
+            cache = normalizers.SpellCorrectionCache.load(path)
+        self.assertEqual(self.cache.lemmas, cache.lemmas)
+        self.assertEqual((True, "house"), cache.get_correction("hosue"))
+
+
+class DeletionIndexTests(unittest.TestCase):
+    VOCAB = {"house": 10, "houses": 3, "horse": 5, "mouse": 2, "hospital": 7, "ñandu": 1, "hosue1": 1}
+    WORDS = ["hosue", "hous", "houes", "housse", "hospitla", "hopsitla", "hose", "nandu", "hosue", "hoseu1"]
+
+    def _candidates(self, deep: bool, diacritics: bool):
+        config = Config()
+        config.general.spell_check_deep = deep
+        config.general.diacritics = diacritics
+        spell_checker = normalizers.BasicSpellChecker(self.VOCAB, config)
+        brute_force = [set(spell_checker.candidates(word)) for word in self.WORDS]
+        spell_checker.build_index()
+        self.assertIsNotNone(spell_checker.get_index())
+        indexed = [set(spell_checker.candidates(word)) for word in self.WORDS]
+        return brute_force, indexed
+
+    def test_same_candidates(self):
+        for deep in (False, True):
+            for diacritics in (False, True):
+                with self.subTest(f"deep={deep}, diacritics={diacritics}"):
+                    brute_force, indexed = self._candidates(deep, diacritics)
+                    self.assertEqual(brute_force, indexed)
+
+    def test_updated_after_vocab_change(self):
+        config = Config()
+        vocab = dict(self.VOCAB)
+        spell_checker = normalizers.BasicSpellChecker(vocab, config)
+        index = spell_checker.build_index()
+        # the same number of words, but a different vocab
+        del vocab["horse"]
+        vocab["hosues"] = 100
+        self.assertIs(index, spell_checker.get_index())
+        self.assertIn("hosues", index)
+        self.assertEqual("hosues", spell_checker.fix("hosuess"))
+        self.assertNotIn("horse", spell_checker.candidates("horsse"))
+
+    def test_updated_on_vocab_version_change(self):
+        config = Config()
+        vocab = dict(self.VOCAB)
+        versions = iter([1, 1, 2])
+        spell_checker = normalizers.BasicSpellChecker(vocab, config, get_vocab_version=lambda: next(versions))
+        index = spell_checker.build_index()
+        vocab["hosues"] = 100
+        # the vocab is only checked again once its version changes
+        self.assertNotIn("hosues", spell_checker.get_index())
+        self.assertIn("hosues", spell_checker.get_index())
+        self.assertIs(index, spell_checker.index)
+
+    def test_rebuilt_for_larger_distance(self):
+        config = Config()
+        spell_checker = normalizers.BasicSpellChecker(self.VOCAB, config)
+        spell_checker.build_index()
+        config.general.spell_check_deep = True
+        self.assertEqual(2, spell_checker.get_index().max_distance)
+
+    def test_save_and_load(self):
+        index = normalizers.DeletionIndex(max_distance=1)
+        index.add_words(self.VOCAB)
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, "spell_check_index.dat")
+            index.save(path)
+            loaded = normalizers.DeletionIndex.load(path)
+        self.assertEqual(index.deletes, loaded.deletes)
+        self.assertEqual(len(self.VOCAB), loaded.nr_of_words)
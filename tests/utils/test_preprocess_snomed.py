@@ -1,6 +1,7 @@
 import os
 from typing import Dict
 import contextlib
+import tempfile
 
 from medcat.utils import preprocess_snomed
 
@@ -105,6 +106,24 @@ class TestSnomedVersionsOPCS4(unittest.TestCase):
         self.assertEqual(snomed.opcs_refset_id, "1382401000000109")
 
 
+class ProcessReleasesTests(unittest.TestCase):
+
+    def _process_releases(self, **kwargs):
+        with patch_fake_files(EXAMPLE_SNOMED_PATH_NEW):
+            snomed = preprocess_snomed.Snomed(EXAMPLE_SNOMED_PATH_NEW, **kwargs)
+        with patch.object(preprocess_snomed, 'ProcessPoolExecutor') as executor:
+            executor.return_value.__enter__.return_value.map.side_effect = map
+            results = snomed._process_releases(pow, [(2, 1), (2, 2), (2, 3)])
+        self.assertEqual([2, 4, 8], results)
+        return executor
+
+    def test_sequential_by_default(self):
+        self._process_releases().assert_not_called()
+
+    def test_at_most_one_process_per_release(self):
+        self._process_releases(n_process=8).assert_called_once_with(max_workers=3)
+
+
 class TestSnomedModelGetter(unittest.TestCase):
     WORKING_BASE_NAMES = [
         "SnomedCT_InternationalRF2_PRODUCTION_20240201T120000Z",
@@ -176,3 +195,100 @@ class TestSnomedModelGetter(unittest.TestCase):
     def test_gets_no_version_incorrect_paths_nonstrict(self):
         full_paths = self._pathify(self.FAILING_BASE_NAMES)
         self.assert_all_get_no_version(full_paths)
+
+
+EXAMPLE_RF2_LINES = [
+    ['id', 'effectiveTime', 'active', 'conceptId', 'term'],
+    ['1', '20240101', '1', '100', 'Kidney failure '],
+    ['2', '20240101', '0', '100', 'Renal failure'],
+    ['3', '20240101', '1', '200', 'Fever'],
+]
+
+
+class RF2ReaderTests(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.temp_dir.name, 'sct2_Description_Snapshot-en_INT_20240101.txt')
+        with open(self.path, 'w', encoding='utf-8') as f:
+            f.writelines('\t'.join(line) + '\r\n' for line in EXAMPLE_RF2_LINES)
+
+    def tearDown(self) -> None:
+        self.temp_dir.cleanup()
+
+    def test_reads_only_active(self):
+        df = preprocess_snomed.read_rf2_file(self.path, chunk_size=1)
+        self.assertEqual(['1', '3'], list(df['id']))
+
+    def test_reads_all(self):
+        df = preprocess_snomed.read_rf2_file(self.path, only_active=False)
+        self.assertEqual(['1', '2', '3'], list(df['id']))
+
+    def test_same_as_parse_file(self):
+        parsed = preprocess_snomed.parse_file(self.path)
+        parsed = parsed[parsed.active == '1'].reset_index(drop=True)
+        self.assertTrue(parsed.equals(preprocess_snomed.read_rf2_file(self.path)))
+
+    def test_cached(self):
+        cache_dir = os.path.join(self.temp_dir.name, 'cache')
+        df = preprocess_snomed.read_rf2_file_cached(self.path, cache_dir)
+        self.assertEqual(1, len(os.listdir(cache_dir)))
+        with patch.object(preprocess_snomed, 'read_rf2_file') as read_rf2_file:
+            cached = preprocess_snomed.read_rf2_file_cached(self.path, cache_dir)
+        read_rf2_file.assert_not_called()
+        self.assertTrue(df.equals(cached))
+
+    def test_changed_file_not_cached(self):
+        cache_dir = os.path.join(self.temp_dir.name, 'cache')
+        preprocess_snomed.read_rf2_file_cached(self.path, cache_dir)
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write('\t'.join(['4', '20240101', '1', '300', 'Cough']) + '\r\n')
+        df = preprocess_snomed.read_rf2_file_cached(self.path, cache_dir)
+        self.assertEqual(['1', '3', '4'], list(df['id']))
+
+
+EXAMPLE_CONCEPT_LINES = [
+    ['id', 'effectiveTime', 'active', 'moduleId', 'definitionStatusId'],
+    ['100', '20240101', '1', '300', '400'],
+    ['200', '20240101', '1', '300', '400'],
+    ['300', '20240101', '1', '300', '400'],
+]
+EXAMPLE_CONCEPT_DESCRIPTION_LINES = [
+    ['id', 'effectiveTime', 'active', 'moduleId', 'conceptId', 'languageCode', 'typeId', 'term',
+     'caseSignificanceId'],
+    ['1', '20240101', '1', '300', '100', 'en', '900000000000013009', 'Fever', '500'],
+    ['2', '20240101', '1', '300', '100', 'en', '900000000000003001', 'Fever (finding)', '500'],
+    ['3', '20240101', '1', '300', '200', 'en', '900000000000003001', 'Cough', '500'],
+    ['4', '20240101', '1', '300', '300', 'en', '900000000000550004', 'A definition', '500'],
+    ['5', '20240101', '1', '300', '300', 'en', '900000000000013009', 'Flu', '500'],
+]
+
+
+class ConceptDFTests(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.concept_file = os.path.join(self.temp_dir.name, 'sct2_Concept_Snapshot_INT_20240101.txt')
+        self.description_file = os.path.join(self.temp_dir.name, 'sct2_Description_Snapshot-en_INT_20240101.txt')
+        for path, lines in [(self.concept_file, EXAMPLE_CONCEPT_LINES),
+                            (self.description_file, EXAMPLE_CONCEPT_DESCRIPTION_LINES)]:
+            with open(path, 'w', encoding='utf-8') as f:
+                f.writelines('\t'.join(line) + '\r\n' for line in lines)
+        self.df = preprocess_snomed._get_release_concept_df(self.concept_file, self.description_file, None)
+
+    def tearDown(self) -> None:
+        self.temp_dir.cleanup()
+
+    def test_primary_names_first(self):
+        self.assertEqual(['100', '200', '100', '300'], list(self.df['cui']))
+        self.assertEqual(['Fever (finding)', 'Cough', 'Fever', 'Flu'], list(self.df['name']))
+        self.assertEqual(['P', 'P', 'A', 'A'], list(self.df['name_status']))
+
+    def test_semantic_tags(self):
+        self.assertEqual(['finding', 'finding'], list(self.df['description_type_ids'][[0, 2]]))
+        self.assertTrue(self.df['description_type_ids'][[1, 3]].isna().all())
+
+    def test_type_ids_same_as_hashed_tags(self):
+        expected = [int(preprocess_snomed.hashlib.sha256(str(tag).encode('utf-8')).hexdigest(), 16) % 10 ** 8
+                    for tag in self.df['description_type_ids']]
+        self.assertEqual(expected, list(self.df['type_ids']))
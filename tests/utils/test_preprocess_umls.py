@@ -0,0 +1,71 @@
+import os
+import tempfile
+import unittest
+
+from medcat.utils.preprocess_umls import UMLS
+
+
+EXAMPLE_MRCONSO = [
+    # CUI, LAT, TS, LUI, STT, SUI, ISPREF, AUI, SAUI, SCUI, SDUI, SAB, TTY, CODE, STR, SRL, SUPPRESS, CVF
+    ['C01', 'ENG', 'P', 'L1', 'PF', 'S1', 'Y', 'A01', '', '0101', '', 'SNOMEDCT_US', 'PT', '0101', 'Disease', '0', 'N', ''],
+    ['C01', 'SPA', 'P', 'L2', 'PF', 'S2', 'Y', 'A02', '', '', '', 'MSH', 'PT', 'D01', 'Enfermedad', '0', 'N', ''],
+    ['C02', 'ENG', 'P', 'L3', 'PF', 'S3', 'Y', 'A03', '', '0202', '', 'SNOMEDCT_US', 'PT', '0202', 'Kidney disease', '0', 'N', ''],
+    ['C02', 'ENG', 'S', 'L4', 'PF', 'S4', 'Y', 'A04', '', '', '', 'ICD10', 'PT', 'N28', 'Renal disease', '0', 'N', ''],
+    ['C03', 'ENG', 'P', 'L5', 'PF', 'S5', 'Y', 'A05', '', '', '', 'ICD10', 'PT', 'N17', 'Kidney failure', '0', 'N', ''],
+]
+EXAMPLE_MRSTY = [
+    ['C01', 'T047', 'B2.2', 'Disease', 'AT1', ''],
+    ['C02', 'T047', 'B2.2', 'Disease', 'AT2', ''],
+    ['C03', 'T047', 'B2.2', 'Disease', 'AT3', ''],
+]
+EXAMPLE_MRHIER = [
+    # CUI, AUI, CXN, PAUI, SAB, RELA, PTR, HCD, CVF
+    ['C02', 'A03', '1', 'A01', 'SNOMEDCT_US', 'isa', 'A01', '', ''],
+    ['C03', 'A05', '1', 'A03', 'SNOMEDCT_US', 'isa', 'A01.A03', '', ''],
+    ['C03', 'A05', '2', 'A04', 'ICD10', '', 'A04', '', ''],
+]
+
+
+class UMLSStreamingTests(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.temp_dir = tempfile.TemporaryDirectory()
+        for file_name, rows in [('MRCONSO.RRF', EXAMPLE_MRCONSO), ('MRSTY.RRF', EXAMPLE_MRSTY),
+                                ('MRHIER.RRF', EXAMPLE_MRHIER)]:
+            with open(os.path.join(cls.temp_dir.name, file_name), 'w') as f:
+                f.writelines('|'.join(row) + '|\n' for row in rows)
+        # small chunks so that the rows are spread over multiple chunks
+        cls.umls = UMLS(os.path.join(cls.temp_dir.name, 'MRCONSO.RRF'),
+                        os.path.join(cls.temp_dir.name, 'MRSTY.RRF'), chunk_size=2)
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        cls.temp_dir.cleanup()
+
+    def test_concept_df_filters_languages(self):
+        df = self.umls.to_concept_df()
+        self.assertEqual(['Disease', 'Kidney disease', 'Renal disease', 'Kidney failure'], list(df['name']))
+        self.assertEqual(['cui', 'name_status', 'ontologies', 'name', 'type_ids'], list(df.columns))
+
+    def test_snomed_codes_kept_as_str(self):
+        df = self.umls.map_umls2snomed()
+        self.assertEqual(['0101', '0202'], list(df['SCUI']))
+
+    def test_icd10(self):
+        df = self.umls.map_umls2icd10()
+        self.assertEqual(['N17', 'N28'], list(df['CODE']))
+
+    def test_pt2ch(self):
+        self.assertEqual({'C01': ['C02'], 'C02': ['C03']}, self.umls.get_pt2ch())
+
+    def test_all_in_one_pass(self):
+        outputs = self.umls.process(concepts=True, snomed=True, sources='ICD10', pt2ch=True)
+        self.assertTrue(outputs['concepts'].equals(self.umls.to_concept_df()))
+        self.assertTrue(outputs['snomed'].equals(self.umls.map_umls2snomed()))
+        self.assertTrue(outputs['sources'].equals(self.umls.map_umls2icd10()))
+        self.assertEqual(self.umls.get_pt2ch(), outputs['pt2ch'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+import tempfile
+import unittest
+
+import spacy
+from spacy.cli.init_config import init_config
+from spacy.lookups import Lookups
+
+from medcat.config import Config
+from medcat.utils import spacy_pipeline
+
+
+class RequiredComponentsTests(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        # the same components (and listeners) as en_core_web_md
+        cls.spacy_config = init_config(lang='en', pipeline=['tagger', 'parser', 'ner'], optimize='accuracy')
+        cls.spacy_config['nlp']['pipeline'] = ['tok2vec', 'tagger', 'parser', 'attribute_ruler', 'lemmatizer', 'ner']
+        cls.spacy_config['components']['attribute_ruler'] = {'factory': 'attribute_ruler'}
+        cls.spacy_config['components']['lemmatizer'] = {'factory': 'lemmatizer', 'mode': 'rule'}
+
+    def setUp(self) -> None:
+        self.config = Config()
+
+    def test_default_excludes_parser_and_ner(self):
+        required, uses_vectors = spacy_pipeline.get_required_components(self.spacy_config, self.config)
+        self.assertEqual({'tok2vec', 'tagger', 'attribute_ruler', 'lemmatizer'}, required)
+        # tok2vec uses the static vectors
+        self.assertTrue(uses_vectors)
+
+    def test_lookup_lemmatizer_does_not_need_tagger(self):
+        self.config.general.spacy_lemmatizer_mode = 'lookup'
+        self.config.preprocessing.do_not_normalize = set()
+        excluded = spacy_pipeline.get_excluded_components(self.spacy_config, self.config)
+        self.assertEqual(['tok2vec', 'tagger', 'parser', 'attribute_ruler', 'ner', 'vectors'], excluded)
+
+    def test_do_not_normalize_needs_tagger(self):
+        self.config.general.spacy_lemmatizer_mode = 'lookup'
+        required, _ = spacy_pipeline.get_required_components(self.spacy_config, self.config)
+        self.assertEqual({'tok2vec', 'tagger', 'lemmatizer'}, required)
+
+    def test_disabled_not_required(self):
+        self.config.general.spacy_disabled_components.append('tagger')
+        required, _ = spacy_pipeline.get_required_components(self.spacy_config, self.config)
+        self.assertNotIn('tagger', required)
+
+
+class LoadMinimalSpacyModelTests(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        nlp = spacy.blank('en')
+        lemmatizer = nlp.add_pipe('lemmatizer', config={'mode': 'lookup'})
+        lemmatizer.lookups = Lookups()
+        lemmatizer.lookups.add_table('lemma_lookup', {'houses': 'house'})
+        nlp.add_pipe('entity_ruler')
+        nlp.add_pipe('sentencizer')
+        cls.temp_dir = tempfile.TemporaryDirectory()
+        nlp.to_disk(cls.temp_dir.name)
+        cls.config = Config()
+        cls.config.general.spacy_model = cls.temp_dir.name
+        cls.config.general.spacy_minimal_pipeline = True
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        cls.temp_dir.cleanup()
+
+    def test_only_loads_required(self):
+        nlp = spacy_pipeline.load_spacy_model(self.config)
+        self.assertEqual(['lemmatizer'], nlp.component_names)
+
+    def test_lemmatizes(self):
+        nlp = spacy_pipeline.load_spacy_model(self.config)
+        self.assertEqual(['two', 'house'], [token.lemma_ for token in nlp('two houses')])